@@ -0,0 +1,167 @@
+"""
+Admission control for the AI endpoints.
+
+When Gemini is slow, /ai/ingest-menu and /ai/parse-ingredients requests
+pile up in the worker, each holding its upload in memory until it times
+out. AIAdmissionMiddleware caps in-flight AI requests before anything is
+read:
+
+  - AI_MAX_INFLIGHT_REQUESTS: across all users (default 16);
+  - AI_MAX_INFLIGHT_PER_USER: per signed-in user (default 2);
+  - AI_MAX_INFLIGHT_UPLOAD_MB: total declared Content-Length of admitted
+    requests (default 100). A single request is always admitted when
+    nothing else is in flight, so large menus still go through.
+
+Requests over a cap get an immediate 503 with Retry-After
+(AI_ADMISSION_RETRY_AFTER_SECONDS, default 10) and a hint to enter the
+items manually. The upload body is never received. The slot is released
+when the response (including a streamed one) has been sent.
+
+The middleware runs before FastAPI's dependencies, so it looks the user
+up in the session store directly. Requests without a valid session are
+answered 401 there, before admission, so they never hold a slot.
+"""
+import os
+import threading
+from typing import Optional
+
+from fastapi.responses import JSONResponse
+
+import auth_routes
+
+INGEST_PATH = "/ai/ingest-menu"
+PARSE_PATH = "/ai/parse-ingredients"
+
+DEFAULT_MAX_INFLIGHT = 16
+DEFAULT_MAX_PER_USER = 2
+DEFAULT_MAX_UPLOAD_MB = 100
+DEFAULT_RETRY_AFTER_SECONDS = 10
+
+
+class AdmissionController:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.in_flight_bytes = 0
+        self._per_user: dict = {}
+        self.stats = {"admitted": 0, "rejected_global": 0, "rejected_user": 0, "rejected_bytes": 0}
+
+    @property
+    def max_in_flight(self) -> int:
+        return int(os.getenv("AI_MAX_INFLIGHT_REQUESTS", DEFAULT_MAX_INFLIGHT))
+
+    @property
+    def max_per_user(self) -> int:
+        return int(os.getenv("AI_MAX_INFLIGHT_PER_USER", DEFAULT_MAX_PER_USER))
+
+    @property
+    def max_bytes(self) -> int:
+        return int(float(os.getenv("AI_MAX_INFLIGHT_UPLOAD_MB", DEFAULT_MAX_UPLOAD_MB)) * 1024 * 1024)
+
+    def try_admit(self, user_id: Optional[str], size: int) -> Optional[str]:
+        """Reserve a slot; returns None when admitted, else the cap that was hit."""
+        with self._lock:
+            if self.in_flight >= self.max_in_flight:
+                reason = "global"
+            elif user_id and self._per_user.get(user_id, 0) >= self.max_per_user:
+                reason = "user"
+            elif self.in_flight and self.in_flight_bytes + size > self.max_bytes:
+                reason = "bytes"
+            else:
+                self.in_flight += 1
+                self.in_flight_bytes += size
+                if user_id:
+                    self._per_user[user_id] = self._per_user.get(user_id, 0) + 1
+                self.stats["admitted"] += 1
+                return None
+            self.stats[f"rejected_{reason}"] += 1
+            return reason
+
+    def release(self, user_id: Optional[str], size: int) -> None:
+        with self._lock:
+            self.in_flight -= 1
+            self.in_flight_bytes -= size
+            if user_id:
+                remaining = self._per_user.get(user_id, 1) - 1
+                if remaining > 0:
+                    self._per_user[user_id] = remaining
+                else:
+                    self._per_user.pop(user_id, None)
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {
+                "in_flight": self.in_flight,
+                "in_flight_bytes": self.in_flight_bytes,
+                "users_in_flight": len(self._per_user),
+                **self.stats,
+            }
+
+
+# Shared by the middleware and /ai/metrics.
+admission = AdmissionController()
+
+
+def _user_id(authorization: str) -> Optional[str]:
+    if not authorization.startswith("Bearer "):
+        return None
+    token_data = auth_routes.SESSION_TOKENS.get(authorization.split("Bearer ", 1)[1])
+    return token_data.get("uid") if token_data else None
+
+
+def _busy_detail(path: str) -> str:
+    if path == PARSE_PATH:
+        return (
+            "The AI service is busy right now. "
+            "Please try again in a moment, or set allergens manually below."
+        )
+    return (
+        "The AI service is busy right now. "
+        "Please try again in a moment, or add items manually below."
+    )
+
+
+class AIAdmissionMiddleware:
+    """ASGI middleware applying ``admission`` to POSTs on the AI endpoints."""
+
+    paths = (INGEST_PATH, PARSE_PATH)
+
+    def __init__(self, app, controller: Optional[AdmissionController] = None):
+        self.app = app
+        self.controller = controller or admission
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope.get("method") != "POST" or scope.get("path") not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        headers = {
+            key.decode("latin-1").lower(): value.decode("latin-1") for key, value in scope.get("headers", [])
+        }
+        user_id = _user_id(headers.get("authorization", ""))
+        if user_id is None:
+            # The endpoint would refuse it anyway; don't let it take a slot first.
+            response = JSONResponse({"detail": "Invalid or expired token"}, status_code=401)
+            await response(scope, receive, send)
+            return
+        try:
+            size = int(headers.get("content-length") or 0)
+        except ValueError:
+            size = 0
+
+        reason = self.controller.try_admit(user_id, size)
+        if reason is not None:
+            print(f"AI admission: rejected {scope['path']} ({reason} cap) for {user_id}")
+            retry_after = os.getenv("AI_ADMISSION_RETRY_AFTER_SECONDS", str(DEFAULT_RETRY_AFTER_SECONDS))
+            response = JSONResponse(
+                {"detail": _busy_detail(scope["path"])},
+                status_code=503,
+                headers={"Retry-After": retry_after},
+            )
+            await response(scope, receive, send)
+            return
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.controller.release(user_id, size)
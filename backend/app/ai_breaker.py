@@ -0,0 +1,169 @@
+"""
+Process-wide circuit breaker in front of the AI provider.
+
+Once the provider has run out of quota, lost its credentials or keeps
+timing out, every new request would otherwise wait (up to 30-240 s) for
+the same failure. The breaker remembers these outcomes across requests:
+
+  - closed: calls go through. A quota or auth failure opens the circuit
+    immediately; timeouts open it after AI_BREAKER_TIMEOUT_THRESHOLD
+    consecutive failures.
+  - open: calls fail at once with CircuitOpenError, which the endpoints
+    turn into a 503 asking the user to tag manually (with Retry-After).
+  - half-open: after AI_BREAKER_COOLDOWN_SECONDS a single probe call is let
+    through. Success closes the circuit; another failure re-opens it.
+
+AI_BREAKER_COOLDOWN_SECONDS=0 disables the breaker. State is per process.
+"""
+import os
+import threading
+import time
+from typing import Callable, Optional
+
+from ai_providers import AIProvider
+
+DEFAULT_COOLDOWN_SECONDS = 60
+DEFAULT_TIMEOUT_THRESHOLD = 2
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# Failure kinds that say something about the backend as a whole, as
+# opposed to the one file or ingredient list that was sent.
+TRIP_KINDS = ("quota", "auth", "timeout")
+# The call never reached the backend (rate limiter, busy scheduler,
+# disconnected client): it says nothing about the backend either way.
+NOT_SENT = "not_sent"
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling the provider while the circuit is open."""
+
+    def __init__(self, kind: str, retry_after: float):
+        super().__init__(f"AI circuit open after {kind} failures; retry in {retry_after:.0f}s")
+        self.kind = kind
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    def __init__(
+        self,
+        cooldown_seconds: Optional[float] = None,
+        timeout_threshold: Optional[int] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.cooldown_seconds = float(
+            cooldown_seconds
+            if cooldown_seconds is not None
+            else os.getenv("AI_BREAKER_COOLDOWN_SECONDS", DEFAULT_COOLDOWN_SECONDS)
+        )
+        self.timeout_threshold = int(
+            timeout_threshold
+            if timeout_threshold is not None
+            else os.getenv("AI_BREAKER_TIMEOUT_THRESHOLD", DEFAULT_TIMEOUT_THRESHOLD)
+        )
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.state = CLOSED
+            self.kind: Optional[str] = None
+            self._opened_at = 0.0
+            self._consecutive_timeouts = 0
+            self._probe_in_flight = False
+
+    def before_call(self) -> None:
+        """Raise CircuitOpenError unless this call may go to the provider."""
+        if self.cooldown_seconds <= 0:
+            return
+        with self._lock:
+            if self.state == CLOSED:
+                return
+            remaining = self._opened_at + self.cooldown_seconds - self._clock()
+            if self.state == OPEN and remaining <= 0:
+                self.state = HALF_OPEN
+            if self.state == HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                print(f"AI circuit half-open; probing after {self.kind} failures")
+                return
+            raise CircuitOpenError(self.kind or "unknown", max(remaining, 1.0))
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._consecutive_timeouts = 0
+            self._probe_in_flight = False
+            if self.state != CLOSED:
+                print("AI circuit closed; provider is responding again")
+            self.state = CLOSED
+            self.kind = None
+
+    def record_not_sent(self) -> None:
+        """Forget a call that was let through but never reached the backend.
+
+        State and counters stay as they were; a half-open circuit may send
+        its probe with the next call.
+        """
+        with self._lock:
+            self._probe_in_flight = False
+
+    def record_failure(self, kind: Optional[str]) -> None:
+        """Record a failed call; ``kind`` is None for request-specific errors, NOT_SENT for skipped calls."""
+        if kind == NOT_SENT:
+            self.record_not_sent()
+            return
+        if kind not in TRIP_KINDS:
+            # The provider answered; the problem was the input. That still
+            # proves the backend is reachable.
+            self.record_success()
+            return
+        with self._lock:
+            self._probe_in_flight = False
+            if kind == "timeout" and self.state == CLOSED:
+                self._consecutive_timeouts += 1
+                if self._consecutive_timeouts < self.timeout_threshold:
+                    return
+            self.state = OPEN
+            self.kind = kind
+            self._opened_at = self._clock()
+            self._consecutive_timeouts = 0
+        if self.cooldown_seconds > 0:
+            print(f"AI circuit open for {self.cooldown_seconds:.0f}s after {kind} failure")
+
+
+class GuardedProvider(AIProvider):
+    """Route provider calls through a CircuitBreaker.
+
+    ``failure_kind(error)`` maps an exception to one of TRIP_KINDS, NOT_SENT or None;
+    routes.py supplies it so the breaker agrees with ``_classify_genai_error``.
+    """
+
+    def __init__(self, inner: AIProvider, breaker: CircuitBreaker, failure_kind: Callable[[Exception], Optional[str]]):
+        self.inner = inner
+        self.breaker = breaker
+        self.failure_kind = failure_kind
+        self.name = inner.name
+
+    def prepare(self, *purposes: str) -> None:
+        self.inner.prepare(*purposes)
+
+    def model_name(self, purpose: str) -> str:
+        return self.inner.model_name(purpose)
+
+    def _call(self, call):
+        self.breaker.before_call()
+        try:
+            response = call()
+        except Exception as error:
+            self.breaker.record_failure(self.failure_kind(error))
+            raise
+        self.breaker.record_success()
+        return response
+
+    def extract_menu(self, prompt: str, file_bytes: bytes, mime_type: str, timeout: Optional[float] = None) -> str:
+        return self._call(lambda: self.inner.extract_menu(prompt, file_bytes, mime_type, timeout))
+
+    def classify(self, prompt: str, text: str, timeout: Optional[float] = None) -> str:
+        return self._call(lambda: self.inner.classify(prompt, text, timeout))
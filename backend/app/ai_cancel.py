@@ -0,0 +1,102 @@
+"""
+Stop AI and storage work for requests whose client has gone away.
+
+Closing the tab during /ai/ingest-menu used to leave the server running
+every remaining extraction and per-item call. Each ingest request now
+carries a ``threading.Event`` that is set when the client disconnects:
+
+  - JSON responses: ``cancel_on_disconnect`` polls the ASGI connection
+    while the request is being processed;
+  - streamed responses: Starlette cancels the response body when the
+    client disconnects, and the stream sets the event on the way out.
+
+Work that has not started yet checks the event and is skipped: queued
+extraction parts, per-item classification calls (via CancellableProvider)
+and queued or retried archive uploads. A provider call that is already
+running cannot be interrupted; its result is discarded and counted.
+``stats`` tallies the work saved.
+"""
+import asyncio
+import contextlib
+import os
+import threading
+from typing import Optional
+
+from ai_providers import AIProvider
+
+DEFAULT_POLL_SECONDS = 0.5
+
+stats = {
+    "requests_cancelled": 0,
+    "ai_calls_skipped": 0,
+    "ai_calls_abandoned": 0,
+    "parts_skipped": 0,
+    "items_untagged": 0,
+}
+_stats_lock = threading.Lock()
+
+
+class RequestCancelled(Exception):
+    """The client disconnected before this work started."""
+
+    def __init__(self):
+        super().__init__("client disconnected; request cancelled")
+
+
+def count(name: str, amount: int = 1) -> None:
+    with _stats_lock:
+        stats[name] += amount
+
+
+def snapshot() -> dict:
+    with _stats_lock:
+        return dict(stats)
+
+
+class CancellableProvider(AIProvider):
+    """Refuse new provider calls once ``cancel`` is set."""
+
+    def __init__(self, inner: AIProvider, cancel: threading.Event):
+        self.inner = inner
+        self.cancel = cancel
+        self.name = inner.name
+
+    def prepare(self, *purposes: str) -> None:
+        self.inner.prepare(*purposes)
+
+    def model_name(self, purpose: str) -> str:
+        return self.inner.model_name(purpose)
+
+    def _call(self, call):
+        if self.cancel.is_set():
+            count("ai_calls_skipped")
+            raise RequestCancelled()
+        result = call()
+        if self.cancel.is_set():
+            count("ai_calls_abandoned")
+        return result
+
+    def extract_menu(self, prompt: str, file_bytes: bytes, mime_type: str, timeout: Optional[float] = None) -> str:
+        return self._call(lambda: self.inner.extract_menu(prompt, file_bytes, mime_type, timeout))
+
+    def classify(self, prompt: str, text: str, timeout: Optional[float] = None) -> str:
+        return self._call(lambda: self.inner.classify(prompt, text, timeout))
+
+
+async def _watch(request, cancel: threading.Event, interval: float) -> None:
+    while not cancel.is_set():
+        if await request.is_disconnected():
+            cancel.set()
+            return
+        await asyncio.sleep(interval)
+
+
+@contextlib.asynccontextmanager
+async def cancel_on_disconnect(request, cancel: threading.Event):
+    """Set ``cancel`` if the client disconnects while the block runs."""
+    interval = float(os.getenv("INGEST_DISCONNECT_POLL_SECONDS", DEFAULT_POLL_SECONDS))
+    watcher = asyncio.create_task(_watch(request, cancel, interval))
+    try:
+        yield
+    finally:
+        watcher.cancel()
@@ -0,0 +1,211 @@
+"""
+Record/replay "cassettes" of AI provider calls.
+
+A cassette is a JSONL file with one line per provider call:
+
+    {"op": "extract" | "classify", "key": ..., "prompt": ..., "text": ...,
+     "input_sha256": ..., "mime_type": ..., "response": <raw model text>,
+     "error": {"type": ..., "message": ...} | null, "latency_ms": ...}
+
+``response`` is the model's raw text, so malformed JSON (the cases that hit
+the ``find("{")`` fallback in routes.py) replays exactly as it was seen.
+
+Recording: set AI_RECORD_CASSETTES to a directory. Every request's provider
+is wrapped in a RecordingProvider that writes one cassette per request.
+
+Replay: set AI_PROVIDER=replay and AI_CASSETTE to a cassette file.
+AI_REPLAY_TIMING scales the recorded latency (1 = original timing,
+0 = as fast as possible).
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from typing import List, Optional
+from uuid import uuid4
+
+from ai_providers import AIProvider
+
+_TIMEOUT_ERROR_TYPES = {"TimeoutError", "DeadlineExceeded", "RetryError", "CancelledError"}
+
+
+class CassetteMiss(Exception):
+    """A replayed call has no matching recording."""
+
+
+class ReplayedError(Exception):
+    """Stand-in for a recorded upstream error whose type cannot be rebuilt."""
+
+
+def call_key(op: str, prompt: str, input_sha256: str = "") -> str:
+    h = hashlib.sha256()
+    for part in (op, prompt or "", input_sha256):
+        h.update(part.encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+def load_cassette(path: str) -> List[dict]:
+    with open(path, encoding="utf-8") as handle:
+        return [json.loads(line) for line in handle if line.strip()]
+
+
+class RecordingProvider(AIProvider):
+    """Pass calls through to ``inner`` and append each one to ``path``."""
+
+    def __init__(self, inner: AIProvider, path: str):
+        self.inner = inner
+        self.path = path
+        self.name = inner.name
+        self._lock = threading.Lock()
+
+    def prepare(self, *purposes: str) -> None:
+        self.inner.prepare(*purposes)
+
+    def model_name(self, purpose: str) -> str:
+        return self.inner.model_name(purpose)
+
+    def _record(self, entry: dict, call):
+        started = time.perf_counter()
+        try:
+            response = call()
+        except Exception as error:
+            entry["response"] = None
+            entry["error"] = {"type": type(error).__name__, "message": str(error)}
+            raise
+        else:
+            entry["response"] = response
+            entry["error"] = None
+            return response
+        finally:
+            entry["latency_ms"] = round((time.perf_counter() - started) * 1000, 1)
+            entry["recorded_at"] = time.time()
+            self._write(entry)
+
+    def _write(self, entry: dict) -> None:
+        try:
+            with self._lock:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                with open(self.path, "a", encoding="utf-8") as handle:
+                    handle.write(json.dumps(entry) + "\n")
+        except Exception as write_error:
+            # Recording is a diagnostic aid; it must never break a request.
+            print(f"Error writing AI cassette {self.path}: {write_error}")
+
+    def extract_menu(self, prompt: str, file_bytes: bytes, mime_type: str, timeout: Optional[float] = None) -> str:
+        digest = hashlib.sha256(file_bytes).hexdigest()
+        entry = {
+            "op": "extract",
+            "key": call_key("extract", prompt, digest),
+            "model": self.inner.model_name("ingest"),
+            "prompt": prompt,
+            "input_sha256": digest,
+            "mime_type": mime_type,
+        }
+        return self._record(entry, lambda: self.inner.extract_menu(prompt, file_bytes, mime_type, timeout))
+
+    def classify(self, prompt: str, text: str, timeout: Optional[float] = None) -> str:
+        entry = {
+            "op": "classify",
+            "key": call_key("classify", prompt),
+            "model": self.inner.model_name("parse"),
+            "prompt": prompt,
+            "text": text,
+        }
+        return self._record(entry, lambda: self.inner.classify(prompt, text, timeout))
+
+
+class ReplayProvider(AIProvider):
+    """Serve recorded responses instead of calling a model.
+
+    Calls are matched by key (operation + prompt + input digest). Repeated
+    identical calls consume recordings in order and then keep returning the
+    last one. With ``sequential=True`` a call without an exact match takes
+    the next unused recording of the same operation, which lets benchmarks
+    replay a menu without the original upload bytes.
+    """
+
+    name = "replay"
+
+    def __init__(self, entries: List[dict], timing_scale: float = 1.0, sequential: bool = False):
+        self.timing_scale = timing_scale
+        self.sequential = sequential
+        self._by_key = defaultdict(deque)
+        self._by_op = defaultdict(deque)
+        self._last = {}
+        self._lock = threading.Lock()
+        self._models = {}
+        for entry in entries:
+            self._by_key[entry["key"]].append(entry)
+            self._by_op[entry["op"]].append(entry)
+            purpose = "ingest" if entry["op"] == "extract" else "parse"
+            self._models.setdefault(purpose, entry.get("model") or "recorded")
+
+    @classmethod
+    def from_file(cls, path: str, timing_scale: float = 1.0, sequential: bool = False) -> "ReplayProvider":
+        return cls(load_cassette(path), timing_scale=timing_scale, sequential=sequential)
+
+    def model_name(self, purpose: str) -> str:
+        return f"replay:{self._models.get(purpose, 'recorded')}"
+
+    def _take(self, op: str, key: str) -> dict:
+        with self._lock:
+            queue = self._by_key.get(key)
+            if queue:
+                entry = queue.popleft()
+                self._remove_from_op(op, entry)
+            elif key in self._last:
+                entry = self._last[key]
+            elif self.sequential and self._by_op[op]:
+                entry = self._by_op[op].popleft()
+            else:
+                raise CassetteMiss(f"No recorded {op} call matches this request")
+            self._last[key] = entry
+            return entry
+
+    def _remove_from_op(self, op: str, entry: dict) -> None:
+        try:
+            self._by_op[op].remove(entry)
+        except ValueError:
+            pass
+
+    def _play(self, entry: dict, timeout: Optional[float]) -> str:
+        delay = (entry.get("latency_ms") or 0) / 1000 * self.timing_scale
+        if timeout is not None and delay > timeout:
+            time.sleep(timeout)
+            raise TimeoutError("deadline exceeded (replayed latency)")
+        if delay:
+            time.sleep(delay)
+        error = entry.get("error")
+        if error:
+            raise _rebuild_error(error)
+        return entry.get("response") or ""
+
+    def extract_menu(self, prompt: str, file_bytes: bytes, mime_type: str, timeout: Optional[float] = None) -> str:
+        key = call_key("extract", prompt, hashlib.sha256(file_bytes).hexdigest())
+        return self._play(self._take("extract", key), timeout)
+
+    def classify(self, prompt: str, text: str, timeout: Optional[float] = None) -> str:
+        return self._play(self._take("classify", call_key("classify", prompt)), timeout)
+
+
+def _rebuild_error(error: dict) -> Exception:
+    """Recreate a recorded error so ``_classify_genai_error`` maps it the same way."""
+    type_name, message = error.get("type") or "", error.get("message") or ""
+    if type_name in _TIMEOUT_ERROR_TYPES:
+        return TimeoutError(message or "deadline exceeded")
+    try:
+        from google.api_core import exceptions as gax_exceptions  # type: ignore
+
+        error_type = getattr(gax_exceptions, type_name, None)
+        if isinstance(error_type, type) and issubclass(error_type, Exception):
+            return error_type(message)
+    except Exception:
+        pass
+    return ReplayedError(message)
+
+
+def cassette_path_for_request(directory: str) -> str:
+    return os.path.join(directory, f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid4().hex[:8]}.jsonl")
@@ -0,0 +1,217 @@
+"""
+Latency-aware timeouts and hedged requests for per-item AI classification.
+
+A fixed 30 s timeout lets one slow upstream call add 30 s to an import.
+Hedger keeps a window of recent successful call latencies (shared by all
+requests in the process) and uses it two ways:
+
+  - timeout: p95 x AI_CLASSIFY_TIMEOUT_P95_MULTIPLIER, clamped between
+    AI_CLASSIFY_MIN_TIMEOUT_SECONDS and AI_CLASSIFY_TIMEOUT_SECONDS (which is
+    also the timeout used until enough samples exist).
+  - hedging: if a call is still running at the recent p90, an identical
+    duplicate is sent and whichever succeeds first wins.
+
+Hedges are capped by a budget: every call earns AI_HEDGE_BUDGET tokens (a
+fraction, default 0.1) up to a small burst, and each hedge spends one, so
+hedging adds at most ~10% extra calls however slow the backend gets.
+AI_HEDGE_BUDGET=0 disables hedging.
+
+The window holds upstream latency only: TimedProvider, innermost in the
+provider stack, times the provider call itself, so time queued in the
+scheduler or rate limiter does not inflate timeouts, and each attempt (a
+hedge included) is timed from its own start.
+"""
+import concurrent.futures
+import os
+import threading
+import time
+from collections import deque
+from typing import Callable, Optional
+
+from ai_providers import AIProvider
+
+DEFAULT_TIMEOUT_SECONDS = 30.0
+DEFAULT_MIN_TIMEOUT_SECONDS = 5.0
+DEFAULT_P95_MULTIPLIER = 3.0
+DEFAULT_BUDGET = 0.1
+BUDGET_BURST = 5.0
+MIN_SAMPLES = 20
+WINDOW_SIZE = 200
+
+
+def _setting(value: Optional[float], env_name: str, default: float) -> float:
+    return float(value if value is not None else os.getenv(env_name, default))
+
+
+class LatencyWindow:
+    """The last ``size`` latencies in seconds, thread-safe."""
+
+    def __init__(self, size: int = WINDOW_SIZE):
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def percentile(self, pct: float) -> Optional[float]:
+        with self._lock:
+            ordered = sorted(self._samples)
+        if not ordered:
+            return None
+        index = min(len(ordered) - 1, int(len(ordered) * pct / 100))
+        return ordered[index]
+
+
+class HedgeBudget:
+    """Token bucket that earns ``ratio`` tokens per call and spends one per hedge."""
+
+    def __init__(self, ratio: float, burst: float = BUDGET_BURST):
+        self.ratio = ratio
+        self.burst = burst
+        self._tokens = 0.0
+        self._lock = threading.Lock()
+
+    def on_call(self) -> None:
+        with self._lock:
+            self._tokens = min(self.burst, self._tokens + self.ratio)
+
+    def try_spend(self) -> bool:
+        with self._lock:
+            # Tolerance for accumulated float error (10 x 0.1 < 1.0).
+            if self._tokens >= 1 - 1e-9:
+                self._tokens = max(0.0, self._tokens - 1)
+                return True
+            return False
+
+
+# Per thread: seconds the last TimedProvider call took, for the attempt
+# running on that thread.
+_provider_time = threading.local()
+
+
+class TimedProvider(AIProvider):
+    """Note how long each provider call takes, for the Hedger running it."""
+
+    def __init__(self, inner: AIProvider):
+        self.inner = inner
+        self.name = inner.name
+
+    def prepare(self, *purposes: str) -> None:
+        self.inner.prepare(*purposes)
+
+    def model_name(self, purpose: str) -> str:
+        return self.inner.model_name(purpose)
+
+    def _call(self, call):
+        started = time.perf_counter()
+        result = call()
+        _provider_time.seconds = time.perf_counter() - started
+        return result
+
+    def extract_menu(self, prompt: str, file_bytes: bytes, mime_type: str, timeout: Optional[float] = None) -> str:
+        return self._call(lambda: self.inner.extract_menu(prompt, file_bytes, mime_type, timeout))
+
+    def classify(self, prompt: str, text: str, timeout: Optional[float] = None) -> str:
+        return self._call(lambda: self.inner.classify(prompt, text, timeout))
+
+
+class Hedger:
+    """Adaptive timeout plus budgeted hedging around a blocking call."""
+
+    def __init__(
+        self,
+        max_timeout: Optional[float] = None,
+        min_timeout: Optional[float] = None,
+        p95_multiplier: Optional[float] = None,
+        budget: Optional[float] = None,
+        min_samples: int = MIN_SAMPLES,
+        workers: int = 16,
+    ):
+        self.max_timeout = _setting(max_timeout, "AI_CLASSIFY_TIMEOUT_SECONDS", DEFAULT_TIMEOUT_SECONDS)
+        self.min_timeout = _setting(min_timeout, "AI_CLASSIFY_MIN_TIMEOUT_SECONDS", DEFAULT_MIN_TIMEOUT_SECONDS)
+        self.p95_multiplier = _setting(p95_multiplier, "AI_CLASSIFY_TIMEOUT_P95_MULTIPLIER", DEFAULT_P95_MULTIPLIER)
+        self.budget_ratio = _setting(budget, "AI_HEDGE_BUDGET", DEFAULT_BUDGET)
+        self.min_samples = min_samples
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ai-hedge")
+        self.reset()
+
+    def reset(self) -> None:
+        self.latencies = LatencyWindow()
+        self.budget = HedgeBudget(self.budget_ratio)
+        self.stats = {"calls": 0, "hedged": 0, "hedge_wins": 0, "budget_denied": 0}
+        self._stats_lock = threading.Lock()
+
+    def _count(self, name: str) -> None:
+        with self._stats_lock:
+            self.stats[name] += 1
+
+    def timeout(self) -> float:
+        p95 = self.latencies.percentile(95) if len(self.latencies) >= self.min_samples else None
+        if p95 is None:
+            return self.max_timeout
+        return min(self.max_timeout, max(self.min_timeout, p95 * self.p95_multiplier))
+
+    def hedge_delay(self) -> Optional[float]:
+        if self.budget_ratio <= 0 or len(self.latencies) < self.min_samples:
+            return None
+        return self.latencies.percentile(90)
+
+    @staticmethod
+    def _attempt(fn: Callable[[float], object], timeout: float) -> tuple:
+        """``(result, seconds)``: the provider call's time if a TimedProvider noted it, else the attempt's."""
+        _provider_time.seconds = None
+        started = time.perf_counter()
+        result = fn(timeout)
+        seconds = _provider_time.seconds
+        return result, time.perf_counter() - started if seconds is None else seconds
+
+    def call(self, fn: Callable[[float], object]):
+        """Run ``fn(timeout)``, hedging it once if it outlives the recent p90."""
+        timeout = self.timeout()
+        delay = self.hedge_delay()
+        self.budget.on_call()
+        self._count("calls")
+        started = time.perf_counter()
+
+        if delay is None:
+            result, seconds = self._attempt(fn, timeout)
+            self.latencies.record(seconds)
+            return result
+
+        primary = self._executor.submit(self._attempt, fn, timeout)
+        done, _ = concurrent.futures.wait([primary], timeout=delay)
+        futures = [primary]
+        if not done:
+            if self.budget.try_spend():
+                self._count("hedged")
+                futures.append(self._executor.submit(self._attempt, fn, max(timeout - delay, 0.1)))
+            else:
+                self._count("budget_denied")
+
+        first_error = None
+        pending = set(futures)
+        # Each call enforces its own timeout; the grace second covers slack.
+        deadline = started + timeout + 1
+        while pending:
+            done, pending = concurrent.futures.wait(
+                pending,
+                timeout=max(0.0, deadline - time.perf_counter()),
+                return_when=concurrent.futures.FIRST_COMPLETED,
+            )
+            if not done:
+                break
+            for future in done:
+                if future.exception() is None:
+                    result, seconds = future.result()
+                    self.latencies.record(seconds)
+                    if future is not primary:
+                        self._count("hedge_wins")
+                    return result
+                first_error = first_error or future.exception()
+        if first_error is not None:
+            raise first_error
+        raise TimeoutError(f"deadline exceeded after {timeout:.1f}s (adaptive timeout)")
@@ -0,0 +1,301 @@
+"""
+AI provider abstraction for menu extraction and ingredient classification.
+
+The AI endpoints only need two operations: extract menu items from an
+uploaded file, and classify a free-text ingredient list. Providers return the
+model's raw text; prompt construction and JSON parsing stay in routes.py so
+every provider gets the same tolerant parsing.
+
+Select a provider with AI_PROVIDER:
+  - "gemini" (default): Google Gemini via google-generativeai.
+  - "stub": deterministic local provider for offline tests and benchmarks.
+    It needs no network or API key. Latency, errors and quota exhaustion can
+    be injected with the AI_STUB_* variables (see StubProvider).
+  - "replay": serve responses from a recorded cassette (see ai_cassettes).
+
+AI_RECORD_CASSETTES wraps the selected provider so every request's calls
+are recorded for later replay.
+"""
+import hashlib
+import io
+import json
+import os
+import random
+import threading
+import time
+from typing import Callable, Optional
+
+try:
+    from google.generativeai.types import RequestOptions
+except Exception:
+    RequestOptions = None
+
+try:
+    from pypdf import PdfReader
+except Exception:
+    PdfReader = None
+
+
+class AIProvider:
+    """Interface implemented by every provider.
+
+    ``extract_menu`` and ``classify`` are blocking calls; the endpoints run
+    them in worker threads. Errors are raised as-is so that
+    ``_classify_genai_error`` can map them to user-facing messages.
+    """
+
+    name = "base"
+
+    def prepare(self, *purposes: str) -> None:
+        """Fail fast on configuration problems before any upload is read."""
+
+    def model_name(self, purpose: str) -> str:
+        """Model used for ``purpose`` ("ingest" or "parse"); part of cache keys."""
+        raise NotImplementedError
+
+    def extract_menu(self, prompt: str, file_bytes: bytes, mime_type: str, timeout: Optional[float] = None) -> str:
+        raise NotImplementedError
+
+    def classify(self, prompt: str, text: str, timeout: Optional[float] = None) -> str:
+        raise NotImplementedError
+
+
+class GeminiProvider(AIProvider):
+    """Gemini through ``google.generativeai``.
+
+    ``build_model(purpose, model_name)`` and ``select_model_name(purpose)``
+    are injected by routes.py so SDK configuration (API key, model
+    discovery) lives in one place.
+    """
+
+    name = "gemini"
+
+    def __init__(self, build_model: Callable, select_model_name: Callable):
+        self._build_model = build_model
+        self._select_model_name = select_model_name
+        self._names: dict = {}
+        self._models: dict = {}
+
+    def model_name(self, purpose: str) -> str:
+        if purpose not in self._names:
+            self._names[purpose] = self._select_model_name(purpose)
+        return self._names[purpose]
+
+    def _model(self, purpose: str):
+        if purpose not in self._models:
+            self._models[purpose] = self._build_model(purpose, self.model_name(purpose))
+        return self._models[purpose]
+
+    def prepare(self, *purposes: str) -> None:
+        for purpose in purposes:
+            self._model(purpose)
+
+    def _request_kwargs(self, timeout: Optional[float]) -> dict:
+        if timeout is None or RequestOptions is None:
+            return {}
+        return {"request_options": RequestOptions(timeout=timeout)}
+
+    def extract_menu(self, prompt: str, file_bytes: bytes, mime_type: str, timeout: Optional[float] = None) -> str:
+        response = self._model("ingest").generate_content(
+            [prompt, {"mime_type": mime_type, "data": file_bytes}],
+            **self._request_kwargs(timeout),
+        )
+        return response.text or ""
+
+    def classify(self, prompt: str, text: str, timeout: Optional[float] = None) -> str:
+        response = self._model("parse").generate_content(prompt, **self._request_kwargs(timeout))
+        if response is None:
+            return ""
+        return getattr(response, "text", None) or ""
+
+
+class StubQuotaError(Exception):
+    """Raised by StubProvider once its call quota is used up (reads like a 429)."""
+
+
+class StubServiceError(Exception):
+    """Injected transient upstream failure (reads like a 503)."""
+
+
+# Tiny keyword tables so stub classifications look plausible to the pipeline.
+_STUB_ALLERGEN_KEYWORDS = {
+    "milk": ("milk", "cheese", "butter", "cream", "mozzarella", "parmesan", "yogurt", "whey"),
+    "eggs": ("egg", "mayonnaise", "aioli"),
+    "fish": ("fish", "salmon", "tuna", "anchov", "cod"),
+    "shellfish": ("shrimp", "crab", "lobster", "prawn"),
+    "tree_nuts": ("almond", "walnut", "pecan", "cashew", "pistachio"),
+    "peanuts": ("peanut",),
+    "wheat": ("flour", "bread", "pasta", "dough", "bun", "noodle", "crouton"),
+    "soybeans": ("soy", "tofu", "edamame"),
+    "sesame": ("sesame", "tahini"),
+}
+_STUB_MEAT_KEYWORDS = ("chicken", "beef", "pork", "bacon", "ham", "prosciutto", "sausage", "turkey")
+_STUB_DISHES = (
+    "Margherita Pizza", "Caesar Salad", "Chicken Sandwich", "Salmon Bowl", "Pad Thai",
+    "Veggie Burger", "Shrimp Tacos", "Tomato Soup", "Pesto Pasta", "Fruit Cup",
+)
+_STUB_INGREDIENTS = (
+    "mozzarella", "tomato", "basil", "romaine", "parmesan", "croutons", "chicken", "bread",
+    "salmon", "rice", "peanuts", "rice noodles", "egg", "black beans", "bun", "shrimp",
+    "tortilla", "cream", "pasta", "pine nuts", "melon", "sesame seeds", "tofu", "soy sauce",
+)
+
+
+class StubProvider(AIProvider):
+    """Deterministic offline provider.
+
+    Extraction returns ``items_per_page`` items per PDF page (or per image),
+    chosen from the file's hash, so the same upload always yields the same
+    menu. Classification tags the ingredient text with keyword rules.
+
+    Fault injection (constructor arguments or environment):
+      - AI_STUB_LATENCY_MS / AI_STUB_JITTER_MS: per-call latency. A call
+        whose latency exceeds its timeout sleeps for the timeout and raises
+        TimeoutError, like a real deadline.
+      - AI_STUB_TAIL_RATE / AI_STUB_TAIL_MS: fraction of calls that take
+        an extra AI_STUB_TAIL_MS, to model a long latency tail.
+      - AI_STUB_ERROR_RATE: fraction of calls failing with a 503-style error.
+      - AI_STUB_QUOTA: calls allowed before every call fails with a 429
+        quota error (unset = unlimited).
+      - AI_STUB_SEED: seed for jitter and error draws, so runs repeat.
+      - AI_STUB_ITEMS_PER_PAGE: items extracted per page/image.
+    """
+
+    name = "stub"
+
+    def __init__(
+        self,
+        latency_ms: Optional[float] = None,
+        jitter_ms: Optional[float] = None,
+        error_rate: Optional[float] = None,
+        quota: Optional[int] = None,
+        seed: Optional[int] = None,
+        items_per_page: Optional[int] = None,
+        tail_rate: Optional[float] = None,
+        tail_ms: Optional[float] = None,
+    ):
+        env = os.getenv
+        self.latency_ms = float(latency_ms if latency_ms is not None else env("AI_STUB_LATENCY_MS", 0))
+        self.jitter_ms = float(jitter_ms if jitter_ms is not None else env("AI_STUB_JITTER_MS", 0))
+        self.error_rate = float(error_rate if error_rate is not None else env("AI_STUB_ERROR_RATE", 0))
+        self.tail_rate = float(tail_rate if tail_rate is not None else env("AI_STUB_TAIL_RATE", 0))
+        self.tail_ms = float(tail_ms if tail_ms is not None else env("AI_STUB_TAIL_MS", 0))
+        quota_env = env("AI_STUB_QUOTA")
+        self.quota = quota if quota is not None else (int(quota_env) if quota_env else None)
+        self.items_per_page = int(items_per_page or env("AI_STUB_ITEMS_PER_PAGE", 6))
+        self._random = random.Random(seed if seed is not None else int(env("AI_STUB_SEED", 0)))
+        self._lock = threading.Lock()
+        self.calls = 0
+
+    def model_name(self, purpose: str) -> str:
+        return f"stub-{purpose}"
+
+    def _simulate_call(self, timeout: Optional[float]) -> None:
+        with self._lock:
+            self.calls += 1
+            calls = self.calls
+            latency = max(0.0, self.latency_ms + self._random.uniform(-self.jitter_ms, self.jitter_ms)) / 1000
+            if self.tail_rate and self._random.random() < self.tail_rate:
+                latency += self.tail_ms / 1000
+            failed = self._random.random() < self.error_rate
+
+        if self.quota is not None and calls > self.quota:
+            raise StubQuotaError("429 Resource has been exhausted (stub quota exceeded)")
+        if timeout is not None and latency > timeout:
+            time.sleep(timeout)
+            raise TimeoutError("deadline exceeded (stub)")
+        if latency:
+            time.sleep(latency)
+        if failed:
+            raise StubServiceError("503 The service is currently unavailable (stub)")
+
+    def _page_count(self, file_bytes: bytes, mime_type: str) -> int:
+        if mime_type == "application/pdf" and PdfReader is not None:
+            try:
+                return max(1, len(PdfReader(io.BytesIO(file_bytes)).pages))
+            except Exception:
+                pass
+        return 1
+
+    def extract_menu(self, prompt: str, file_bytes: bytes, mime_type: str, timeout: Optional[float] = None) -> str:
+        self._simulate_call(timeout)
+        seed = int.from_bytes(hashlib.sha256(file_bytes).digest()[:8], "big")
+        rng = random.Random(seed)
+        items = []
+        for index in range(self._page_count(file_bytes, mime_type) * self.items_per_page):
+            dish = _STUB_DISHES[rng.randrange(len(_STUB_DISHES))]
+            items.append(
+                {
+                    "name": f"{dish} #{seed % 1000}-{index + 1}",
+                    "description": "",
+                    "price": round(rng.uniform(4, 30), 2),
+                    "ingredients": rng.sample(_STUB_INGREDIENTS, 4),
+                }
+            )
+        return json.dumps({"items": items})
+
+    def classify(self, prompt: str, text: str, timeout: Optional[float] = None) -> str:
+        self._simulate_call(timeout)
+        lowered = (text or "").lower()
+        allergens = [
+            allergen
+            for allergen, keywords in _STUB_ALLERGEN_KEYWORDS.items()
+            if any(keyword in lowered for keyword in keywords)
+        ]
+        has_meat = any(keyword in lowered for keyword in _STUB_MEAT_KEYWORDS)
+        has_seafood = "fish" in allergens or "shellfish" in allergens
+        dietary = []
+        if not has_meat and not has_seafood:
+            dietary.append("vegetarian")
+            if "milk" not in allergens and "eggs" not in allergens:
+                dietary.insert(0, "vegan")
+        return json.dumps(
+            {
+                "allergens": allergens,
+                "dietaryCategories": dietary,
+                "extractedIngredients": [part.strip() for part in (text or "").split(",") if part.strip()],
+            }
+        )
+
+
+_shared_stub: Optional[StubProvider] = None
+
+
+def configure_stub(**options) -> StubProvider:
+    """Replace the process-wide stub (e.g. to inject faults in a benchmark)."""
+    global _shared_stub
+    _shared_stub = StubProvider(**options)
+    return _shared_stub
+
+
+def create_provider(name: Optional[str] = None, **gemini_hooks) -> AIProvider:
+    """Build the provider selected by ``name`` or AI_PROVIDER.
+
+    The stub is shared by all requests so call counts (and therefore quota
+    injection) span requests like a real account quota does.
+    """
+    name = (name or os.getenv("AI_PROVIDER") or "gemini").strip().lower()
+    if name == "stub":
+        provider = _shared_stub or configure_stub()
+    elif name == "gemini":
+        provider = GeminiProvider(**gemini_hooks)
+    elif name == "replay":
+        provider = _replay_provider()
+    else:
+        raise ValueError(f"Unknown AI_PROVIDER: {name}")
+
+    record_dir = os.getenv("AI_RECORD_CASSETTES")
+    if record_dir and name != "replay":
+        import ai_cassettes
+
+        provider = ai_cassettes.RecordingProvider(provider, ai_cassettes.cassette_path_for_request(record_dir))
+    return provider
+
+
+def _replay_provider() -> AIProvider:
+    import ai_cassettes
+
+    path = os.getenv("AI_CASSETTE")
+    if not path or not os.path.exists(path):
+        raise ValueError("AI_PROVIDER=replay needs AI_CASSETTE pointing at a recorded cassette")
+    return ai_cassettes.ReplayProvider.from_file(path, timing_scale=float(os.getenv("AI_REPLAY_TIMING", 1)))
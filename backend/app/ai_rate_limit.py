@@ -0,0 +1,211 @@
+"""
+Token-bucket rate limiter shared by every AI call in every worker process.
+
+Gemini's free tier allows a fixed number of requests per minute. Bursts
+of imports used to go straight through and come back as 429s. Now each
+call takes a token first. When the bucket is empty the call reserves the
+next token and sleeps until it is due, so bursts are spread out instead of
+rejected. A call that would have to wait longer than its deadline fails at
+once with RateLimitTimeout (a 503 with Retry-After), without touching the
+provider.
+
+The bucket lives in a small JSON file guarded by ``fcntl.flock``, so all
+uvicorn workers on a host draw from the same budget. Without fcntl
+(Windows) it falls back to a per-process bucket.
+
+Settings (read on every call so they can be changed without a restart):
+  - AI_RATE_LIMIT_RPM: sustained requests per minute (default 15; 0 = off).
+  - AI_RATE_LIMIT_BURST: tokens that can accumulate while idle (default 5).
+  - AI_RATE_LIMIT_MAX_WAIT_SECONDS: longest a call may queue (default 60);
+    calls with their own timeout queue for at most half of it.
+  - AI_RATE_LIMIT_STATE_FILE: bucket file (default in the temp directory).
+"""
+import contextlib
+import json
+import math
+import os
+import tempfile
+import threading
+import time
+from typing import Callable, Optional
+
+try:
+    import fcntl
+except Exception:
+    fcntl = None
+
+from ai_hedging import LatencyWindow
+from ai_providers import AIProvider
+
+DEFAULT_RPM = 15
+DEFAULT_BURST = 5
+DEFAULT_MAX_WAIT_SECONDS = 60
+
+
+class RateLimitTimeout(Exception):
+    """The wait for a token would exceed the caller's deadline."""
+
+    def __init__(self, wait_seconds: float):
+        super().__init__(f"AI request rate limit: next slot in {wait_seconds:.0f}s exceeds the deadline")
+        self.retry_after = wait_seconds
+
+
+class TokenBucket:
+    def __init__(
+        self,
+        rpm: Optional[float] = None,
+        burst: Optional[float] = None,
+        max_wait: Optional[float] = None,
+        state_path: Optional[str] = None,
+        clock: Callable[[], float] = time.time,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        self._rpm = rpm
+        self._burst = burst
+        self._max_wait = max_wait
+        self._state_path = state_path
+        self._clock = clock
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        self._memory_state: dict = {}
+        self.reset_metrics()
+
+    def reset_metrics(self) -> None:
+        self.waits = LatencyWindow()
+        self.stats = {"acquired": 0, "queued": 0, "rejected": 0, "waiting": 0, "max_waiting": 0}
+
+    def _setting(self, value: Optional[float], env_name: str, default: float) -> float:
+        return float(value if value is not None else os.getenv(env_name, default))
+
+    @property
+    def rpm(self) -> float:
+        return self._setting(self._rpm, "AI_RATE_LIMIT_RPM", DEFAULT_RPM)
+
+    @property
+    def burst(self) -> float:
+        return max(1.0, self._setting(self._burst, "AI_RATE_LIMIT_BURST", DEFAULT_BURST))
+
+    @property
+    def max_wait(self) -> float:
+        return self._setting(self._max_wait, "AI_RATE_LIMIT_MAX_WAIT_SECONDS", DEFAULT_MAX_WAIT_SECONDS)
+
+    @property
+    def state_path(self) -> str:
+        return self._state_path or os.getenv("AI_RATE_LIMIT_STATE_FILE") or os.path.join(
+            tempfile.gettempdir(), "safeeats-ai-rate-limit.json"
+        )
+
+    @contextlib.contextmanager
+    def _state(self):
+        """Yield the bucket state dict, locked across threads and processes."""
+        with self._lock:
+            if fcntl is None:
+                yield self._memory_state
+                return
+            with open(self.state_path, "a+", encoding="utf-8") as handle:
+                fcntl.flock(handle, fcntl.LOCK_EX)
+                try:
+                    handle.seek(0)
+                    try:
+                        state = json.loads(handle.read() or "{}")
+                    except ValueError:
+                        state = {}
+                    yield state
+                    handle.seek(0)
+                    handle.truncate()
+                    handle.write(json.dumps(state))
+                    handle.flush()
+                finally:
+                    fcntl.flock(handle, fcntl.LOCK_UN)
+
+    def _refill(self, state: dict, now: float, rate: float) -> float:
+        burst = self.burst
+        tokens = state.get("tokens", burst)
+        elapsed = max(0.0, now - state.get("updated", now))
+        return min(burst, tokens + elapsed * rate)
+
+    def _reserve(self, max_wait: float) -> float:
+        """Take a token (possibly one not yet earned) and return the wait for it."""
+        rate = self.rpm / 60
+        with self._state() as state:
+            now = self._clock()
+            tokens = self._refill(state, now, rate)
+            wait = 0.0 if tokens >= 1 else (1 - tokens) / rate
+            state["updated"] = now
+            if wait > max_wait:
+                state["tokens"] = tokens
+                raise RateLimitTimeout(wait)
+            # Negative tokens are reservations by callers still sleeping.
+            state["tokens"] = tokens - 1
+            return wait
+
+    def _count(self, name: str, delta: int = 1) -> None:
+        with self._lock:
+            self.stats[name] += delta
+            self.stats["max_waiting"] = max(self.stats["max_waiting"], self.stats["waiting"])
+
+    def acquire(self, deadline: Optional[float] = None) -> float:
+        """Block until a token is available; returns the seconds waited."""
+        if self.rpm <= 0:
+            return 0.0
+        max_wait = self.max_wait if deadline is None else min(self.max_wait, deadline)
+        try:
+            wait = self._reserve(max_wait)
+        except RateLimitTimeout:
+            self._count("rejected")
+            raise
+        if wait > 0:
+            self._count("queued")
+            self._count("waiting")
+            try:
+                self._sleep(wait)
+            finally:
+                self._count("waiting", -1)
+        self._count("acquired")
+        self.waits.record(wait)
+        return wait
+
+    def metrics(self) -> dict:
+        """In-process counters plus the shared queue depth and wait percentiles."""
+        depth = 0
+        if self.rpm > 0:
+            with self._state() as state:
+                tokens = self._refill(state, self._clock(), self.rpm / 60)
+            depth = max(0, math.ceil(-tokens))
+        return {
+            "rpm": self.rpm,
+            "queue_depth": depth,
+            "wait_p50_ms": round((self.waits.percentile(50) or 0) * 1000, 1),
+            "wait_p95_ms": round((self.waits.percentile(95) or 0) * 1000, 1),
+            **self.stats,
+        }
+
+
+class RateLimitedProvider(AIProvider):
+    """Take a token from ``bucket`` before every provider call.
+
+    Time spent queueing comes out of the call's own timeout. A call may
+    queue for at most half of that timeout, so it still has a useful
+    budget left when it runs.
+    """
+
+    def __init__(self, inner: AIProvider, bucket: TokenBucket):
+        self.inner = inner
+        self.bucket = bucket
+        self.name = inner.name
+
+    def prepare(self, *purposes: str) -> None:
+        self.inner.prepare(*purposes)
+
+    def model_name(self, purpose: str) -> str:
+        return self.inner.model_name(purpose)
+
+    def _acquire(self, timeout: Optional[float]) -> Optional[float]:
+        waited = self.bucket.acquire(None if timeout is None else timeout / 2)
+        return None if timeout is None else timeout - waited
+
+    def extract_menu(self, prompt: str, file_bytes: bytes, mime_type: str, timeout: Optional[float] = None) -> str:
+        return self.inner.extract_menu(prompt, file_bytes, mime_type, self._acquire(timeout))
+
+    def classify(self, prompt: str, text: str, timeout: Optional[float] = None) -> str:
+        return self.inner.classify(prompt, text, self._acquire(timeout))
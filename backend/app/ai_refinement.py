@@ -0,0 +1,156 @@
+"""
+Background AI refinements for speculative /ai/parse-ingredients requests.
+
+A speculative parse answers at once with the local ``ingredient_parser``
+tags (marked provisional) and starts the Gemini call in the background.
+The client collects the AI result from
+``GET /ai/parse-ingredients/{refinement_id}``, which can long-poll.
+
+Refinements run on a small thread pool (AI_REFINEMENT_WORKERS, default 4)
+rather than as asyncio tasks, so they outlive the request that started
+them; the AI scheduler and rate limiter still apply to the call itself.
+Results are kept for AI_REFINEMENT_TTL_SECONDS (default 300) and at most
+AI_REFINEMENT_MAX_ENTRIES (default 1000) are held; the oldest go first,
+and a pruned refinement that has not started yet is cancelled.
+Only the user who started a refinement can read it.
+
+The pool's queue is bounded too: at most AI_REFINEMENT_MAX_PENDING
+(default 16) refinements may be unfinished, AI_REFINEMENT_MAX_PENDING_PER_USER
+(default 2) per user, and each holds one of its user's AI admission slots
+until it finishes. ``start`` returns None when a refinement cannot be
+queued; the caller then makes the AI call in the request instead.
+"""
+import concurrent.futures
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Optional
+
+import ai_admission
+
+DEFAULT_WORKERS = 4
+DEFAULT_TTL_SECONDS = 300
+DEFAULT_MAX_ENTRIES = 1000
+DEFAULT_MAX_PENDING = 16
+DEFAULT_MAX_PENDING_PER_USER = 2
+
+
+class RefinementStore:
+    def __init__(
+        self,
+        workers: Optional[int] = None,
+        clock: Callable[[], float] = time.monotonic,
+        admission: Optional[ai_admission.AdmissionController] = None,
+    ):
+        self.workers = workers or int(os.getenv("AI_REFINEMENT_WORKERS", DEFAULT_WORKERS))
+        self.clock = clock
+        self.admission = admission or ai_admission.admission
+        self._executor: Optional[concurrent.futures.ThreadPoolExecutor] = None
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._pending = 0
+        self._pending_per_owner: dict = {}
+        self._lock = threading.Lock()
+        self.stats = {
+            "started": 0, "completed": 0, "failed": 0, "cancelled": 0, "expired": 0, "rejected": 0,
+        }
+
+    @property
+    def ttl_seconds(self) -> float:
+        return float(os.getenv("AI_REFINEMENT_TTL_SECONDS", DEFAULT_TTL_SECONDS))
+
+    @property
+    def max_entries(self) -> int:
+        return int(os.getenv("AI_REFINEMENT_MAX_ENTRIES", DEFAULT_MAX_ENTRIES))
+
+    @property
+    def max_pending(self) -> int:
+        return int(os.getenv("AI_REFINEMENT_MAX_PENDING", DEFAULT_MAX_PENDING))
+
+    @property
+    def max_pending_per_user(self) -> int:
+        return int(os.getenv("AI_REFINEMENT_MAX_PENDING_PER_USER", DEFAULT_MAX_PENDING_PER_USER))
+
+    def _prune(self, now: float) -> list:
+        """Drop expired and excess entries; returns their futures for the caller to cancel."""
+        dropped = []
+        while self._entries:
+            _, (_, future, created) = next(iter(self._entries.items()))
+            if now - created <= self.ttl_seconds and len(self._entries) <= self.max_entries:
+                break
+            self._entries.popitem(last=False)
+            self.stats["expired"] += 1
+            dropped.append(future)
+        return dropped
+
+    @staticmethod
+    def _cancel(futures: list) -> None:
+        # Outside the lock: cancelling runs the done callbacks, which take it.
+        # Refinements already running cannot be cancelled and finish normally.
+        for future in futures:
+            future.cancel()
+
+    def start(self, owner: str, fn: Callable[[], dict]) -> Optional[str]:
+        """Run ``fn`` in the background and return the id to collect it with.
+
+        Returns None, without running ``fn``, when the pending caps or the
+        owner's admission slots are used up.
+        """
+        with self._lock:
+            if (
+                self._pending >= self.max_pending
+                or self._pending_per_owner.get(owner, 0) >= self.max_pending_per_user
+            ):
+                self.stats["rejected"] += 1
+                return None
+            if self.admission.try_admit(owner, 0) is not None:
+                self.stats["rejected"] += 1
+                return None
+            if self._executor is None:
+                self._executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=self.workers, thread_name_prefix="ai-refine"
+                )
+            refinement_id = secrets.token_urlsafe(12)
+            future = self._executor.submit(fn)
+            now = self.clock()
+            self._entries[refinement_id] = (owner, future, now)
+            self._pending += 1
+            self._pending_per_owner[owner] = self._pending_per_owner.get(owner, 0) + 1
+            self.stats["started"] += 1
+            dropped = self._prune(now)
+        self._cancel(dropped)
+        # Outside the lock: the callback runs at once if ``fn`` already finished.
+        future.add_done_callback(lambda done: self._finish(owner, done))
+        return refinement_id
+
+    def _finish(self, owner: str, future: concurrent.futures.Future) -> None:
+        with self._lock:
+            if future.cancelled():
+                self.stats["cancelled"] += 1
+            else:
+                self.stats["failed" if future.exception() is not None else "completed"] += 1
+            self._pending -= 1
+            remaining = self._pending_per_owner.get(owner, 1) - 1
+            if remaining > 0:
+                self._pending_per_owner[owner] = remaining
+            else:
+                self._pending_per_owner.pop(owner, None)
+        self.admission.release(owner, 0)
+
+    def get(self, refinement_id: str, owner: str) -> Optional[concurrent.futures.Future]:
+        """The refinement's future, or None if unknown, expired or not ``owner``'s."""
+        with self._lock:
+            dropped = self._prune(self.clock())
+            entry = self._entries.get(refinement_id)
+        self._cancel(dropped)
+        if entry is None or entry[0] != owner:
+            return None
+        return entry[1]
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {"held": len(self._entries), "pending": self._pending, **self.stats}
+
+
+refinements = RefinementStore()
@@ -0,0 +1,191 @@
+"""
+Priority scheduling of AI calls with per-restaurant fair share.
+
+Every AI call needs one of AI_MAX_CONCURRENT_CALLS slots (default 8; 0 =
+unlimited). A call that finds no free slot queues, and each freed slot
+goes to the waiter with:
+
+  1. the most urgent priority class: INTERACTIVE (a staff member waiting on
+     "parse ingredients") before BULK (menu ingestion) before BACKGROUND
+     (speculative parse refinements, whose user already has local tags);
+  2. within that class, the next restaurant in round-robin order, so one
+     restaurant's 80-item import cannot starve another restaurant's. A
+     request is keyed by its restaurant only if the caller may edit that
+     restaurant's menu, otherwise by the user.
+
+Slots are taken before the rate limiter's tokens, so the per-minute budget
+is also handed out in priority order. A call queues for at most half of its
+timeout (or AI_RATE_LIMIT_MAX_WAIT_SECONDS), after which it fails with
+SchedulerBusy, the same "busy, tag manually" 503 as the rate limiter.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Optional
+
+from ai_hedging import LatencyWindow
+from ai_providers import AIProvider
+from ai_rate_limit import DEFAULT_MAX_WAIT_SECONDS, RateLimitTimeout
+
+INTERACTIVE = 0
+BULK = 1
+BACKGROUND = 2
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BULK: "bulk", BACKGROUND: "background"}
+
+DEFAULT_MAX_CONCURRENT = 8
+
+
+class SchedulerBusy(RateLimitTimeout):
+    """No call slot became free before the caller's deadline."""
+
+    def __init__(self, waited: float):
+        Exception.__init__(self, f"AI scheduler: no call slot free after {waited:.1f}s")
+        self.retry_after = 5.0
+
+
+class _Waiter:
+    __slots__ = ("event", "granted")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.granted = False
+
+
+class AIScheduler:
+    def __init__(self, max_concurrent: Optional[int] = None, max_wait: Optional[float] = None):
+        self._max_concurrent = max_concurrent
+        self._max_wait = max_wait
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        # priority -> OrderedDict(tenant -> deque of waiters); tenants rotate
+        # to the back after each grant.
+        self._queues = {priority: OrderedDict() for priority in PRIORITY_NAMES}
+        self.reset_metrics()
+
+    def reset_metrics(self) -> None:
+        self.waits = {priority: LatencyWindow() for priority in PRIORITY_NAMES}
+        self.stats = {"granted": 0, "queued": 0, "rejected": 0}
+
+    @property
+    def max_concurrent(self) -> int:
+        if self._max_concurrent is not None:
+            return self._max_concurrent
+        return int(os.getenv("AI_MAX_CONCURRENT_CALLS", DEFAULT_MAX_CONCURRENT))
+
+    @property
+    def max_wait(self) -> float:
+        if self._max_wait is not None:
+            return self._max_wait
+        return float(os.getenv("AI_RATE_LIMIT_MAX_WAIT_SECONDS", DEFAULT_MAX_WAIT_SECONDS))
+
+    def _has_waiters(self) -> bool:
+        return any(self._queues.values())
+
+    def acquire(self, priority: int, tenant: str, deadline: Optional[float] = None) -> float:
+        """Block until a call slot is granted; returns the seconds waited."""
+        started = time.perf_counter()
+        limit = self.max_concurrent
+        with self._lock:
+            if limit <= 0 or (self._in_flight < limit and not self._has_waiters()):
+                self._in_flight += 1
+                self.stats["granted"] += 1
+                self.waits[priority].record(0.0)
+                return 0.0
+            waiter = _Waiter()
+            self._queues[priority].setdefault(tenant, deque()).append(waiter)
+            self.stats["queued"] += 1
+
+        max_wait = self.max_wait if deadline is None else min(self.max_wait, deadline)
+        waiter.event.wait(max_wait)
+        waited = time.perf_counter() - started
+        with self._lock:
+            if not waiter.granted:
+                self._remove(priority, tenant, waiter)
+                self.stats["rejected"] += 1
+                raise SchedulerBusy(waited)
+            self.stats["granted"] += 1
+        self.waits[priority].record(waited)
+        return waited
+
+    def release(self) -> None:
+        with self._lock:
+            waiter = self._next_waiter()
+            if waiter is None:
+                self._in_flight -= 1
+                return
+            # Hand the slot straight to the waiter; in-flight count is unchanged.
+            waiter.granted = True
+            waiter.event.set()
+
+    def _next_waiter(self) -> Optional[_Waiter]:
+        for priority in sorted(self._queues):
+            tenants = self._queues[priority]
+            if tenants:
+                tenant, waiters = next(iter(tenants.items()))
+                waiter = waiters.popleft()
+                if waiters:
+                    tenants.move_to_end(tenant)
+                else:
+                    del tenants[tenant]
+                return waiter
+        return None
+
+    def _remove(self, priority: int, tenant: str, waiter: _Waiter) -> None:
+        waiters = self._queues[priority].get(tenant)
+        if waiters is None:
+            return
+        try:
+            waiters.remove(waiter)
+        except ValueError:
+            return
+        if not waiters:
+            del self._queues[priority][tenant]
+
+    def metrics(self) -> dict:
+        with self._lock:
+            depth = {
+                PRIORITY_NAMES[priority]: sum(len(waiters) for waiters in tenants.values())
+                for priority, tenants in self._queues.items()
+            }
+            in_flight = self._in_flight
+        return {
+            "max_concurrent": self.max_concurrent,
+            "in_flight": in_flight,
+            "queue_depth": depth,
+            "wait_p95_ms": {
+                PRIORITY_NAMES[priority]: round((window.percentile(95) or 0) * 1000, 1)
+                for priority, window in self.waits.items()
+            },
+            **self.stats,
+        }
+
+
+class ScheduledProvider(AIProvider):
+    """Hold a scheduler slot for the duration of every provider call."""
+
+    def __init__(self, inner: AIProvider, scheduler: AIScheduler, priority: int, tenant: str):
+        self.inner = inner
+        self.scheduler = scheduler
+        self.priority = priority
+        self.tenant = tenant
+        self.name = inner.name
+
+    def prepare(self, *purposes: str) -> None:
+        self.inner.prepare(*purposes)
+
+    def model_name(self, purpose: str) -> str:
+        return self.inner.model_name(purpose)
+
+    def _call(self, timeout: Optional[float], call):
+        waited = self.scheduler.acquire(self.priority, self.tenant, None if timeout is None else timeout / 2)
+        try:
+            return call(None if timeout is None else timeout - waited)
+        finally:
+            self.scheduler.release()
+
+    def extract_menu(self, prompt: str, file_bytes: bytes, mime_type: str, timeout: Optional[float] = None) -> str:
+        return self._call(timeout, lambda remaining: self.inner.extract_menu(prompt, file_bytes, mime_type, remaining))
+
+    def classify(self, prompt: str, text: str, timeout: Optional[float] = None) -> str:
+        return self._call(timeout, lambda remaining: self.inner.classify(prompt, text, remaining))
@@ -0,0 +1,103 @@
+"""
+Allergen and dietary tags as integer bitmasks.
+
+Tag lists travel through the API and the database as sorted lists of ids,
+but combining them (the parser's union over sub-ingredients, merging parser
+tags into manual ones, the ``allergen_free`` filter) is set algebra, done
+here with one ``|`` / ``&`` / ``~`` on ints instead of building sets and
+sorting them again on every call.
+
+Bit ``i`` of a mask is the ``i``-th name of its ``TagCodec`` in sorted
+order, so decoding a mask yields the sorted list the API returns. The bit
+layout is only an in-process representation and is never stored.
+"""
+import threading
+from typing import Iterable, List, Tuple
+
+VALID_ALLERGENS = {
+    "milk",
+    "eggs",
+    "fish",
+    "tree_nuts",
+    "wheat",
+    "shellfish",
+    "gluten_free",
+    "peanuts",
+    "soybeans",
+    "sesame",
+}
+
+VALID_DIETARY_CATEGORIES = {"vegan", "vegetarian"}
+
+# What ingredient_parser reports: the local rules can rule a diet out but
+# never confirm one.
+PARSER_DIETARY_FLAGS = {"not vegan", "not vegetarian"}
+
+
+class TagCodec:
+    """Two-way mapping between tag names and bits; decoding is memoized per mask."""
+
+    def __init__(self, names: Iterable[str]):
+        self._lock = threading.Lock()
+        self._bits = {}
+        self._decoded = {}
+        self.names: Tuple[str, ...] = ()
+        self.register(names)
+
+    def register(self, names: Iterable[str]) -> None:
+        """Add names (e.g. extra tags of a knowledge base); existing bits never move."""
+        with self._lock:
+            new = sorted(set(names) - set(self._bits))
+            if not new:
+                return
+            for name in new:
+                self._bits[name] = 1 << len(self.names)
+                self.names += (name,)
+            # Sorted decoding no longer follows bit order once names are
+            # appended out of order.
+            self._decoded = {}
+
+    def bit(self, name: str) -> int:
+        return self._bits[name]
+
+    def encode(self, names: Iterable[str]) -> int:
+        """Mask of ``names``; KeyError for a name this codec does not know."""
+        mask = 0
+        for name in names:
+            mask |= self._bits[name]
+        return mask
+
+    def split(self, names: Iterable[str]) -> Tuple[int, List[str]]:
+        """``(mask of the known names, unknown names)``, for stored data that predates validation."""
+        mask = 0
+        unknown = []
+        for name in names or ():
+            bit = self._bits.get(name)
+            if bit is None:
+                unknown.append(name)
+            else:
+                mask |= bit
+        return mask, unknown
+
+    def mask(self, names: Iterable[str]) -> int:
+        """Mask of the known ``names``, ignoring the rest (the hot path of filters)."""
+        bits = self._bits
+        mask = 0
+        for name in names or ():
+            mask |= bits.get(name, 0)
+        return mask
+
+    def decode(self, mask: int) -> List[str]:
+        """Sorted names of the bits set in ``mask``."""
+        names = self._decoded.get(mask)
+        if names is None:
+            names = tuple(sorted(name for name, bit in self._bits.items() if mask & bit))
+            self._decoded[mask] = names
+        return list(names)
+
+
+ALLERGENS = TagCodec(VALID_ALLERGENS)
+DIETARY_CATEGORIES = TagCodec(VALID_DIETARY_CATEGORIES | PARSER_DIETARY_FLAGS)
+VALID_ALLERGEN_MASK = ALLERGENS.encode(VALID_ALLERGENS)
+VALID_DIETARY_MASK = DIETARY_CATEGORIES.encode(VALID_DIETARY_CATEGORIES)
+
@@ -0,0 +1,25 @@
+"""
+Offline benchmarks for the ingest and parsing pipelines.
+
+Run from backend/app, e.g. ``python -m benchmarks.ingest_fanout``. They never
+touch Gemini or Firebase; model latency is simulated.
+"""
+import json
+import os
+
+# Labeled ingredient declarations: [{name, input, expected: {allergens, ...}}].
+GOLD_DATASET = os.path.join(os.path.dirname(__file__), "..", "..", "tests", "testdata", "gold_dataset.json")
+
+
+def load_gold(path: str = GOLD_DATASET) -> list:
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def percentile(values, pct: float) -> float:
+    """Nearest-rank percentile of ``values`` (0 for an empty list)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * pct // 100))
+    return ordered[int(rank) - 1]
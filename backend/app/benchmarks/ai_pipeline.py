@@ -0,0 +1,95 @@
+"""
+Throughput, concurrency and degradation of the ingest pipeline on the stub
+provider (no network).
+
+Runs the same stages /ai/ingest-menu runs (page split, concurrent
+extraction, per-item classification) against ``ai_providers.StubProvider``
+with injected latency, errors and quota, and reports items/sec and how many
+items still got AI tags.
+
+    python -m benchmarks.ai_pipeline [--pages 10] [--latency-ms 150]
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import time
+
+from pypdf import PdfWriter
+
+import ai_providers
+import routes
+
+
+def make_pdf(page_count: int, base_width: int = 600) -> bytes:
+    writer = PdfWriter()
+    for index in range(page_count):
+        # Distinct page sizes give each page different bytes, hence different stub items.
+        writer.add_blank_page(width=base_width + index, height=792)
+    buffer = io.BytesIO()
+    writer.write(buffer)
+    return buffer.getvalue()
+
+
+def run_ingest(provider, parts) -> dict:
+    # The pipeline logs every injected failure; keep the report readable.
+    with contextlib.redirect_stdout(io.StringIO()):
+        return asyncio.run(_run_ingest(provider, parts))
+
+
+async def _run_ingest(provider, parts) -> dict:
+    started = time.perf_counter()
+    try:
+        items, failures = await routes._extract_parts(provider, parts)
+    except Exception:
+        return {"items": 0, "tagged": 0, "failed_parts": len(parts), "seconds": time.perf_counter() - started}
+    classifier = routes._MenuItemClassifier(provider)
+    tagged = 0
+    for item in items:
+        result = await asyncio.to_thread(classifier.classify, item)
+        tagged += bool(result["allergens"] or result["dietaryCategories"])
+    return {
+        "items": len(items),
+        "tagged": tagged,
+        "failed_parts": len(failures),
+        "seconds": time.perf_counter() - started,
+    }
+
+
+def report(label: str, result: dict) -> None:
+    rate = result["items"] / result["seconds"] if result["seconds"] else 0.0
+    print(
+        f"{label:<28} {result['items']:>5} {result['tagged']:>6} {result['failed_parts']:>6} "
+        f"{result['seconds']:>7.2f}s {rate:>8.1f}"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--pages", type=int, default=10)
+    parser.add_argument("--latency-ms", type=float, default=150)
+    parser.add_argument("--jitter-ms", type=float, default=50)
+    args = parser.parse_args()
+
+    os.environ["INGEST_PDF_PAGES_PER_PART"] = "1"
+    parts = routes._split_ingest_parts("menu.pdf", make_pdf(args.pages), "application/pdf")
+    stub = dict(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, seed=7, items_per_page=4)
+
+    print(f"{args.pages} pages, stub latency {args.latency_ms}±{args.jitter_ms} ms")
+    print(f"{'scenario':<28} {'items':>5} {'tagged':>6} {'failed':>6} {'wall':>8} {'items/s':>8}")
+    for concurrency in (1, 2, 4, 8):
+        os.environ["INGEST_MAX_CONCURRENCY"] = str(concurrency)
+        report(f"concurrency {concurrency}", run_ingest(ai_providers.StubProvider(**stub), parts))
+
+    os.environ["INGEST_MAX_CONCURRENCY"] = "4"
+    for error_rate in (0.05, 0.2):
+        provider = ai_providers.StubProvider(error_rate=error_rate, **stub)
+        report(f"error rate {error_rate:.0%}", run_ingest(provider, parts))
+    quota = args.pages + 5
+    provider = ai_providers.StubProvider(quota=quota, **stub)
+    report(f"quota after {quota} calls", run_ingest(provider, parts))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Microbenchmarks: tag lists and sets against allergen_tags bitmasks.
+
+Each row times one operation the API performs per item, over a synthetic
+menu of --items items with random allergen and dietary tags. The "lists"
+column is the code the routes and parser used before (set unions plus
+sorted(), list scans); "masks" is the current code. The bulk-update merge
+is the exception: its list scans won and are what the route uses.
+
+    python -m benchmarks.allergen_tags [--items 300]
+"""
+import argparse
+import random
+import timeit
+
+from allergen_tags import ALLERGENS, VALID_ALLERGENS
+from routes import _has_any_allergen, _merge_tag_updates
+
+
+def merge_tag_masks(existing, additions, removals):
+    """The bulk-update merge as masks; slower than the list scans it replaced, so not used."""
+    mask, unknown = ALLERGENS.split(existing)
+    return ALLERGENS.decode((mask | additions) & ~removals) + unknown
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--items", type=int, default=300)
+    parser.add_argument("--number", type=int, default=200)
+    args = parser.parse_args()
+
+    rng = random.Random(11)
+    names = sorted(VALID_ALLERGENS)
+    menu = [rng.sample(names, rng.randint(0, 4)) for _ in range(args.items)]
+    parsed = [rng.sample(names, rng.randint(0, 3)) for _ in range(args.items)]
+    parsed_masks = [ALLERGENS.encode(tags) for tags in parsed]
+    # Per-ingredient tags of a 10-ingredient declaration, for the parser's union.
+    ingredients = [[rng.sample(names, rng.randint(0, 2)) for _ in range(10)] for _ in range(args.items)]
+    ingredient_masks = [[ALLERGENS.encode(tags) for tags in item] for item in ingredients]
+    excluded = ["milk", "peanuts"]
+    add, remove = ["fish"], ["milk"]
+
+    def parser_union_lists():
+        for item in ingredients:
+            found = set()
+            for tags in item:
+                found.update(tags)
+            sorted(found)
+
+    def parser_union_masks():
+        for item in ingredient_masks:
+            mask = 0
+            for tags in item:
+                mask |= tags
+            ALLERGENS.decode(mask)
+
+    def add_item_lists():
+        for manual, found in zip(menu, parsed):
+            sorted(set(manual) | set(found))
+
+    def add_item_masks():
+        for manual, found in zip(menu, parsed_masks):
+            ALLERGENS.decode(ALLERGENS.encode(manual) | found)
+
+    def bulk_lists():
+        for tags in menu:
+            _merge_tag_updates(tags, add, remove)
+
+    def bulk_masks():
+        add_mask, remove_mask = ALLERGENS.encode(add), ALLERGENS.encode(remove)
+        for tags in menu:
+            merge_tag_masks(tags, add_mask, remove_mask)
+
+    def filter_lists():
+        return [tags for tags in menu if not any(a in tags for a in excluded)]
+
+    def filter_masks():
+        mask, unknown = ALLERGENS.split(excluded)
+        return [tags for tags in menu if not _has_any_allergen(tags, mask, unknown)]
+
+    assert filter_lists() == filter_masks()
+    rows = [
+        ("parser union (10 ingr/item)", parser_union_lists, parser_union_masks),
+        ("add_menu_item merge", add_item_lists, add_item_masks),
+        ("bulk-update merge", bulk_lists, bulk_masks),
+        ("allergen_free filter", filter_lists, filter_masks),
+    ]
+    print(f"{args.items} items per call, best of 5 x {args.number} calls\n")
+    print(f"{'operation':<30} {'lists us':>10} {'masks us':>10} {'speedup':>8}")
+    for label, lists, masks in rows:
+        before = min(timeit.repeat(lists, number=args.number, repeat=5)) / args.number * 1e6
+        after = min(timeit.repeat(masks, number=args.number, repeat=5)) / args.number * 1e6
+        print(f"{label:<30} {before:>10.1f} {after:>10.1f} {before / after:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,273 @@
+"""
+Accuracy and speed of the allergen parsers on gold_dataset.json.
+
+Every case is run through each parser:
+
+- ``local``: ``ingredient_parser.parse_ingredients``, with its caches
+  cleared first, so repeated ingredients are only fast the way they are in
+  production, through ``PARSE_CACHE``.
+- ``ai``: ``routes._ai_parse_ingredients``, the /ai/parse-ingredients path,
+  against AI_PROVIDER (default here: the offline stub, with --ai-latency-ms
+  of simulated model time). A failed call scores as an empty answer and is
+  counted under ``errors``. Only the first --ai-limit cases are sent, so a
+  run against a real provider has a bounded cost.
+
+The report gives precision/recall per allergen and overall, exact matches,
+cross-contact ("may contain") precision/recall where the parser reports
+it, items/sec, p50/p99 latency per call and memory: the peak and the
+retained growth of Python allocations (tracemalloc, measured in a separate
+pass so it does not slow the timed one) and the process's max RSS.
+
+--scale N replaces the 49 cases with N synthetic ones: each joins one to
+three gold cases as sentences, with random casing and spacing around
+commas, and is labeled with the union of their labels. Parser changes can then be judged
+at production sizes (e.g. --scale 100000) on speed and accuracy together;
+--json writes the whole report for comparison between runs.
+
+    python -m benchmarks.gold_eval [--parsers local,ai] [--scale 100000]
+        [--ai-latency-ms 0] [--ai-limit 2000] [--json report.json]
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import re
+import sys
+import time
+import tracemalloc
+from collections import Counter
+from typing import Callable, List, NamedTuple, Optional
+
+import ingredient_parser
+from benchmarks import GOLD_DATASET, load_gold, percentile
+
+try:
+    import resource
+except Exception:  # not on Windows
+    resource = None
+
+CROSS_CONTACT_NOTE = "possible cross-contact: "
+
+
+class Case(NamedTuple):
+    text: str
+    allergens: frozenset
+    cross_contact: frozenset
+
+
+class Prediction(NamedTuple):
+    allergens: frozenset
+    # None when the parser does not report cross-contact at all.
+    cross_contact: Optional[frozenset]
+
+
+def gold_cases(path: str = GOLD_DATASET) -> List[Case]:
+    cases = []
+    for case in load_gold(path):
+        notes = case["expected"].get("notes") or []
+        cross = {n[len(CROSS_CONTACT_NOTE):] for n in notes if n.startswith(CROSS_CONTACT_NOTE)}
+        cases.append(Case(case["input"], frozenset(case["expected"]["allergens"]), frozenset(cross)))
+    return cases
+
+
+def _respell(text: str, rng: random.Random) -> str:
+    casing = rng.choice((str, str, str.upper, str.lower, str.title))
+    return re.sub(r",\s*", lambda _: rng.choice((", ", ", ", ",", " , ", ",   ")), casing(text))
+
+
+def synthetic_cases(gold: List[Case], count: int, seed: int = 11) -> List[Case]:
+    """``count`` label-preserving combinations of gold cases (see the module docstring)."""
+    rng = random.Random(seed)
+    usable = [case for case in gold if case.text.strip()]
+    cases = []
+    for _ in range(count):
+        parts = rng.sample(usable, rng.randint(1, 3))
+        text = " ".join(_respell(part.text.strip().rstrip("."), rng) + "." for part in parts)
+        allergens = frozenset().union(*(part.allergens for part in parts))
+        cross = frozenset().union(*(part.cross_contact for part in parts)) - allergens
+        cases.append(Case(text, allergens, cross))
+    return cases
+
+
+def local_parser() -> Callable[[str], Prediction]:
+    ingredient_parser.clear_caches()
+
+    def parse(text: str) -> Prediction:
+        result = ingredient_parser.parse_ingredients(text)
+        return Prediction(frozenset(result["allergens"]), frozenset(result["cross_contact"]))
+
+    return parse
+
+
+def ai_parser(latency_ms: float) -> Callable[[str], Prediction]:
+    import ai_providers
+    import routes
+
+    if (os.getenv("AI_PROVIDER") or "stub") == "stub":
+        os.environ["AI_PROVIDER"] = "stub"
+        ai_providers.configure_stub(latency_ms=latency_ms, seed=7)
+    provider = ai_providers.create_provider()
+
+    def parse(text: str) -> Prediction:
+        return Prediction(frozenset(routes._ai_parse_ingredients(provider, text)["allergens"]), None)
+
+    return parse
+
+
+def _ratio(numerator: int, denominator: int) -> Optional[float]:
+    return round(numerator / denominator, 4) if denominator else None
+
+
+def _scores(tp: int, fp: int, fn: int) -> dict:
+    return {"precision": _ratio(tp, tp + fp), "recall": _ratio(tp, tp + fn), "support": tp + fn}
+
+
+def score(cases: List[Case], predictions: List[Optional[Prediction]]) -> dict:
+    """Per-allergen and micro precision/recall; a None prediction is a failed call."""
+    counts = {key: Counter() for key in ("tp", "fp", "fn")}
+    cross = Counter()
+    exact = 0
+    reports_cross = any(p is not None and p.cross_contact is not None for p in predictions)
+    for case, prediction in zip(cases, predictions):
+        got = prediction.allergens if prediction is not None else frozenset()
+        exact += got == case.allergens
+        counts["tp"].update(got & case.allergens)
+        counts["fp"].update(got - case.allergens)
+        counts["fn"].update(case.allergens - got)
+        if reports_cross:
+            got_cross = prediction.cross_contact if prediction is not None else frozenset()
+            cross["tp"] += len(got_cross & case.cross_contact)
+            cross["fp"] += len(got_cross - case.cross_contact)
+            cross["fn"] += len(case.cross_contact - got_cross)
+    allergens = sorted(set().union(*counts.values()))
+    return {
+        "exact": exact,
+        "micro": _scores(*(sum(counts[key].values()) for key in ("tp", "fp", "fn"))),
+        "per_allergen": {a: _scores(counts["tp"][a], counts["fp"][a], counts["fn"][a]) for a in allergens},
+        "cross_contact": _scores(cross["tp"], cross["fp"], cross["fn"]) if reports_cross else None,
+    }
+
+
+def evaluate(make_parser: Callable[[], Callable[[str], Prediction]], cases: List[Case]) -> dict:
+    """Score and time ``make_parser()`` over ``cases``, then measure its memory in a second pass."""
+    parse = make_parser()
+    predictions, timings, errors = [], [], 0
+    started = time.perf_counter()
+    for case in cases:
+        call_started = time.perf_counter()
+        try:
+            predictions.append(parse(case.text))
+        except Exception:
+            predictions.append(None)
+            errors += 1
+        timings.append(time.perf_counter() - call_started)
+    seconds = time.perf_counter() - started
+
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    parse = make_parser()
+    for case in cases:
+        try:
+            parse(case.text)
+        except Exception:
+            pass
+    after, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "items": len(cases),
+        "errors": errors,
+        **score(cases, predictions),
+        "items_per_sec": round(len(cases) / seconds, 1) if seconds else None,
+        "p50_ms": round(percentile(timings, 50) * 1000, 4),
+        "p99_ms": round(percentile(timings, 99) * 1000, 4),
+        "peak_alloc_mib": round((peak - before) / 2**20, 2),
+        "retained_alloc_mib": round((after - before) / 2**20, 2),
+    }
+
+
+def _max_rss_mib() -> Optional[float]:
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes.
+    return round(rss / (2**20 if sys.platform == "darwin" else 2**10), 1)
+
+
+def _pct(value: Optional[float]) -> str:
+    return "-" if value is None else f"{value:.1%}"
+
+
+def print_report(report: dict) -> None:
+    results = report["parsers"]
+    print(f"{report['dataset']}: {report['cases']} cases")
+    print(
+        f"\n{'parser':<7} {'items':>7} {'exact':>7} {'prec':>7} {'recall':>7} {'x-prec':>7} {'x-rec':>7} "
+        f"{'items/s':>10} {'p50 ms':>8} {'p99 ms':>8} {'peak MiB':>9} {'kept MiB':>9} {'errors':>6}"
+    )
+    for name, r in results.items():
+        cross = r["cross_contact"] or {}
+        print(
+            f"{name:<7} {r['items']:>7} {_pct(r['exact'] / r['items'] if r['items'] else None):>7} "
+            f"{_pct(r['micro']['precision']):>7} {_pct(r['micro']['recall']):>7} "
+            f"{_pct(cross.get('precision')):>7} {_pct(cross.get('recall')):>7} "
+            f"{r['items_per_sec'] or 0:>10,.0f} {r['p50_ms']:>8.3f} {r['p99_ms']:>8.3f} "
+            f"{r['peak_alloc_mib']:>9.2f} {r['retained_alloc_mib']:>9.2f} {r['errors']:>6}"
+        )
+
+    allergens = sorted({a for r in results.values() for a in r["per_allergen"]})
+    print(f"\n{'allergen':<11} {'support':>7}" + "".join(f" {name + ' P':>9} {name + ' R':>9}" for name in results))
+    for allergen in allergens:
+        support = max(r["per_allergen"].get(allergen, {}).get("support", 0) for r in results.values())
+        row = f"{allergen:<11} {support:>7}"
+        for r in results.values():
+            scores = r["per_allergen"].get(allergen, {})
+            row += f" {_pct(scores.get('precision')):>9} {_pct(scores.get('recall')):>9}"
+        print(row)
+    if report["max_rss_mib"] is not None:
+        print(f"\nmax RSS {report['max_rss_mib']} MiB")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--dataset", default=GOLD_DATASET)
+    parser.add_argument("--parsers", default="local,ai", help="comma-separated: local, ai")
+    parser.add_argument("--scale", type=int, default=0, help="synthetic cases to generate (0 = the gold cases)")
+    parser.add_argument("--seed", type=int, default=11)
+    parser.add_argument("--ai-latency-ms", type=float, default=0, help="simulated model time of the stub provider")
+    parser.add_argument("--ai-limit", type=int, default=2000, help="cases sent to the AI path")
+    parser.add_argument("--json", help="also write the report to this file")
+    args = parser.parse_args()
+
+    cases = gold_cases(args.dataset)
+    if args.scale:
+        cases = synthetic_cases(cases, args.scale, args.seed)
+    parsers = {
+        "local": (local_parser, cases),
+        "ai": (lambda: ai_parser(args.ai_latency_ms), cases[: args.ai_limit]),
+    }
+    report = {
+        "dataset": os.path.basename(args.dataset) + (f" x{args.scale} synthetic" if args.scale else ""),
+        "cases": len(cases),
+        "parsers": {},
+    }
+    for name in [n.strip() for n in args.parsers.split(",") if n.strip()]:
+        if name not in parsers:
+            parser.error(f"unknown parser {name!r}")
+        make_parser, subset = parsers[name]
+        # The AI path logs every failed call; keep the report readable.
+        with contextlib.redirect_stdout(io.StringIO()):
+            report["parsers"][name] = evaluate(make_parser, subset)
+    report["max_rss_mib"] = _max_rss_mib()
+
+    print_report(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Bytes sent and end-to-end latency of photo ingestion, before and after
+preprocessing.
+
+Builds synthetic phone-style menu photos (text on a noisy, shaded page at
+12 MP), runs ``image_preprocess.preprocess_image`` in a process pool like the
+endpoint does, and models the two uploads the endpoint makes (archival +
+Gemini) at ``--mbps`` uplink speed.
+
+    python -m benchmarks.image_preprocess [--mbps 20] [--photos 4]
+"""
+import argparse
+import asyncio
+import concurrent.futures
+import io
+import random
+import time
+
+from PIL import Image, ImageDraw, ImageFilter
+
+import image_preprocess
+
+
+def make_photo(seed: int, size=(4032, 3024)) -> bytes:
+    rng = random.Random(seed)
+    page = Image.linear_gradient("L").resize(size).point(lambda v: 150 + v // 3)
+    noise = Image.effect_noise(size, 40).filter(ImageFilter.GaussianBlur(0.6))
+    page = Image.blend(page, noise, 0.25).convert("RGB")
+    draw = ImageDraw.Draw(page)
+    for line in range(40):
+        y = 120 + line * 70
+        text = " ".join(rng.choice(["Grilled", "Salmon", "Caesar", "Salad", "Garlic", "Bread", "$14.50"]) for _ in range(6))
+        draw.text((200, y), text, fill=(20, 20, 20))
+    buffer = io.BytesIO()
+    page.save(buffer, "JPEG", quality=92)
+    return buffer.getvalue()
+
+
+async def preprocess_all(pool, photos, budget, side):
+    loop = asyncio.get_running_loop()
+    return await asyncio.gather(
+        *(loop.run_in_executor(pool, image_preprocess.preprocess_image, p, budget, side) for p in photos)
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--photos", type=int, default=4)
+    parser.add_argument("--mbps", type=float, default=20.0, help="uplink used for archival + Gemini uploads")
+    parser.add_argument("--workers", type=int, default=image_preprocess.worker_count())
+    args = parser.parse_args()
+
+    photos = [make_photo(seed) for seed in range(args.photos)]
+    budget, side = image_preprocess.max_bytes(), image_preprocess.max_side()
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=max(args.workers, 1)) as pool:
+        asyncio.run(preprocess_all(pool, photos[:1], budget, side))  # warm the pool
+        started = time.perf_counter()
+        processed = asyncio.run(preprocess_all(pool, photos, budget, side))
+        preprocess_s = time.perf_counter() - started
+
+    processed = [p or original for p, original in zip(processed, photos)]
+    before = sum(len(p) for p in photos)
+    after = sum(len(p) for p in processed)
+    bytes_per_s = args.mbps * 1_000_000 / 8
+
+    def send_s(total):
+        return 2 * total / bytes_per_s  # archival copy + Gemini request body
+
+    print(f"{args.photos} photos, budget {budget} B, long side {side} px, {args.mbps} Mbit/s uplink")
+    print(f"{'':>8} {'bytes':>12} {'per photo':>10} {'preprocess':>10} {'send':>7} {'total':>7}")
+    print(f"{'before':>8} {before:>12,} {before // args.photos:>10,} {0:>9.2f}s {send_s(before):>6.2f}s {send_s(before):>6.2f}s")
+    print(
+        f"{'after':>8} {after:>12,} {after // args.photos:>10,} {preprocess_s:>9.2f}s "
+        f"{send_s(after):>6.2f}s {preprocess_s + send_s(after):>6.2f}s"
+    )
+
+
+if __name__ == "__main__":
+    main()
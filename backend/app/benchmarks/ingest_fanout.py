@@ -0,0 +1,79 @@
+"""
+Timing of /ai/ingest-menu extraction for 1, 5 and 20 page PDFs.
+
+Compares sending the whole PDF in one call against the page-range fan-out.
+The simulated model costs ``base + per_page * pages`` seconds per call, which
+mirrors how Gemini latency grows with document size.
+
+    python -m benchmarks.ingest_fanout [--base 0.4] [--per-page 0.25]
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import time
+
+from pypdf import PdfReader, PdfWriter
+
+import routes
+from ai_providers import AIProvider
+
+
+class SimulatedProvider(AIProvider):
+    name = "simulated"
+
+    def __init__(self, base: float, per_page: float):
+        self.base = base
+        self.per_page = per_page
+
+    def extract_menu(self, prompt, file_bytes, mime_type, timeout=None):
+        reader = PdfReader(io.BytesIO(file_bytes))
+        pages = len(reader.pages)
+        time.sleep(self.base + self.per_page * pages)
+        first = int(reader.pages[0].mediabox.width)
+        items = [{"name": f"Dish {first + i}", "price": 9.5, "ingredients": []} for i in range(pages)]
+        return json.dumps({"items": items})
+
+
+def make_pdf(page_count: int) -> bytes:
+    writer = PdfWriter()
+    for index in range(page_count):
+        writer.add_blank_page(width=100 + index, height=200)
+    buffer = io.BytesIO()
+    writer.write(buffer)
+    return buffer.getvalue()
+
+
+def time_extraction(provider, pdf: bytes, pages_per_part: int) -> tuple:
+    os.environ["INGEST_PDF_PAGES_PER_PART"] = str(pages_per_part)
+    parts = routes._split_ingest_parts("menu.pdf", pdf, "application/pdf")
+    start = time.perf_counter()
+    items, failures = asyncio.run(routes._extract_parts(provider, parts))
+    return time.perf_counter() - start, len(parts), len(items)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--base", type=float, default=0.4, help="fixed seconds per model call")
+    parser.add_argument("--per-page", type=float, default=0.25, help="extra seconds per page")
+    parser.add_argument("--pages-per-part", type=int, default=2)
+    parser.add_argument("--concurrency", type=int, default=4)
+    args = parser.parse_args()
+
+    os.environ["INGEST_MAX_CONCURRENCY"] = str(args.concurrency)
+    provider = SimulatedProvider(args.base, args.per_page)
+
+    print(f"{'pages':>5} {'single call':>12} {'fan-out':>9} {'parts':>5} {'items':>5} {'speedup':>7}")
+    for page_count in (1, 5, 20):
+        pdf = make_pdf(page_count)
+        single, _, _ = time_extraction(provider, pdf, pages_per_part=page_count)
+        fanned, parts, items = time_extraction(provider, pdf, pages_per_part=args.pages_per_part)
+        print(
+            f"{page_count:>5} {single:>11.2f}s {fanned:>8.2f}s {parts:>5} {items:>5} "
+            f"{single / fanned:>6.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
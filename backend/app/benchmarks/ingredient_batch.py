@@ -0,0 +1,67 @@
+"""
+Batch parsing against the per-item loop on a synthetic menu.
+
+A menu of --items declarations is assembled from the ingredients of
+gold_dataset.json (so common ones like flour, butter and eggs recur across
+items, as on a real menu) and tagged three ways: ``parse_ingredients`` per
+item with a cold ``parse_ingredient`` cache, the same loop with the cache
+warm, and one ``parse_ingredients_batch`` call. Every approach is checked to
+give the same allergens.
+
+    python -m benchmarks.ingredient_batch [--items 300] [--repeat 20]
+"""
+import argparse
+import random
+import time
+
+import ingredient_parser
+from benchmarks import load_gold
+from ingredient_parser import iter_ingredients, parse_ingredients, parse_ingredients_batch
+
+
+def synthetic_menu(count: int, seed: int = 5) -> list:
+    rng = random.Random(seed)
+    pool = [item["text"] for case in load_gold() for item in iter_ingredients(case["input"]) if item["text"]]
+    return [", ".join(rng.sample(pool, rng.randint(4, 12))) for _ in range(count)]
+
+
+def timed(run, repeat: int, before=None) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        if before:
+            before()
+        started = time.perf_counter()
+        run()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--items", type=int, default=300)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    menu = synthetic_menu(args.items)
+    batch = parse_ingredients_batch(menu)
+    assert [r["allergens"] for r in batch["items"]] == [parse_ingredients(text)["allergens"] for text in menu]
+    print(
+        f"Menu of {len(menu)} items: {batch['total_ingredients']} ingredients, "
+        f"{batch['distinct_ingredients']} distinct"
+    )
+
+    def loop():
+        return [parse_ingredients(text) for text in menu]
+
+    rows = [
+        ("per-item loop, cold cache", timed(loop, args.repeat, ingredient_parser.clear_caches)),
+        ("per-item loop, warm cache", timed(loop, args.repeat)),
+        ("parse_ingredients_batch", timed(lambda: parse_ingredients_batch(menu), args.repeat)),
+    ]
+    print(f"\n{'approach':<28} {'ms':>8} {'items/s':>10}")
+    for label, seconds in rows:
+        print(f"{label:<28} {seconds * 1000:>8.2f} {len(menu) / seconds:>10,.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Typo correction: recall on misspelled labels and lookup latency.
+
+Every gold_dataset.json input is misspelled by applying one random edit
+(substitution, deletion, insertion or swap of neighbours) to each
+ingredient word of five letters or more, --variants times with different seeds. Allergen
+recall and false positives are reported on the clean and misspelled sets
+with correction off (INGREDIENT_FUZZY_MAX_DISTANCE=0) and on. Latency of
+``SymSpellIndex.correct`` is measured per word with a cold and a warm
+cache.
+
+    python -m benchmarks.ingredient_fuzzy [--variants 5]
+"""
+import argparse
+import random
+import re
+import string
+import time
+
+import ingredient_fuzzy
+import ingredient_parser
+from benchmarks import load_gold, percentile
+
+_LONG_WORD = re.compile(r"[A-Za-z]{5,}")
+# Statement wording is the tokenizer's business; only ingredients are misspelled.
+_KEYWORDS = {
+    "allergen", "contain", "contains", "equipment", "facility", "information", "ingredients",
+    "manufactured", "processed", "processes", "traces",
+}
+
+
+def misspell(text: str, rng: random.Random) -> str:
+    def edit(match):
+        word = match.group()
+        if word.lower() in _KEYWORDS:
+            return word
+        i = rng.randrange(1, len(word) - 1)
+        kind = rng.choice(["substitute", "delete", "insert", "swap"])
+        if kind == "substitute":
+            return word[:i] + rng.choice(string.ascii_lowercase) + word[i + 1:]
+        if kind == "delete":
+            return word[:i] + word[i + 1:]
+        if kind == "insert":
+            return word[:i] + rng.choice(string.ascii_lowercase) + word[i:]
+        return word[:i - 1] + word[i] + word[i - 1] + word[i + 1:]
+
+    return _LONG_WORD.sub(edit, text)
+
+
+def score(cases) -> tuple:
+    expected_total = found = false_positives = 0
+    for text, expected in cases:
+        got = set(ingredient_parser.parse_ingredients(text)["allergens"])
+        expected_total += len(expected)
+        found += len(got & expected)
+        false_positives += len(got - expected)
+    return found / max(1, expected_total), false_positives
+
+
+def with_index(index):
+    rules = ingredient_parser.active_rules()
+    ingredient_parser.install_rules(
+        ingredient_parser.RuleSet(rules.rules, rules.variants, matcher=rules.matcher, fuzzy=index), warm=0
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--variants", type=int, default=5)
+    args = parser.parse_args()
+
+    vocabulary = ingredient_parser._vocabulary()
+    started = time.perf_counter()
+    index = ingredient_fuzzy.SymSpellIndex(vocabulary)
+    build_ms = (time.perf_counter() - started) * 1000
+    print(f"Index: {len(index)} words, {len(index._deletes):,} delete keys, built in {build_ms:.0f} ms")
+
+    gold = [(case["input"], set(case["expected"]["allergens"])) for case in load_gold()]
+    typos = [(misspell(text, random.Random(seed)), expected) for seed in range(args.variants) for text, expected in gold]
+    disabled = ingredient_fuzzy.SymSpellIndex(vocabulary, max_distance=0)
+
+    print(f"\n{'dataset':<22} {'correction':<11} {'recall':>7} {'false +':>8}")
+    for label, cases in (("gold", gold), (f"gold misspelled x{args.variants}", typos)):
+        for mode, active in (("off", disabled), ("on", index)):
+            with_index(active)
+            recall, false_positives = score(cases)
+            print(f"{label:<22} {mode:<11} {recall:>7.1%} {false_positives:>8}")
+    print()
+
+    words = sorted({w.lower() for text, _ in typos for w in _LONG_WORD.findall(text)})
+    index = ingredient_fuzzy.SymSpellIndex(vocabulary)
+    for label in ("cold cache", "warm cache"):
+        latencies = []
+        for word in words:
+            started = time.perf_counter()
+            index.correct(word)
+            latencies.append((time.perf_counter() - started) * 1e6)
+        print(
+            f"correct() {label}: {len(words)} words, p50 {percentile(latencies, 50):.1f} us, "
+            f"p99 {percentile(latencies, 99):.1f} us"
+        )
+    print(f"cache: {index.correct.cache_info()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+Compiled knowledge base against in-process tables at knowledge-base scale.
+
+Builds a source of --terms ingredients (the built-in rules plus synthetic
+terms and synonyms), compiles it with ``ingredient_kb.build`` and compares:
+startup time and Python heap (tracemalloc) of opening the mmap artifact
+versus loading the same table into dicts and an Aho–Corasick automaton,
+plus per-ingredient match throughput on gold_dataset.json. Each worker
+also builds an ``ingredient_parser.RuleSet`` around its matcher (typo
+index, normalizer tables), so the full RuleSet build is timed as well,
+step by step. The artifact's
+pages live in the OS page cache, so they are shared by every worker and
+not counted as heap.
+
+    python -m benchmarks.ingredient_kb [--terms 50000]
+"""
+import argparse
+import gc
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+
+import ingredient_kb
+import ingredient_parser
+from benchmarks import load_gold
+
+_SYLLABLES = ["ka", "lo", "mi", "ne", "su", "ta", "ri", "po", "ve", "zu", "shi", "dar"]
+
+
+def synthetic_source(count: int, seed: int = 3) -> tuple:
+    rng = random.Random(seed)
+    rules = {term: dict(body) for term, body in ingredient_parser.ALLERGEN_RULES.items()}
+    variants = dict(ingredient_parser.INGREDIENT_VARIANTS)
+    allergens = ["milk", "eggs", "fish", "shellfish", "tree_nuts", "peanuts", "wheat", "soybeans", "sesame"]
+    canonicals = list(rules)
+    while len(rules) + len(variants) < count:
+        words = rng.randint(1, 3)
+        term = " ".join("".join(rng.choice(_SYLLABLES) for _ in range(rng.randint(2, 4))) for _ in range(words))
+        if term in rules or term in variants:
+            continue
+        if rng.random() < 0.3:
+            variants[term] = rng.choice(canonicals)
+        else:
+            tags = rng.sample(allergens, rng.choice([0, 0, 1, 2]))
+            rules[term] = {"allergens": tags, "dietaryCategories": []}
+            canonicals.append(term)
+    return rules, variants
+
+
+def measure(label: str, load, ingredients, repeat: int) -> None:
+    tracemalloc.start()
+    started = time.perf_counter()
+    matcher = load()
+    load_ms = (time.perf_counter() - started) * 1000
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for ingredient in ingredients:
+            matcher.find(ingredient)
+    rate = len(ingredients) * repeat / (time.perf_counter() - started)
+    print(f"{label:<24} {load_ms:>9.1f} {peak / 1024 / 1024:>9.1f} {rate:>10,.0f}")
+
+
+def measure_ruleset(label: str, build) -> None:
+    """Time ``build()``, then measure its heap in a second build (tracemalloc slows it down)."""
+    gc.collect()  # not the previous measurement's garbage
+    started = time.perf_counter()
+    rules = build()
+    total_ms = (time.perf_counter() - started) * 1000
+    tracemalloc.start()
+    build()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    steps = ", ".join(f"{step[:-3]} {ms:.0f}" for step, ms in rules.timings.items())
+    print(f"{label:<24} {total_ms:>9.0f} {peak / 1024 / 1024:>9.1f}  {steps}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--terms", type=int, default=50000)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    rules, variants = synthetic_source(args.terms)
+    path = os.path.join(tempfile.mkdtemp(), "ingredients.sekb")
+    started = time.perf_counter()
+    count = ingredient_kb.build(rules, variants, path)
+    print(
+        f"Built {count:,} terms in {(time.perf_counter() - started) * 1000:.0f} ms, "
+        f"{os.path.getsize(path) / 1024 / 1024:.1f} MiB on disk"
+    )
+
+    ingredients = [
+        ingredient_parser.normalize_ingredient(item["text"])
+        for case in load_gold()
+        for item in ingredient_parser.iter_ingredients(case["input"])
+    ]
+    print(f"\n{'matcher':<24} {'load ms':>9} {'heap MiB':>9} {'ingr/s':>10}")
+    measure("dicts + automaton", lambda: ingredient_parser._compile(rules, variants), ingredients, args.repeat)
+    measure("mmap knowledge base", lambda: ingredient_kb.KnowledgeBase(path), ingredients, args.repeat)
+
+    print(f"\n{'rule set':<24} {'total ms':>9} {'heap MiB':>9}  steps (ms)")
+    measure_ruleset("dicts + automaton", lambda: ingredient_parser.RuleSet(rules, variants))
+    measure_ruleset(
+        "mmap knowledge base",
+        lambda: ingredient_parser.RuleSet(
+            ingredient_parser.ALLERGEN_RULES, ingredient_parser.INGREDIENT_VARIANTS,
+            matcher=ingredient_kb.KnowledgeBase(path),
+        ),
+    )
+
+    kb = ingredient_kb.KnowledgeBase(path)
+    automaton = ingredient_parser._compile(rules, variants)
+    same = sum(
+        [m[2][1:] for m in kb.find(i)] == [m[2][1:] for m in automaton.find(i)] for i in ingredients
+    )
+    print(f"\nSame tags from both matchers for {same}/{len(ingredients)} gold ingredients")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+Allergen detection accuracy and throughput of the ingredient matcher.
+
+Compares the original whole-string lookup (each comma-separated ingredient
+looked up exactly in the rule table) with the Aho–Corasick matcher on
+gold_dataset.json: per-case exact matches, micro precision/recall, and
+ingredients/sec. A naive scan (one word-boundary regex per rule term) is
+timed too, with --extra-terms synthetic terms added to every table to show
+how each approach scales with the size of the rule table.
+
+    python -m benchmarks.ingredient_matcher [--repeat 200] [--extra-terms 5000]
+"""
+import argparse
+import re
+import time
+
+import ingredient_parser
+from benchmarks import load_gold
+from ingredient_matcher import compile_terms
+
+
+def whole_string_lookup(rules: dict):
+    def detect(ingredient: str) -> set:
+        rule = rules.get(ingredient_parser.normalize_ingredient(ingredient))
+        return set(rule["allergens"]) if rule else set()
+
+    return detect
+
+
+def regex_scan(rules: dict):
+    patterns = [(re.compile(r"(?<!\w)" + re.escape(term) + r"(?!\w)"), body) for term, body in rules.items()]
+
+    def detect(ingredient: str) -> set:
+        text = ingredient_parser.normalize_ingredient(ingredient)
+        found = set()
+        for pattern, body in patterns:
+            if pattern.search(text):
+                found.update(body["allergens"])
+        return found
+
+    return detect
+
+
+def automaton(rules: dict):
+    matcher = compile_terms((term, term) for term in rules)
+
+    def detect(ingredient: str) -> set:
+        found = set()
+        for _, _, term in matcher.find(ingredient_parser.normalize_ingredient(ingredient)):
+            found.update(rules[term]["allergens"])
+        return found
+
+    return detect
+
+
+def score(detect, gold) -> tuple:
+    exact = tp = fp = fn = 0
+    for case in gold:
+        got = set()
+        for ingredient in ingredient_parser.split_ingredients(case["input"]):
+            got |= detect(ingredient)
+        expected = set(case["expected"]["allergens"])
+        exact += got == expected
+        tp += len(got & expected)
+        fp += len(got - expected)
+        fn += len(expected - got)
+    precision = tp / (tp + fp) if tp + fp else 1.0
+    recall = tp / (tp + fn) if tp + fn else 1.0
+    return exact, precision, recall
+
+
+def throughput(detect, ingredients, repeat: int) -> float:
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for ingredient in ingredients:
+            detect(ingredient)
+    return len(ingredients) * repeat / (time.perf_counter() - started)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--extra-terms", type=int, default=5000)
+    args = parser.parse_args()
+
+    gold = load_gold()
+    ingredients = [i for case in gold for i in ingredient_parser.split_ingredients(case["input"])]
+    rules = ingredient_parser.ALLERGEN_RULES
+    print(f"{len(gold)} gold cases, {len(ingredients)} ingredients, {len(rules)} rule terms")
+
+    print(f"\n{'detector':<22} {'exact':>7} {'precision':>9} {'recall':>7} {'ingr/s':>10}")
+    for label, build in (
+        ("whole-string lookup", whole_string_lookup),
+        ("regex per term", regex_scan),
+        ("aho-corasick", automaton),
+    ):
+        detect = build(rules)
+        exact, precision, recall = score(detect, gold)
+        rate = throughput(detect, ingredients, args.repeat)
+        print(f"{label:<22} {exact:>4}/{len(gold):<2} {precision:>9.2f} {recall:>7.2f} {rate:>10,.0f}")
+
+    big = dict(rules)
+    for index in range(args.extra_terms):
+        big[f"synthetic term {index}"] = {"allergens": [], "dietaryCategories": []}
+    print(f"\nWith {len(big)} rule terms:")
+    print(f"{'detector':<22} {'build ms':>9} {'ingr/s':>10}")
+    for label, build in (("regex per term", regex_scan), ("aho-corasick", automaton)):
+        started = time.perf_counter()
+        detect = build(big)
+        build_ms = (time.perf_counter() - started) * 1000
+        rate = throughput(detect, ingredients, max(1, args.repeat // 50))
+        print(f"{label:<22} {build_ms:>9.0f} {rate:>10,.0f}")
+
+
+if __name__ == "__main__":
+    main()
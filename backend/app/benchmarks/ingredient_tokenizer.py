@@ -0,0 +1,72 @@
+"""
+Ingredient tokenizer: the old comma splitter against the one-pass tokenizer.
+
+Accuracy is the share of gold_dataset.json cases whose top-level ingredient
+declarations come out exactly as labeled (``ingredients_normalized``).
+Speed and peak memory (tracemalloc) are measured on one long label paste
+made of every gold input repeated --repeat times, consumed both as a list
+and as a stream, and on the same paste with its brackets replaced by
+commas (the tokenizer's bracket-free path).
+
+    python -m benchmarks.ingredient_tokenizer [--repeat 500]
+"""
+import argparse
+import time
+import tracemalloc
+
+from benchmarks import load_gold
+from ingredient_parser import iter_ingredients
+
+
+def legacy_split(text: str) -> list:
+    """The splitter this module replaced: every comma, no nesting."""
+    return [ingredient.strip() for ingredient in text.split(",") if ingredient.strip()]
+
+
+def _declarations(pieces) -> list:
+    return [" ".join(piece.lower().split()) for piece in pieces]
+
+
+def accuracy(gold) -> tuple:
+    legacy = tokenizer = 0
+    for case in gold:
+        expected = case["expected"]["ingredients_normalized"]
+        legacy += _declarations(legacy_split(case["input"])) == expected
+        items = [item["text"] for item in iter_ingredients(case["input"]) if item["section"] == "ingredients"]
+        tokenizer += _declarations(items) == expected
+    return legacy, tokenizer
+
+
+def measure(label: str, consume, text: str) -> None:
+    started = time.perf_counter()
+    count = consume(text)
+    seconds = time.perf_counter() - started
+    tracemalloc.start()
+    consume(text)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:<24} {count:>8} {seconds * 1000:>9.1f} {len(text) / seconds / 1e6:>8.2f} {peak / 1024:>10,.0f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--repeat", type=int, default=500)
+    args = parser.parse_args()
+
+    gold = load_gold()
+    legacy, tokenizer = accuracy(gold)
+    print(f"Top-level declarations exactly right: comma split {legacy}/{len(gold)}, tokenizer {tokenizer}/{len(gold)}")
+
+    text = " ".join(case["input"] for case in gold if case["input"].strip()) * args.repeat
+    print(f"\nLabel paste of {len(text) / 1024:,.0f} KiB")
+    print(f"{'splitter':<24} {'items':>8} {'ms':>9} {'MB/s':>8} {'peak KiB':>10}")
+    measure("comma split (list)", lambda t: len(legacy_split(t)), text)
+    measure("tokenizer (list)", lambda t: len(list(iter_ingredients(t))), text)
+    measure("tokenizer (streamed)", lambda t: sum(1 for _ in iter_ingredients(t)), text)
+    flat = text.translate(str.maketrans("()[]{}", ",,,,,,"))
+    measure("comma split, no brackets", lambda t: len(legacy_split(t)), flat)
+    measure("tokenizer, no brackets", lambda t: sum(1 for _ in iter_ingredients(t)), flat)
+
+
+if __name__ == "__main__":
+    main()
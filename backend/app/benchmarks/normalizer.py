@@ -0,0 +1,110 @@
+"""
+Morphological normalizer: cache sharing, tag coverage and cost.
+
+Takes every ingredient name in gold_dataset.json and generates --lookups
+spellings of them the way menus write them: random casing, singular or
+plural words, a cooking modifier in front ("fresh", "toasted", ...) and
+stray punctuation. The stream is parsed with the normalizer off
+(INGREDIENT_MORPHOLOGY=0: lowercase and collapse whitespace only) and on,
+each time with an empty cache, reporting:
+
+- distinct keys: different strings seen vs. different canonical keys;
+- ``PARSE_CACHE`` hit rate (keyed by the string as written, so the same
+  either way) and the analysis hit rate: how many lookups were answered
+  without typo correction and matching because another spelling of the
+  same ingredient had been analyzed;
+- coverage: lookups tagged exactly like the name they were generated from;
+- cost of computing the key per call (``RuleSet.canonical``) and total
+  time for the stream.
+
+    python -m benchmarks.normalizer [--lookups 50000]
+"""
+import argparse
+import random
+import time
+
+import ingredient_parser
+from benchmarks import load_gold, percentile
+from ingredient_parser import COOKING_MODIFIERS, RuleSet, _plurals, _singulars
+
+_MODIFIERS = sorted(COOKING_MODIFIERS)
+
+
+def base_names() -> list:
+    names = set()
+    for case in load_gold():
+        for item in ingredient_parser._iter_items(case["input"]):
+            names.update(" ".join(name.lower().split()) for name in ingredient_parser._subtree_names(item))
+    return sorted(names)
+
+
+def respell(name: str, rng: random.Random) -> str:
+    words = []
+    for word in name.split():
+        forms = [word] + [f for f in _plurals(word) + _singulars(word) if f[-1:].isalpha()]
+        words.append(rng.choice(forms) if rng.random() < 0.5 else word)
+    if rng.random() < 0.3:
+        words.insert(0, rng.choice(_MODIFIERS))
+    text = " ".join(words)
+    text = rng.choice((str, str, str.title, str.upper, str.capitalize))(text)
+    return text + rng.choice(("", "", "", ".", "*", " †"))
+
+
+def run(rules: RuleSet, stream: list) -> dict:
+    ingredient_parser.install_rules(rules, warm=0)
+    ingredient_parser.clear_caches()
+    started = time.perf_counter()
+    for text, _ in stream:
+        ingredient_parser.parse_ingredient(text)
+    seconds = time.perf_counter() - started
+    metrics = ingredient_parser.cache_metrics()
+
+    covered = sum(ingredient_parser.parse_ingredient(text)["allergens"] == expected for text, expected in stream)
+    timings = []
+    for text, _ in stream:
+        key_started = time.perf_counter()
+        rules.canonical(text)
+        timings.append(time.perf_counter() - key_started)
+    return {
+        "keys": len({text for text, _ in stream}),
+        "canonical_keys": len({rules.canonical(text) for text, _ in stream}),
+        "hit_rate": metrics["hit_rate"],
+        "analysis_hit_rate": metrics["analysis_hit_rate"],
+        "analyses": metrics["analysis_misses"],
+        "coverage": covered / len(stream),
+        "key_p50_us": percentile(timings, 50) * 1e6,
+        "key_p99_us": percentile(timings, 99) * 1e6,
+        "total_ms": seconds * 1000,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--lookups", type=int, default=50000)
+    parser.add_argument("--seed", type=int, default=5)
+    args = parser.parse_args()
+
+    original = ingredient_parser.active_rules()
+    names = base_names()
+    expected = {name: list(ingredient_parser.parse_ingredient(name)["allergens"]) for name in names}
+    rng = random.Random(args.seed)
+    stream = [(respell(name, rng), expected[name]) for name in (rng.choice(names) for _ in range(args.lookups))]
+
+    print(f"{len(stream)} lookups of {len(names)} gold ingredient names")
+    print(
+        f"\n{'normalizer':<10} {'keys':>6} {'canon':>6} {'hit rate':>9} {'analysis':>9} {'analyses':>9} "
+        f"{'coverage':>9} {'key p50 us':>11} {'key p99 us':>11} {'total ms':>9}"
+    )
+    for label, morphology in (("off", False), ("on", True)):
+        rules = RuleSet(original.rules, original.variants, source=original.source, morphology=morphology)
+        r = run(rules, stream)
+        print(
+            f"{label:<10} {r['keys']:>6} {r['canonical_keys']:>6} {r['hit_rate']:>9.1%} "
+            f"{r['analysis_hit_rate']:>9.1%} {r['analyses']:>9} {r['coverage']:>9.1%} "
+            f"{r['key_p50_us']:>11.2f} {r['key_p99_us']:>11.2f} {r['total_ms']:>9.0f}"
+        )
+    ingredient_parser.install_rules(original, warm=0)
+
+
+if __name__ == "__main__":
+    main()
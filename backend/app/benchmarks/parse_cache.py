@@ -0,0 +1,89 @@
+"""
+parse_ingredient latency and hit rate by cache level.
+
+A synthetic menu (see benchmarks.ingredient_batch) is tagged ingredient by
+ingredient four ways: with caching off, with a cold level 1, with level 1
+warm, and as a fresh worker whose level 1 is empty but whose level 2 (a
+shared SQLite file) was filled by another worker. It also reports what the
+startup warm-up covers: the hit rate of a fresh cache after
+``warm_up(menu, top=--warm-top)``.
+
+    python -m benchmarks.parse_cache [--items 300] [--warm-top 500]
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import ingredient_parser
+from benchmarks import percentile
+from benchmarks.ingredient_batch import synthetic_menu
+from parse_cache import ParseCache
+
+
+def names_of(menu: list) -> list:
+    """The ``parse_ingredient`` keys tagging ``menu`` looks up, in order."""
+    names = []
+    for text in menu:
+        for item in ingredient_parser._iter_items(text):
+            names.extend(ingredient_parser._subtree_names(item))
+    return names
+
+
+def run(cache: ParseCache, names: list) -> tuple:
+    ingredient_parser.PARSE_CACHE = cache
+    cache.reset_metrics()
+    timings = []
+    for name in names:
+        started = time.perf_counter()
+        ingredient_parser.parse_ingredient(name)
+        timings.append(time.perf_counter() - started)
+    return timings, cache.metrics()
+
+
+def new_cache(**kwargs) -> ParseCache:
+    return ParseCache(
+        ingredient_parser._compute_ingredient,
+        ingredient_parser.RULES_VERSION,
+        load=ingredient_parser._load_ingredient,
+        **kwargs,
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--items", type=int, default=300)
+    parser.add_argument("--warm-top", type=int, default=500)
+    args = parser.parse_args()
+
+    menu = synthetic_menu(args.items)
+    names = names_of(menu)
+    original = ingredient_parser.PARSE_CACHE
+    with tempfile.TemporaryDirectory() as tmp:
+        shared_path = os.path.join(tmp, "parse-cache.sqlite")
+        writer = new_cache(shared_path=shared_path)
+        rows = [("caching off", run(new_cache(max_bytes=0, shared_path=""), names))]
+        rows.append(("level 1, cold", run(writer, names)))
+        rows.append(("level 1, warm", run(writer, names)))
+        rows.append(("fresh worker, level 2 warm", run(new_cache(shared_path=shared_path), names)))
+
+        warmed = new_cache(shared_path="")
+        ingredient_parser.PARSE_CACHE = warmed
+        started = time.perf_counter()
+        ingredient_parser.warm_up(menu, top=args.warm_top)
+        warm_seconds = time.perf_counter() - started
+        rows.append((f"after warm_up(top={args.warm_top})", run(warmed, names)))
+    ingredient_parser.PARSE_CACHE = original
+
+    print(f"{len(names)} ingredient lookups ({len(set(names))} distinct) over {len(menu)} items")
+    print(f"\n{'cache':<28} {'total ms':>9} {'p50 us':>8} {'p99 us':>8} {'hit rate':>9}")
+    for label, (timings, metrics) in rows:
+        print(
+            f"{label:<28} {sum(timings) * 1000:>9.2f} {percentile(timings, 50) * 1e6:>8.1f} "
+            f"{percentile(timings, 99) * 1e6:>8.1f} {metrics['hit_rate']:>9.1%}"
+        )
+    print(f"\nwarm_up took {warm_seconds * 1000:.1f} ms; level 1 held {writer.metrics()['bytes']:,} bytes")
+
+
+if __name__ == "__main__":
+    main()
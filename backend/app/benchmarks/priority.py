@@ -0,0 +1,92 @@
+"""
+Interactive parse latency while bulk imports saturate the AI budget.
+
+Two restaurants run bulk imports (A with many concurrent calls, B with a
+few) against the stub provider behind the scheduler and a shared rate
+limiter, while a staff member at restaurant C clicks "parse ingredients"
+every half second. Reports C's p50/p95 and the bulk calls served per
+restaurant, first with every call in one FIFO class and then with the
+priority classes and per-restaurant fair share.
+
+    python -m benchmarks.priority [--seconds 15] [--rpm 600] [--slots 4]
+"""
+import argparse
+import os
+import tempfile
+import threading
+import time
+
+import ai_providers
+import ai_rate_limit
+import ai_scheduler
+from benchmarks import percentile
+
+
+def run(label: str, prioritized: bool, args) -> None:
+    stub = ai_providers.StubProvider(latency_ms=args.latency_ms, jitter_ms=args.latency_ms / 4, seed=5)
+    state = os.path.join(tempfile.mkdtemp(), "bucket.json")
+    bucket = ai_rate_limit.TokenBucket(rpm=args.rpm, burst=5, max_wait=120, state_path=state)
+    scheduler = ai_scheduler.AIScheduler(max_concurrent=args.slots, max_wait=120)
+    limited = ai_rate_limit.RateLimitedProvider(stub, bucket)
+
+    def provider(priority, tenant):
+        if not prioritized:
+            priority, tenant = ai_scheduler.BULK, "all"
+        return ai_scheduler.ScheduledProvider(limited, scheduler, priority, tenant)
+
+    stop = threading.Event()
+    served = {"A": 0, "B": 0}
+    lock = threading.Lock()
+
+    def bulk_worker(tenant):
+        bulk = provider(ai_scheduler.BULK, tenant)
+        while not stop.is_set():
+            bulk.classify("prompt", "cream, flour")
+            with lock:
+                served[tenant] += 1
+
+    workers = [threading.Thread(target=bulk_worker, args=("A",)) for _ in range(args.bulk_a)]
+    workers += [threading.Thread(target=bulk_worker, args=("B",)) for _ in range(args.bulk_b)]
+    for worker in workers:
+        worker.start()
+
+    interactive = provider(ai_scheduler.INTERACTIVE, "C")
+    latencies = []
+    deadline = time.perf_counter() + args.seconds
+    time.sleep(1)  # let the bulk queue build up first
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        interactive.classify("prompt", "milk, eggs")
+        latencies.append(time.perf_counter() - started)
+        time.sleep(max(0.0, 0.5 - (time.perf_counter() - started)))
+    stop.set()
+    for worker in workers:
+        worker.join()
+
+    print(
+        f"{label:<22} {percentile(latencies, 50) * 1000:>7.0f} {percentile(latencies, 95) * 1000:>7.0f} "
+        f"{len(latencies):>5} {served['A']:>7} {served['B']:>7}"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--seconds", type=float, default=15)
+    parser.add_argument("--rpm", type=float, default=600)
+    parser.add_argument("--slots", type=int, default=4)
+    parser.add_argument("--latency-ms", type=float, default=200)
+    parser.add_argument("--bulk-a", type=int, default=12)
+    parser.add_argument("--bulk-b", type=int, default=2)
+    args = parser.parse_args()
+
+    print(
+        f"{args.slots} slots, {args.rpm:.0f} RPM, stub {args.latency_ms:.0f} ms; "
+        f"bulk A x{args.bulk_a}, bulk B x{args.bulk_b}, interactive C every 0.5 s"
+    )
+    print(f"{'scheduling':<22} {'p50 ms':>7} {'p95 ms':>7} {'calls':>5} {'bulk A':>7} {'bulk B':>7}")
+    run("single FIFO queue", False, args)
+    run("priority + fair share", True, args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Replay recorded AI cassettes through the ingest pipeline.
+
+Each cassette in the corpus directory is one recorded /ai/ingest-menu
+request (see ai_cassettes). Its extraction and classification responses are
+replayed with the recorded latency (scaled by --timing) through the same
+stages the endpoint runs, and the report gives items/sec plus p50/p95
+per-menu latency. Results are comparable between runs because the model
+outputs, including malformed JSON and errors, are identical every time.
+
+    python -m benchmarks.replay --corpus DIR [--timing 1.0] [--concurrency 4]
+
+Without real recordings, build a corpus from the stub provider first:
+
+    python -m benchmarks.replay --make-corpus DIR [--menus 20]
+"""
+import argparse
+import glob
+import os
+import random
+
+import ai_cassettes
+import ai_providers
+import routes
+from benchmarks import percentile
+from benchmarks.ai_pipeline import make_pdf, run_ingest
+
+
+def make_corpus(directory: str, menus: int, latency_ms: float, jitter_ms: float) -> None:
+    os.makedirs(directory, exist_ok=True)
+    rng = random.Random(11)
+    stub = ai_providers.StubProvider(latency_ms=latency_ms, jitter_ms=jitter_ms, seed=11, items_per_page=4)
+    for index in range(menus):
+        pdf = make_pdf(rng.randint(1, 8), base_width=600 + index * 10)
+        parts = routes._split_ingest_parts(f"menu-{index}.pdf", pdf, "application/pdf")
+        path = os.path.join(directory, f"menu-{index:03d}.jsonl")
+        if os.path.exists(path):
+            os.remove(path)
+        run_ingest(ai_cassettes.RecordingProvider(stub, path), parts)
+    print(f"Recorded {menus} menus into {directory}")
+
+
+def replay_corpus(directory: str, timing: float) -> None:
+    paths = sorted(glob.glob(os.path.join(directory, "*.jsonl")))
+    latencies, total_items, total_tagged, total_seconds, replayed = [], 0, 0, 0.0, 0
+    for path in paths:
+        entries = ai_cassettes.load_cassette(path)
+        extract_calls = sum(1 for entry in entries if entry["op"] == "extract")
+        if not extract_calls:
+            continue  # a recorded /ai/parse-ingredients request
+        provider = ai_cassettes.ReplayProvider(entries, timing_scale=timing, sequential=True)
+        # The original upload is not stored; one placeholder part per recorded
+        # extraction call replays the same fan-out.
+        parts = [
+            {"label": f"part {index + 1}", "mime_type": "application/pdf", "data": b"%d" % index}
+            for index in range(extract_calls)
+        ]
+        result = run_ingest(provider, parts)
+        replayed += 1
+        latencies.append(result["seconds"])
+        total_items += result["items"]
+        total_tagged += result["tagged"]
+        total_seconds += result["seconds"]
+
+    if not replayed:
+        print(f"No ingest cassettes found in {directory}")
+        return
+    rate = total_items / total_seconds if total_seconds else 0.0
+    print(f"{replayed} menus, {total_items} items ({total_tagged} tagged), timing x{timing}")
+    print(f"items/sec  {rate:8.1f}")
+    print(f"p50        {percentile(latencies, 50) * 1000:8.0f} ms")
+    print(f"p95        {percentile(latencies, 95) * 1000:8.0f} ms")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--corpus", help="directory of recorded cassettes to replay")
+    parser.add_argument("--make-corpus", help="record stub ingests into this directory")
+    parser.add_argument("--menus", type=int, default=20)
+    parser.add_argument("--latency-ms", type=float, default=150)
+    parser.add_argument("--jitter-ms", type=float, default=50)
+    parser.add_argument("--timing", type=float, default=1.0, help="scale recorded latency (0 = instant)")
+    parser.add_argument("--concurrency", type=int, default=4)
+    args = parser.parse_args()
+
+    os.environ["INGEST_PDF_PAGES_PER_PART"] = "1"
+    os.environ["INGEST_MAX_CONCURRENCY"] = str(args.concurrency)
+    if args.make_corpus:
+        make_corpus(args.make_corpus, args.menus, args.latency_ms, args.jitter_ms)
+    if args.corpus or args.make_corpus:
+        replay_corpus(args.corpus or args.make_corpus, args.timing)
+    else:
+        parser.error("pass --corpus or --make-corpus")
+
+
+if __name__ == "__main__":
+    main()
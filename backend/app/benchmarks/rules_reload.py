@@ -0,0 +1,98 @@
+"""
+Cost of hot-reloading the ingredient rules, and what requests see meanwhile.
+
+For each --terms size, writes a JSON source of that many terms (the
+built-in rules plus synthetic ones, see benchmarks.ingredient_kb) and
+reloads it with ``ingredient_rules.RulesReloader``, reporting each phase:
+reading the source, compiling the matcher, building the typo index,
+warming the new parse cache with the --warm hottest entries of the old one,
+and the total. Meanwhile a thread keeps parsing gold_dataset.json
+ingredients; their p50/p99 during the reload are compared with the same
+stream while nothing reloads, to show the swap does not stall parsing
+beyond sharing the CPU (the GIL) with the compile.
+
+    python -m benchmarks.rules_reload [--terms 1000,10000,50000] [--warm 500]
+"""
+import argparse
+import json
+import os
+import tempfile
+import threading
+import time
+
+import ingredient_parser
+from benchmarks import load_gold, percentile
+from benchmarks.ingredient_kb import synthetic_source
+from ingredient_rules import RulesReloader
+
+
+def ingredient_names() -> list:
+    names = []
+    for case in load_gold():
+        for item in ingredient_parser._iter_items(case["input"]):
+            names.extend(ingredient_parser._subtree_names(item))
+    return names
+
+
+def parse_while(names: list, busy: threading.Event) -> list:
+    """Latencies of parsing ``names`` round-robin for as long as ``busy`` is set."""
+    timings = []
+    while busy.is_set() or not timings:
+        for name in names:
+            started = time.perf_counter()
+            ingredient_parser.parse_ingredient(name)
+            timings.append(time.perf_counter() - started)
+    return timings
+
+
+def timed_stream(names: list, work) -> tuple:
+    """Run ``work()`` while parsing on another thread; ``(work result, parse latencies)``."""
+    busy = threading.Event()
+    busy.set()
+    timings = []
+    thread = threading.Thread(target=lambda: timings.extend(parse_while(names, busy)))
+    thread.start()
+    try:
+        result = work()
+    finally:
+        busy.clear()
+        thread.join()
+    return result, timings
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--terms", default="1000,10000,50000")
+    parser.add_argument("--warm", type=int, default=500)
+    args = parser.parse_args()
+
+    os.environ["PARSE_CACHE_WARM_TOP"] = str(args.warm)
+    names = ingredient_names()
+    original = ingredient_parser.active_rules()
+    for name in names:
+        ingredient_parser.parse_ingredient(name)
+
+    print(
+        f"{'terms':>7} {'load ms':>8} {'compile':>8} {'fuzzy':>8} {'warm ms':>8} {'total ms':>9} "
+        f"{'warmed':>6} | {'p50 us':>7} {'p99 us':>8} idle -> {'p50 us':>7} {'p99 us':>8} reloading"
+    )
+    with tempfile.TemporaryDirectory() as tmp:
+        for count in [int(n) for n in args.terms.split(",") if n.strip()]:
+            rules, variants = synthetic_source(count)
+            path = os.path.join(tmp, f"rules-{count}.json")
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump({"rules": rules, "variants": variants}, f)
+
+            _, idle = timed_stream(names, lambda: time.sleep(0.5))
+            report, during = timed_stream(names, lambda: RulesReloader(source=path, poll_seconds=0).reload(None))
+            print(
+                f"{report['terms']:>7} {report['load_ms']:>8.0f} {report['compile_ms']:>8.0f} "
+                f"{report['fuzzy_index_ms']:>8.0f} {report['warm_ms']:>8.0f} {report['total_ms']:>9.0f} "
+                f"{report['warmed']:>6} | {percentile(idle, 50) * 1e6:>7.1f} {percentile(idle, 99) * 1e6:>8.1f}"
+                f"         {percentile(during, 50) * 1e6:>7.1f} {percentile(during, 99) * 1e6:>8.1f}"
+            )
+    ingredient_parser.install_rules(original, warm=0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Shrink menu photos before they are archived and sent to the AI.
+
+Phone photos are often 5-12 MB. Menu text stays legible at roughly 2000 px on
+the long side in grayscale, so larger uploads are EXIF-rotated, downscaled,
+converted to grayscale and recompressed as JPEG until they fit the byte
+budget. ``preprocess_image`` is a plain top-level function so it can run in a
+process pool and keep the CPU work off the event loop.
+
+Pillow is optional: without it uploads pass through unchanged.
+"""
+import io
+import os
+from typing import Optional
+
+try:
+    from PIL import Image, ImageOps
+except Exception:
+    Image = None
+    ImageOps = None
+
+DEFAULT_MAX_BYTES = 1_500_000
+DEFAULT_MAX_SIDE = 2048
+DEFAULT_WORKERS = 2
+
+# Below this long-side size small menu print stops being readable, so we
+# stop shrinking and accept being over budget instead.
+MIN_SIDE = 1000
+QUALITY_STEPS = (85, 75, 65, 55, 45)
+
+
+def max_bytes() -> int:
+    return int(os.getenv("INGEST_IMAGE_MAX_BYTES", DEFAULT_MAX_BYTES))
+
+
+def max_side() -> int:
+    return int(os.getenv("INGEST_IMAGE_MAX_SIDE", DEFAULT_MAX_SIDE))
+
+
+def worker_count() -> int:
+    """Process pool size; 0 runs preprocessing in the default thread pool."""
+    return int(os.getenv("INGEST_PREPROCESS_WORKERS", DEFAULT_WORKERS))
+
+
+def settings_signature() -> str:
+    """Every setting that changes the image the AI sees, for ingest cache keys."""
+    pillow = "pillow" if Image is not None else "none"
+    return f"{pillow}:{max_side()}:{max_bytes()}:{MIN_SIDE}:{QUALITY_STEPS}"
+
+
+def preprocess_image(data: bytes, byte_budget: int, long_side: int) -> Optional[bytes]:
+    """Return a grayscale JPEG of at most ``byte_budget`` bytes.
+
+    Returns None when the original should be used as-is: Pillow is missing,
+    the upload already fits the budget, or nothing smaller could be produced.
+    """
+    if Image is None or len(data) <= byte_budget:
+        return None
+
+    with Image.open(io.BytesIO(data)) as original:
+        image = ImageOps.exif_transpose(original).convert("L")
+
+    side = max(long_side, MIN_SIDE)
+    while True:
+        candidate = image
+        if max(image.size) > side:
+            candidate = image.copy()
+            candidate.thumbnail((side, side), Image.LANCZOS)
+
+        for quality in QUALITY_STEPS:
+            buffer = io.BytesIO()
+            candidate.save(buffer, "JPEG", quality=quality, optimize=True)
+            if buffer.tell() <= byte_budget:
+                return buffer.getvalue()
+
+        if side <= MIN_SIDE or max(candidate.size) < side:
+            # Out of legible sizes to try; keep the best effort if it helped.
+            return buffer.getvalue() if buffer.tell() < len(data) else None
+        side = max(MIN_SIDE, int(side * 0.75))
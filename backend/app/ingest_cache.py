@@ -0,0 +1,103 @@
+"""
+Content-addressed cache for /ai/ingest-menu results.
+
+Uploads are identified by the SHA-256 of their bytes. A finished extraction
+plus per-item classification is stored under ``ingest_cache/{key}`` where the
+key combines that digest with a version hash of the prompts, model names and
+image preprocessing settings (size, quality, byte budget), so changing any of
+them automatically misses the old entries.
+
+Eviction: entries older than INGEST_CACHE_TTL_SECONDS (since last use) are
+dropped on read, and after each write the least recently used entries beyond
+INGEST_CACHE_MAX_ENTRIES are removed. ``ingest_cache_index/{key}`` holds just
+the last-used timestamp so eviction never has to download cached items.
+"""
+import hashlib
+import os
+import time
+from typing import Any, List, Optional
+
+CACHE_PATH = "ingest_cache"
+INDEX_PATH = "ingest_cache_index"
+
+DEFAULT_TTL_SECONDS = 7 * 24 * 60 * 60
+DEFAULT_MAX_ENTRIES = 500
+
+
+def _ttl_seconds() -> int:
+    return int(os.getenv("INGEST_CACHE_TTL_SECONDS", DEFAULT_TTL_SECONDS))
+
+
+def _max_entries() -> int:
+    return int(os.getenv("INGEST_CACHE_MAX_ENTRIES", DEFAULT_MAX_ENTRIES))
+
+
+def content_digest(data: bytes) -> str:
+    """Hex SHA-256 of an uploaded file."""
+    return hashlib.sha256(data).hexdigest()
+
+
+def pipeline_version(*parts: str) -> str:
+    """Short hash of everything that changes the output (prompts, model names, image settings)."""
+    h = hashlib.sha256()
+    for part in parts:
+        h.update((part or "").encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()[:16]
+
+
+def cache_key(digest: str, version: str) -> str:
+    return f"{digest}-{version}"
+
+
+def get_cached_items(db: Any, key: str, now: Optional[float] = None) -> Optional[List[dict]]:
+    """Return cached items for ``key``, or None on a miss / expired entry."""
+    now = time.time() if now is None else now
+    entry = db.reference(f"{CACHE_PATH}/{key}").get()
+    if not entry:
+        return None
+    last_used = entry.get("last_used_at") or entry.get("created_at") or 0
+    if now - last_used > _ttl_seconds():
+        _delete_entry(db, key)
+        return None
+    db.reference(f"{CACHE_PATH}/{key}").update({"last_used_at": now})
+    db.reference(f"{INDEX_PATH}/{key}").set(now)
+    return entry.get("items") or []
+
+
+def store_items(db: Any, key: str, digest: str, items: List[dict], now: Optional[float] = None) -> None:
+    """Store a complete ingest result and evict expired / excess entries."""
+    now = time.time() if now is None else now
+    db.reference(f"{CACHE_PATH}/{key}").set(
+        {
+            "sha256": digest,
+            "items": items,
+            "created_at": now,
+            "last_used_at": now,
+        }
+    )
+    db.reference(f"{INDEX_PATH}/{key}").set(now)
+    evict(db, now)
+
+
+def evict(db: Any, now: Optional[float] = None) -> int:
+    """Apply the TTL and LRU size limit; returns the number of entries removed."""
+    now = time.time() if now is None else now
+    index = db.reference(INDEX_PATH).get() or {}
+    ttl = _ttl_seconds()
+
+    expired = [key for key, used in index.items() if now - (used or 0) > ttl]
+    live = sorted(
+        ((used or 0, key) for key, used in index.items() if key not in expired),
+        reverse=True,
+    )
+    overflow = [key for _, key in live[_max_entries():]]
+
+    for key in expired + overflow:
+        _delete_entry(db, key)
+    return len(expired) + len(overflow)
+
+
+def _delete_entry(db: Any, key: str) -> None:
+    db.reference(f"{CACHE_PATH}/{key}").delete()
+    db.reference(f"{INDEX_PATH}/{key}").delete()
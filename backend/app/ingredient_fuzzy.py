@@ -0,0 +1,147 @@
+"""
+Typo-tolerant lookup of ingredient words (SymSpell).
+
+OCR output and staff typing misspell ingredients ("parmesean", "shirmp",
+"sesme"), and the rule matcher only knows exact words, so those items
+went untagged. ``SymSpellIndex`` is built once over the vocabulary of the
+rule tables: every word is stored under each string obtainable by deleting
+up to ``max_distance`` characters from it. A lookup generates the same
+deletes of the misspelled word, so candidates come from a few dict probes
+instead of a scan of the vocabulary, and only those candidates are checked
+with the (optimal string alignment) edit distance, which counts a swapped
+pair of letters as one edit.
+
+Corrections are deliberately conservative:
+
+* words shorter than 5 letters are never corrected, 5-7 letters allow one
+  edit and longer words two;
+* a word that is itself in the vocabulary is left alone, which is why the
+  vocabulary also holds common words that carry no allergen ("batter" must
+  not become "butter");
+* confidence is ``1 - distance / len(word)``, divided by the number of
+  equally close candidates (a word and its plural count once), and
+  corrections below ``min_confidence`` are dropped rather than guessed;
+* ``ingredient_parser`` also drops a correction that would lose an
+  allergen: one whose word is within ``single_edits`` of a term tagged
+  with an allergen the correction lacks.
+"""
+from functools import lru_cache
+from typing import Iterable, Optional, Tuple
+
+# Everyday menu words with no allergen of their own. They anchor lookups:
+# a typo closest to one of these is corrected to it, and these words are
+# never "corrected" into a similar allergen term.
+NEUTRAL_WORDS = (
+    "apple", "apples", "artificial", "baking", "basil", "batter", "beans", "beets", "berries",
+    "black", "bleached", "brown", "cabbage", "canola", "caramel", "carrots", "celery", "cherries",
+    "chili", "chives", "cilantro", "cinnamon", "citric", "cloves", "coconut", "coffee", "color", "colors",
+    "cooked", "corn", "cranberries", "cucumber", "cumin", "dextrose", "dried", "enriched", "extract", "fennel",
+    "flakes", "flavor", "flavors", "flavour", "fresh", "fried", "garlic", "ginger", "glucose", "grain", "grape",
+    "green", "ground", "herbs", "including", "juice", "ketchup", "lemon", "lettuce", "maple",
+    "matter", "mushrooms", "mustard", "natural", "niacin", "nutmeg", "olive", "onion", "onions", "orange",
+    "oregano", "organic", "paprika", "parsley", "pepper", "peppers", "pickles", "potato", "potatoes", "powder",
+    "processed", "raisins", "roasted", "rolled", "rosemary", "salted", "sauce", "seasoning", "shallots",
+    "smoked", "sodium", "spice", "spices", "spinach", "starch", "sugar", "sweet", "syrup", "thyme", "tomato",
+    "tomatoes", "turmeric", "vanilla", "vegetable", "vinegar", "water", "white", "whole", "yeast",
+)
+
+
+def osa_distance(a: str, b: str, limit: int) -> int:
+    """Optimal string alignment distance, or ``limit + 1`` once it exceeds ``limit``."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous2 = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        row_min = i
+        for j in range(1, len(b) + 1):
+            cost = a[i - 1] != b[j - 1]
+            value = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if previous2 is not None and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                value = min(value, previous2[j - 2] + 1)
+            current[j] = value
+            row_min = min(row_min, value)
+        if row_min > limit:
+            return limit + 1
+        previous2, previous = previous, current
+    return previous[-1]
+
+
+def single_edits(word: str) -> set:
+    """``word`` and every string one deletion, swap, substitution or insertion away."""
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    splits = [(word[:i], word[i:]) for i in range(len(word) + 1)]
+    edits = {word}
+    edits.update(a + b[1:] for a, b in splits if b)
+    edits.update(a + b[1] + b[0] + b[2:] for a, b in splits if len(b) > 1)
+    edits.update(a + c + b[1:] for a, b in splits if b for c in letters)
+    edits.update(a + c + b for a, b in splits for c in letters)
+    return edits
+
+
+def allowed_distance(word: str, max_distance: int) -> int:
+    if len(word) < 5:
+        return 0
+    return min(max_distance, 1 if len(word) < 8 else 2)
+
+
+class SymSpellIndex:
+    """Built once from a vocabulary; ``correct`` is cached and thread-safe."""
+
+    def __init__(
+        self,
+        words: Iterable[str],
+        max_distance: int = 2,
+        min_confidence: float = 0.75,
+        cache_size: int = 4096,
+    ):
+        self.max_distance = max_distance
+        self.min_confidence = min_confidence
+        self.words = frozenset(w for w in words if w)
+        self._deletes = {}
+        for word in self.words:
+            for variant in self._variants(word, max_distance):
+                self._deletes.setdefault(variant, []).append(word)
+        self.correct = lru_cache(maxsize=cache_size)(self._correct)
+
+    def __len__(self) -> int:
+        return len(self.words)
+
+    @staticmethod
+    def _variants(word: str, distance: int) -> set:
+        """``word`` and every string ``distance`` or fewer deletions away."""
+        variants = {word}
+        frontier = {word}
+        for _ in range(distance):
+            frontier = {w[:i] + w[i + 1:] for w in frontier if len(w) > 1 for i in range(len(w))}
+            variants |= frontier
+        return variants
+
+    def lookup(self, word: str, max_distance: Optional[int] = None) -> list:
+        """Vocabulary words within ``max_distance`` edits as ``(word, distance)``, closest first."""
+        limit = self.max_distance if max_distance is None else min(max_distance, self.max_distance)
+        found = {}
+        for variant in self._variants(word, limit):
+            for candidate in self._deletes.get(variant, ()):
+                if candidate not in found:
+                    found[candidate] = osa_distance(word, candidate, limit)
+        return sorted(((w, d) for w, d in found.items() if d <= limit), key=lambda m: (m[1], m[0]))
+
+    def _correct(self, word: str) -> Optional[Tuple[str, int, float]]:
+        """``(correction, distance, confidence)`` for a misspelled word, else None."""
+        if word in self.words:
+            return None
+        limit = allowed_distance(word, self.max_distance)
+        if not limit:
+            return None
+        matches = self.lookup(word, limit)
+        if not matches:
+            return None
+        best, distance = matches[0]
+        closest = {w for w, d in matches if d == distance}
+        ties = sum(1 for w in closest if not (w.endswith("s") and w[:-1] in closest))
+        confidence = round((1 - distance / len(word)) / ties, 3)
+        if confidence < self.min_confidence:
+            return None
+        return best, distance, confidence
@@ -0,0 +1,324 @@
+"""
+Compiled ingredient knowledge base, read through mmap.
+
+The built-in ALLERGEN_RULES / INGREDIENT_VARIANTS tables hold about a
+hundred terms. A full mapping table (tens of thousands of ingredients and
+synonyms) is compiled ahead of time into a binary sorted string table and
+memory-mapped at startup, so opening it costs one header read whatever its
+size, and every worker on the host shares the same page-cache copy instead
+of building its own dicts.
+
+Layout (little-endian):
+
+    header   "SEKB", version u16, max_words u16, count u32,
+             tags_len u32, strings_len u32, slots u32
+    tags     JSON {"allergens": [...], "dietaryCategories": [...], "forms":
+             {...}, "termModifiers": [...]}; bit i of a record's masks is
+             the i-th name; forms/termModifiers are the normalizer tables
+             (ingredient_parser.normalizer_tables), computed here once
+             instead of in every worker
+    records  count x (term_offset u32, term_len u16, canonical u32,
+             allergen_mask u16, dietary_mask u16), sorted by term bytes
+    index    slots x u32: open-addressing table keyed by CRC-32 of the term,
+             holding record number + 1 (0 = empty), linear probing
+    strings  UTF-8 terms
+
+A synonym's record points at its canonical term and already carries the
+canonical term's tags. Lookups hash into the index (one or two probes at
+its 50% load), and the sorted records keep range scans possible.
+
+Build an artifact from a CSV (columns: term, canonical, allergens,
+dietaryCategories; multiple tags separated by ";") or a JSON file shaped
+like the built-in tables ({"rules": {...}, "variants": {...}}):
+
+    python -m ingredient_kb build SOURCE OUT.sekb
+    python -m ingredient_kb export OUT.json   # built-in tables, as a starting source
+
+Point INGREDIENT_KB_PATH at the artifact to use it instead of the built-in
+tables. Typo correction (ingredient_fuzzy) then still covers the built-in
+vocabulary only, so opening the artifact stays cheap in every worker.
+"""
+import argparse
+import csv
+import json
+import mmap
+import os
+import re
+import struct
+import sys
+import zlib
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from allergen_tags import ALLERGENS, DIETARY_CATEGORIES
+
+MAGIC = b"SEKB"
+VERSION = 1
+_HEADER = struct.Struct("<4sHHIIII")
+_SLOT = struct.Struct("<I")
+_RECORD = struct.Struct("<IHIHH")
+_WORD = re.compile(r"\w+")
+
+
+class KnowledgeBaseError(Exception):
+    """The artifact is missing, truncated or from another format version."""
+
+
+def normalize_term(term: str) -> str:
+    return " ".join((term or "").lower().split())
+
+
+def _split_tags(value) -> List[str]:
+    if isinstance(value, list):
+        return [str(v).strip() for v in value if str(v).strip()]
+    return [v.strip() for v in (value or "").split(";") if v.strip()]
+
+
+def tables_from_json(data: dict) -> Tuple[Dict[str, dict], Dict[str, str]]:
+    """``{"rules": {...}, "variants": {...}}`` into normalized (rules, variants).
+
+    Terms are normalized and tag lists may be missing (as the database
+    drops empty lists) or ";"-separated strings.
+    """
+    rules = {
+        normalize_term(term): {
+            "allergens": _split_tags((body or {}).get("allergens")),
+            "dietaryCategories": _split_tags((body or {}).get("dietaryCategories")),
+        }
+        for term, body in (data.get("rules") or {}).items()
+    }
+    variants = {
+        normalize_term(variant): normalize_term(canonical)
+        for variant, canonical in (data.get("variants") or {}).items()
+    }
+    return rules, variants
+
+
+def load_source(path: str) -> Tuple[Dict[str, dict], Dict[str, str]]:
+    """Read a CSV or JSON source into (rules, variants) like the built-in tables."""
+    if path.endswith(".json"):
+        with open(path, encoding="utf-8") as f:
+            return tables_from_json(json.load(f))
+
+    rules: Dict[str, dict] = {}
+    variants: Dict[str, str] = {}
+    with open(path, encoding="utf-8", newline="") as f:
+        for row in csv.DictReader(f):
+            term = normalize_term(row.get("term", ""))
+            if not term:
+                continue
+            canonical = normalize_term(row.get("canonical", "")) or term
+            if canonical != term:
+                variants[term] = canonical
+            else:
+                rules[term] = {
+                    "allergens": _split_tags(row.get("allergens")),
+                    "dietaryCategories": _split_tags(row.get("dietaryCategories")),
+                }
+    return rules, variants
+
+
+def build(rules: Dict[str, dict], variants: Dict[str, str], out_path: str) -> int:
+    """Compile ``rules`` and ``variants`` into ``out_path``; returns the term count."""
+    terms = {normalize_term(t): body for t, body in rules.items() if normalize_term(t)}
+    for variant, canonical in variants.items():
+        terms.setdefault(normalize_term(canonical), {"allergens": [], "dietaryCategories": []})
+    allergen_names = sorted({a for body in terms.values() for a in body.get("allergens", [])})
+    dietary_names = sorted({d for body in terms.values() for d in body.get("dietaryCategories", [])})
+    if len(allergen_names) > 16 or len(dietary_names) > 16:
+        raise KnowledgeBaseError("at most 16 allergen and 16 dietary tags fit in a record")
+
+    entries = {term: term for term in terms}
+    for variant, canonical in variants.items():
+        variant = normalize_term(variant)
+        if variant and variant not in terms:
+            entries[variant] = normalize_term(canonical)
+    ordered = sorted(entries, key=lambda t: t.encode("utf-8"))
+    position = {term: index for index, term in enumerate(ordered)}
+
+    strings = bytearray()
+    records = bytearray()
+    for term in ordered:
+        encoded = term.encode("utf-8")
+        canonical = entries[term]
+        body = terms[canonical]
+        allergen_mask = sum(1 << allergen_names.index(a) for a in set(body.get("allergens", [])))
+        dietary_mask = sum(1 << dietary_names.index(d) for d in set(body.get("dietaryCategories", [])))
+        records += _RECORD.pack(len(strings), len(encoded), position[canonical], allergen_mask, dietary_mask)
+        strings += encoded
+
+    slots = 1
+    while slots < 2 * len(ordered):
+        slots *= 2
+    index = [0] * slots
+    for number, term in enumerate(ordered):
+        slot = zlib.crc32(term.encode("utf-8")) & (slots - 1)
+        while index[slot]:
+            slot = (slot + 1) & (slots - 1)
+        index[slot] = number + 1
+
+    import ingredient_parser
+
+    tables = ingredient_parser.normalizer_tables(ordered)
+    tags = json.dumps(
+        {"allergens": allergen_names, "dietaryCategories": dietary_names, **tables}, separators=(",", ":")
+    ).encode("utf-8")
+    max_words = max((len(term.split()) for term in ordered), default=0)
+    tmp_path = out_path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, VERSION, max_words, len(ordered), len(tags), len(strings), slots))
+        f.write(tags)
+        f.write(records)
+        f.write(struct.pack(f"<{slots}I", *index))
+        f.write(strings)
+    os.replace(tmp_path, out_path)
+    return len(ordered)
+
+
+class KnowledgeBase:
+    """Read-only view of a compiled artifact; safe to share between threads."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            try:
+                self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError as e:  # empty file
+                raise KnowledgeBaseError(f"{path}: {e}")
+        if len(self._mm) < _HEADER.size:
+            raise KnowledgeBaseError(f"{path}: truncated header")
+        magic, version, self.max_words, self.count, tags_len, strings_len, self._slots = _HEADER.unpack_from(
+            self._mm, 0
+        )
+        if magic != MAGIC or version != VERSION:
+            raise KnowledgeBaseError(f"{path}: not a version {VERSION} knowledge base")
+        tags_start = _HEADER.size
+        self._records = tags_start + tags_len
+        self._index = self._records + self.count * _RECORD.size
+        self._strings = self._index + self._slots * _SLOT.size
+        if len(self._mm) < self._strings + strings_len:
+            raise KnowledgeBaseError(f"{path}: truncated")
+        tags = json.loads(self._mm[tags_start:self._records].decode("utf-8"))
+        self.allergen_names: List[str] = tags["allergens"]
+        self.dietary_names: List[str] = tags["dietaryCategories"]
+        # ingredient_parser's normalizer tables; None in artifacts built before them.
+        self.forms: Optional[Dict[str, str]] = tags.get("forms")
+        self.term_modifiers = frozenset(tags.get("termModifiers", ()))
+        # The file's own bit order -> the process-wide allergen_tags bits.
+        ALLERGENS.register(self.allergen_names)
+        DIETARY_CATEGORIES.register(self.dietary_names)
+        self._allergen_bits = [ALLERGENS.bit(name) for name in self.allergen_names]
+        self._dietary_bits = [DIETARY_CATEGORIES.bit(name) for name in self.dietary_names]
+        self._tag_cache: Dict[Tuple[int, int, int], tuple] = {}
+
+    def __len__(self) -> int:
+        return self.count
+
+    def close(self) -> None:
+        self._mm.close()
+
+    def _record(self, index: int) -> tuple:
+        return _RECORD.unpack_from(self._mm, self._records + index * _RECORD.size)
+
+    def _term_bytes(self, offset: int, length: int) -> bytes:
+        start = self._strings + offset
+        return self._mm[start:start + length]
+
+    def _index_of(self, key: bytes) -> int:
+        if not self._slots:
+            return -1
+        mask = self._slots - 1
+        slot = zlib.crc32(key) & mask
+        while True:
+            (number,) = _SLOT.unpack_from(self._mm, self._index + slot * _SLOT.size)
+            if not number:
+                return -1
+            offset, length, _, _, _ = self._record(number - 1)
+            if length == len(key) and self._term_bytes(offset, length) == key:
+                return number - 1
+            slot = (slot + 1) & mask
+
+    def _value(self, canonical: int, allergen_mask: int, dietary_mask: int) -> tuple:
+        key = (canonical, allergen_mask, dietary_mask)
+        value = self._tag_cache.get(key)
+        if value is None:
+            offset, length, _, _, _ = self._record(canonical)
+            value = (
+                self._term_bytes(offset, length).decode("utf-8"),
+                sum(bit for i, bit in enumerate(self._allergen_bits) if allergen_mask >> i & 1),
+                sum(bit for i, bit in enumerate(self._dietary_bits) if dietary_mask >> i & 1),
+            )
+            self._tag_cache[key] = value
+        return value
+
+    def lookup(self, term: str) -> Optional[tuple]:
+        """``(canonical, allergen_mask, dietary_mask)`` for a normalized term (``allergen_tags`` bits)."""
+        index = self._index_of(term.encode("utf-8"))
+        if index < 0:
+            return None
+        _, _, canonical, allergen_mask, dietary_mask = self._record(index)
+        return self._value(canonical, allergen_mask, dietary_mask)
+
+    def find(self, text: str) -> List[tuple]:
+        """Leftmost-longest whole-word matches as ``(start, end, value)``.
+
+        Same contract as ``AhoCorasick.find``: runs of up to ``max_words``
+        words starting at each word are looked up, longest first.
+        """
+        words = [(m.start(), m.end()) for m in _WORD.finditer(text)]
+        matches = []
+        index = 0
+        while index < len(words):
+            start = words[index][0]
+            for width in range(min(self.max_words, len(words) - index), 0, -1):
+                end = words[index + width - 1][1]
+                value = self.lookup(text[start:end])
+                if value is not None:
+                    matches.append((start, end, value))
+                    index += width
+                    break
+            else:
+                index += 1
+        return matches
+
+    def entries(self) -> Iterable[Tuple[str, tuple]]:
+        for index in range(self.count):
+            offset, length, canonical, allergen_mask, dietary_mask = self._record(index)
+            yield self._term_bytes(offset, length).decode("utf-8"), self._value(canonical, allergen_mask, dietary_mask)
+
+
+def open_kb(path: Optional[str] = None) -> Optional[KnowledgeBase]:
+    """The artifact at ``path`` / INGREDIENT_KB_PATH, or None when unset."""
+    path = path or os.getenv("INGREDIENT_KB_PATH")
+    if not path:
+        return None
+    return KnowledgeBase(path)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m ingredient_kb", description="Ingredient knowledge base tools.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build_cmd = commands.add_parser("build", help="compile a CSV/JSON source into an artifact")
+    build_cmd.add_argument("source")
+    build_cmd.add_argument("out")
+    export_cmd = commands.add_parser("export", help="write the built-in tables as a JSON source")
+    export_cmd.add_argument("out")
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        rules, variants = load_source(args.source)
+        count = build(rules, variants, args.out)
+        print(f"Wrote {count} terms to {args.out} ({os.path.getsize(args.out):,} bytes)")
+    else:
+        import ingredient_parser
+
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(
+                {"rules": ingredient_parser.ALLERGEN_RULES, "variants": ingredient_parser.INGREDIENT_VARIANTS},
+                f,
+                indent=2,
+            )
+        print(f"Wrote {len(ingredient_parser.ALLERGEN_RULES)} rules to {args.out}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,104 @@
+"""
+Aho–Corasick multi-pattern matcher for ingredient text.
+
+``ingredient_parser`` used to look ingredients up as whole strings, so
+"enriched flour (wheat flour)" or "soy lecithin" inside a longer
+declaration matched nothing. The rule and variant tables are compiled into
+one automaton instead, and each ingredient string is scanned once, in time
+linear in its length plus the number of matches, however many terms the
+tables hold.
+
+Matches respect word boundaries ("butter" is found in "butter (cream)" but
+not in "butternut"). Where matches overlap, the leftmost-longest one wins,
+so a more specific term can shadow a shorter one: "cocoa butter" and
+"peanut butter" hide the "butter" inside them.
+"""
+from typing import Any, Dict, Iterable, List, Tuple
+
+
+class AhoCorasick:
+    """Build once with ``add``/``build``, then call ``find`` from any thread."""
+
+    def __init__(self):
+        # Node 0 is the root. Per node: goto transitions, failure link and the
+        # (length, value) of every pattern ending there, fail chain included.
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[Tuple[int, Any]]] = [[]]
+        self._built = False
+
+    def __len__(self) -> int:
+        return sum(1 for out in self._out if out)
+
+    def add(self, pattern: str, value: Any) -> None:
+        """Register ``pattern`` (already normalized); a repeated pattern keeps the last value."""
+        if self._built:
+            raise RuntimeError("matcher is already built")
+        node = 0
+        for char in pattern:
+            nxt = self._goto[node].get(char)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][char] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            node = nxt
+        self._out[node] = [(len(pattern), value)]
+
+    def build(self) -> "AhoCorasick":
+        """Compute failure links breadth-first and merge outputs along them."""
+        queue = list(self._goto[0].values())
+        for node in queue:
+            for char, child in self._goto[node].items():
+                fail = self._fail[node]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(char, 0)
+                if self._out[self._fail[child]]:
+                    self._out[child] = self._out[child] + self._out[self._fail[child]]
+                queue.append(child)
+        self._built = True
+        return self
+
+    def find_all(self, text: str) -> List[Tuple[int, int, Any]]:
+        """Every whole-word match in ``text`` as ``(start, end, value)``."""
+        goto, fail, out = self._goto, self._fail, self._out
+        matches = []
+        node = 0
+        last = len(text) - 1
+        for index, char in enumerate(text):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            if not out[node]:
+                continue
+            if index < last and text[index + 1].isalnum():
+                continue
+            for length, value in out[node]:
+                start = index - length + 1
+                if start == 0 or not text[start - 1].isalnum():
+                    matches.append((start, index + 1, value))
+        return matches
+
+    def find(self, text: str) -> List[Tuple[int, int, Any]]:
+        """Non-overlapping matches, leftmost-longest first, in text order."""
+        matches = self.find_all(text)
+        if len(matches) < 2:
+            return matches
+        matches.sort(key=lambda m: (m[0], m[0] - m[1]))
+        chosen = []
+        end = -1
+        for match in matches:
+            if match[0] >= end:
+                chosen.append(match)
+                end = match[1]
+        return chosen
+
+
+def compile_terms(terms: Iterable[Tuple[str, Any]]) -> AhoCorasick:
+    """Automaton over ``(pattern, value)`` pairs."""
+    matcher = AhoCorasick()
+    for pattern, value in terms:
+        matcher.add(pattern, value)
+    return matcher.build()
@@ -1,4 +1,19 @@
+import hashlib
+import json
+import os
+import re
+import string
+import threading
+import time
+from collections import Counter
 from functools import lru_cache
+from typing import Iterable
+
+import ingredient_fuzzy
+import ingredient_kb
+import parse_cache
+from allergen_tags import ALLERGENS, DIETARY_CATEGORIES
+from ingredient_matcher import compile_terms
 
 INGREDIENT_VARIANTS = {
     "parm": "parmesan",
@@ -8,83 +23,998 @@ INGREDIENT_VARIANTS = {
     "crab": "crab",
     "shrimp": "shrimp",
     "bacon": "bacon",
+    "bread & butter pickles": "bread and butter pickles",
 }
 
+# Rule bodies shared by several terms. Allergen ids match VALID_ALLERGENS
+# in allergen_tags.py (the nine FDA major allergens).
+_MILK = {"allergens": ["milk"], "dietaryCategories": ["not vegan"]}
+_EGGS = {"allergens": ["eggs"], "dietaryCategories": ["not vegan"]}
+_WHEAT = {"allergens": ["wheat"], "dietaryCategories": []}
+_SOY = {"allergens": ["soybeans"], "dietaryCategories": []}
+_SESAME = {"allergens": ["sesame"], "dietaryCategories": []}
+_PEANUTS = {"allergens": ["peanuts"], "dietaryCategories": []}
+_TREE_NUTS = {"allergens": ["tree_nuts"], "dietaryCategories": []}
+_FISH = {"allergens": ["fish"], "dietaryCategories": ["not vegetarian", "not vegan"]}
+_SHELLFISH = {"allergens": ["shellfish"], "dietaryCategories": ["not vegetarian", "not vegan"]}
+_MEAT = {"allergens": [], "dietaryCategories": ["not vegetarian", "not vegan"]}
+_NONE = {"allergens": [], "dietaryCategories": []}
+
+# Terms are matched anywhere in an ingredient on word boundaries, longest
+# match first, so entries mapped to _NONE shadow a shorter allergen term
+# ("cocoa butter" is not milk, "rice flour" is not wheat).
 ALLERGEN_RULES = {
-    "cheese": {
-        "allergens": ["dairy"],
-        "dietaryCategories": ["not vegan"],
-    },
-    "parmesan": {
-        "allergens": ["dairy"],
-        "dietaryCategories": ["not vegan"],
-    },
-    "crab": {
-        "allergens": ["shellfish"],
-        "dietaryCategories": ["not vegetarian", "not vegan"],
-    },
-    "shrimp": {
-        "allergens": ["shellfish"],
-        "dietaryCategories": ["not vegetarian", "not vegan"],
-    },
-    "bacon": {
-        "allergens": [],
-        "dietaryCategories": ["not vegetarian", "not vegan"],
-    },
+    # milk
+    "cheese": _MILK,
+    "parmesan": _MILK,
+    "milk": _MILK,
+    "butter": _MILK,
+    "buttermilk": _MILK,
+    "cream": _MILK,
+    "yogurt": _MILK,
+    "whey": _MILK,
+    "casein": _MILK,
+    "caseinate": _MILK,
+    "ghee": _MILK,
+    "lactose": _MILK,
+    "cocoa butter": _NONE,
+    "cream of tartar": _NONE,
+    "coconut milk": _NONE,
+    "coconut cream": _NONE,
+    "oat milk": _NONE,
+    "rice milk": _NONE,
+    "hemp milk": _NONE,
+    "almond milk": _TREE_NUTS,
+    "cashew milk": _TREE_NUTS,
+    "hazelnut milk": _TREE_NUTS,
+    "macadamia milk": _TREE_NUTS,
+    "soy milk": _SOY,
+    "bread and butter pickles": _NONE,
+    # eggs
+    "egg": _EGGS,
+    "eggs": _EGGS,
+    "egg yolk": _EGGS,
+    "egg white": _EGGS,
+    "albumin": _EGGS,
+    "mayonnaise": _EGGS,
+    "aioli": _EGGS,
+    "meringue": _EGGS,
+    # wheat ("flour" alone defaults to wheat)
+    "wheat": _WHEAT,
+    "flour": _WHEAT,
+    "semolina": _WHEAT,
+    "durum": _WHEAT,
+    "spelt": _WHEAT,
+    "gluten": _WHEAT,
+    "bread": _WHEAT,
+    "breadcrumbs": _WHEAT,
+    "panko": _WHEAT,
+    "couscous": _WHEAT,
+    "seitan": _WHEAT,
+    "rice flour": _NONE,
+    "corn flour": _NONE,
+    "oat flour": _NONE,
+    "coconut flour": _NONE,
+    "chickpea flour": _NONE,
+    "almond flour": _TREE_NUTS,
+    # soybeans
+    "soy": _SOY,
+    "soya": _SOY,
+    "soja": _SOY,
+    "soybean": _SOY,
+    "soybeans": _SOY,
+    "soy lecithin": _SOY,
+    "soy sauce": {"allergens": ["soybeans", "wheat"], "dietaryCategories": []},
+    "edamame": _SOY,
+    "tofu": _SOY,
+    "miso": _SOY,
+    "tempeh": _SOY,
+    # sesame
+    "sesame": _SESAME,
+    "tahini": _SESAME,
+    # peanuts
+    "peanut": _PEANUTS,
+    "peanuts": _PEANUTS,
+    "peanut butter": _PEANUTS,
+    "groundnut": _PEANUTS,
+    "ground nut": _PEANUTS,
+    "ground nuts": _PEANUTS,
+    # tree nuts
+    "tree nut": _TREE_NUTS,
+    "tree nuts": _TREE_NUTS,
+    "treenuts": _TREE_NUTS,
+    "almond": _TREE_NUTS,
+    "almonds": _TREE_NUTS,
+    "walnut": _TREE_NUTS,
+    "walnuts": _TREE_NUTS,
+    "cashew": _TREE_NUTS,
+    "cashews": _TREE_NUTS,
+    "pecan": _TREE_NUTS,
+    "pecans": _TREE_NUTS,
+    "hazelnut": _TREE_NUTS,
+    "hazelnuts": _TREE_NUTS,
+    "pistachio": _TREE_NUTS,
+    "pistachios": _TREE_NUTS,
+    "pine nut": _TREE_NUTS,
+    "pine nuts": _TREE_NUTS,
+    "macadamia": _TREE_NUTS,
+    "pesto": {"allergens": ["tree_nuts", "milk"], "dietaryCategories": ["not vegan"]},
+    # fish
+    "fish": _FISH,
+    "cod": _FISH,
+    "salmon": _FISH,
+    "tuna": _FISH,
+    "anchovy": _FISH,
+    "anchovies": _FISH,
+    "tilapia": _FISH,
+    "halibut": _FISH,
+    "fish sauce": _FISH,
+    # shellfish
+    "shellfish": _SHELLFISH,
+    "crab": _SHELLFISH,
+    "shrimp": _SHELLFISH,
+    "prawn": _SHELLFISH,
+    "prawns": _SHELLFISH,
+    "scallop": _SHELLFISH,
+    "scallops": _SHELLFISH,
+    "lobster": _SHELLFISH,
+    "crawfish": _SHELLFISH,
+    "crab apple": _NONE,
+    "crab apples": _NONE,
+    # meat
+    "bacon": _MEAT,
+    "beef": _MEAT,
+    "pork": _MEAT,
+    "ham": _MEAT,
+    "chicken": _MEAT,
+    "turkey": _MEAT,
+    "lamb": _MEAT,
+    "sausage": _MEAT,
+    "meatballs": _MEAT,
+    "gelatin": _MEAT,
+    "honey": {"allergens": [], "dietaryCategories": ["not vegan"]},
 }
 
 
+# Memoized analyses (typo correction, matching) per canonical ingredient key.
+ANALYSIS_CACHE_SIZE = 16384
+
+# Preparation words dropped by the normalizer ("toasted sesame seeds" is
+# "sesame seeds"); a word that is part of a rule term is always kept.
+COOKING_MODIFIERS = frozenset((
+    "baked", "blanched", "boiled", "chopped", "coarse", "coarsely", "cooked", "crushed", "cubed", "diced",
+    "dried", "finely", "fresh", "freshly", "frozen", "grated", "ground", "large", "mashed", "melted",
+    "minced", "organic", "peeled", "pitted", "powdered", "raw", "roasted", "shelled", "shredded",
+    "sliced", "small", "softened", "steamed", "toasted", "whole",
+))
+
+
+def _compile(rules: dict, variants: dict, canonical=None):
+    """One automaton over every rule term and every variant spelling.
+
+    Each pattern maps to ``(canonical term, allergen_mask, dietary_mask)``
+    (``allergen_tags`` bitmasks): variants resolve to the term they
+    normalize to, rule terms to themselves. With ``canonical`` (the
+    normalizer of the rule set), each pattern is also added in the form the
+    normalizer turns it into, so normalized text still matches.
+    """
+    ALLERGENS.register(a for body in rules.values() for a in body["allergens"])
+    DIETARY_CATEGORIES.register(d for body in rules.values() for d in body["dietaryCategories"])
+
+    def value(term: str) -> tuple:
+        body = rules.get(term, _NONE)
+        return term, ALLERGENS.encode(body["allergens"]), DIETARY_CATEGORIES.encode(body["dietaryCategories"])
+
+    terms = {term: value(term) for term in rules}
+    for variant, term in variants.items():
+        terms[variant] = value(term)
+    if canonical is not None:
+        for pattern, pattern_value in list(terms.items()):
+            terms.setdefault(canonical(pattern), pattern_value)
+    return compile_terms(terms.items())
+
+
+_WORD = re.compile(r"[^\W\d_]+")
+# Punctuation becomes a word break, apostrophes disappear ("st. john's" ->
+# "st johns"); one str.translate pass per ingredient.
+_PUNCTUATION = str.maketrans(
+    {**{c: " " for c in string.punctuation + "“”«»…–—•·"}, "'": None, "’": None, "‘": None}
+)
+
+
+def _term_words(rules: dict, variants: dict) -> set:
+    """Every word of the rule tables."""
+    terms = list(rules) + list(variants) + list(variants.values())
+    return {word for term in terms for word in _WORD.findall(term)}
+
+
+def _vocabulary(rules: dict = ALLERGEN_RULES, variants: dict = INGREDIENT_VARIANTS) -> set:
+    """Every word of the rule tables, plus neutral words and modifiers."""
+    return _term_words(rules, variants).union(ingredient_fuzzy.NEUTRAL_WORDS, COOKING_MODIFIERS)
+
+
+def _singulars(word: str) -> list:
+    """Candidate singulars of ``word``, most specific suffix rule first."""
+    if word.endswith("ies") and len(word) > 4:
+        return [word[:-3] + "y"]
+    if word.endswith("ves"):
+        return [word[:-3] + "f", word[:-3] + "fe", word[:-1]]
+    if word.endswith(("oes", "ches", "shes", "xes", "sses", "zes")):
+        return [word[:-2], word[:-1]]
+    if word.endswith("s") and not word.endswith(("ss", "us", "is")) and len(word) > 3:
+        return [word[:-1]]
+    return []
+
+
+def _plurals(word: str) -> list:
+    if word.endswith("y") and len(word) > 2 and word[-2] not in "aeiou":
+        return [word[:-1] + "ies"]
+    if word.endswith("fe"):
+        return [word[:-2] + "ves", word + "s"]
+    if word.endswith("f"):
+        return [word[:-1] + "ves", word + "s"]
+    if word.endswith(("s", "x", "z", "ch", "sh", "o")):
+        return [word + "es", word + "s"]
+    return [word + "s"]
+
+
+def _word_forms(vocabulary: set, protected: frozenset = frozenset()) -> dict:
+    """Inflected form -> lemma for the words of ``vocabulary``, computed once per rule set.
+
+    A known word whose singular is also known maps to it ("eggs" -> "egg");
+    singular and plural forms the vocabulary lacks map to the known form
+    ("shrimps" -> "shrimp", "meatball" -> "meatballs"). Words in
+    ``protected`` are never rewritten. Anything else is left alone: the
+    table never guesses at words it does not know.
+    """
+    forms = {}
+    for word in sorted(vocabulary - protected):
+        for singular in _singulars(word):
+            if singular in vocabulary:
+                forms[word] = singular
+                break
+    for word in sorted(vocabulary):
+        lemma = forms.get(word, word)
+        for form in _plurals(word) + _singulars(word):
+            if form not in vocabulary and form not in protected:
+                forms.setdefault(form, lemma)
+    # One level of chaining at most ("glasses" -> "glass" -> ...).
+    return {form: forms.get(lemma, lemma) for form, lemma in forms.items()}
+
+
+def normalizer_tables(terms: Iterable[str]) -> dict:
+    """The normalizer's tables for a knowledge base of ``terms``, stored in the artifact.
+
+    Its patterns cannot be re-added in normalized form the way ``_compile``
+    does, so its own words are never rewritten or dropped: ``forms`` only
+    maps inflections it lacks to words it has, and ``termModifiers`` lists
+    the modifiers its terms use.
+    """
+    term_words = {word for term in terms for word in _WORD.findall(term)}
+    vocabulary = term_words.union(ingredient_fuzzy.NEUTRAL_WORDS, COOKING_MODIFIERS)
+    return {
+        "forms": _word_forms(vocabulary, frozenset(term_words)),
+        "termModifiers": sorted(COOKING_MODIFIERS & term_words),
+    }
+
+
+def _fuzzy_index(vocabulary: set) -> ingredient_fuzzy.SymSpellIndex:
+    """Misspelling index; INGREDIENT_FUZZY_MAX_DISTANCE=0 turns typo correction off."""
+    return ingredient_fuzzy.SymSpellIndex(
+        vocabulary,
+        max_distance=int(os.getenv("INGREDIENT_FUZZY_MAX_DISTANCE", "2")),
+        min_confidence=float(os.getenv("INGREDIENT_FUZZY_MIN_CONFIDENCE", "0.75")),
+    )
+
+
+def _rules_version(
+    rules: dict, variants: dict, matcher, fuzzy: ingredient_fuzzy.SymSpellIndex, modifiers: frozenset | None
+) -> str:
+    """Short hash of everything that decides a parse result (``modifiers`` None: no morphology)."""
+    h = hashlib.sha256()
+    h.update(json.dumps([rules, variants], sort_keys=True).encode("utf-8"))
+    if isinstance(matcher, ingredient_kb.KnowledgeBase):
+        stat = os.stat(matcher.path)
+        h.update(f"{matcher.path}:{stat.st_size}:{stat.st_mtime_ns}".encode("utf-8"))
+    h.update(f"{fuzzy.max_distance}:{fuzzy.min_confidence}:{sorted(fuzzy.words)}".encode("utf-8"))
+    h.update(f"morphology:{sorted(modifiers) if modifiers is not None else None}".encode("utf-8"))
+    return h.hexdigest()[:16]
+
+
+# Statement openers. A label ending in ":" switches the section for the rest
+# of the sentence; the same words without a colon ("Contains Soy.") are
+# recognized at the start of a declaration by _STATEMENT_PREFIX.
+_SECTION_LABELS = {
+    "ingredients": "ingredients",
+    "contains": "contains",
+    "may contain": "may_contain",
+    "may contain traces of": "may_contain",
+}
+_STATEMENT_PREFIX = re.compile(
+    r"^(?:(?P<contains>contains)"
+    r"|(?P<may>may contain(?: traces of)?"
+    r"|(?:manufactured|produced|processed|made|packaged) (?:in|on) (?:a )?(?:shared )?"
+    r"(?:facility|equipment|line)(?: that)?(?: also)? (?:processes|handles|uses))"
+    r")\b:?\s*",
+    re.IGNORECASE,
+)
+# Brackets, separators, label colons, and periods that end a sentence
+# (followed by whitespace or the end of the text, so "2.5%" is not split).
+_STRUCTURE = re.compile(r"[()\[\]{},;:\n]|\.(?=\s|$)")
+# The same separators, for text without opening brackets (kept by split).
+_OPENER = re.compile(r"[(\[{]")
+_FLAT = re.compile(r"([,;:\n]|\.(?=\s|$))")
+_FLAT_BEFORE_BRACKET = re.compile(r"([,;:\n]|\.(?=\s))")
+# Inside brackets a colon is text, and the text goes on after the closer.
+_BRACKET = re.compile(r"[()\[\]{}]")
+_CHILD_SEPARATOR = re.compile(r"[,;\n]|\.(?=\s)")
+_STATEMENT_LIST = re.compile(r"(?:^|\s+)(?:and|or|&)\s+", re.IGNORECASE)
+_OPENERS = "([{"
+_CLOSERS = ")]}"
+_DECORATION = " \t\r\n*•·_"
+
+
+def _clean(fragment: str) -> str:
+    return " ".join(fragment.strip(_DECORATION).split())
+
+
+class _Node:
+    __slots__ = ("start", "parts", "children")
+
+    def __init__(self, start: int):
+        self.start = start
+        self.parts: list = []
+        self.children: list = []
+
+
+def _finish(node: _Node, text: str, end: int, section: str) -> dict | None:
+    if not node.children:
+        # A plain item: its name is its whole text.
+        name = _clean(text[node.start:end])
+        if not name:
+            return None
+        return {"name": name, "text": name, "section": section, "children": node.children}
+    name = " ".join(part for part in (_clean(text[a:b]) for a, b in node.parts) if part)
+    return {
+        "name": name,
+        "text": _clean(text[node.start:end]),
+        "section": section,
+        "children": node.children,
+    }
+
+
+def _attach(children: list, item: dict | None) -> None:
+    if item is None:
+        return
+    if item["name"]:
+        children.append(item)
+    else:  # "(Garlic Powder)" has no name of its own
+        children.extend(item["children"])
+
+
+def _statement_items(item: dict, section: str) -> list[dict]:
+    """Apply a "Contains"/"May contain" opener and split "x and y" lists."""
+    match = _STATEMENT_PREFIX.match(item["name"])
+    if match:
+        section = "contains" if match.group("contains") else "may_contain"
+        item["name"] = item["name"][match.end():]
+        item["text"] = _STATEMENT_PREFIX.sub("", item["text"], count=1)
+    item["section"] = section
+    if section == "ingredients":
+        return [item]
+    # Allergen statements list names in prose: "Wheat, Soy, and Peanuts".
+    names = [n for n in _STATEMENT_LIST.split(item["name"]) if n]
+    if len(names) <= 1:
+        item["name"] = names[0] if names else ""
+        return [item] if item["name"] or item["children"] else []
+    items = [{"name": n, "text": n, "section": section, "children": []} for n in names[:-1]]
+    items.append({**item, "name": names[-1], "text": item["text"][item["text"].lower().rfind(names[-1].lower()):]})
+    return items
+
+
+def iter_ingredients(text: str):
+    """Tokenize an ingredient declaration in one pass, yielding top-level items.
+
+    Each item is ``{"name", "text", "section", "children"}``: ``name`` is the
+    ingredient without its parenthetical, ``text`` the whole declaration
+    ("Butter (Cream, Salt)"), ``children`` the sub-ingredients as nested
+    items, and ``section`` one of "ingredients", "contains" (allergen
+    statement) or "may_contain" (cross-contact warning). Commas and
+    semicolons separate items at every nesting level; a period followed by
+    whitespace or the end of the text ends a sentence, and with it any
+    "Contains"/"May contain" section.
+
+    Most items have no brackets, so the text up to the next opening bracket
+    is cut at its separators by one ``re.split`` (no per-character work in
+    Python); an item with one pair of brackets is cut the same way around
+    them, and only deeper nesting goes through ``_iter_nested``. Items are
+    yielded as they are cut, and only one bracket-free stretch is held in
+    pieces at a time.
+    """
+    section = "ingredients"
+    position = 0
+    length = len(text)
+    while position < length:
+        opener = _OPENER.search(text, position)
+        end = opener.start() if opener else length
+        # At the end of the text a trailing period is a separator; before
+        # an opening bracket it is not ("2.5%(").
+        parts = (_FLAT if opener is None else _FLAT_BEFORE_BRACKET).split(text[position:end])
+        if opener is None:
+            parts.append("")  # the last piece ends the text
+        names = [" ".join(piece.strip(_DECORATION).split()) for piece in parts[0:-1:2]]
+        for name, separator in zip(names, parts[1::2]):
+            if separator == ":":
+                # Unknown labels ("Allergen Information:") are dropped as well.
+                section = _SECTION_LABELS.get(name.lower(), section)
+                continue
+            if not name:
+                pass
+            elif section == "ingredients" and not _STATEMENT_PREFIX.match(name):
+                yield {"name": name, "text": name, "section": section, "children": []}
+            else:
+                item = {"name": name, "text": name, "section": section, "children": []}
+                for statement_item in _statement_items(item, section):
+                    section = statement_item["section"]
+                    yield statement_item
+            if separator in (".", "\n"):
+                section = "ingredients"
+        if opener is None:
+            return
+        # The last piece starts the item the bracket belongs to.
+        start = end - len(parts[-1])
+        found = _one_level_item(text, start, end, section)
+        if found is None:
+            section, position = yield from _iter_nested(text, start, section)
+            continue
+        item, position = found
+        for statement_item in _statement_items(item, section):
+            section = statement_item["section"]
+            yield statement_item
+        if position < length and text[position] in ".\n":
+            section = "ingredients"
+        position += 1
+
+
+def _one_level_item(text: str, start: int, opener: int, section: str) -> tuple | None:
+    """``(item, end)`` for the item at ``start`` if its only brackets are the pair at ``opener``.
+
+    ``end`` is the index of the separator after it. None for anything else
+    (nested or unclosed brackets, a label colon, an empty pair), which
+    ``_iter_nested`` handles.
+    """
+    bracket = _BRACKET.search(text, opener + 1)
+    if bracket is None or text[bracket.start()] in _OPENERS:
+        return None
+    close = bracket.start()
+    after = _STRUCTURE.search(text, close + 1)
+    end = after.start() if after else len(text)
+    if after is not None and text[end] not in ",;.\n":
+        return None
+    children = [
+        {"name": name, "text": name, "section": section, "children": []}
+        for name in (_clean(piece) for piece in _CHILD_SEPARATOR.split(text[opener + 1:close]))
+        if name
+    ]
+    if not children:
+        return None
+    name = " ".join(part for part in (_clean(text[start:opener]), _clean(text[close + 1:end])) if part)
+    return {"name": name, "text": _clean(text[start:end]), "section": section, "children": children}, end
+
+
+def _iter_nested(text: str, start: int, section: str):
+    """Yield the top-level item at ``start``, which has brackets.
+
+    Returns ``(section, position)`` with the position after the separator
+    that ended it (the text's length if nothing did).
+    """
+    stack: list[_Node] = []
+    node = _Node(start)
+    segment = start
+    length = len(text)
+
+    # Only structural characters are visited; the text between them is
+    # skipped by the regex engine and sliced once when an item ends.
+    for match in _STRUCTURE.finditer(text, start):
+        index = match.start()
+        char = text[index]
+        if char in _OPENERS:
+            node.parts.append((segment, index))
+            stack.append(node)
+            node = _Node(index + 1)
+            segment = index + 1
+        elif char in _CLOSERS:
+            if not stack:
+                continue  # stray closing bracket
+            node.parts.append((segment, index))
+            child = _finish(node, text, index, section)
+            node = stack.pop()
+            _attach(node.children, child)
+            segment = index + 1
+        elif char in ",;.\n":
+            node.parts.append((segment, index))
+            item = _finish(node, text, index, section)
+            if stack:
+                _attach(stack[-1].children, item)
+                node = _Node(index + 1)
+                segment = index + 1
+                continue
+            if item is not None:
+                for statement_item in _statement_items(item, section):
+                    section = statement_item["section"]
+                    yield statement_item
+            if char in ".\n":
+                section = "ingredients"
+            return section, index + 1
+        elif char == ":" and not stack and not node.children:
+            label = _clean(text[node.start:index]).lower()
+            section = _SECTION_LABELS.get(label, section)
+            # Unknown labels ("Allergen Information:") are dropped as well.
+            node = _Node(index + 1)
+            segment = index + 1
+
+    # Close anything left open by truncated text.
+    node.parts.append((segment, length))
+    while stack:
+        child = _finish(node, text, length, section)
+        node = stack.pop()
+        _attach(node.children, child)
+    item = _finish(node, text, length, section)
+    if item is not None:
+        yield from _statement_items(item, section)
+    return section, length
+
+
 def split_ingredients(ingredients: str | list[str]) -> list[str]:
+    """Top-level declarations of ``ingredients``, parentheticals kept whole."""
     if isinstance(ingredients, str):
-        return [
-            ingredient.strip()
-            for ingredient in ingredients.split(",")
-            if ingredient.strip()
-        ]
+        return [item["text"] for item in iter_ingredients(ingredients)]
 
     return ingredients
 
 
-def normalize_ingredient(ingredient: str) -> str:
-    cleaned = ingredient.strip().lower()
-    return INGREDIENT_VARIANTS.get(cleaned, cleaned)
+class ParsedIngredient(parse_cache.FrozenDict):
+    """A read-only ``parse_ingredient`` result that also carries its tag bitmasks."""
+
+    __slots__ = ("allergen_mask", "dietary_mask")
 
 
-@lru_cache(maxsize=500)
-def parse_ingredient(ingredient: str) -> dict:
-    normalized = normalize_ingredient(ingredient)
+def _parsed(result: dict, allergen_mask: int, dietary_mask: int) -> ParsedIngredient:
+    parsed = ParsedIngredient((key, parse_cache.freeze(value)) for key, value in result.items())
+    parsed.allergen_mask = allergen_mask
+    parsed.dietary_mask = dietary_mask
+    return parsed
 
-    rules = ALLERGEN_RULES.get(
-        normalized,
-        {
-            "allergens": [],
-            "dietaryCategories": [],
-        },
+
+def _load_ingredient(stored: dict) -> ParsedIngredient:
+    """Rebuild a result read back from the shared cache tier."""
+    return _parsed(
+        stored, ALLERGENS.mask(stored["allergens"]), DIETARY_CATEGORIES.mask(stored["dietaryCategories"])
     )
 
+
+class RuleSet:
+    """One generation of the rule tables and everything compiled from them.
+
+    Never changed once built: a reload builds a new RuleSet off the request
+    path and ``install_rules`` swaps it in. ``matcher`` / ``fuzzy`` are
+    compiled from the tables unless given (e.g. a knowledge base).
+    ``timings`` records how long each step took, in milliseconds.
+
+    Ingredients are reduced to a ``canonical`` key first: lowercase, no
+    punctuation, cooking modifiers dropped and every word looked up in a
+    plural/singular table built from the vocabulary here, so "Eggs",
+    "fresh egg" and "EGG." share one key and the typo correction and
+    matching done for a key (``analysis``) are shared by all its spellings.
+    ``morphology=False`` (INGREDIENT_MORPHOLOGY=0) only lowercases and
+    collapses whitespace.
+    """
+
+    def __init__(
+        self,
+        rules: dict,
+        variants: dict,
+        matcher=None,
+        fuzzy=None,
+        source: str = "built-in",
+        morphology: bool | None = None,
+    ):
+        started = time.perf_counter()
+        self.rules = rules
+        self.variants = variants
+        self.source = source
+        self.morphology = os.getenv("INGREDIENT_MORPHOLOGY", "1") != "0" if morphology is None else morphology
+        kb = isinstance(matcher, ingredient_kb.KnowledgeBase)
+        # With a knowledge base the typo index covers the built-in
+        # vocabulary only: indexing every artifact word would cost each
+        # worker seconds and a heap copy of what the mmap shares.
+        vocabulary = _vocabulary(ALLERGEN_RULES, INGREDIENT_VARIANTS) if kb else _vocabulary(rules, variants)
+        if self.morphology and kb:
+            # Built with the artifact (normalizer_tables); one without them
+            # only gets punctuation folded.
+            self.forms = matcher.forms or {}
+            self.modifiers = COOKING_MODIFIERS - matcher.term_modifiers if matcher.forms is not None else frozenset()
+        elif self.morphology:
+            self.modifiers = COOKING_MODIFIERS - _term_words(rules, variants)
+            self.forms = _word_forms(vocabulary)
+        else:
+            self.modifiers, self.forms = None, {}
+        self.matcher = matcher if matcher is not None else _compile(rules, variants, self.canonical)
+        self.lookup_variants = {self.canonical(k): v for k, v in variants.items()}
+        compiled = time.perf_counter()
+        self.fuzzy = fuzzy if fuzzy is not None else _fuzzy_index(vocabulary)
+        indexed = time.perf_counter()
+        self.version = _rules_version(rules, variants, self.matcher, self.fuzzy, self.modifiers)
+        self.terms = len(self.matcher) if isinstance(self.matcher, ingredient_kb.KnowledgeBase) else (
+            len(rules) + len(variants)
+        )
+        self.analysis = lru_cache(maxsize=ANALYSIS_CACHE_SIZE)(self._analyze)
+        self.timings = {
+            "compile_ms": round((compiled - started) * 1000, 1),
+            "fuzzy_index_ms": round((indexed - compiled) * 1000, 1),
+            "version_ms": round((time.perf_counter() - indexed) * 1000, 1),
+        }
+
+    def correct_typos(self, cleaned: str) -> tuple:
+        """``cleaned`` with misspelled words replaced, and the corrections made."""
+        fuzzy = self.fuzzy
+        if all(len(word) < 5 or word in fuzzy.words for word in _WORD.findall(cleaned)):
+            return cleaned, ()
+        corrections = []
+
+        def fix(match):
+            word = match.group()
+            hit = fuzzy.correct(word) if len(word) >= 5 else None
+            if hit is None or not self._keeps_allergens(word, hit[0]):
+                return word
+            corrections.append({"from": word, "to": hit[0], "distance": hit[1], "confidence": hit[2]})
+            return hit[0]
+
+        return _WORD.sub(fix, cleaned), tuple(corrections)
+
+    def _keeps_allergens(self, word: str, correction: str) -> bool:
+        """False if ``word`` is within one edit of a term with an allergen ``correction`` lacks.
+
+        Asks the matcher rather than the typo index, which does not hold a
+        knowledge base's own words: "scallops" must not become "shallots"
+        because the index only knows the latter.
+        """
+        kept = self.classify(correction)[1]
+        return not any(self.classify(near)[1] & ~kept for near in ingredient_fuzzy.single_edits(word))
+
+    def canonical(self, ingredient: str) -> str:
+        """The key ``ingredient`` is analyzed under; O(length), no regex."""
+        if not self.morphology:
+            return " ".join(ingredient.lower().split())
+        words = ingredient.lower().translate(_PUNCTUATION).split()
+        forms = self.forms
+        kept = [forms.get(word, word) for word in words if word not in self.modifiers]
+        # "Fresh" alone is an ingredient, not a modifier of one.
+        return " ".join(kept or [forms.get(word, word) for word in words])
+
+    def _analyze(self, key: str) -> tuple:
+        """``(normalized, corrections, matched_terms, allergen_mask, dietary_mask)`` of a canonical key."""
+        corrected, corrections = self.correct_typos(key)
+        if corrections:
+            corrected = self.canonical(corrected)
+        normalized = self.lookup_variants.get(corrected, corrected)
+        return (normalized, corrections, *self.classify(normalized))
+
+    def normalize(self, ingredient: str) -> tuple:
+        return self.analysis(self.canonical(ingredient))[:2]
+
+    def classify(self, normalized: str) -> tuple:
+        """``(matched_terms, allergen_mask, dietary_mask)`` of a normalized ingredient."""
+        allergens = 0
+        dietary_categories = 0
+        matched_terms = []
+        for _, _, (term, term_allergens, term_dietary) in self.matcher.find(normalized):
+            if term in matched_terms:
+                continue
+            matched_terms.append(term)
+            allergens |= term_allergens
+            dietary_categories |= term_dietary
+        return tuple(matched_terms), allergens, dietary_categories
+
+    def compute(self, ingredient: str) -> ParsedIngredient:
+        normalized, corrections, matched_terms, allergens, dietary_categories = self.analysis(
+            self.canonical(ingredient)
+        )
+        result = {
+            "original_ingredient": ingredient,
+            "normalized_ingredient": normalized,
+            "matched_terms": matched_terms,
+            "allergens": ALLERGENS.decode(allergens),
+            "dietaryCategories": DIETARY_CATEGORIES.decode(dietary_categories),
+            "corrections": corrections,
+        }
+        return _parsed(result, allergens, dietary_categories)
+
+    def new_cache(self) -> parse_cache.ParseCache:
+        return parse_cache.ParseCache(self.compute, self.version, load=_load_ingredient)
+
+
+# A compiled knowledge base (INGREDIENT_KB_PATH, see ingredient_kb) replaces
+# the built-in tables; both expose the same ``find``. ingredient_rules can
+# load other tables at runtime.
+_KB = ingredient_kb.open_kb()
+_ACTIVE = RuleSet(ALLERGEN_RULES, INGREDIENT_VARIANTS, matcher=_KB, source=_KB.path if _KB else "built-in")
+# The rule set and its parse cache are swapped together (install_rules):
+# PARSE_CACHE computes with the rule set it was made for, so a cached
+# result never outlives its rules.
+PARSE_CACHE = _ACTIVE.new_cache()
+RULES_VERSION = _ACTIVE.version
+_INSTALL_LOCK = threading.Lock()
+
+
+def active_rules() -> RuleSet:
+    return _ACTIVE
+
+
+def install_rules(rules: RuleSet, warm: int | None = None) -> dict:
+    """Make ``rules`` the active rule set; returns what the swap cost.
+
+    The new parse cache is filled first with the ``warm`` (default
+    PARSE_CACHE_WARM_TOP) most recently used ingredients of the current
+    one, so traffic does not hit a cold cache. Requests keep using the old
+    rule set until the reference swap; nothing they do waits on this.
+    """
+    global _ACTIVE, PARSE_CACHE, RULES_VERSION
+    warm = int(os.getenv("PARSE_CACHE_WARM_TOP", parse_cache.DEFAULT_WARM_TOP)) if warm is None else warm
+    with _INSTALL_LOCK:
+        started = time.perf_counter()
+        cache = rules.new_cache()
+        warmed = cache.warm(PARSE_CACHE.hot_keys(warm)) if warm > 0 else 0
+        _ACTIVE = rules
+        PARSE_CACHE = cache
+        RULES_VERSION = rules.version
+    return {"warmed": warmed, "warm_ms": round((time.perf_counter() - started) * 1000, 1)}
+
+
+def _normalize(ingredient: str) -> tuple:
+    return _ACTIVE.normalize(ingredient)
+
+
+def normalize_ingredient(ingredient: str) -> str:
+    """Lowercased, whitespace-collapsed, typo-corrected and variant-resolved."""
+    return _ACTIVE.normalize(ingredient)[0]
+
+
+def _classify(normalized: str) -> tuple:
+    return _ACTIVE.classify(normalized)
+
+
+def _compute_ingredient(ingredient: str) -> ParsedIngredient:
+    return _ACTIVE.compute(ingredient)
+
+
+def parse_ingredient(ingredient: str) -> ParsedIngredient:
+    """Tags of one ingredient, through the two-level ``PARSE_CACHE``.
+
+    The result is shared with other callers and read-only; copy it (e.g.
+    ``copy.deepcopy``) before modifying it.
+    """
+    return PARSE_CACHE.get(ingredient)
+
+
+def clear_caches() -> None:
+    """Forget memoized results of the active rule set."""
+    PARSE_CACHE.clear()
+    _ACTIVE.analysis.cache_clear()
+
+
+def cache_metrics() -> dict:
+    """``PARSE_CACHE`` metrics plus the shared per-canonical-key analysis memo.
+
+    ``PARSE_CACHE`` is keyed by the ingredient as written; ``analysis_*``
+    counts how often a miss there was still answered from another
+    spelling of the same ingredient.
+    """
+    info = _ACTIVE.analysis.cache_info()
+    lookups = info.hits + info.misses
     return {
-        "original_ingredient": ingredient,
-        "normalized_ingredient": normalized,
-        "allergens": rules["allergens"],
-        "dietaryCategories": rules["dietaryCategories"],
+        **PARSE_CACHE.metrics(),
+        "analysis_hits": info.hits,
+        "analysis_misses": info.misses,
+        "analysis_entries": info.currsize,
+        "analysis_hit_rate": round(info.hits / lookups, 4) if lookups else 0.0,
+    }
+
+
+def warm_up(declarations: Iterable, top: int | None = None) -> int:
+    """Pre-parse the ``top`` most common ingredient names in ``declarations``.
+
+    ``declarations`` are ingredient texts of existing menu items. Returns the
+    number of names parsed (names already cached are skipped).
+    """
+    top = int(os.getenv("PARSE_CACHE_WARM_TOP", parse_cache.DEFAULT_WARM_TOP)) if top is None else top
+    if top <= 0:
+        return 0
+    counts = Counter()
+    for declaration in declarations:
+        if not declaration or not isinstance(declaration, (str, list)):
+            continue
+        for item in _iter_items(declaration):
+            counts.update(_subtree_names(item))
+    return PARSE_CACHE.warm(name for name, _ in counts.most_common(top))
+
+
+def _merge(values: list, extra) -> None:
+    values.extend(v for v in extra if v not in values)
+
+
+def _parse_item(item: dict) -> tuple:
+    """``(result, allergen_mask, dietary_mask)`` of a tokenized item, sub-ingredients included."""
+    matched_terms = []
+    corrections = []
+    allergens = dietary_categories = 0
+    if item["name"]:
+        own = parse_ingredient(item["name"])
+        matched_terms.extend(own["matched_terms"])
+        corrections.extend(own["corrections"])
+        allergens, dietary_categories = own.allergen_mask, own.dietary_mask
+    sub_ingredients = []
+    for child in item["children"]:
+        sub, sub_allergens, sub_dietary = _parse_item(child)
+        sub_ingredients.append(sub)
+        _merge(matched_terms, sub["matched_terms"])
+        corrections.extend(sub["corrections"])
+        allergens |= sub_allergens
+        dietary_categories |= sub_dietary
+    result = {
+        "original_ingredient": item["text"],
+        "normalized_ingredient": normalize_ingredient(item["text"]),
+        "matched_terms": matched_terms,
+        "allergens": ALLERGENS.decode(allergens),
+        "dietaryCategories": DIETARY_CATEGORIES.decode(dietary_categories),
+        "corrections": corrections,
+        "sub_ingredients": sub_ingredients,
     }
+    return result, allergens, dietary_categories
+
+
+def _subtree_names(item: dict):
+    if item["name"]:
+        yield item["name"]
+    for child in item["children"]:
+        yield from _subtree_names(child)
+
+
+def _subtree_masks(item: dict) -> tuple:
+    allergens = dietary_categories = 0
+    for name in _subtree_names(item):
+        parsed = parse_ingredient(name)
+        allergens |= parsed.allergen_mask
+        dietary_categories |= parsed.dietary_mask
+    return allergens, dietary_categories
+
+
+def _iter_items(ingredients: str | list[str]):
+    if isinstance(ingredients, str):
+        yield from iter_ingredients(ingredients)
+    else:
+        for declaration in ingredients:
+            yield from iter_ingredients(declaration)
 
 
 def parse_ingredients(ingredients: str | list[str]) -> dict:
-    ingredient_list = split_ingredients(ingredients)
+    """Allergens and dietary flags of a declaration (or list of declarations).
 
-    allergens = set()
-    dietary_categories = set()
+    "Contains" statements add to ``allergens``; "May contain" / shared
+    facility warnings are reported separately in ``cross_contact`` and are
+    not ingredients.
+    """
+    allergens = dietary_categories = cross_contact = 0
     parsed = []
 
-    for ingredient in ingredient_list:
-        result = parse_ingredient(ingredient)
-        parsed.append(result)
-        allergens.update(result["allergens"])
-        dietary_categories.update(result["dietaryCategories"])
+    for item in _iter_items(ingredients):
+        if item["section"] == "ingredients":
+            result, item_allergens, item_dietary = _parse_item(item)
+            parsed.append(result)
+        else:
+            item_allergens, item_dietary = _subtree_masks(item)
+        if item["section"] == "may_contain":
+            cross_contact |= item_allergens
+            continue
+        allergens |= item_allergens
+        dietary_categories |= item_dietary
 
     return {
         "parsed_ingredients": parsed,
-        "allergens": sorted(allergens),
-        "dietaryCategories": sorted(dietary_categories),
-    }
\ No newline at end of file
+        "allergens": ALLERGENS.decode(allergens),
+        "dietaryCategories": DIETARY_CATEGORIES.decode(dietary_categories),
+        "cross_contact": ALLERGENS.decode(cross_contact & ~allergens),
+    }
+
+
+def parse_ingredient_tags(ingredients: str | list[str]) -> tuple:
+    """``(allergen_mask, dietary_mask, cross_contact_mask)`` of a declaration.
+
+    The tags of ``parse_ingredients`` without the per-ingredient breakdown,
+    as ``allergen_tags`` masks for callers that combine them further.
+    """
+    allergens = dietary_categories = cross_contact = 0
+    for item in _iter_items(ingredients):
+        item_allergens, item_dietary = _subtree_masks(item)
+        if item["section"] == "may_contain":
+            cross_contact |= item_allergens
+            continue
+        allergens |= item_allergens
+        dietary_categories |= item_dietary
+    return allergens, dietary_categories, cross_contact & ~allergens
+
+
+def ingredient_names(ingredients: str | list[str]) -> set:
+    """Every ingredient and sub-ingredient name of a declaration, lowercased
+    and whitespace-collapsed (the ``parse_ingredient`` inputs that decide its
+    tags)."""
+    return {" ".join(name.lower().split()) for item in _iter_items(ingredients) for name in _subtree_names(item)}
+
+
+def parse_ingredients_batch(items: list) -> dict:
+    """Tags for every item of a menu at once.
+
+    ``items`` holds one declaration (string or list of strings) per menu
+    item. All items are tokenized first, each distinct canonical ingredient
+    (see ``RuleSet.canonical``) is analyzed once however many items share
+    it, and the tags are
+    scattered back. Per item, ``allergens`` / ``dietaryCategories`` /
+    ``cross_contact`` are what ``parse_ingredients`` reports for it;
+    ``ingredients`` lists its top-level declarations instead of the full
+    ``parsed_ingredients`` trees. Identical declarations share one result.
+    """
+    # One rule set for the whole batch, even if a reload swaps it meanwhile.
+    rules = _ACTIVE
+    analyses = {}
+    # item index -> [(section, [normalized names in that top-level subtree])]
+    tokenized = []
+    by_declaration = {}
+    tags = {}
+    total = 0
+    for declaration in items:
+        key = declaration if isinstance(declaration, str) else tuple(declaration)
+        if key in by_declaration:
+            tokenized.append(by_declaration[key])
+            total += sum(len(names) for _, _, names in by_declaration[key])
+            continue
+        entries = []
+        for item in _iter_items(declaration):
+            names = []
+            for name in _subtree_names(item):
+                canonical = rules.canonical(name)
+                if canonical not in analyses:
+                    analyses[canonical] = rules.analysis(canonical)
+                normalized = analyses[canonical][0]
+                tags.setdefault(normalized, analyses[canonical][2:])
+                names.append(normalized)
+            total += len(names)
+            entries.append((item["section"], item["text"], names))
+        by_declaration[key] = entries
+        tokenized.append(entries)
+
+    results = {}
+    scattered = []
+    for entries in tokenized:
+        result = results.get(id(entries))
+        if result is None:
+            allergens = dietary_categories = cross_contact = 0
+            declarations = []
+            for section, text, names in entries:
+                if section == "may_contain":
+                    for name in names:
+                        cross_contact |= tags[name][1]
+                    continue
+                for name in names:
+                    allergens |= tags[name][1]
+                    dietary_categories |= tags[name][2]
+                if section == "ingredients":
+                    declarations.append(text)
+            result = results[id(entries)] = {
+                "allergens": ALLERGENS.decode(allergens),
+                "dietaryCategories": DIETARY_CATEGORIES.decode(dietary_categories),
+                "cross_contact": ALLERGENS.decode(cross_contact & ~allergens),
+                "ingredients": declarations,
+            }
+        scattered.append(result)
+
+    return {"items": scattered, "total_ingredients": total, "distinct_ingredients": len(tags)}
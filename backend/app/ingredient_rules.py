@@ -0,0 +1,263 @@
+"""
+Ingredient rule tables that can be replaced while the server runs.
+
+INGREDIENT_RULES_SOURCE selects where the tables come from:
+  - unset: the built-in tables (or the INGREDIENT_KB_PATH knowledge base)
+    ``ingredient_parser`` starts with; nothing is reloaded.
+  - a file path: a JSON or CSV source (see ``ingredient_kb``) or a compiled
+    ``.sekb`` knowledge base. Write the new file next to the old one and
+    rename it over it, so a reload never reads half a file.
+  - ``db``: the ``ingredient_rules`` node, ``{"rules": {...}, "variants":
+    {...}}``, written by PUT /ingredients/rules along with
+    ``ingredient_rules_meta`` ``{version, updated_at, updated_by}``.
+
+Each worker keeps a marker of what it loaded (the file's size and mtime, or
+the meta node's version) and checks it every INGREDIENT_RULES_POLL_SECONDS
+(default 30; 0 = only at startup and on POST /ingredients/rules/reload), so
+a change published through one worker reaches the others by reading one
+small node. A changed source is loaded, compiled into an
+``ingredient_parser.RuleSet`` and given a warmed parse cache on a
+background thread, then swapped in with ``install_rules``: requests never
+wait for a reload and never see half of one. Only one reload runs at a
+time; a change noticed meanwhile (an admin publishing tables while the
+poller compiles) is loaded by the running one when it finishes. A source
+that fails to load or validate leaves the current rules in place.
+
+Every reload that changes the rules, polled or asked for, calls the
+``on_change`` callback given to ``start`` (main.py re-tags stored menus;
+``menu_retag`` makes sure only one worker's job runs).
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Any, Callable, Optional, Tuple
+
+import ingredient_kb
+import ingredient_parser
+from allergen_tags import PARSER_DIETARY_FLAGS, VALID_ALLERGENS
+
+RULES_PATH = "ingredient_rules"
+META_PATH = "ingredient_rules_meta"
+DEFAULT_POLL_SECONDS = 30
+# Characters Firebase does not allow in keys; rule terms are keys in RULES_PATH.
+_FORBIDDEN_KEY_CHARS = set(".$#[]/")
+
+
+class RulesError(ValueError):
+    """A rule source that cannot be used; the message says why."""
+
+
+def validate(rules: dict, variants: dict) -> None:
+    """Raise RulesError unless the tables are usable by ``ingredient_parser``."""
+    if not rules:
+        raise RulesError("The rule table is empty.")
+    for term, body in rules.items():
+        if not term:
+            raise RulesError("Rule terms cannot be empty.")
+        unknown = set(body.get("allergens", [])) - VALID_ALLERGENS
+        if unknown:
+            raise RulesError(f"Unknown allergens for '{term}': {', '.join(sorted(unknown))}")
+        unknown = set(body.get("dietaryCategories", [])) - PARSER_DIETARY_FLAGS
+        if unknown:
+            raise RulesError(f"Unknown dietary flags for '{term}': {', '.join(sorted(unknown))}")
+    for variant, canonical in variants.items():
+        if not variant:
+            raise RulesError("Variant spellings cannot be empty.")
+        if canonical not in rules:
+            raise RulesError(f"Variant '{variant}' points at '{canonical}', which has no rule.")
+
+
+def tables_version(rules: dict, variants: dict) -> str:
+    return hashlib.sha256(json.dumps([rules, variants], sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+
+def publish(db: Any, rules: dict, variants: dict, updated_by: str) -> dict:
+    """Store new tables under RULES_PATH for every worker to pick up; returns the meta.
+
+    ``rules`` / ``variants`` are normalized like a JSON source first. The
+    meta node is written after the tables, so a worker that sees the new
+    version always reads the new tables.
+    """
+    rules, variants = ingredient_kb.tables_from_json({"rules": rules, "variants": variants})
+    validate(rules, variants)
+    for term in list(rules) + list(variants):
+        if _FORBIDDEN_KEY_CHARS & set(term):
+            raise RulesError(f"'{term}' cannot be stored: terms may not contain . $ # [ ] /")
+    meta = {"version": tables_version(rules, variants), "updated_at": time.time(), "updated_by": updated_by}
+    db.reference(RULES_PATH).set({"rules": rules, "variants": variants})
+    db.reference(META_PATH).set(meta)
+    return meta
+
+
+class RulesReloader:
+    """Watches INGREDIENT_RULES_SOURCE and installs new rule sets off the request path."""
+
+    def __init__(
+        self,
+        source: Optional[str] = None,
+        poll_seconds: Optional[float] = None,
+        on_change: Optional[Callable[[dict], Any]] = None,
+    ):
+        self.source = source if source is not None else (os.getenv("INGREDIENT_RULES_SOURCE") or "")
+        self.poll_seconds = (
+            poll_seconds
+            if poll_seconds is not None
+            else float(os.getenv("INGREDIENT_RULES_POLL_SECONDS", DEFAULT_POLL_SECONDS))
+        )
+        self.on_change = on_change
+        # Guards the fields below only; never held while loading or compiling.
+        self._lock = threading.Lock()
+        self._loading = False
+        self._pending: Optional[bool] = None  # a reload asked for meanwhile (its ``force``)
+        self._marker: Optional[str] = None
+        self._worker: Optional[threading.Thread] = None
+        self._poller: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self.reloads = 0
+        self.last_report: Optional[dict] = None
+        self.last_error: Optional[str] = None
+
+    @property
+    def reloading(self) -> bool:
+        return self._loading or (self._worker is not None and self._worker.is_alive())
+
+    def marker(self, db: Any) -> Optional[str]:
+        """What identifies the source's current content; None = nothing to load."""
+        if not self.source:
+            return None
+        if self.source == "db":
+            return (db.reference(META_PATH).get() or {}).get("version")
+        stat = os.stat(self.source)
+        return f"{stat.st_size}:{stat.st_mtime_ns}"
+
+    def _load(self, db: Any) -> Tuple[dict, dict, Any]:
+        """``(rules, variants, matcher)`` of the source; matcher None = compile the tables."""
+        if self.source == "db":
+            data = db.reference(RULES_PATH).get()
+            if not isinstance(data, dict):
+                raise RulesError(f"No rule tables at {RULES_PATH}.")
+            rules, variants = ingredient_kb.tables_from_json(data)
+        elif self.source.endswith(".sekb"):
+            return {}, {}, ingredient_kb.KnowledgeBase(self.source)
+        else:
+            rules, variants = ingredient_kb.load_source(self.source)
+        validate(rules, variants)
+        return rules, variants, None
+
+    def reload(self, db: Any, force: bool = False) -> Optional[dict]:
+        """Load, compile and install the source if it changed (or ``force``).
+
+        Returns the report of the reload, None when there was nothing new or
+        another reload is running (which then loads the source again).
+        Raises when the source cannot be loaded; the current rules stay.
+        """
+        marker = self.marker(db)
+        with self._lock:
+            if marker is None or (marker == self._marker and not force):
+                return None
+            if self._loading:
+                self._pending = bool(self._pending) or force
+                return None
+            self._loading = True
+        try:
+            report = self._install(db, marker)
+        finally:
+            with self._lock:
+                self._loading = False
+                pending, self._pending = self._pending, None
+        print(
+            f"Ingredient rules reloaded from {self.source}: {report['terms']} terms, "
+            f"version {report['version']}, {report['total_ms']:.0f} ms"
+        )
+        if report["changed"] and self.on_change is not None:
+            try:
+                self.on_change(report)
+            except Exception as e:
+                print(f"Ingredient rules reload callback failed: {e}")
+        if pending is not None:
+            return self.check(db, pending) or report
+        return report
+
+    def _install(self, db: Any, marker: str) -> dict:
+        previous = ingredient_parser.active_rules().version
+        started = time.perf_counter()
+        rules, variants, matcher = self._load(db)
+        load_ms = round((time.perf_counter() - started) * 1000, 1)
+        ruleset = ingredient_parser.RuleSet(rules, variants, matcher=matcher, source=self.source)
+        swap = ingredient_parser.install_rules(ruleset)
+        report = {
+            "source": self.source,
+            "version": ruleset.version,
+            "previousVersion": previous,
+            "changed": ruleset.version != previous,
+            "terms": ruleset.terms,
+            "load_ms": load_ms,
+            **ruleset.timings,
+            **swap,
+            "total_ms": round((time.perf_counter() - started) * 1000, 1),
+            "finished_at": time.time(),
+        }
+        with self._lock:
+            self._marker = marker
+            self.reloads += 1
+            self.last_report = report
+            self.last_error = None
+        return report
+
+    def check(self, db: Any, force: bool = False) -> Optional[dict]:
+        """``reload`` that logs a failure instead of raising it."""
+        try:
+            return self.reload(db, force)
+        except Exception as e:
+            self.last_error = str(e)
+            print(f"Ingredient rules reload from {self.source} failed, keeping version "
+                  f"{ingredient_parser.RULES_VERSION}: {e}")
+            return None
+
+    def reload_in_background(self, db: Any, force: bool = False) -> bool:
+        """``check`` on a daemon thread; False if one started that way is still running."""
+        with self._lock:
+            if self._worker is not None and self._worker.is_alive():
+                return False
+            self._worker = threading.Thread(target=self.check, args=(db, force), name="rules-reload", daemon=True)
+            self._worker.start()
+            return True
+
+    def join(self, timeout: Optional[float] = None) -> None:
+        if self._worker is not None:
+            self._worker.join(timeout)
+
+    def start(self, db: Any, on_change: Optional[Callable[[dict], Any]] = None) -> None:
+        """Load the source now, then keep polling it in the background."""
+        if on_change is not None:
+            self.on_change = on_change
+        if not self.source:
+            return
+        self.check(db)
+        if self.poll_seconds > 0 and self._poller is None:
+            self._poller = threading.Thread(target=self._poll, args=(db,), name="rules-poll", daemon=True)
+            self._poller.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _poll(self, db: Any) -> None:
+        while not self._stop.wait(self.poll_seconds):
+            self.check(db)
+
+    def status(self) -> dict:
+        active = ingredient_parser.active_rules()
+        return {
+            "source": self.source or "built-in",
+            "poll_seconds": self.poll_seconds,
+            "active": {"version": active.version, "source": active.source, "terms": active.terms, **active.timings},
+            "reloading": self.reloading,
+            "reloads": self.reloads,
+            "last_report": self.last_report,
+            "last_error": self.last_error,
+        }
+
+
+reloader = RulesReloader()
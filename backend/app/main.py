@@ -1,4 +1,4 @@
-from routes import router
+from routes import router, warm_parse_cache
 from firebase_admin import credentials
 from dotenv import load_dotenv
 import json
@@ -7,7 +7,11 @@ from fastapi.middleware.cors import CORSMiddleware
 import firebase_admin
 from firebase_admin import credentials, db
 import os
+import threading
+import ingredient_rules
+import menu_retag
 from auth_routes import auth_router
+from ai_admission import AIAdmissionMiddleware
 
 app = FastAPI()
 app.include_router(auth_router, prefix="/auth")
@@ -18,6 +22,9 @@ origins = [
     "https://safeeats-teamm.onrender.com" # Render app
 ]
 
+# Added before CORS so CORS wraps it and its fast 503s stay readable by the browser.
+app.add_middleware(AIAdmissionMiddleware)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,
@@ -63,6 +70,25 @@ initialize_firebase()
 app.include_router(router)
 
 
+@app.on_event("startup")
+def start_rules_reloader():
+    # Before the warm-up and re-tagging below, so both use the loaded rules.
+    # Every worker re-tags after a reload; menu_retag runs one job of them.
+    ingredient_rules.reloader.start(db, on_change=lambda report: menu_retag.retagger.start(db))
+
+
+@app.on_event("startup")
+def start_parse_cache_warm_up():
+    # In the background: reading every menu must not delay the first request.
+    threading.Thread(target=warm_parse_cache, name="parse-cache-warm-up", daemon=True).start()
+
+
+@app.on_event("startup")
+def start_menu_retag():
+    # Stored tags follow rule changes shipped with this deploy (see menu_retag).
+    menu_retag.retag_on_startup(db)
+
+
 @app.get("/")
 async def root():
     return {"message": "Restaurant Allergy Manager API"}
@@ -0,0 +1,128 @@
+"""
+Background archival of uploaded menu files.
+
+/ai/ingest-menu keeps a copy of every upload under ``menu_files/`` for
+auditing. Uploading it inline added the storage round trip to every ingest,
+so uploads are handed to a small pool of worker threads instead and overlap
+with extraction. The queue is bounded (MENU_ARCHIVE_QUEUE_SIZE) because each
+job holds the file bytes; when it is full the copy is dropped and logged
+rather than making the user wait. Failed uploads are retried
+MENU_ARCHIVE_MAX_ATTEMPTS times with exponential backoff. A job submitted
+with a ``cancel`` event (set when the client disconnects) is skipped if the
+event is set before it starts or between retries.
+
+Threads rather than asyncio tasks are used so jobs survive the end of the
+request and do not depend on which event loop accepted it.
+"""
+import os
+import queue
+import threading
+import time
+from typing import Callable, Optional
+
+DEFAULT_QUEUE_SIZE = 32
+DEFAULT_MAX_ATTEMPTS = 3
+DEFAULT_BACKOFF_SECONDS = 0.5
+DEFAULT_WORKERS = 2
+
+
+class MenuArchiver:
+    def __init__(
+        self,
+        queue_size: Optional[int] = None,
+        max_attempts: Optional[int] = None,
+        backoff_seconds: Optional[float] = None,
+        workers: Optional[int] = None,
+    ):
+        self.queue_size = queue_size or int(os.getenv("MENU_ARCHIVE_QUEUE_SIZE", DEFAULT_QUEUE_SIZE))
+        self.max_attempts = max_attempts or int(os.getenv("MENU_ARCHIVE_MAX_ATTEMPTS", DEFAULT_MAX_ATTEMPTS))
+        self.backoff_seconds = (
+            backoff_seconds
+            if backoff_seconds is not None
+            else float(os.getenv("MENU_ARCHIVE_RETRY_BACKOFF", DEFAULT_BACKOFF_SECONDS))
+        )
+        self.workers = workers or int(os.getenv("MENU_ARCHIVE_WORKERS", DEFAULT_WORKERS))
+        self.stats = {"queued": 0, "uploaded": 0, "retried": 0, "failed": 0, "dropped": 0, "cancelled": 0}
+        self._queue: "queue.Queue" = queue.Queue(maxsize=self.queue_size)
+        self._threads: list = []
+        self._start_lock = threading.Lock()
+        # Workers and request threads all bump the counters; += on a dict
+        # entry is not atomic.
+        self._stats_lock = threading.Lock()
+
+    def _ensure_started(self) -> None:
+        with self._start_lock:
+            self._threads = [t for t in self._threads if t.is_alive()]
+            while len(self._threads) < self.workers:
+                thread = threading.Thread(target=self._run, name="menu-archiver", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def submit(
+        self,
+        label: str,
+        upload: Callable[[], None],
+        on_done: Optional[Callable[[bool], None]] = None,
+        cancel: Optional[threading.Event] = None,
+    ) -> bool:
+        """Queue ``upload`` without blocking; returns False if it was dropped."""
+        self._ensure_started()
+        try:
+            self._queue.put_nowait((label, upload, on_done, cancel))
+        except queue.Full:
+            self._count("dropped")
+            print(f"Menu archive queue full; not archiving {label}")
+            return False
+        self._count("queued")
+        return True
+
+    def metrics(self) -> dict:
+        with self._stats_lock:
+            return dict(self.stats)
+
+    def _count(self, name: str) -> None:
+        with self._stats_lock:
+            self.stats[name] += 1
+
+    def join(self, timeout: Optional[float] = None) -> bool:
+        """Wait until every queued upload has finished; True if drained."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._queue.all_tasks_done.wait(remaining)
+        return True
+
+    def _run(self) -> None:
+        while True:
+            label, upload, on_done, cancel = self._queue.get()
+            try:
+                ok = self._upload_with_retries(label, upload, cancel)
+                if on_done is not None:
+                    try:
+                        on_done(ok)
+                    except Exception as callback_error:
+                        print(f"Menu archive callback failed for {label}: {callback_error}")
+            finally:
+                self._queue.task_done()
+
+    def _upload_with_retries(self, label: str, upload: Callable[[], None], cancel: Optional[threading.Event] = None) -> bool:
+        for attempt in range(1, self.max_attempts + 1):
+            if cancel is not None and cancel.is_set():
+                self._count("cancelled")
+                print(f"Not archiving {label}: the request was cancelled")
+                return False
+            try:
+                upload()
+                self._count("uploaded")
+                return True
+            except Exception as storage_error:
+                if attempt == self.max_attempts:
+                    self._count("failed")
+                    print(f"Error archiving menu file {label} after {attempt} attempts: {storage_error}")
+                    return False
+                self._count("retried")
+                time.sleep(self.backoff_seconds * (2 ** (attempt - 1)))
+        return False
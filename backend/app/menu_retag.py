@@ -0,0 +1,443 @@
+"""
+Incremental re-tagging of stored menu items when the ingredient rules change.
+
+A menu item's tags are the ones set by hand plus the ones
+``ingredient_parser`` inferred from its ingredients when it was saved.
+Items record which of their tags came only from the parser
+(``inferredAllergens`` / ``inferredDietaryCategories``) and the
+``rulesVersion`` (``ingredient_parser.RULES_VERSION``) they were inferred
+under, so re-tagging can replace the inferred part and never touch a tag
+somebody set by hand.
+
+``ingredient_index/{id}`` is a reverse index from each ingredient name
+(lowercased, whitespace-collapsed) to the items that contain it, and holds
+the ingredient's own tags under every rules version an item was tagged
+with::
+
+    {"name": "whey", "items": {item_id: true}, "tags": {version: "milk|not vegan"}}
+
+After a rules change the job parses each indexed ingredient (there are far
+fewer distinct ingredients than items) and re-evaluates only the items of
+ingredients whose tags differ from an older version's. Items are handled
+in batches of RETAG_BATCH_SIZE (default 200) with a
+RETAG_BATCH_PAUSE_SECONDS pause (default 0.05) between them so a large job
+leaves room for requests. Each batch re-reads its items just before writing
+and stores their new tag fields and ``rulesVersion`` in one multi-path
+update of only those fields, so a manual edit made earlier in the job is
+re-tagged rather than overwritten, and an item deleted meanwhile is skipped
+instead of being recreated as a stub.
+
+Every worker starts a job at startup and after a rules reload, but only one
+runs it: a job first claims ``retag_state/lease`` in a transaction (held for
+RETAG_LEASE_SECONDS, default 300, and renewed every batch), and a job
+started that way is dropped once it holds the lease if ``retag_state``
+already records the current rules version.
+
+Items saved before the index existed are picked up by a full rescan, which
+reads every item and rebuilds the index; it runs on its own the first time
+(no ``retag_state`` yet) only when an admin asks for it
+(``POST /ingredients/retag``) or MENU_RETAG_AUTO_FULL=1 lets the startup
+and reload jobs start it, since it rewrites every item. Those items did not
+record which tags were inferred, so the tags the parser finds in them now
+are taken as inferred and the rest as set by hand. Set
+MENU_RETAG_ON_STARTUP=0 to skip the check at startup.
+"""
+import hashlib
+import os
+import threading
+import time
+from typing import Any, Iterable, Optional
+from uuid import uuid4
+
+import ingredient_parser
+from allergen_tags import ALLERGENS, DIETARY_CATEGORIES
+
+INDEX_PATH = "ingredient_index"
+MENU_PATH = "menu_items"
+STATE_PATH = "retag_state"
+
+DEFAULT_BATCH_SIZE = 200
+DEFAULT_BATCH_PAUSE_SECONDS = 0.05
+DEFAULT_LEASE_SECONDS = 300
+
+# Tag fields of an item, as written by tag_fields.
+_TAG_FIELDS = ("allergens", "dietaryCategories", "inferredAllergens", "inferredDietaryCategories")
+
+
+def entry_id(name: str) -> str:
+    """Database key of an ingredient's index entry (names may hold "." or "/")."""
+    return hashlib.sha256(name.encode("utf-8")).hexdigest()[:20]
+
+
+def ingredient_signature(name: str) -> str:
+    """An ingredient's tags under the current rules, as stored in the index."""
+    parsed = ingredient_parser.parse_ingredient(name)
+    return (
+        ",".join(ALLERGENS.decode(parsed.allergen_mask))
+        + "|"
+        + ",".join(DIETARY_CATEGORIES.decode(parsed.dietary_mask))
+    )
+
+
+def item_ingredients(ingredients: Any) -> set:
+    if not ingredients or not isinstance(ingredients, (str, list)):
+        return set()
+    return ingredient_parser.ingredient_names(ingredients)
+
+
+def tag_fields(
+    ingredients: Any,
+    allergens: Iterable[str],
+    dietary_categories: Iterable[str],
+    inferred_allergens: Iterable[str] = (),
+    inferred_dietary_categories: Iterable[str] = (),
+) -> dict:
+    """An item's tag fields under the current rules.
+
+    The tags not listed as inferred are the hand-set ones and are all kept
+    (names the codec does not know included); the inferred part is replaced
+    by what the parser finds now.
+    """
+    parsed_allergens = parsed_dietary = 0
+    if ingredients and isinstance(ingredients, (str, list)):
+        parsed_allergens, parsed_dietary, _ = ingredient_parser.parse_ingredient_tags(ingredients)
+    manual_allergens, unknown_allergens = ALLERGENS.split(allergens)
+    manual_dietary, unknown_dietary = DIETARY_CATEGORIES.split(dietary_categories)
+    manual_allergens &= ~ALLERGENS.mask(inferred_allergens)
+    manual_dietary &= ~DIETARY_CATEGORIES.mask(inferred_dietary_categories)
+    return {
+        "allergens": ALLERGENS.decode(manual_allergens | parsed_allergens) + unknown_allergens,
+        "dietaryCategories": DIETARY_CATEGORIES.decode(manual_dietary | parsed_dietary) + unknown_dietary,
+        "inferredAllergens": ALLERGENS.decode(parsed_allergens & ~manual_allergens),
+        "inferredDietaryCategories": DIETARY_CATEGORIES.decode(parsed_dietary & ~manual_dietary),
+        "rulesVersion": ingredient_parser.RULES_VERSION,
+    }
+
+
+def retag_item(item: dict) -> dict:
+    """``tag_fields`` of a stored item.
+
+    An item without a ``rulesVersion`` was saved before inferred tags were
+    recorded; the tags the parser finds in it now count as the inferred ones.
+    """
+    if "rulesVersion" in item:
+        inferred_allergens = item.get("inferredAllergens") or []
+        inferred_dietary = item.get("inferredDietaryCategories") or []
+    else:
+        inferred_allergens = inferred_dietary = []
+        ingredients = item.get("ingredients")
+        if ingredients and isinstance(ingredients, (str, list)):
+            allergen_mask, dietary_mask, _ = ingredient_parser.parse_ingredient_tags(ingredients)
+            inferred_allergens = ALLERGENS.decode(allergen_mask)
+            inferred_dietary = DIETARY_CATEGORIES.decode(dietary_mask)
+    return tag_fields(
+        item.get("ingredients"),
+        item.get("allergens") or [],
+        item.get("dietaryCategories") or [],
+        inferred_allergens,
+        inferred_dietary,
+    )
+
+
+def edited_tag_fields(existing: dict, updated: dict) -> dict:
+    """Tag fields to store after a manual edit turned ``existing`` into ``updated``.
+
+    Inferred tags the user removed are no longer inferred (so the edit
+    sticks); if the ingredients changed, the item is re-tagged under the
+    current rules, keeping the hand-set tags.
+    """
+    allergens = updated.get("allergens") or []
+    dietary_categories = updated.get("dietaryCategories") or []
+    inferred_allergens = [a for a in existing.get("inferredAllergens") or [] if a in allergens]
+    inferred_dietary = [d for d in existing.get("inferredDietaryCategories") or [] if d in dietary_categories]
+    if (updated.get("ingredients") or "") != (existing.get("ingredients") or ""):
+        return tag_fields(
+            updated.get("ingredients"), allergens, dietary_categories, inferred_allergens, inferred_dietary
+        )
+    return {"inferredAllergens": inferred_allergens, "inferredDietaryCategories": inferred_dietary}
+
+
+def index_updates(item_id: str, old_ingredients: Any, new_ingredients: Any) -> dict:
+    """Multi-path update of the index for an item whose ingredients changed."""
+    old_names = item_ingredients(old_ingredients)
+    new_names = item_ingredients(new_ingredients)
+    updates = {}
+    for name in old_names - new_names:
+        updates[f"{entry_id(name)}/items/{item_id}"] = None
+    for name in new_names - old_names:
+        key = entry_id(name)
+        updates[f"{key}/name"] = name
+        updates[f"{key}/items/{item_id}"] = True
+        updates[f"{key}/tags/{ingredient_parser.RULES_VERSION}"] = ingredient_signature(name)
+    return updates
+
+
+def reindex_item(db: Any, item_id: str, old_ingredients: Any, new_ingredients: Any) -> None:
+    """Best effort: a missed index write only costs a full rescan later."""
+    try:
+        updates = index_updates(item_id, old_ingredients, new_ingredients)
+        if updates:
+            db.reference(INDEX_PATH).update(updates)
+    except Exception as e:
+        print(f"Error updating ingredient index for {item_id}: {e}")
+
+
+class MenuRetagger:
+    """Runs one re-tagging job at a time on a daemon thread."""
+
+    def __init__(
+        self,
+        batch_size: Optional[int] = None,
+        batch_pause: Optional[float] = None,
+        lease_seconds: Optional[float] = None,
+    ):
+        self.batch_size = batch_size or int(os.getenv("RETAG_BATCH_SIZE", DEFAULT_BATCH_SIZE))
+        self.batch_pause = (
+            batch_pause
+            if batch_pause is not None
+            else float(os.getenv("RETAG_BATCH_PAUSE_SECONDS", DEFAULT_BATCH_PAUSE_SECONDS))
+        )
+        self.lease_seconds = lease_seconds or float(os.getenv("RETAG_LEASE_SECONDS", DEFAULT_LEASE_SECONDS))
+        self.owner = uuid4().hex
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self.last_report: Optional[dict] = None
+        self.last_error: Optional[str] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def status(self) -> dict:
+        return {"running": self.running, "last_report": self.last_report, "last_error": self.last_error}
+
+    def start(self, db: Any, full: Optional[bool] = None) -> bool:
+        """Start a job in the background; False if one is already running here.
+
+        ``full=None`` drops the job if one already ran under the current rules
+        version, and runs incrementally unless no job has ever finished, in
+        which case the full rescan needs MENU_RETAG_AUTO_FULL=1.
+        """
+        with self._lock:
+            if self.running:
+                return False
+            self._thread = threading.Thread(
+                target=self._run, args=(db, full, full is None), name="menu-retag", daemon=True
+            )
+            self._thread.start()
+            return True
+
+    def join(self, timeout: Optional[float] = None) -> None:
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self, db: Any, full: Optional[bool], stale_only: bool) -> None:
+        try:
+            self.run(db, full, stale_only)
+            self.last_error = None
+        except Exception as e:
+            self.last_error = str(e)
+            print(f"Menu re-tagging failed: {e}")
+
+    def run(self, db: Any, full: Optional[bool] = None, stale_only: bool = False) -> Optional[dict]:
+        """Re-tag synchronously and return the report (also kept as ``last_report``).
+
+        Returns None without re-tagging when another worker holds the lease,
+        or with ``stale_only`` when the current rules version was done already
+        or when it would be an unrequested full rescan.
+        """
+        if not self._hold_lease(db):
+            print("Menu re-tagging skipped: another worker is running it")
+            return None
+        try:
+            state = db.reference(STATE_PATH).get() or {}
+            if stale_only and state.get("rulesVersion") == ingredient_parser.RULES_VERSION:
+                return None
+            if (
+                stale_only
+                and full is None
+                and not state.get("rulesVersion")
+                and os.getenv("MENU_RETAG_AUTO_FULL", "0") != "1"
+            ):
+                print(
+                    "Menu re-tagging skipped: no job has run yet; start the full rescan with "
+                    "POST /ingredients/retag?full=true or set MENU_RETAG_AUTO_FULL=1"
+                )
+                return None
+            return self._run_claimed(db, full, state)
+        finally:
+            self._release_lease(db)
+
+    def _run_claimed(self, db: Any, full: Optional[bool], state: dict) -> dict:
+        started = time.perf_counter()
+        if full is None:
+            full = not state.get("rulesVersion")
+        report = self._full(db) if full else self._incremental(db)
+        report.update(
+            {
+                "mode": "full" if full else "incremental",
+                "rulesVersion": ingredient_parser.RULES_VERSION,
+                "previousVersion": state.get("rulesVersion"),
+                "seconds": round(time.perf_counter() - started, 3),
+                "finished_at": time.time(),
+            }
+        )
+        self._hold_lease(db, renew=True)
+        db.reference(STATE_PATH).update(
+            {"rulesVersion": ingredient_parser.RULES_VERSION, "report": report, "lease": None}
+        )
+        self.last_report = report
+        print(
+            f"Menu re-tagging ({report['mode']}): {report['items_touched']} of "
+            f"{report['items_indexed']} items re-evaluated, {report['items_updated']} updated "
+            f"in {report['seconds']:.2f}s"
+        )
+        return report
+
+    def _incremental(self, db: Any) -> dict:
+        version = ingredient_parser.RULES_VERSION
+        index = db.reference(INDEX_PATH).get() or {}
+        all_items = set()
+        touched = {}
+        index_changes = {}
+        changed = 0
+        for key, entry in index.items():
+            if not isinstance(entry, dict) or not entry.get("name"):
+                continue
+            items = set(entry.get("items") or {})
+            all_items |= items
+            tags = entry.get("tags") or {}
+            if set(tags) == {version}:
+                continue
+            signature = ingredient_signature(entry["name"])
+            if any(stored != signature for v, stored in tags.items() if v != version):
+                changed += 1
+                for item_id in items:
+                    touched.setdefault(item_id, []).append(entry["name"])
+            index_changes[f"{key}/tags"] = {version: signature}
+
+        updated, batches, missing = self._retag(db, touched)
+        for item_id in missing:
+            # Deleted without its index entries (best-effort writes).
+            for name in touched[item_id]:
+                index_changes[f"{entry_id(name)}/items/{item_id}"] = None
+        self._write(db, INDEX_PATH, index_changes)
+        return {
+            "ingredients_indexed": len(index),
+            "ingredients_changed": changed,
+            "items_indexed": len(all_items),
+            "items_touched": len(touched),
+            "items_updated": updated,
+            "batches": batches,
+        }
+
+    def _full(self, db: Any) -> dict:
+        version = ingredient_parser.RULES_VERSION
+        menu_items = db.reference(MENU_PATH).get() or {}
+        menu_items = {k: v for k, v in menu_items.items() if isinstance(v, dict)}
+        index = {}
+        for item_id, item in menu_items.items():
+            for name in item_ingredients(item.get("ingredients")):
+                key = entry_id(name)
+                if key not in index:
+                    index[key] = {"name": name, "items": {}, "tags": {version: ingredient_signature(name)}}
+                index[key]["items"][item_id] = True
+
+        updated, batches, _ = self._retag(db, menu_items)
+        db.reference(INDEX_PATH).set(index)
+        return {
+            "ingredients_indexed": len(index),
+            "ingredients_changed": len(index),
+            "items_indexed": len(menu_items),
+            "items_touched": len(menu_items),
+            "items_updated": updated,
+            "batches": batches,
+        }
+
+    def _hold_lease(self, db: Any, renew: bool = False) -> bool:
+        """Claim (or with ``renew``, extend) the job lease; False if another worker holds it."""
+        now = time.time()
+
+        def claim(lease):
+            if isinstance(lease, dict) and lease.get("owner") != self.owner and lease.get("expires", 0) > now:
+                return lease
+            return {"owner": self.owner, "expires": now + self.lease_seconds}
+
+        lease = db.reference(f"{STATE_PATH}/lease").transaction(claim)
+        if (lease or {}).get("owner") == self.owner:
+            return True
+        if renew:
+            raise RuntimeError("Lost the re-tagging lease to another worker")
+        return False
+
+    def _release_lease(self, db: Any) -> None:
+        try:
+            db.reference(f"{STATE_PATH}/lease").transaction(
+                lambda lease: None if (lease or {}).get("owner") == self.owner else lease
+            )
+        except Exception as e:
+            print(f"Error releasing the re-tagging lease: {e}")
+
+    def _retag(self, db: Any, item_ids: Iterable[str]) -> tuple:
+        """Re-tag the items in batches; ``(updated, batches, missing item ids)``."""
+        updated = batches = 0
+        missing = []
+        batch = []
+        for item_id in item_ids:
+            batch.append(item_id)
+            if len(batch) == self.batch_size:
+                batch_updated, written = self._retag_batch(db, batch, missing)
+                updated, batches, batch = updated + batch_updated, batches + written, []
+        batch_updated, written = self._retag_batch(db, batch, missing)
+        return updated + batch_updated, batches + written, missing
+
+    def _retag_batch(self, db: Any, batch: list, missing: list) -> tuple:
+        """``(updated, written)``: items whose tags changed, and 1 if anything was written.
+
+        Items read just now and gone are appended to ``missing`` and not written.
+        """
+        if not batch:
+            return 0, 0
+        self._hold_lease(db, renew=True)
+        updated = 0
+        updates = {}
+        for item_id in batch:
+            item = db.reference(f"{MENU_PATH}/{item_id}").get()
+            if not isinstance(item, dict):
+                missing.append(item_id)
+                continue
+            fields = retag_item(item)
+            if fields["allergens"] != (item.get("allergens") or []) or fields["dietaryCategories"] != (
+                item.get("dietaryCategories") or []
+            ):
+                updated += 1
+            for field in _TAG_FIELDS:
+                if fields[field] != (item.get(field) or []):
+                    updates[f"{item_id}/{field}"] = fields[field]
+            if item.get("rulesVersion") != fields["rulesVersion"]:
+                updates[f"{item_id}/rulesVersion"] = fields["rulesVersion"]
+        return updated, self._write(db, MENU_PATH, updates)
+
+    def _write(self, db: Any, path: str, updates: dict) -> int:
+        if not updates:
+            return 0
+        db.reference(path).update(updates)
+        if self.batch_pause:
+            time.sleep(self.batch_pause)
+        return 1
+
+
+retagger = MenuRetagger()
+
+
+def retag_on_startup(db: Any) -> None:
+    """Re-tag in the background if the rules changed since the last job."""
+    if os.getenv("MENU_RETAG_ON_STARTUP", "1") == "0":
+        return
+    try:
+        state = db.reference(STATE_PATH).get() or {}
+    except Exception as e:
+        print(f"Menu re-tagging check skipped: {e}")
+        return
+    if state.get("rulesVersion") != ingredient_parser.RULES_VERSION:
+        retagger.start(db)
@@ -0,0 +1,261 @@
+"""
+Two-level cache for ``ingredient_parser.parse_ingredient``.
+
+Level 1 is an in-process LRU bounded by an estimate of the memory its
+entries hold rather than by entry count, since a parsed declaration with
+sub-ingredients can be a hundred times the size of a bare "salt". Level 2
+is optional: a SQLite file shared by every worker on the host, so one
+worker's parse warms them all and a restart does not start cold. Entries
+are keyed by a version of the rule tables, so a rule change misses the old
+ones instead of serving stale tags.
+
+Cached results are shared between callers and therefore frozen:
+``FrozenDict`` / ``FrozenList`` are plain ``dict`` / ``list`` subclasses
+(equal to, and JSON-encoded like, the built-ins) whose mutating methods
+raise TypeError. ``copy.deepcopy`` of one returns ordinary mutable
+containers.
+
+Settings (read when the cache is created):
+  - PARSE_CACHE_MAX_BYTES: level-1 budget (default 8 MiB; 0 disables caching).
+  - PARSE_CACHE_SHARED_PATH: SQLite file for level 2 (unset = no level 2).
+  - PARSE_CACHE_SHARED_MAX_ENTRIES: level-2 rows kept (default 200000).
+  - PARSE_CACHE_WARM_TOP: how many of the most common ingredients on
+    existing menus are parsed at startup (default 500; 0 = off).
+"""
+import json
+import os
+import sqlite3
+import sys
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Iterable, Optional
+
+DEFAULT_MAX_BYTES = 8 * 1024 * 1024
+DEFAULT_SHARED_MAX_ENTRIES = 200_000
+DEFAULT_WARM_TOP = 500
+# Level-2 housekeeping (old versions, row cap) runs once per this many writes.
+_SHARED_PRUNE_EVERY = 1000
+
+
+def _read_only(self, *args, **kwargs):
+    raise TypeError(f"cached parse results are read-only ({type(self).__name__})")
+
+
+class FrozenList(list):
+    __slots__ = ()
+    append = extend = insert = remove = pop = clear = sort = reverse = _read_only
+    __setitem__ = __delitem__ = __iadd__ = __imul__ = _read_only
+
+    def __reduce_ex__(self, protocol):
+        return list, (list(self),)
+
+
+class FrozenDict(dict):
+    __slots__ = ()
+    __setitem__ = __delitem__ = __ior__ = _read_only
+    clear = pop = popitem = setdefault = update = _read_only
+
+    def __reduce_ex__(self, protocol):
+        return dict, (dict(self),)
+
+
+def freeze(value: Any) -> Any:
+    """Recursively convert dicts and lists into their frozen counterparts."""
+    if isinstance(value, dict) and not isinstance(value, FrozenDict):
+        return FrozenDict((k, freeze(v)) for k, v in value.items())
+    if isinstance(value, (list, tuple)) and not isinstance(value, FrozenList):
+        return FrozenList(freeze(v) for v in value)
+    return value
+
+
+def estimate_size(value: Any) -> int:
+    """Approximate bytes held by ``value`` and everything it contains."""
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(estimate_size(k) + estimate_size(v) for k, v in value.items())
+    elif isinstance(value, (list, tuple)):
+        size += sum(estimate_size(v) for v in value)
+    return size
+
+
+class SharedTier:
+    """Level 2: one SQLite table of JSON results, safe across processes (WAL)."""
+
+    def __init__(self, path: str, max_entries: Optional[int] = None):
+        self.path = path
+        self.max_entries = max_entries or int(
+            os.getenv("PARSE_CACHE_SHARED_MAX_ENTRIES", DEFAULT_SHARED_MAX_ENTRIES)
+        )
+        self._local = threading.local()
+        self._writes = 0
+        with self._connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS parse_cache "
+                "(version TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, PRIMARY KEY (version, key))"
+            )
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, version: str, key: str) -> Optional[Any]:
+        row = self._connection().execute(
+            "SELECT value FROM parse_cache WHERE version = ? AND key = ?", (version, key)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, version: str, key: str, value: Any) -> None:
+        conn = self._connection()
+        conn.execute(
+            "INSERT OR REPLACE INTO parse_cache (version, key, value) VALUES (?, ?, ?)",
+            (version, key, json.dumps(value, separators=(",", ":"))),
+        )
+        self._writes += 1
+        if self._writes % _SHARED_PRUNE_EVERY == 0:
+            self.prune(version)
+
+    def prune(self, version: str) -> None:
+        """Drop other versions' rows and the oldest rows beyond ``max_entries``."""
+        conn = self._connection()
+        conn.execute("DELETE FROM parse_cache WHERE version != ?", (version,))
+        conn.execute(
+            "DELETE FROM parse_cache WHERE rowid IN "
+            "(SELECT rowid FROM parse_cache ORDER BY rowid DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        )
+
+    def count(self) -> int:
+        return self._connection().execute("SELECT COUNT(*) FROM parse_cache").fetchone()[0]
+
+
+class ParseCache:
+    """``get(key)`` returns ``compute(key)``, frozen, from level 1, level 2 or a fresh call.
+
+    ``load`` rebuilds a value from its level-2 JSON form (default: ``freeze``),
+    for results that carry more than their JSON, e.g. precomputed bitmasks.
+    """
+
+    def __init__(
+        self,
+        compute: Callable[[str], Any],
+        version: str,
+        max_bytes: Optional[int] = None,
+        shared_path: Optional[str] = None,
+        load: Callable[[Any], Any] = freeze,
+    ):
+        self.compute = compute
+        self.version = version
+        self.load = load
+        self.max_bytes = (
+            int(os.getenv("PARSE_CACHE_MAX_BYTES", DEFAULT_MAX_BYTES)) if max_bytes is None else max_bytes
+        )
+        shared_path = shared_path if shared_path is not None else os.getenv("PARSE_CACHE_SHARED_PATH")
+        self.shared: Optional[SharedTier] = None
+        if shared_path and self.max_bytes:
+            try:
+                self.shared = SharedTier(shared_path)
+            except Exception as e:
+                print(f"Parse cache: shared tier at {shared_path} unavailable, using memory only: {e}")
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.reset_metrics()
+
+    def reset_metrics(self) -> None:
+        self.stats = {"hits": 0, "shared_hits": 0, "misses": 0, "evictions": 0, "shared_errors": 0, "warmed": 0}
+
+    def get(self, key: str) -> Any:
+        if not self.max_bytes:
+            self.stats["misses"] += 1
+            return freeze(self.compute(key))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return entry[0]
+
+        value = None
+        if self.shared is not None:
+            try:
+                stored = self.shared.get(self.version, key)
+            except Exception as e:
+                stored = None
+                self._shared_error("read", e)
+            if stored is not None:
+                value = self.load(stored)
+                self.stats["shared_hits"] += 1
+        if value is None:
+            value = freeze(self.compute(key))
+            self.stats["misses"] += 1
+            if self.shared is not None:
+                try:
+                    self.shared.put(self.version, key, value)
+                except Exception as e:
+                    self._shared_error("write", e)
+        self._store(key, value)
+        return value
+
+    def _shared_error(self, operation: str, error: Exception) -> None:
+        self.stats["shared_errors"] += 1
+        print(f"Parse cache: shared tier {operation} failed: {error}")
+
+    def _store(self, key: str, value: Any) -> None:
+        size = estimate_size(key) + estimate_size(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous[1]
+            self._entries[key] = (value, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.stats["evictions"] += 1
+
+    def clear(self, version: Optional[str] = None) -> None:
+        """Empty level 1; with ``version``, also stop reading other versions from level 2."""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            if version is not None:
+                self.version = version
+
+    def warm(self, keys: Iterable[str]) -> int:
+        """Parse ``keys`` ahead of traffic; returns how many were not cached yet."""
+        added = 0
+        for key in keys:
+            with self._lock:
+                cached = key in self._entries
+            if not cached:
+                self.get(key)
+                added += 1
+        self.stats["warmed"] += added
+        return added
+
+    def hot_keys(self, top: int) -> list:
+        """Up to ``top`` level-1 keys, most recently used first."""
+        with self._lock:
+            keys = list(self._entries)
+        return keys[: -top - 1 : -1] if top > 0 else []
+
+    def metrics(self) -> dict:
+        lookups = self.stats["hits"] + self.stats["shared_hits"] + self.stats["misses"]
+        with self._lock:
+            entries, used = len(self._entries), self._bytes
+        return {
+            **self.stats,
+            "hit_rate": round((self.stats["hits"] + self.stats["shared_hits"]) / lookups, 4) if lookups else 0.0,
+            "entries": entries,
+            "bytes": used,
+            "max_bytes": self.max_bytes,
+            "shared": self.shared.path if self.shared is not None else None,
+            "version": self.version,
+        }
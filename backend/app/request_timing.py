@@ -0,0 +1,52 @@
+"""
+Per-request stage timing for the AI endpoints.
+
+Each stage is recorded as a start offset and a duration relative to the start
+of the request, so stages that overlap (e.g. background archival running
+while Gemini extracts the menu) are visible side by side. ``server_timing``
+renders them as a ``Server-Timing`` header, which browser dev tools show on
+the request's Timing tab.
+"""
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+
+class RequestTimer:
+    def __init__(self):
+        self.origin = time.perf_counter()
+        self._spans: Dict[str, tuple] = {}
+        self._lock = threading.Lock()
+
+    def now(self) -> float:
+        return time.perf_counter()
+
+    def record(self, name: str, started: float, finished: Optional[float] = None) -> None:
+        """Record a stage given ``perf_counter`` timestamps (thread-safe)."""
+        finished = time.perf_counter() if finished is None else finished
+        with self._lock:
+            self._spans[name] = (started - self.origin, finished - started)
+
+    @contextmanager
+    def span(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, started)
+
+    def as_dict(self) -> Dict[str, dict]:
+        """``{stage: {"start_ms", "dur_ms"}}`` in start order."""
+        with self._lock:
+            spans = sorted(self._spans.items(), key=lambda kv: kv[1][0])
+        return {
+            name: {"start_ms": round(start * 1000, 1), "dur_ms": round(duration * 1000, 1)}
+            for name, (start, duration) in spans
+        }
+
+    def server_timing(self) -> str:
+        return ", ".join(
+            f'{name};dur={span["dur_ms"]};desc="start {span["start_ms"]}ms"'
+            for name, span in self.as_dict().items()
+        )
@@ -1,18 +1,42 @@
-from fastapi import APIRouter, HTTPException, Depends, UploadFile, File, Form, status
+from fastapi import APIRouter, HTTPException, Depends, UploadFile, File, Form, Query, Request, status
+from fastapi.responses import Response, StreamingResponse
 from firebase_admin import auth, db, storage
 import random
 from models import Restaurant, MenuItem, MenuItemUpdate, BulkMenuUpdate
-from typing import List, Optional
-from ingredient_parser import parse_ingredients
-from auth_routes import verify_token
+from typing import Dict, List, Optional
+import ingredient_parser
+import ingredient_rules
+from ingredient_parser import parse_ingredients, parse_ingredients_batch
+from allergen_tags import (
+    ALLERGENS,
+    DIETARY_CATEGORIES,
+    VALID_ALLERGENS,
+    VALID_DIETARY_CATEGORIES,
+)
+from auth_routes import admin_only, verify_token
 from permissions import can_manage_restaurant, can_edit_menu, is_restaurant_owner
+import ingest_cache
+import menu_retag
+import ai_admission
+import ai_breaker
+import ai_cancel
+import ai_hedging
+import ai_providers
+import ai_rate_limit
+import ai_refinement
+import ai_scheduler
+import image_preprocess
+from menu_archive import MenuArchiver
+from request_timing import RequestTimer
 import os
 import json
 from pydantic import BaseModel
-from google.generativeai.types import RequestOptions
 from google.api_core import retry
 import asyncio
 import concurrent.futures
+import io
+import threading
+import time
 from uuid import uuid4
 from datetime import timedelta
 
@@ -21,9 +45,16 @@ try:
 except Exception:
     genai = None
 
+try:
+    from pypdf import PdfReader, PdfWriter
+except Exception:
+    PdfReader = None
+    PdfWriter = None
+
 router = APIRouter()
 
 MAX_IMAGE_SIZE_BYTES = 5 * 1024 * 1024  # 5MB
+MAX_PARSE_BATCH_ITEMS = 2000
 
 
 def generate_id(ref_path: str, length: int = 5, max_attempts: int = 5) -> str:
@@ -98,6 +129,32 @@ def _classify_genai_error(error: Exception, context: str = "file") -> tuple:
     """
     is_text = context == "text"
 
+    if isinstance(error, ai_breaker.CircuitOpenError):
+        # Fail-fast while the shared circuit breaker is open: no provider call
+        # was made, so keep the message about the AI as a whole.
+        if error.kind == "quota":
+            reason = "AI quota or credits have been exhausted."
+        else:
+            reason = "The AI service is temporarily unavailable."
+        if is_text:
+            return 503, f"{reason} Please try again in a few minutes, or set allergens manually below."
+        return 503, f"{reason} Please try again in a few minutes, or add items manually below."
+
+    if isinstance(error, ai_rate_limit.RateLimitTimeout):
+        # Our own request-rate limiter could not fit the call in before its
+        # deadline; nothing was sent upstream.
+        if is_text:
+            return (
+                503,
+                "The AI service is busy right now. "
+                "Please try again in a minute, or set allergens manually below.",
+            )
+        return (
+            503,
+            "The AI service is busy right now. "
+            "Please try again in a minute, or add items manually below.",
+        )
+
     if _is_timeout_error(error):
         if is_text:
             return (
@@ -205,20 +262,29 @@ def _classify_genai_error(error: Exception, context: str = "file") -> tuple:
     )
 
 
-VALID_ALLERGENS = {
-    "milk",
-    "eggs",
-    "fish",
-    "tree_nuts",
-    "wheat",
-    "shellfish",
-    "gluten_free",
-    "peanuts",
-    "soybeans",
-    "sesame",
-}
+def _genai_error_headers(error: Exception) -> Optional[dict]:
+    """Retry-After for fail-fast responses (open circuit breaker, full rate limit queue)."""
+    if isinstance(error, (ai_breaker.CircuitOpenError, ai_rate_limit.RateLimitTimeout)):
+        return {"Retry-After": str(int(error.retry_after + 0.999))}
+    return None
+
 
-VALID_DIETARY_CATEGORIES = {"vegan", "vegetarian"}
+def _breaker_failure_kind(error: Exception) -> Optional[str]:
+    """Which ``_classify_genai_error`` outcome ``error`` is, for the circuit breaker.
+
+    Quota, auth/configuration and timeout outcomes say the backend itself is
+    unusable; anything else (bad input, policy refusals) is request-specific.
+    Rate-limiter and scheduler rejections and calls skipped for a
+    disconnected client never reached the backend at all (NOT_SENT).
+    """
+    if isinstance(error, (ai_rate_limit.RateLimitTimeout, ai_cancel.RequestCancelled)):
+        return ai_breaker.NOT_SENT
+    status_code, detail = _classify_genai_error(error)
+    if status_code == 504:
+        return "timeout"
+    if status_code == 503:
+        return "quota" if "quota" in detail.lower() else "auth"
+    return None
 
 
 async def _get_authenticated_user(token_data: dict):
@@ -304,6 +370,7 @@ def _attach_restaurant_logo_url(restaurant_dict: dict, bucket=None) -> None:
 
 
 def _merge_tag_updates(existing_values: List[str], additions: List[str], removals: List[str]) -> List[str]:
+    # A few names per item: list scans beat encoding and decoding masks here.
     merged = [value for value in (
         existing_values or []) if value not in removals]
     for value in additions or []:
@@ -312,6 +379,17 @@ def _merge_tag_updates(existing_values: List[str], additions: List[str], removal
     return merged
 
 
+def _has_any_allergen(item_allergens: Optional[List[str]], excluded: int, unknown: List[str]) -> bool:
+    """Whether an item carries any of the ``allergen_free`` allergens.
+
+    ``unknown`` are filter values that have no bit; they can only match
+    items storing the same unrecognized name.
+    """
+    if ALLERGENS.mask(item_allergens) & excluded:
+        return True
+    return bool(unknown) and any(name in unknown for name in item_allergens or ())
+
+
 # Check if the user is an admin
 async def check_admin_status(token_data: dict) -> bool:
     """Check if the user has admin privileges based on token data"""
@@ -327,52 +405,62 @@ async def check_admin_status(token_data: dict) -> bool:
     return user_data.get("is_admin", False) if user_data else False
 
 
+async def _ai_tenant(token_data: dict, restaurant_id: Optional[str]) -> str:
+    """Fair-share key for the AI scheduler: the restaurant, if the caller edits its menu, else the user."""
+    user_id = token_data.get("uid")
+    if restaurant_id and can_edit_menu(db, user_id, restaurant_id, await check_admin_status(token_data)):
+        return restaurant_id
+    return user_id
+
+
 class ParseIngredientsRequest(BaseModel):
     ingredients: str
+    # Optional: lets the AI scheduler share capacity fairly between restaurants.
+    restaurant_id: Optional[str] = None
+    # Answer at once with the local parser's tags and refine them with AI in
+    # the background (collect from GET /ai/parse-ingredients/{refinement_id}).
+    speculative: bool = False
 
 
-@router.post("/ai/parse-ingredients")
-async def parse_ingredients_ai(
-    payload: ParseIngredientsRequest, token_data: dict = Depends(verify_token)
-):
-    try:
-        user_id = token_data.get("uid")
-        if not user_id:
-            raise HTTPException(status_code=401, detail="Invalid user token")
+def _local_parse_result(ingredients: str) -> dict:
+    """Provisional tags from ``ingredient_parser``; no AI call involved.
 
-        # Configure the SDK and pick a parse-appropriate model. _select_model_name
-        # honors GEMINI_PARSE_MODEL first, then GEMINI_MODEL, then auto-discovery,
-        # then current static fallbacks. This mirrors the ingest endpoint and
-        # avoids the stale hardcoded model list that previously surfaced as
-        # InvalidArgument errors here.
-        _ensure_genai_configured()
-        model_name = _select_model_name("parse")
-        model = genai.GenerativeModel(
-            model_name=model_name,
-            generation_config={
-                "temperature": 0,
-                "response_mime_type": "application/json",
-            },
-        )
+    Only allergens are reported: the local rules can say an ingredient is
+    "not vegan" but never that a dish is vegan, so dietary categories are
+    left for the AI refinement.
+    """
+    parsed = parse_ingredients(ingredients)
+    return {
+        "allergens": [a for a in parsed["allergens"] if a in VALID_ALLERGENS],
+        "dietaryCategories": [],
+        "extractedIngredients": [item["original_ingredient"] for item in parsed["parsed_ingredients"]],
+    }
 
-        prompt = (
-            "You are extracting food safety attributes from free-text ingredient lists.\n"
-            "Given the text, return a strict JSON object with keys: allergens (array of strings), "
-            "dietaryCategories (array of strings), and extractedIngredients (array of strings).\n"
-            "The allowed allergen ids are: milk, eggs, fish, tree_nuts, wheat, shellfish, peanuts, soybeans, sesame.\n"
-            "The allowed dietary category ids are: vegan, vegetarian.\n"
-            "Normalize synonyms to these ids (e.g., 'tree nuts' -> 'tree_nuts').\n"
-            "Only output valid ids. If none, output empty arrays.\n"
-            f"Text: {payload.ingredients}"
-        )
 
+def _ai_parse_ingredients(provider, ingredients: str) -> dict:
+    """Classify free-text ingredients with the AI provider (blocking).
+
+    Every failure is raised as an HTTPException with a user-facing detail.
+    """
+    prompt = (
+        "You are extracting food safety attributes from free-text ingredient lists.\n"
+        "Given the text, return a strict JSON object with keys: allergens (array of strings), "
+        "dietaryCategories (array of strings), and extractedIngredients (array of strings).\n"
+        "The allowed allergen ids are: milk, eggs, fish, tree_nuts, wheat, shellfish, peanuts, soybeans, sesame.\n"
+        "The allowed dietary category ids are: vegan, vegetarian.\n"
+        "Normalize synonyms to these ids (e.g., 'tree nuts' -> 'tree_nuts').\n"
+        "Only output valid ids. If none, output empty arrays.\n"
+        f"Text: {ingredients}"
+    )
+
+    try:
         try:
-            response = model.generate_content(prompt)
+            raw_text = provider.classify(prompt, ingredients)
         except Exception as e:
             status_code, detail = _classify_genai_error(e, context="text")
-            raise HTTPException(status_code=status_code, detail=detail)
+            raise HTTPException(status_code=status_code, detail=detail, headers=_genai_error_headers(e))
 
-        if response is None or not getattr(response, "text", None):
+        if not raw_text:
             raise HTTPException(
                 status_code=503,
                 detail=(
@@ -380,7 +468,6 @@ async def parse_ingredients_ai(
                     "Please try again later, or set allergens manually below."
                 ),
             )
-        raw_text = response.text
 
         try:
             parsed = json.loads(raw_text)
@@ -440,7 +527,190 @@ async def parse_ingredients_ai(
     except Exception as e:
         print(f"AI parse error: {str(e)}")
         status_code, detail = _classify_genai_error(e, context="text")
-        raise HTTPException(status_code=status_code, detail=detail)
+        raise HTTPException(status_code=status_code, detail=detail, headers=_genai_error_headers(e))
+
+
+def _parse_provider(priority: int, tenant: str) -> ai_providers.AIProvider:
+    # Configure the provider's parse-appropriate model. For Gemini,
+    # _select_model_name honors GEMINI_PARSE_MODEL first, then GEMINI_MODEL,
+    # then auto-discovery, then current static fallbacks. This mirrors the
+    # ingest endpoint and avoids the stale hardcoded model list that
+    # previously surfaced as InvalidArgument errors here.
+    try:
+        provider = _get_ai_provider(priority, tenant)
+        provider.prepare("parse")
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"AI parse error: {str(e)}")
+        status_code, detail = _classify_genai_error(e, context="text")
+        raise HTTPException(status_code=status_code, detail=detail, headers=_genai_error_headers(e))
+    return provider
+
+
+@router.post("/ai/parse-ingredients")
+async def parse_ingredients_ai(
+    payload: ParseIngredientsRequest, token_data: dict = Depends(verify_token)
+):
+    user_id = token_data.get("uid")
+    if not user_id:
+        raise HTTPException(status_code=401, detail="Invalid user token")
+
+    tenant = await _ai_tenant(token_data, payload.restaurant_id)
+
+    if payload.speculative:
+        # The local parse takes well under a millisecond; the AI call keeps
+        # running after this response is sent. The user already has tags,
+        # so it queues behind calls someone is waiting on. When the
+        # refinement queue is full, fall through and answer with the AI
+        # result directly.
+        provider = _parse_provider(ai_scheduler.BACKGROUND, tenant)
+        refinement_id = ai_refinement.refinements.start(
+            user_id, lambda: _ai_parse_ingredients(provider, payload.ingredients)
+        )
+        if refinement_id is not None:
+            return {
+                **_local_parse_result(payload.ingredients),
+                "provisional": True,
+                "refinementId": refinement_id,
+            }
+
+    # Someone is waiting on this result: schedule it ahead of bulk imports.
+    provider = _parse_provider(ai_scheduler.INTERACTIVE, tenant)
+    # In a worker thread: the rate limiter may queue this call.
+    return await asyncio.to_thread(_ai_parse_ingredients, provider, payload.ingredients)
+
+
+@router.get("/ai/parse-ingredients/{refinement_id}")
+async def get_parse_refinement(
+    refinement_id: str,
+    response: Response,
+    wait: float = Query(0, ge=0, le=30, description="Seconds to wait for the AI result before answering 202."),
+    token_data: dict = Depends(verify_token),
+):
+    """AI result of a speculative parse; 202 while it is still running."""
+    future = ai_refinement.refinements.get(refinement_id, token_data.get("uid"))
+    if future is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired refinement.")
+
+    if wait and not future.done():
+        await asyncio.to_thread(concurrent.futures.wait, [future], wait)
+    if not future.done():
+        response.status_code = 202
+        response.headers["Retry-After"] = "1"
+        return {"status": "pending"}
+
+    # Raises the stored HTTPException for a failed AI call.
+    return {**future.result(), "provisional": False}
+
+
+def warm_parse_cache() -> None:
+    """Pre-parse the most common ingredients of stored menus (run at startup)."""
+    try:
+        started = time.perf_counter()
+        menu_items = db.reference("menu_items").get() or {}
+        parsed = ingredient_parser.warm_up(
+            item.get("ingredients") for item in menu_items.values() if isinstance(item, dict)
+        )
+        print(
+            f"Parse cache warmed with {parsed} ingredients from {len(menu_items)} menu items "
+            f"in {(time.perf_counter() - started) * 1000:.0f} ms"
+        )
+    except Exception as e:
+        print(f"Parse cache warm-up skipped: {e}")
+
+
+class ParseIngredientsBatchRequest(BaseModel):
+    # One ingredient declaration per menu item.
+    items: List[str]
+
+
+@router.post("/ingredients/parse-batch")
+def parse_ingredients_batch_endpoint(
+    payload: ParseIngredientsBatchRequest, token_data: dict = Depends(verify_token)
+):
+    """Local (non-AI) tags for a whole menu in one call.
+
+    Each distinct ingredient is classified once across all items; results
+    come back in request order.
+    """
+    if len(payload.items) > MAX_PARSE_BATCH_ITEMS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"At most {MAX_PARSE_BATCH_ITEMS} items per batch.",
+        )
+    return parse_ingredients_batch(payload.items)
+
+
+@router.post("/ingredients/retag")
+def start_menu_retag(full: bool = False, token_data: dict = Depends(admin_only)):
+    """Re-tag stored menu items under the current ingredient rules (admin only).
+
+    Runs in the background; only items containing ingredients whose tags
+    changed are re-evaluated, unless ``full`` asks for a rescan of every
+    item (needed once for items saved before the ingredient index).
+    """
+    started = menu_retag.retagger.start(db, full=full)
+    return {"started": started, **menu_retag.retagger.status()}
+
+
+@router.get("/ingredients/retag")
+def get_menu_retag_status(token_data: dict = Depends(admin_only)):
+    """Whether a re-tagging job is running, and the report of the last one."""
+    return menu_retag.retagger.status()
+
+
+class IngredientRulesUpdate(BaseModel):
+    # Shaped like an ingredient_kb JSON source; tag lists may be omitted.
+    rules: Dict[str, dict]
+    variants: Dict[str, str] = {}
+
+
+@router.get("/ingredients/rules")
+def get_ingredient_rules(tables: bool = False, token_data: dict = Depends(admin_only)):
+    """Where the ingredient rules come from, the active version and the last reload.
+
+    ``tables`` adds the active rule tables (empty for a compiled knowledge base).
+    """
+    result = ingredient_rules.reloader.status()
+    if tables:
+        active = ingredient_parser.active_rules()
+        result.update({"rules": active.rules, "variants": active.variants})
+    return result
+
+
+@router.put("/ingredients/rules")
+def update_ingredient_rules(payload: IngredientRulesUpdate, token_data: dict = Depends(admin_only)):
+    """Replace the ingredient rule tables (admin only; INGREDIENT_RULES_SOURCE=db).
+
+    The tables are stored for every worker and this worker reloads them in
+    the background; the reloader re-tags stored menu items once it is done.
+    """
+    reloader = ingredient_rules.reloader
+    if reloader.source != "db":
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Ingredient rules are read from {reloader.source or 'the built-in tables'}, not the database.",
+        )
+    try:
+        meta = ingredient_rules.publish(db, payload.rules, payload.variants, token_data.get("uid"))
+    except ingredient_rules.RulesError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    started = reloader.reload_in_background(db)
+    return {"published": meta, "reload_started": started, **reloader.status()}
+
+
+@router.post("/ingredients/rules/reload")
+def reload_ingredient_rules(token_data: dict = Depends(admin_only)):
+    """Reload the rule source now instead of at the next poll (admin only)."""
+    reloader = ingredient_rules.reloader
+    if not reloader.source:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="INGREDIENT_RULES_SOURCE is not set; the built-in tables cannot be reloaded.",
+        )
+    started = reloader.reload_in_background(db, force=True)
+    return {"reload_started": started, **reloader.status()}
 
 
 def _ensure_genai_configured() -> None:
@@ -506,306 +776,822 @@ def _select_model_name(purpose: Optional[str] = None) -> str:
         return fb
 
 
-@router.post("/ai/ingest-menu")
-async def ingest_menu_file(  # 1. Renamed for clarity
-    file: UploadFile = File(...), token_data: dict = Depends(verify_token)
-):
+MAX_INGEST_FILES = 20
+
+SUPPORTED_INGEST_MIME_TYPES = (
+    "image/png",
+    "image/jpeg",
+    "image/jpg",
+    "application/pdf",
+)
+
+# Streaming formats accepted by /ai/ingest-menu?stream=...
+INGEST_STREAM_MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "sse": "text/event-stream",
+}
+
+INGEST_PROMPT = (
+    "You are a high-accuracy menu extraction bot. Your sole task is to extract menu items "
+    "from the document and return ONLY a single, strict JSON object.\n"
+    "Do not include any preamble, explanations, or any text other than the JSON object.\n\n"
+    "The JSON object must have a single key 'items', which is an array of item objects.\n"
+    "Each item object must have this exact structure:\n"
+    "{\n"
+    "  'name': 'string', (The concise, primary name of the item)\n"
+    "  'description': 'string', (The description text, or '' if none)\n"
+    "  'price': number, (Numeric value only, e.g., 14.50. No currency symbols, no ranges.)\n"
+    "  'ingredients': [array of strings] (A list of all ingredient strings)\n"
+    "}\n\n"
+    "---"
+    "### **CRITICAL INSTRUCTIONS for 'ingredients' field**\n"
+    "The 'ingredients' array must contain only actual food components, NEVER the dish name itself.\n"
+    "Build the list by following these steps IN ORDER:\n\n"
+    "1.  **Never use the dish name as an ingredient.** Do NOT add the menu item's 'name' (or any obvious dish-name phrase) as a literal entry.\n"
+    "    * **Example:** For 'name' = 'Mushroom Pizza', the array must NOT contain 'mushroom pizza' or 'pizza'.\n"
+    "    * **Example:** For 'name' = 'Chicken Sandwich', the array must NOT contain 'chicken sandwich'.\n"
+    "    * **Example:** For 'name' = 'Latte', the array must NOT contain 'latte'.\n"
+    "    * **Example:** For 'name' = 'Queso Dip', the array must NOT contain 'queso dip'.\n\n"
+    "2.  **Add from Description:** Scan the 'description' and add ALL ingredients explicitly mentioned.\n"
+    "    * **Example:** If 'description' is 'topped with parmesan and fresh basil', you must add 'parmesan' and 'fresh basil' to the array.\n\n"
+    "3.  **Decompose the Name into real food components:** Break the dish name (and any cooking-style or preparation words) into the underlying food components and add those. If the description is empty, also infer any *absolutely essential* additional ingredients implied by the dish.\n"
+    "    * **Example:** 'Mushroom Pizza' (no description) -> ['mushroom', 'pizza dough', 'tomato sauce', 'mozzarella']. Do NOT add 'mushroom pizza'.\n"
+    "    * **Example:** 'Chicken Sandwich' -> ['chicken', 'bread']. Do NOT add 'chicken sandwich'.\n"
+    "    * **Example:** 'Latte' -> ['espresso', 'milk']. Do NOT add 'latte'.\n"
+    "    * **Example:** 'Queso Dip' -> ['queso', 'cheese']. Do NOT add 'queso dip'.\n"
+    "    * **Example:** 'Rigatoni' -> ['rigatoni pasta', 'wheat flour']. The noodle type is a real ingredient, but the bare dish name on its own is not.\n\n"
+    "4.  **Format:** The final output for 'ingredients' MUST be a JSON array of strings, and none of those strings may be the dish name itself."
+)
+
+
+def _build_item_classification_prompt(ingredients_text: str) -> str:
+    """Prompt used to tag a single extracted menu item with allergens/diets."""
+    return (
+        "You are an expert food safety and dietary attribute extractor. Your task is to analyze a free-text ingredient list and return a single, strict JSON object.\n"
+        "Do not provide any preamble, explanation, or any text other than the JSON object itself.\n\n"
+        "### JSON Structure:\n"
+        "{\n"
+        '  "allergens": [array of strings],\n'
+        '  "dietaryCategories": [array of strings],\n'
+        '  "extractedIngredients": [array of strings] (List all distinct ingredients found in the text)\n'
+        "}\n\n"
+        "---"
+        "### Allowed IDs:\n"
+        "* **Allergens:** `milk`, `eggs`, `fish`, `tree_nuts`, `wheat`, `shellfish`, `peanuts`, `soybeans`, `sesame`\n"
+        "* **Dietary Categories:** `vegan`, `vegetarian`\n\n"
+        "---"
+        "### **CRITICAL EXTRACTION RULES**\n\n"
+        "**1. Dietary Category Rules (Follow Strictly):**\n\n"
+        "* **For `vegetarian`:**\n"
+        "    * **DO NOT** assign `vegetarian` if *any* meat, poultry, fish, or shellfish products are present.\n"
+        "    * **Exclusion list (check carefully):** `anchovies`, `prosciutto`, `bacon`, `ham`, `chicken`, `beef`, `pork`, `fish`, `shrimp`, `crab`, `lobster`, `gelatin`, `chicken broth`, `beef stock`, `fish sauce`, `lard`.\n\n"
+        "* **For `vegan`:**\n"
+        "    * **DO NOT** assign `vegan` if *any* animal-derived products are present.\n"
+        "    * This includes all items on the `vegetarian` exclusion list, **PLUS:** `milk`, `cheese`, `butter`, `cream`, `yogurt`, `eggs`, `honey`, `whey`, `casein`, `collagen`.\n"
+        '    * If an item qualifies as `vegan`, it *also* qualifies as `vegetarian`. In this case, the output array must be `["vegan", "vegetarian"]`.\n\n'
+        "**2. Allergen Rules (Follow Strictly):**\n\n"
+        "* **`wheat` (Inference Rule):**\n"
+        "    * **YOU MUST** assume `wheat` is present if the ingredients list `pasta`, `flour`, `bread`, `semolina`, `couscous`, `farro`, `spelt`, or `noodles`.\n"
+        "    * **Exception:** Do *not* assign `wheat` only if the item is explicitly qualified as non-wheat (e.g., `gluten-free pasta`, `rice flour`, `almond flour`, `rice noodles`).\n\n"
+        "* **`fish`:**\n"
+        "    * Must be included for all types of fish, including `anchovies`.\n\n"
+        "* **`milk`:**\n"
+        "    * Must be included for `milk` and all common dairy products like `cheese`, `butter`, `yogurt`, `cream`, `whey`, `casein`.\n\n"
+        "**3. General Rules:**\n"
+        "* Normalize all synonyms to the allowed IDs (e.g., 'soya' -> 'soybeans', 'pecans' -> 'tree_nuts', 'parmesan' -> 'milk').\n"
+        "* If no attributes for a category are found, output an empty array `[]` for that key.\n\n"
+        "---"
+        f"Text to analyze: {ingredients_text}"
+    )
+
+
+def _parse_model_json(raw_text: str, default: Optional[dict] = None) -> dict:
+    """Parse a model response as JSON, tolerating preamble/trailing text.
+
+    If the text has no ``{...}`` span at all, ``default`` is returned when
+    given; otherwise the original decode error is re-raised.
+    """
     try:
-        user_id = token_data.get("uid")
-        if not user_id:
-            raise HTTPException(status_code=401, detail="Invalid user token")
+        return json.loads(raw_text)
+    except Exception:
+        start = raw_text.find("{")
+        end = raw_text.rfind("}")
+        if start != -1 and end != -1 and end > start:
+            return json.loads(raw_text[start: end + 1])
+        if default is not None:
+            return default
+        raise
+
+
+def _build_json_model(purpose: str, model_name: Optional[str] = None):
+    """Configure the SDK and build a JSON-mode Gemini model for ``purpose``."""
+    _ensure_genai_configured()
+    return genai.GenerativeModel(
+        model_name=model_name or _select_model_name(purpose),
+        generation_config={
+            "temperature": 0,
+            "response_mime_type": "application/json",
+        },
+    )
 
-        # 2. Add "application/pdf" to supported types
-        supported_mime_types = (
-            "image/png",
-            "image/jpeg",
-            "image/jpg",
-            "application/pdf",
-        )
-        if file.content_type not in supported_mime_types:
-            raise HTTPException(
-                status_code=400,
-                # 3. Update error message
-                detail="Only PNG/JPEG images and PDFs are supported.",
-            )
 
-        _ensure_genai_configured()
+def _get_ai_provider(
+    priority: int = ai_scheduler.BULK,
+    tenant: str = "",
+    cancel: Optional[threading.Event] = None,
+) -> ai_providers.AIProvider:
+    """Provider for this request, selected by AI_PROVIDER (default: gemini).
 
-        # Use a potentially heavier, multimodal-capable model for ingestion.
-        model_name = _select_model_name("ingest")
-        model = genai.GenerativeModel(
-            model_name=model_name,
-            generation_config={
-                "temperature": 0,
-                "response_mime_type": "application/json",
-            },
+    Calls pass, outermost first, through the circuit breaker, the priority
+    scheduler (``priority`` class, fair share per ``tenant``) and the rate
+    limiter before reaching the provider, whose own call time is what the
+    classify hedger learns from. Once ``cancel`` is set (client
+    disconnected), calls that reach the front of the queue are refused.
+    """
+    try:
+        provider = ai_providers.create_provider(
+            build_model=_build_json_model,
+            select_model_name=_select_model_name,
         )
+    except ValueError as config_error:
+        raise HTTPException(status_code=500, detail=str(config_error))
+    provider = ai_hedging.TimedProvider(provider)
+    if cancel is not None:
+        provider = ai_cancel.CancellableProvider(provider, cancel)
+    provider = ai_rate_limit.RateLimitedProvider(provider, ai_rate_limiter)
+    provider = ai_scheduler.ScheduledProvider(provider, ai_call_scheduler, priority, tenant)
+    return ai_breaker.GuardedProvider(provider, ai_circuit, _breaker_failure_kind)
+
+
+# Shared across requests so a quota/auth/timeout outage is only waited out once.
+ai_circuit = ai_breaker.CircuitBreaker()
+# Requests-per-minute budget shared by every AI call (and worker process).
+ai_rate_limiter = ai_rate_limit.TokenBucket()
+# Concurrency slots handed out by priority class and restaurant.
+ai_call_scheduler = ai_scheduler.AIScheduler()
+
+
+# Shared background uploader for menu_files/ archival (see menu_archive.py).
+menu_archiver = MenuArchiver()
+
+
+def _archive_menu_file(
+    user_id: str,
+    filename: Optional[str],
+    file_bytes: bytes,
+    content_type: str,
+    digest: str,
+    timer: Optional[RequestTimer] = None,
+    cancel: Optional[threading.Event] = None,
+) -> None:
+    """Queue the uploaded menu file for archival in Cloud Storage (auditing/debugging).
+
+    Files are stored by content address (``menu_files/{uid}/{sha256}{ext}``),
+    so re-uploading the same file does not create another copy. The upload
+    runs in the background and never delays or fails the ingestion.
+    """
+    original_name = filename or "menu"
+    _, ext = os.path.splitext(original_name)
+    ext = ext.lower() if ext else ""
+    source_key = f"menu_files/{user_id}/{digest}{ext}"
 
-        file_bytes = await file.read()
+    def upload() -> None:
+        bucket_name = os.getenv("FIREBASE_STORAGE_BUCKET")
+        bucket = storage.bucket(
+            bucket_name) if bucket_name else storage.bucket()
+        source_blob = bucket.blob(source_key)
+        exists = getattr(source_blob, "exists", None)
+        if callable(exists) and exists():
+            return
+        source_blob.upload_from_string(file_bytes, content_type=content_type)
 
-        # Persist the original uploaded menu file to Cloud Storage for auditing/debugging.
-        try:
-            bucket_name = os.getenv("FIREBASE_STORAGE_BUCKET")
-            bucket = storage.bucket(
-                bucket_name) if bucket_name else storage.bucket()
-
-            original_name = file.filename or "menu"
-            _, ext = os.path.splitext(original_name)
-            ext = ext.lower() if ext else ""
-            source_key = f"menu_files/{user_id}/{uuid4().hex}{ext}"
-
-            source_blob = bucket.blob(source_key)
-            source_blob.upload_from_string(
-                file_bytes, content_type=file.content_type)
-        except Exception as storage_error:
-            # Log but do not fail the ingestion if archival storage is unavailable.
-            print(f"Error archiving menu file to storage: {storage_error}")
-
-        # 5. This logic now works for images AND PDFs seamlessly
-        model_part = {
-            "mime_type": file.content_type,
-            "data": file_bytes,
-        }
+    queued_at = time.perf_counter()
 
-        # 6. Update prompt to be file-generic
-        prompt = (
-            "You are a high-accuracy menu extraction bot. Your sole task is to extract menu items "
-            "from the document and return ONLY a single, strict JSON object.\n"
-            "Do not include any preamble, explanations, or any text other than the JSON object.\n\n"
-            "The JSON object must have a single key 'items', which is an array of item objects.\n"
-            "Each item object must have this exact structure:\n"
-            "{\n"
-            "  'name': 'string', (The concise, primary name of the item)\n"
-            "  'description': 'string', (The description text, or '' if none)\n"
-            "  'price': number, (Numeric value only, e.g., 14.50. No currency symbols, no ranges.)\n"
-            "  'ingredients': [array of strings] (A list of all ingredient strings)\n"
-            "}\n\n"
-            "---"
-            "### **CRITICAL INSTRUCTIONS for 'ingredients' field**\n"
-            "The 'ingredients' array must contain only actual food components, NEVER the dish name itself.\n"
-            "Build the list by following these steps IN ORDER:\n\n"
-            "1.  **Never use the dish name as an ingredient.** Do NOT add the menu item's 'name' (or any obvious dish-name phrase) as a literal entry.\n"
-            "    * **Example:** For 'name' = 'Mushroom Pizza', the array must NOT contain 'mushroom pizza' or 'pizza'.\n"
-            "    * **Example:** For 'name' = 'Chicken Sandwich', the array must NOT contain 'chicken sandwich'.\n"
-            "    * **Example:** For 'name' = 'Latte', the array must NOT contain 'latte'.\n"
-            "    * **Example:** For 'name' = 'Queso Dip', the array must NOT contain 'queso dip'.\n\n"
-            "2.  **Add from Description:** Scan the 'description' and add ALL ingredients explicitly mentioned.\n"
-            "    * **Example:** If 'description' is 'topped with parmesan and fresh basil', you must add 'parmesan' and 'fresh basil' to the array.\n\n"
-            "3.  **Decompose the Name into real food components:** Break the dish name (and any cooking-style or preparation words) into the underlying food components and add those. If the description is empty, also infer any *absolutely essential* additional ingredients implied by the dish.\n"
-            "    * **Example:** 'Mushroom Pizza' (no description) -> ['mushroom', 'pizza dough', 'tomato sauce', 'mozzarella']. Do NOT add 'mushroom pizza'.\n"
-            "    * **Example:** 'Chicken Sandwich' -> ['chicken', 'bread']. Do NOT add 'chicken sandwich'.\n"
-            "    * **Example:** 'Latte' -> ['espresso', 'milk']. Do NOT add 'latte'.\n"
-            "    * **Example:** 'Queso Dip' -> ['queso', 'cheese']. Do NOT add 'queso dip'.\n"
-            "    * **Example:** 'Rigatoni' -> ['rigatoni pasta', 'wheat flour']. The noodle type is a real ingredient, but the bare dish name on its own is not.\n\n"
-            "4.  **Format:** The final output for 'ingredients' MUST be a JSON array of strings, and none of those strings may be the dish name itself."
-        )
+    def on_done(ok: bool) -> None:
+        if timer is not None:
+            timer.record("archive" if ok else "archive-failed", queued_at)
+
+    menu_archiver.submit(source_key, upload, on_done, cancel=cancel)
+
+
+def _extract_menu_items(provider, file_bytes: bytes, content_type: str) -> list:
+    """Run the file-level extraction call and return the raw item dicts.
+
+    Upstream failures are translated into an HTTPException carrying the
+    ``_classify_genai_error`` status/detail; malformed JSON propagates.
+    """
+    try:
+        # Use a single-call timeout rather than a long retry chain to keep UX snappy.
+        # 240s is generous enough for large/complex menus that Gemini has
+        # successfully processed before but occasionally needs longer for.
+        raw_text = provider.extract_menu(INGEST_PROMPT, file_bytes, content_type, timeout=240)
+    except ai_cancel.RequestCancelled:
+        raise
+    except Exception as e:
+        # File-level extraction is mandatory: without it we have nothing to return.
+        # Translate upstream errors into a clean HTTPException so the frontend can
+        # display an actionable message (quota exceeded, timeout, etc.) instead of
+        # a generic 500.
+        print(f"Ingest file extraction error: {str(e)}")
+        status_code, detail = _classify_genai_error(e)
+        raise HTTPException(status_code=status_code, detail=detail, headers=_genai_error_headers(e))
+
+    parsed = _parse_model_json(raw_text or "")
+    items = parsed.get("items", [])
+    if not isinstance(items, list):
+        items = []
+    return items
 
-        # 7. The AI call is identical, just using the generic 'model_part'
-        try:
-            # Use a single-call timeout rather than a long retry chain to keep UX snappy.
-            # 240s is generous enough for large/complex menus that Gemini has
-            # successfully processed before but occasionally needs longer for.
-            response = model.generate_content(
-                [prompt, model_part],
-                request_options=RequestOptions(timeout=240),
-            )
-        except Exception as e:
-            # File-level extraction is mandatory: without it we have nothing to return.
-            # Translate upstream errors into a clean HTTPException so the frontend can
-            # display an actionable message (quota exceeded, timeout, etc.) instead of
-            # a generic 500.
-            print(f"Ingest file extraction error: {str(e)}")
-            status_code, detail = _classify_genai_error(e)
-            raise HTTPException(status_code=status_code, detail=detail)
-        raw_text = response.text or ""
 
+def _coerce_extracted_item(item: dict) -> dict:
+    """Normalize one extracted item to name/description/price/ingredients."""
+    name = (item.get("name") or "").strip()
+    description = (item.get("description") or "").strip()
+    # price: try to coerce to float
+    price_value = item.get("price")
+    try:
+        price = float(price_value)
+    except Exception:
+        # Try to scrub non-digits
         try:
-            parsed = json.loads(raw_text)
+            price = float(str(price_value).replace("$", "").strip())
         except Exception:
-            start = raw_text.find("{")
-            end = raw_text.rfind("}")
-            if start != -1 and end != -1 and end > start:
-                parsed = json.loads(raw_text[start: end + 1])
-            else:
-                raise
+            price = 0.0
+
+    # Get the list of ingredients from the AI's output
+    ingredients_list = item.get("ingredients", []) or []
+
+    # Join the list of strings into a single comma-separated string
+    if isinstance(ingredients_list, list):
+        ingredients_text = ", ".join(ingredients_list)
+    else:
+        # Add a fallback in case the AI returned a single string by mistake
+        ingredients_text = str(ingredients_list).strip()
+
+    return {
+        "name": name,
+        "description": description,
+        "price": price,
+        "ingredients": ingredients_text,
+    }
+
+
+_preprocess_pool: Optional[concurrent.futures.ProcessPoolExecutor] = None
+
 
-        items = parsed.get("items", [])
-        if not isinstance(items, list):
-            items = []
-
-        # The per-item allergen/dietary classifier model is reused for every item,
-        # so build it once outside the loop instead of re-instantiating it each time.
-        _ensure_genai_configured()
-        parse_model_name = _select_model_name("parse")
-        parse_model = genai.GenerativeModel(
-            model_name=parse_model_name,
-            generation_config={
-                "temperature": 0,
-                "response_mime_type": "application/json",
-            },
+def _get_preprocess_pool() -> Optional[concurrent.futures.ProcessPoolExecutor]:
+    global _preprocess_pool
+    workers = image_preprocess.worker_count()
+    if workers <= 0:
+        return None
+    if _preprocess_pool is None:
+        _preprocess_pool = concurrent.futures.ProcessPoolExecutor(max_workers=workers)
+    return _preprocess_pool
+
+
+async def _preprocess_upload(filename: Optional[str], data: bytes, content_type: str) -> tuple:
+    """Downsize/grayscale large photos off the event loop.
+
+    Returns ``(filename, data, content_type)``; anything that is not an
+    image, already fits the byte budget, or fails to decode is returned
+    unchanged so preprocessing can never fail an import.
+    """
+    if not content_type.startswith("image/"):
+        return filename, data, content_type
+
+    started = time.perf_counter()
+    try:
+        processed = await asyncio.get_running_loop().run_in_executor(
+            _get_preprocess_pool(),
+            image_preprocess.preprocess_image,
+            data,
+            image_preprocess.max_bytes(),
+            image_preprocess.max_side(),
         )
+    except Exception as preprocess_error:
+        print(f"Image preprocessing failed for {filename}; sending original: {preprocess_error}")
+        return filename, data, content_type
+
+    if processed is None:
+        return filename, data, content_type
+
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    print(
+        f"Preprocessed {filename or 'menu'}: {len(data)} -> {len(processed)} bytes "
+        f"in {elapsed_ms:.0f} ms"
+    )
+    stem, _ = os.path.splitext(filename or "menu")
+    return f"{stem}.jpg", processed, "image/jpeg"
 
-        # If per-item AI parsing breaks midway (e.g. quota mid-import), stop calling
-        # the API for the rest of the items but still return everything we extracted
-        # so the user can finish tagging manually. This implements the spec's
-        # "Graceful AI Degradation" requirement.
-        per_item_ai_disabled = False
-        per_item_ai_error_logged = False
-
-        normalized_items = []
-        for item in items:
-            name = (item.get("name") or "").strip()
-            description = (item.get("description") or "").strip()
-            # price: try to coerce to float
-            price_value = item.get("price")
+
+def _ingest_pages_per_part() -> int:
+    return max(1, int(os.getenv("INGEST_PDF_PAGES_PER_PART", 2)))
+
+
+def _ingest_max_concurrency() -> int:
+    return max(1, int(os.getenv("INGEST_MAX_CONCURRENCY", 4)))
+
+
+def _split_ingest_parts(filename: Optional[str], file_bytes: bytes, content_type: str) -> List[dict]:
+    """Split one upload into extraction parts of at most N PDF pages each.
+
+    Images (and PDFs when pypdf is unavailable or cannot read the file) are a
+    single part; Gemini then gets the original bytes exactly as before.
+    """
+    label = filename or "menu"
+    whole = [{"label": label, "mime_type": content_type, "data": file_bytes}]
+    if content_type != "application/pdf" or PdfReader is None:
+        return whole
+
+    try:
+        reader = PdfReader(io.BytesIO(file_bytes))
+        page_count = len(reader.pages)
+    except Exception as pdf_error:
+        print(f"Could not split PDF {label}; sending it whole: {pdf_error}")
+        return whole
+
+    per_part = _ingest_pages_per_part()
+    if page_count <= per_part:
+        return whole
+
+    parts = []
+    for start in range(0, page_count, per_part):
+        end = min(start + per_part, page_count)
+        writer = PdfWriter()
+        for page_index in range(start, end):
+            writer.add_page(reader.pages[page_index])
+        buffer = io.BytesIO()
+        writer.write(buffer)
+        parts.append(
+            {
+                "label": f"{label} pages {start + 1}-{end}",
+                "mime_type": content_type,
+                "data": buffer.getvalue(),
+            }
+        )
+    return parts
+
+
+def _item_dedup_key(item: dict) -> Optional[tuple]:
+    name = " ".join(item["name"].lower().split())
+    if not name:
+        return None
+    return name, round(item["price"], 2)
+
+
+async def _extract_parts(provider, parts: List[dict], cancel: Optional[threading.Event] = None) -> tuple:
+    """Extract every part concurrently and merge the items in document order.
+
+    At most INGEST_MAX_CONCURRENCY extraction calls run at once. An item that
+    repeats an item of the part just before it (same name and price, e.g. a
+    heading carried over a page break) is kept once; repeats within one part
+    or between parts further apart are real menu entries and are all kept.
+    A failing part only drops its own items and is
+    reported in ``failures`` as ``(part, error)``; if every part fails the
+    first error is raised so single-file behavior is unchanged. Parts still
+    waiting for a slot when ``cancel`` is set are skipped.
+    """
+    semaphore = asyncio.Semaphore(_ingest_max_concurrency())
+
+    async def run(part):
+        started = False
+        try:
+            async with semaphore:
+                if cancel is not None and cancel.is_set():
+                    raise ai_cancel.RequestCancelled()
+                started = True
+                return await asyncio.to_thread(
+                    _extract_menu_items, provider, part["data"], part["mime_type"])
+        except (ai_cancel.RequestCancelled, asyncio.CancelledError):
+            if not started:
+                ai_cancel.count("parts_skipped")
+            raise
+
+    results = await asyncio.gather(*(run(part) for part in parts), return_exceptions=True)
+
+    merged: List[dict] = []
+    failures = []
+    previous_keys = set()
+    for part, result in zip(parts, results):
+        if isinstance(result, Exception):
+            print(f"Ingest extraction failed for {part['label']}: {result}")
+            failures.append((part, result))
+            previous_keys = set()
+            continue
+        keys = set()
+        for raw_item in result:
+            item = _coerce_extracted_item(raw_item)
+            key = _item_dedup_key(item)
+            if key is not None:
+                keys.add(key)
+                if key in previous_keys:
+                    continue
+            merged.append(item)
+        previous_keys = keys
+
+    if failures and len(failures) == len(parts):
+        raise failures[0][1]
+    return merged, failures
+
+
+# Shared latency window and hedge budget for per-item classification calls.
+classify_hedger = ai_hedging.Hedger()
+
+
+class _MenuItemClassifier:
+    """Per-item allergen/dietary tagging shared by the ingest response modes.
+
+    If per-item AI parsing breaks midway (e.g. quota mid-import), stop calling
+    the API for the rest of the items but still return everything we extracted
+    so the user can finish tagging manually. This implements the spec's
+    "Graceful AI Degradation" requirement. ``error`` keeps the first failure
+    so callers can report it.
+    """
+
+    valid_allergens = {
+        "milk",
+        "eggs",
+        "fish",
+        "tree_nuts",
+        "wheat",
+        "shellfish",
+        "peanuts",
+        "soybeans",
+        "sesame",
+    }
+    valid_dietary = {"vegan", "vegetarian"}
+    synonyms = {
+        "tree nuts": "tree_nuts",
+        "treenuts": "tree_nuts",
+        "gluten": "wheat",
+    }
+
+    def __init__(self, provider):
+        # The provider (and its classifier model) is reused for every item,
+        # so it is built once per request instead of for each item.
+        self.provider = provider
+        self.disabled = False
+        self.error: Optional[Exception] = None
+
+    def _norm(self, value: str) -> str:
+        t = (value or "").strip().lower()
+        if t in self.synonyms:
+            t = self.synonyms[t]
+        return t.replace(" ", "_")
+
+    def classify(self, base_item: dict) -> dict:
+        ingredients_text = base_item["ingredients"]
+        ai_parsed: dict = {}
+
+        if not self.disabled:
+            prompt = _build_item_classification_prompt(ingredients_text)
             try:
-                price = float(price_value)
-            except Exception:
-                # Try to scrub non-digits
-                try:
-                    price = float(str(price_value).replace("$", "").strip())
-                except Exception:
-                    price = 0.0
+                # Timeout and hedging adapt to recent classification latency
+                # (see ai_hedging) instead of a fixed 30 s per item.
+                ai_raw = classify_hedger.call(
+                    lambda timeout: self.provider.classify(prompt, ingredients_text, timeout=timeout)
+                )
+                ai_parsed = _parse_model_json(ai_raw or "{}", default={})
+            except Exception as per_item_error:
+                # Don't fail the whole import on a per-item AI error.
+                # Disable further AI calls for this request and let the user
+                # tag remaining items manually (graceful AI degradation).
+                self.disabled = True
+                self.error = per_item_error
+                print(
+                    f"Per-item AI parsing failed; falling back to manual "
+                    f"tagging for remaining items: {per_item_error}"
+                )
+                ai_parsed = {}
 
-            # Get the list of ingredients from the AI's output
-            ingredients_list = item.get("ingredients", []) or []
+        allergens = [
+            a
+            for a in [self._norm(x) for x in ai_parsed.get("allergens", [])]
+            if a in self.valid_allergens
+        ]
+        dietary = [
+            d
+            for d in [self._norm(x) for x in ai_parsed.get("dietaryCategories", [])]
+            if d in self.valid_dietary
+        ]
+        extracted_ingredients = ai_parsed.get("extractedIngredients", []) or []
+        if extracted_ingredients and not ingredients_text:
+            ingredients_text = ", ".join(extracted_ingredients)
 
-            # Join the list of strings into a single comma-separated string
-            if isinstance(ingredients_list, list):
-                ingredients_text = ", ".join(ingredients_list)
-            else:
-                # Add a fallback in case the AI returned a single string by mistake
-                ingredients_text = str(ingredients_list).strip()
-            ing_prompt = (
-                "You are an expert food safety and dietary attribute extractor. Your task is to analyze a free-text ingredient list and return a single, strict JSON object.\n"
-                "Do not provide any preamble, explanation, or any text other than the JSON object itself.\n\n"
-                "### JSON Structure:\n"
-                "{\n"
-                '  "allergens": [array of strings],\n'
-                '  "dietaryCategories": [array of strings],\n'
-                '  "extractedIngredients": [array of strings] (List all distinct ingredients found in the text)\n'
-                "}\n\n"
-                "---"
-                "### Allowed IDs:\n"
-                "* **Allergens:** `milk`, `eggs`, `fish`, `tree_nuts`, `wheat`, `shellfish`, `peanuts`, `soybeans`, `sesame`\n"
-                "* **Dietary Categories:** `vegan`, `vegetarian`\n\n"
-                "---"
-                "### **CRITICAL EXTRACTION RULES**\n\n"
-                "**1. Dietary Category Rules (Follow Strictly):**\n\n"
-                "* **For `vegetarian`:**\n"
-                "    * **DO NOT** assign `vegetarian` if *any* meat, poultry, fish, or shellfish products are present.\n"
-                "    * **Exclusion list (check carefully):** `anchovies`, `prosciutto`, `bacon`, `ham`, `chicken`, `beef`, `pork`, `fish`, `shrimp`, `crab`, `lobster`, `gelatin`, `chicken broth`, `beef stock`, `fish sauce`, `lard`.\n\n"
-                "* **For `vegan`:**\n"
-                "    * **DO NOT** assign `vegan` if *any* animal-derived products are present.\n"
-                "    * This includes all items on the `vegetarian` exclusion list, **PLUS:** `milk`, `cheese`, `butter`, `cream`, `yogurt`, `eggs`, `honey`, `whey`, `casein`, `collagen`.\n"
-                '    * If an item qualifies as `vegan`, it *also* qualifies as `vegetarian`. In this case, the output array must be `["vegan", "vegetarian"]`.\n\n'
-                "**2. Allergen Rules (Follow Strictly):**\n\n"
-                "* **`wheat` (Inference Rule):**\n"
-                "    * **YOU MUST** assume `wheat` is present if the ingredients list `pasta`, `flour`, `bread`, `semolina`, `couscous`, `farro`, `spelt`, or `noodles`.\n"
-                "    * **Exception:** Do *not* assign `wheat` only if the item is explicitly qualified as non-wheat (e.g., `gluten-free pasta`, `rice flour`, `almond flour`, `rice noodles`).\n\n"
-                "* **`fish`:**\n"
-                "    * Must be included for all types of fish, including `anchovies`.\n\n"
-                "* **`milk`:**\n"
-                "    * Must be included for `milk` and all common dairy products like `cheese`, `butter`, `yogurt`, `cream`, `whey`, `casein`.\n\n"
-                "**3. General Rules:**\n"
-                "* Normalize all synonyms to the allowed IDs (e.g., 'soya' -> 'soybeans', 'pecans' -> 'tree_nuts', 'parmesan' -> 'milk').\n"
-                "* If no attributes for a category are found, output an empty array `[]` for that key.\n\n"
-                "---"
-                f"Text to analyze: {ingredients_text}"
+        return {
+            **base_item,
+            "ingredients": ingredients_text,
+            "allergens": allergens,
+            "dietaryCategories": dietary,
+        }
+
+
+def _ingest_cache_lookup(key: str) -> Optional[List[dict]]:
+    try:
+        return ingest_cache.get_cached_items(db, key)
+    except Exception as cache_error:
+        print(f"Error reading ingest cache: {cache_error}")
+        return None
+
+
+def _ingest_cache_store(key: str, digest: str, items: List[dict]) -> None:
+    try:
+        ingest_cache.store_items(db, key, digest, items)
+    except Exception as cache_error:
+        # A cache write failure only costs a future re-extraction.
+        print(f"Error writing ingest cache: {cache_error}")
+
+
+def _format_stream_event(event: dict, stream_format: str) -> str:
+    payload = json.dumps(event)
+    if stream_format == "sse":
+        return f"event: {event['event']}\ndata: {payload}\n\n"
+    return payload + "\n"
+
+
+def _error_status_detail(error: Exception) -> tuple:
+    if isinstance(error, HTTPException):
+        return error.status_code, error.detail
+    return _classify_genai_error(error)
+
+
+def _stream_error_event(error: Exception, fatal: bool) -> dict:
+    status_code, detail = _error_status_detail(error)
+    return {"event": "error", "status": status_code, "detail": detail, "fatal": fatal}
+
+
+def _part_failure(part: dict, error: Exception) -> dict:
+    status_code, detail = _error_status_detail(error)
+    return {"part": part["label"], "status": status_code, "detail": detail}
+
+
+async def _cached_event_stream(items: List[dict]):
+    """Replay a cached ingest result using the live stream's event shapes."""
+    yield {"event": "started", "cached": True}
+    yield {
+        "event": "items",
+        "items": [
+            {key: item.get(key) for key in ("name", "description", "price", "ingredients")}
+            for item in items
+        ],
+    }
+    for index, item in enumerate(items):
+        yield {"event": "item", "index": index, "item": item}
+    yield {"event": "done", "count": len(items)}
+
+
+async def _ingest_event_stream(
+    provider,
+    parts: List[dict],
+    on_complete=None,
+    timer: Optional[RequestTimer] = None,
+    cancel: Optional[threading.Event] = None,
+):
+    """Yield ingest progress events as soon as each stage completes.
+
+    Order: ``started`` -> ``items`` (extracted list, untagged) -> one ``item``
+    per classified entry -> ``done``. Failures are emitted as ``error``
+    events carrying the same status/detail the JSON response would use;
+    ``fatal: false`` means the import continues with fewer items or with
+    manual tagging. ``on_complete(items)`` is called only when every part
+    was extracted and every item was AI-tagged. ``done`` carries the
+    request's stage timings.
+
+    When the client disconnects, Starlette cancels the response body; the
+    stream then sets ``cancel`` so queued work for this request is skipped.
+    """
+    timer = timer or RequestTimer()
+    cancel = cancel or threading.Event()
+    base_items: List[dict] = []
+    results = []
+    try:
+        yield {"event": "started", "parts": len(parts)}
+
+        try:
+            with timer.span("extract"):
+                base_items, failures = await _extract_parts(provider, parts, cancel)
+        except Exception as e:
+            if not isinstance(e, HTTPException):
+                print(f"Ingest file error: {str(e)}")
+            yield _stream_error_event(e, fatal=True)
+            return
+
+        yield {"event": "items", "items": base_items}
+        for part, error in failures:
+            yield {**_stream_error_event(error, fatal=False), "part": part["label"]}
+
+        classifier = _MenuItemClassifier(provider)
+        degraded_reported = False
+        classify_started = timer.now()
+        for index, base_item in enumerate(base_items):
+            item = await asyncio.to_thread(classifier.classify, base_item)
+            results.append(item)
+            if classifier.error is not None and not degraded_reported:
+                yield _stream_error_event(classifier.error, fatal=False)
+                degraded_reported = True
+            yield {"event": "item", "index": index, "item": item}
+
+        timer.record("classify", classify_started)
+
+        if on_complete is not None and classifier.error is None and not failures:
+            on_complete(results)
+        yield {"event": "done", "count": len(base_items), "timings": timer.as_dict()}
+    except (asyncio.CancelledError, GeneratorExit):
+        cancel.set()
+        ai_cancel.count("requests_cancelled")
+        ai_cancel.count("items_untagged", len(base_items) - len(results))
+        raise
+
+
+@router.post("/ai/ingest-menu")
+async def ingest_menu_file(
+    request: Request,
+    response: Response,
+    file: List[UploadFile] = File(...),
+    stream: Optional[str] = Query(
+        None,
+        description="Stream progress events instead of one JSON body: 'ndjson' or 'sse'.",
+    ),
+    refresh: bool = Query(
+        False,
+        description="Ignore any cached result for this file and extract it again.",
+    ),
+    restaurant_id: Optional[str] = Query(
+        None,
+        description="Restaurant the menu belongs to; used for fair sharing of AI capacity.",
+    ),
+    token_data: dict = Depends(verify_token),
+):
+    """Extract menu items from one or more images/PDFs (repeat the ``file`` field).
+
+    PDFs are split into page ranges that are extracted concurrently; items
+    are merged in upload and page order.
+    """
+    try:
+        user_id = token_data.get("uid")
+        if not user_id:
+            raise HTTPException(status_code=401, detail="Invalid user token")
+
+        uploads = file
+        if len(uploads) > MAX_INGEST_FILES:
+            raise HTTPException(
+                status_code=400,
+                detail=f"At most {MAX_INGEST_FILES} files can be imported at once.",
+            )
+        if any(upload.content_type not in SUPPORTED_INGEST_MIME_TYPES for upload in uploads):
+            raise HTTPException(
+                status_code=400,
+                detail="Only PNG/JPEG images and PDFs are supported.",
             )
 
-            allergens: List[str] = []
-            dietary: List[str] = []
-            ai_parsed: dict = {}
+        if stream is not None and stream not in INGEST_STREAM_MEDIA_TYPES:
+            raise HTTPException(
+                status_code=400,
+                detail="stream must be one of: ndjson, sse.",
+            )
 
-            if not per_item_ai_disabled:
-                try:
-                    ai_resp = parse_model.generate_content(
-                        ing_prompt,
-                        request_options=RequestOptions(timeout=30),
+        timer = RequestTimer()
+
+        # The provider uses a potentially heavier, multimodal-capable model
+        # for ingestion and the parse model for per-item classification.
+        # Set when the client disconnects; queued AI and storage work is skipped.
+        cancel = threading.Event()
+        provider = _get_ai_provider(ai_scheduler.BULK, await _ai_tenant(token_data, restaurant_id), cancel)
+        provider.prepare("ingest", "parse")
+
+        with timer.span("read"):
+            files_bytes = [await upload.read() for upload in uploads]
+        digests = [ingest_cache.content_digest(data) for data in files_bytes]
+
+        # Identical uploads (page refresh, second device) reuse the stored
+        # result as long as the prompts, models and image preprocessing
+        # settings are unchanged. A multi-file
+        # upload is addressed by the ordered list of its file digests.
+        digest = (
+            digests[0]
+            if len(digests) == 1
+            else ingest_cache.content_digest("".join(digests).encode("ascii"))
+        )
+        key = ingest_cache.cache_key(
+            digest,
+            ingest_cache.pipeline_version(
+                INGEST_PROMPT,
+                _build_item_classification_prompt(""),
+                provider.name,
+                provider.model_name("ingest"),
+                provider.model_name("parse"),
+                image_preprocess.settings_signature(),
+            ),
+        )
+        cached_items = None if refresh else _ingest_cache_lookup(key)
+        cache_status = "hit" if cached_items is not None else "miss"
+
+        parts: List[dict] = []
+        if cached_items is None:
+            # Digests are taken from the original bytes so a re-upload still
+            # hits the cache before any preprocessing work is done.
+            with timer.span("preprocess"):
+                prepared = await asyncio.gather(
+                    *(
+                        _preprocess_upload(upload.filename, data, upload.content_type)
+                        for upload, data in zip(uploads, files_bytes)
                     )
-                    ai_raw = ai_resp.text or "{}"
-                    try:
-                        ai_parsed = json.loads(ai_raw)
-                    except Exception:
-                        s = ai_raw.find("{")
-                        e = ai_raw.rfind("}")
-                        ai_parsed = (
-                            json.loads(ai_raw[s : e + 1])
-                            if s != -1 and e != -1 and e > s
-                            else {}
-                        )
-                except Exception as per_item_error:
-                    # Don't fail the whole import on a per-item AI error.
-                    # Disable further AI calls for this request and let the user
-                    # tag remaining items manually (graceful AI degradation).
-                    per_item_ai_disabled = True
-                    if not per_item_ai_error_logged:
-                        print(
-                            f"Per-item AI parsing failed; falling back to manual "
-                            f"tagging for remaining items: {per_item_error}"
-                        )
-                        per_item_ai_error_logged = True
-                    ai_parsed = {}
-
-            # Validate ids
-            valid_allergens = {
-                "milk",
-                "eggs",
-                "fish",
-                "tree_nuts",
-                "wheat",
-                "shellfish",
-                "peanuts",
-                "soybeans",
-                "sesame",
-            }
-            valid_dietary = {"vegan", "vegetarian"}
-            synonyms = {
-                "tree nuts": "tree_nuts",
-                "treenuts": "tree_nuts",
-                "gluten": "wheat",
-            }
+                )
+            for (filename, data, content_type), file_digest in zip(prepared, digests):
+                _archive_menu_file(user_id, filename, data, content_type, file_digest, timer, cancel)
+                parts.extend(_split_ingest_parts(filename, data, content_type))
 
-            def norm(v: str) -> str:
-                t = (v or "").strip().lower()
-                if t in synonyms:
-                    t = synonyms[t]
-                return t.replace(" ", "_")
+        if stream is not None:
+            if cached_items is not None:
+                events = _cached_event_stream(cached_items)
+            else:
+                events = _ingest_event_stream(
+                    provider,
+                    parts,
+                    on_complete=lambda items: _ingest_cache_store(key, digest, items),
+                    timer=timer,
+                    cancel=cancel,
+                )
 
-            allergens = [
-                a
-                for a in [norm(x) for x in ai_parsed.get("allergens", [])]
-                if a in valid_allergens
-            ]
-            dietary = [
-                d
-                for d in [norm(x) for x in ai_parsed.get("dietaryCategories", [])]
-                if d in valid_dietary
-            ]
-            extracted_ingredients = ai_parsed.get(
-                "extractedIngredients", []) or []
-            if extracted_ingredients and not ingredients_text:
-                ingredients_text = ", ".join(extracted_ingredients)
-
-            normalized_items.append(
-                {
-                    "name": name,
-                    "description": description,
-                    "price": price,
-                    "ingredients": ingredients_text,
-                    "allergens": allergens,
-                    "dietaryCategories": dietary,
-                }
+            async def body():
+                async for event in events:
+                    yield _format_stream_event(event, stream)
+
+            return StreamingResponse(
+                body(),
+                media_type=INGEST_STREAM_MEDIA_TYPES[stream],
+                # Stop proxies (Render/nginx) from buffering the stream.
+                headers={
+                    "Cache-Control": "no-cache",
+                    "X-Accel-Buffering": "no",
+                    "X-Ingest-Cache": cache_status,
+                },
             )
 
-        return {"items": normalized_items}
+        response.headers["X-Ingest-Cache"] = cache_status
+        if cached_items is not None:
+            return {"items": cached_items}
+
+        base_items: List[dict] = []
+        normalized_items: List[dict] = []
+        try:
+            async with ai_cancel.cancel_on_disconnect(request, cancel):
+                with timer.span("extract"):
+                    base_items, failures = await _extract_parts(provider, parts, cancel)
+
+                with timer.span("classify"):
+                    classifier = _MenuItemClassifier(provider)
+                    for item in base_items:
+                        if cancel.is_set():
+                            break
+                        normalized_items.append(await asyncio.to_thread(classifier.classify, item))
+        except ai_cancel.RequestCancelled:
+            pass  # every part was skipped; ``cancel`` is set
+
+        if cancel.is_set():
+            ai_cancel.count("requests_cancelled")
+            ai_cancel.count("items_untagged", len(base_items) - len(normalized_items))
+            # Nobody is listening any more: skip caching and answer with
+            # nginx's "client closed request" status.
+            return Response(status_code=499)
+
+        # Archival normally finishes during extraction; when it does, its span
+        # shows up next to "extract" so the overlap is visible.
+        response.headers["Server-Timing"] = timer.server_timing()
+
+        # Only complete, fully tagged results are cached; a degraded import
+        # should be retried against the AI next time.
+        if classifier.error is None and not failures:
+            _ingest_cache_store(key, digest, normalized_items)
+
+        result = {"items": normalized_items}
+        if failures:
+            result["failed_parts"] = [_part_failure(part, error) for part, error in failures]
+        return result
     except HTTPException:
         raise
     except Exception as e:
         print(f"Ingest file error: {str(e)}")
         status_code, detail = _classify_genai_error(e)
-        raise HTTPException(status_code=status_code, detail=detail)
+        raise HTTPException(status_code=status_code, detail=detail, headers=_genai_error_headers(e))
+
+
+@router.get("/ai/metrics")
+async def ai_metrics(token_data=Depends(admin_only)):
+    """Operational counters for the shared AI call guards (admin only)."""
+    return {
+        "admission": ai_admission.admission.metrics(),
+        "parse_refinements": ai_refinement.refinements.metrics(),
+        "parse_cache": ingredient_parser.cache_metrics(),
+        "cancellation": {
+            **ai_cancel.snapshot(),
+            "archive_uploads_skipped": menu_archiver.metrics()["cancelled"],
+        },
+        "rate_limit": ai_rate_limiter.metrics(),
+        "scheduler": ai_call_scheduler.metrics(),
+        "circuit": {"state": ai_circuit.state, "kind": ai_circuit.kind},
+        "classify_hedging": dict(classify_hedger.stats),
+    }
 
 
 @router.post("/restaurants/")
@@ -1008,6 +1794,9 @@ async def delete_restaurant(
                     "restaurant_id"
                 ) == restaurant_id:
                     db.reference(f"menu_items/{item_id}").delete()
+                    menu_retag.reindex_item(
+                        db, item_id, item_data.get("ingredients"), None
+                    )
 
         # Best-effort cleanup of the restaurant's own logo blob.
         _best_effort_delete_blob(
@@ -1080,18 +1869,15 @@ async def add_menu_item(
         menu_item_id = generate_id("menu_items")
         menu_item_dict = menu_item.dict()
 
-        # 🔥 1. Run your parser on ingredients
-        parsed = parse_ingredients(menu_item.ingredients)
-
-        # 🔥 2. Merge parser-detected allergens/categories with user-supplied
+        # 🔥 Merge parser-detected allergens/categories with user-supplied
         # values. The parser augments manual input; it must never silently
-        # discard fields the user explicitly set on the menu item.
-        menu_item_dict["allergens"] = sorted(
-            set(menu_item.allergens) | set(parsed.get("allergens") or [])
-        )
-        menu_item_dict["dietaryCategories"] = sorted(
-            set(menu_item.dietaryCategories)
-            | set(parsed.get("dietaryCategories") or [])
+        # discard fields the user explicitly set on the menu item. Which tags
+        # came only from the parser is recorded so a rules change can re-tag
+        # them later (see menu_retag).
+        menu_item_dict.update(
+            menu_retag.tag_fields(
+                menu_item.ingredients, menu_item.allergens, menu_item.dietaryCategories
+            )
         )
 
         # Add restaurant_id and item_id to the menu item data --> build final object
@@ -1104,6 +1890,7 @@ async def add_menu_item(
         # Store menu item
         menu_ref = db.reference("menu_items")
         menu_ref.child(menu_item_id).set(menu_item_data)
+        menu_retag.reindex_item(db, menu_item_id, None, menu_item.ingredients)
 
         return menu_item_data
 
@@ -1195,12 +1982,11 @@ async def get_menu_items(
 
         # Apply allergen-free filter if specified
         if allergen_free:
+            excluded, unknown = ALLERGENS.split(allergen_free)
             restaurant_menu = [
                 item
                 for item in restaurant_menu
-                if not any(
-                    allergen in item.get("allergens", []) for allergen in allergen_free
-                )
+                if not _has_any_allergen(item.get("allergens"), excluded, unknown)
             ]
 
         return restaurant_menu
@@ -1262,8 +2048,18 @@ async def update_menu_item(
         if "archived" in menu_item_dict:
             updated_menu_item["archived"] = bool(menu_item_dict["archived"])
 
+        updated_menu_item.update(
+            menu_retag.edited_tag_fields(existing_menu_item_data, updated_menu_item)
+        )
+
         # Update in database
         menu_ref.set(updated_menu_item)
+        menu_retag.reindex_item(
+            db,
+            menu_item_id,
+            existing_menu_item_data.get("ingredients"),
+            updated_menu_item.get("ingredients"),
+        )
 
         return updated_menu_item
 
@@ -1312,6 +2108,9 @@ async def duplicate_menu_item(
 
         db.reference("menu_items").child(
             new_menu_item_id).set(duplicated_menu_item)
+        menu_retag.reindex_item(
+            db, new_menu_item_id, None, duplicated_menu_item.get("ingredients")
+        )
         return duplicated_menu_item
     except HTTPException:
         raise
@@ -1428,6 +2227,12 @@ async def bulk_update_menu_items(
             raise HTTPException(
                 status_code=400, detail="No menu item ids provided")
 
+        # Encoded once per request, for clearing the inferred flags below.
+        edited_allergens = ALLERGENS.encode(payload.add_allergens + payload.remove_allergens)
+        edited_dietary = DIETARY_CATEGORIES.encode(
+            payload.add_dietary_categories + payload.remove_dietary_categories
+        )
+
         menu_ref = db.reference("menu_items")
         updated_items = []
 
@@ -1460,6 +2265,17 @@ async def bulk_update_menu_items(
                     payload.add_dietary_categories,
                     payload.remove_dietary_categories,
                 ),
+                # Tags added or removed by hand are no longer the parser's.
+                "inferredAllergens": ALLERGENS.decode(
+                    ALLERGENS.mask(existing_menu_item_data.get("inferredAllergens"))
+                    & ~edited_allergens
+                ),
+                "inferredDietaryCategories": DIETARY_CATEGORIES.decode(
+                    DIETARY_CATEGORIES.mask(
+                        existing_menu_item_data.get("inferredDietaryCategories")
+                    )
+                    & ~edited_dietary
+                ),
                 "archived": bool(existing_menu_item_data.get("archived", False)),
             }
             item_ref.set(updated_menu_item)
@@ -1519,6 +2335,9 @@ async def delete_menu_item(
 
         # Delete the menu item
         menu_ref.delete()
+        menu_retag.reindex_item(
+            db, menu_item_id, menu_item_data.get("ingredients"), None
+        )
 
         return {"message": f"Menu item {menu_item_id} successfully deleted"}
 
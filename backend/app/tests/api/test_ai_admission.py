@@ -0,0 +1,110 @@
+"""Admission control in front of the AI endpoints."""
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+import ai_admission
+import ai_providers
+
+
+@pytest.fixture
+def controller(monkeypatch):
+    monkeypatch.setenv("AI_PROVIDER", "stub")
+    ai_providers.configure_stub(seed=1, items_per_page=2)
+    yield ai_admission.admission
+    ai_providers._shared_stub = None
+    assert ai_admission.admission.in_flight == 0
+
+
+def _parse(client, headers):
+    return client.post("/ai/parse-ingredients", headers=headers, json={"ingredients": "cream"})
+
+
+def test_per_user_cap_sheds_with_retry_after(client: TestClient, user_auth_header, admin_auth_header, controller):
+    for _ in range(controller.max_per_user):
+        assert controller.try_admit("user1", 0) is None
+    try:
+        resp = _parse(client, user_auth_header)
+        assert resp.status_code == 503
+        assert "manually" in resp.json()["detail"].lower()
+        assert resp.headers["Retry-After"] == "10"
+
+        # Other users are unaffected.
+        assert _parse(client, admin_auth_header).status_code == 200
+    finally:
+        for _ in range(controller.max_per_user):
+            controller.release("user1", 0)
+
+    assert _parse(client, user_auth_header).status_code == 200
+
+
+def test_global_cap_sheds_every_user(client: TestClient, user_auth_header, controller, monkeypatch):
+    monkeypatch.setenv("AI_MAX_INFLIGHT_REQUESTS", "1")
+    assert controller.try_admit("someone-else", 0) is None
+    try:
+        files = {"file": ("menu.png", b"menu-photo", "image/png")}
+        resp = client.post("/ai/ingest-menu", headers=user_auth_header, files=files)
+        assert resp.status_code == 503
+        assert "add items manually" in resp.json()["detail"]
+    finally:
+        controller.release("someone-else", 0)
+
+
+def test_upload_bytes_cap_uses_content_length(controller, monkeypatch):
+    monkeypatch.setenv("AI_MAX_INFLIGHT_UPLOAD_MB", "1")
+    big = 800 * 1024
+    assert controller.try_admit("a", big) is None  # alone: always admitted
+    assert controller.try_admit("b", big) == "bytes"
+    assert controller.try_admit("b", 1024) is None
+    controller.release("a", big)
+    controller.release("b", 1024)
+
+
+def _call_middleware(controller, headers):
+    reached_app = []
+
+    async def app(scope, receive, send):  # pragma: no cover - must not run
+        reached_app.append(True)
+
+    async def receive():
+        raise AssertionError("body was read")
+
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    middleware = ai_admission.AIAdmissionMiddleware(app, controller)
+    scope = {"type": "http", "method": "POST", "path": ai_admission.INGEST_PATH, "headers": headers}
+    asyncio.run(middleware(scope, receive, send))
+    assert not reached_app
+    return sent[0]["status"]
+
+
+def test_rejected_request_body_is_never_read(monkeypatch):
+    monkeypatch.setitem(ai_admission.auth_routes.SESSION_TOKENS, "t1", {"uid": "u1"})
+    monkeypatch.setenv("AI_MAX_INFLIGHT_REQUESTS", "1")
+    controller = ai_admission.AdmissionController()
+    controller.try_admit("someone-else", 0)
+
+    assert _call_middleware(controller, [(b"authorization", b"Bearer t1")]) == 503
+
+
+def test_requests_without_a_session_never_take_a_slot():
+    controller = ai_admission.AdmissionController()
+
+    assert _call_middleware(controller, []) == 401
+    assert _call_middleware(controller, [(b"authorization", b"Bearer unknown")]) == 401
+    assert controller.metrics()["in_flight"] == 0
+    assert controller.metrics()["admitted"] == 0
+
+
+def test_streamed_ingest_releases_slot_after_stream(
+    client: TestClient, user_auth_header, controller, storage_objects
+):
+    files = {"file": ("menu.png", b"menu-photo", "image/png")}
+    resp = client.post("/ai/ingest-menu?stream=ndjson&refresh=true", headers=user_auth_header, files=files)
+    assert resp.status_code == 200
+    assert controller.in_flight == 0
+    assert controller.metrics()["admitted"] >= 1
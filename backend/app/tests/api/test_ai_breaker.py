@@ -0,0 +1,128 @@
+"""Shared circuit breaker in front of the AI provider."""
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+import ai_breaker
+import ai_providers
+import ai_rate_limit
+import routes as app_routes
+
+
+@pytest.fixture
+def stub(monkeypatch):
+    monkeypatch.setenv("AI_PROVIDER", "stub")
+    provider = ai_providers.configure_stub(seed=1, items_per_page=2)
+    yield provider
+    ai_providers._shared_stub = None
+
+
+def _parse(client, headers, text="cream"):
+    return client.post("/ai/parse-ingredients", headers=headers, json={"ingredients": text})
+
+
+def test_quota_failure_opens_circuit_for_later_requests(client: TestClient, user_auth_header, stub):
+    stub.quota = 0
+    first = _parse(client, user_auth_header)
+    assert first.status_code == 503
+    assert stub.calls == 1
+
+    started = time.perf_counter()
+    second = _parse(client, user_auth_header)
+    assert time.perf_counter() - started < 0.5
+    assert second.status_code == 503
+    assert "manually" in second.json()["detail"].lower()
+    assert "quota" in second.json()["detail"].lower()
+    assert int(second.headers["Retry-After"]) > 0
+    assert stub.calls == 1  # failed fast without calling the provider
+
+    files = {"file": ("menu.png", b"menu-photo", "image/png")}
+    ingest = client.post("/ai/ingest-menu?refresh=true", headers=user_auth_header, files=files)
+    assert ingest.status_code == 503
+    assert "manually" in ingest.json()["detail"].lower()
+    assert stub.calls == 1
+
+
+def test_input_errors_do_not_open_circuit(client: TestClient, user_auth_header, stub, monkeypatch):
+    def refuse(prompt, text, timeout=None):
+        raise Exception("Response blocked by safety policy")
+
+    monkeypatch.setattr(stub, "classify", refuse)
+    assert _parse(client, user_auth_header).status_code == 422
+    assert app_routes.ai_circuit.state == ai_breaker.CLOSED
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_timeouts_open_after_threshold_then_half_open_probe():
+    clock = FakeClock()
+    breaker = ai_breaker.CircuitBreaker(cooldown_seconds=30, timeout_threshold=2, clock=clock)
+
+    breaker.before_call()
+    breaker.record_failure("timeout")
+    assert breaker.state == ai_breaker.CLOSED
+    breaker.before_call()
+    breaker.record_failure("timeout")
+    assert breaker.state == ai_breaker.OPEN
+
+    with pytest.raises(ai_breaker.CircuitOpenError) as excinfo:
+        breaker.before_call()
+    assert excinfo.value.kind == "timeout"
+
+    clock.now += 31
+    breaker.before_call()  # the probe
+    assert breaker.state == ai_breaker.HALF_OPEN
+    with pytest.raises(ai_breaker.CircuitOpenError):
+        breaker.before_call()  # only one probe at a time
+
+    breaker.record_failure("timeout")
+    assert breaker.state == ai_breaker.OPEN  # failed probe re-opens at once
+
+    clock.now += 31
+    breaker.before_call()
+    breaker.record_success()
+    assert breaker.state == ai_breaker.CLOSED
+    breaker.before_call()
+
+
+def test_zero_cooldown_disables_breaker():
+    breaker = ai_breaker.CircuitBreaker(cooldown_seconds=0)
+    breaker.record_failure("quota")
+    breaker.before_call()
+
+
+
+def test_calls_that_never_reach_the_backend_leave_the_circuit_open():
+    clock = FakeClock()
+    breaker = ai_breaker.CircuitBreaker(cooldown_seconds=30, timeout_threshold=2, clock=clock)
+    inner = ai_providers.StubProvider()
+    guarded = ai_breaker.GuardedProvider(inner, breaker, app_routes._breaker_failure_kind)
+
+    def opened_meanwhile(prompt, text, timeout=None):
+        # Another request trips the breaker while this one queues for a token.
+        breaker.record_failure("quota")
+        raise ai_rate_limit.RateLimitTimeout(5)
+
+    inner.classify = opened_meanwhile
+    with pytest.raises(ai_rate_limit.RateLimitTimeout):
+        guarded.classify("prompt", "cream")
+    assert breaker.state == ai_breaker.OPEN
+
+    def rate_limited(prompt, text, timeout=None):
+        raise ai_rate_limit.RateLimitTimeout(5)
+
+    inner.classify = rate_limited
+    clock.now += 31
+    with pytest.raises(ai_rate_limit.RateLimitTimeout):
+        guarded.classify("prompt", "cream")  # the half-open probe, rejected before the provider
+    assert breaker.state == ai_breaker.HALF_OPEN
+    with pytest.raises(ai_rate_limit.RateLimitTimeout):
+        guarded.classify("prompt", "cream")  # the probe slot was released, not spent
+    assert breaker.state == ai_breaker.HALF_OPEN
@@ -0,0 +1,115 @@
+"""Recording AI calls to cassettes and replaying them."""
+import os
+
+import pytest
+from fastapi.testclient import TestClient
+
+import ai_cassettes
+import ai_providers
+import routes as app_routes
+
+
+@pytest.fixture
+def recording(monkeypatch, tmp_path):
+    monkeypatch.setenv("AI_PROVIDER", "stub")
+    monkeypatch.setenv("AI_RECORD_CASSETTES", str(tmp_path))
+    ai_providers.configure_stub(seed=1, items_per_page=2)
+    yield tmp_path
+    ai_providers._shared_stub = None
+
+
+def _cassettes(directory):
+    return sorted(os.path.join(directory, name) for name in os.listdir(directory))
+
+
+def test_recorded_ingest_replays_identically(
+    client: TestClient, user_auth_header, recording, monkeypatch, storage_objects
+):
+    files = {"file": ("menu.png", b"menu-photo", "image/png")}
+    recorded = client.post("/ai/ingest-menu?refresh=true", headers=user_auth_header, files=files)
+    assert recorded.status_code == 200
+
+    (path,) = _cassettes(recording)
+    entries = ai_cassettes.load_cassette(path)
+    assert [e["op"] for e in entries].count("extract") == 1
+    assert [e["op"] for e in entries].count("classify") == 2
+    assert all("latency_ms" in e for e in entries)
+
+    monkeypatch.delenv("AI_RECORD_CASSETTES")
+    monkeypatch.setenv("AI_PROVIDER", "replay")
+    monkeypatch.setenv("AI_CASSETTE", path)
+    monkeypatch.setenv("AI_REPLAY_TIMING", "0")
+    replayed = client.post("/ai/ingest-menu?refresh=true", headers=user_auth_header, files=files)
+    assert replayed.status_code == 200
+    assert replayed.json() == recorded.json()
+
+
+def _entry(op, prompt, response=None, error=None, input_sha256=""):
+    return {
+        "op": op,
+        "key": ai_cassettes.call_key(op, prompt, input_sha256),
+        "response": response,
+        "error": error,
+        "latency_ms": 5,
+    }
+
+
+class ChattyStub(ai_providers.StubProvider):
+    """Wraps its JSON in prose, like models sometimes do."""
+
+    def classify(self, prompt, text, timeout=None):
+        return "Sure! Here you go: " + super().classify(prompt, text, timeout) + " Hope that helps."
+
+
+def test_malformed_json_replays_through_fallback_parsing(
+    client: TestClient, user_auth_header, recording, monkeypatch
+):
+    ai_providers._shared_stub = ChattyStub()
+    body = {"ingredients": "cream, sugar"}
+    recorded = client.post("/ai/parse-ingredients", headers=user_auth_header, json=body)
+    assert recorded.status_code == 200
+    assert recorded.json()["allergens"] == ["milk"]
+
+    (path,) = _cassettes(recording)
+    (entry,) = ai_cassettes.load_cassette(path)
+    assert entry["response"].startswith("Sure! Here you go: {")
+
+    monkeypatch.delenv("AI_RECORD_CASSETTES")
+    monkeypatch.setenv("AI_PROVIDER", "replay")
+    monkeypatch.setenv("AI_CASSETTE", path)
+    monkeypatch.setenv("AI_REPLAY_TIMING", "0")
+    replayed = client.post("/ai/parse-ingredients", headers=user_auth_header, json=body)
+    assert replayed.json() == recorded.json()
+
+
+def test_replayed_errors_keep_their_classification(monkeypatch):
+    provider = ai_cassettes.ReplayProvider(
+        [
+            _entry("classify", "a", error={"type": "DeadlineExceeded", "message": "504 Deadline Exceeded"}),
+            _entry("classify", "b", error={"type": "StubQuotaError", "message": "429 Resource has been exhausted"}),
+        ],
+        timing_scale=0,
+    )
+    with pytest.raises(TimeoutError):
+        provider.classify("a", "")
+    with pytest.raises(Exception) as excinfo:
+        provider.classify("b", "")
+
+    status_code, detail = app_routes._classify_genai_error(excinfo.value, context="text")
+    assert status_code == 503
+    assert "manually" in detail.lower()
+
+
+def test_replay_scales_recorded_latency_and_honours_timeouts():
+    entry = _entry("classify", "slow", response="{}")
+    entry["latency_ms"] = 200
+    provider = ai_cassettes.ReplayProvider([entry], timing_scale=1)
+    with pytest.raises(TimeoutError):
+        provider.classify("slow", "", timeout=0.01)
+    assert ai_cassettes.ReplayProvider([entry], timing_scale=0).classify("slow", "") == "{}"
+
+
+def test_unmatched_call_is_a_cassette_miss():
+    provider = ai_cassettes.ReplayProvider([], timing_scale=0)
+    with pytest.raises(ai_cassettes.CassetteMiss):
+        provider.classify("never recorded", "")
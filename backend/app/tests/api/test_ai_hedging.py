@@ -0,0 +1,124 @@
+"""Adaptive timeouts and hedged per-item classification calls."""
+import threading
+import time
+
+import pytest
+
+import ai_hedging
+import ai_providers
+
+
+def _warm(hedger, seconds=0.01, count=20):
+    for _ in range(count):
+        hedger.latencies.record(seconds)
+
+
+def test_timeout_follows_recent_p95_within_bounds():
+    hedger = ai_hedging.Hedger(max_timeout=30, min_timeout=2, p95_multiplier=3, budget=0)
+    assert hedger.timeout() == 30  # not enough samples yet
+
+    _warm(hedger, seconds=1.5)
+    assert hedger.timeout() == pytest.approx(4.5)
+
+    _warm(hedger, seconds=0.1, count=200)
+    assert hedger.timeout() == 2
+
+
+def test_slow_call_is_hedged_and_first_result_wins():
+    hedger = ai_hedging.Hedger(budget=1)
+    _warm(hedger)
+    calls = []
+    lock = threading.Lock()
+
+    def fn(timeout):
+        with lock:
+            calls.append(timeout)
+            first = len(calls) == 1
+        if first:
+            time.sleep(1)
+            return "slow"
+        return "fast"
+
+    started = time.perf_counter()
+    assert hedger.call(fn) == "fast"
+    assert time.perf_counter() - started < 0.5
+    assert len(calls) == 2
+    assert hedger.stats["hedged"] == 1
+    assert hedger.stats["hedge_wins"] == 1
+
+
+def test_hedges_are_capped_by_budget():
+    hedger = ai_hedging.Hedger(budget=0.1)
+    _warm(hedger, count=200)  # keep p90 at 10 ms while the slow calls are recorded
+    calls = []
+
+    def fn(timeout):
+        calls.append(timeout)
+        time.sleep(0.03)
+        return "ok"
+
+    for _ in range(20):
+        hedger.call(fn)
+    assert hedger.stats["hedged"] == 2
+    assert hedger.stats["budget_denied"] == 18
+    assert len(calls) == 22
+
+
+def test_error_waits_for_the_other_attempt():
+    hedger = ai_hedging.Hedger(budget=1)
+    _warm(hedger)
+    attempts = []
+
+    def fn(timeout):
+        attempts.append(timeout)
+        if len(attempts) == 1:
+            time.sleep(0.05)
+            raise RuntimeError("503 unavailable")
+        time.sleep(0.1)
+        return "ok"
+
+    assert hedger.call(fn) == "ok"
+
+
+def test_all_attempts_failing_raises_first_error():
+    hedger = ai_hedging.Hedger(budget=0)
+
+    def fn(timeout):
+        raise RuntimeError("429 quota")
+
+    with pytest.raises(RuntimeError):
+        hedger.call(fn)
+
+
+def test_latency_excludes_queueing_before_the_provider_call():
+    class Provider(ai_providers.AIProvider):
+        name = "fake"
+
+        def classify(self, prompt, text, timeout=None):
+            time.sleep(0.01)
+            return "{}"
+
+    provider = ai_hedging.TimedProvider(Provider())
+    hedger = ai_hedging.Hedger(budget=0)
+
+    def fn(timeout):
+        time.sleep(0.2)  # queued in the scheduler / rate limiter
+        return provider.classify("p", "t", timeout)
+
+    hedger.call(fn)
+    assert hedger.latencies.percentile(50) < 0.1
+
+
+def test_winning_hedge_is_timed_from_its_own_start():
+    hedger = ai_hedging.Hedger(budget=1)
+    _warm(hedger, seconds=0.05)
+    calls = []
+
+    def fn(timeout):
+        calls.append(timeout)
+        time.sleep(1 if len(calls) == 1 else 0.01)
+        return "ok"
+
+    hedger.call(fn)
+    assert hedger.stats["hedge_wins"] == 1
+    assert hedger.latencies.percentile(0) < 0.05  # not the 1 s since the primary started
@@ -0,0 +1,122 @@
+"""Speculative /ai/parse-ingredients: local tags first, AI refinement later."""
+import threading
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+import ai_admission
+import ai_providers
+import ai_refinement
+
+
+@pytest.fixture
+def slow_stub(monkeypatch):
+    monkeypatch.setenv("AI_PROVIDER", "stub")
+    yield ai_providers.configure_stub(latency_ms=300)
+    ai_providers._shared_stub = None
+
+
+def _parse(client, headers, text):
+    return client.post(
+        "/ai/parse-ingredients",
+        headers=headers,
+        json={"ingredients": text, "speculative": True},
+    )
+
+
+def test_local_tags_come_back_before_the_ai_call(client: TestClient, user_auth_header, slow_stub):
+    started = time.perf_counter()
+    r = _parse(client, user_auth_header, "cheddar, shrimp, eggs")
+    elapsed = time.perf_counter() - started
+
+    assert r.status_code == 200
+    data = r.json()
+    assert elapsed < 0.3
+    assert data["provisional"] is True
+    assert data["allergens"] == ["eggs", "milk", "shellfish"]
+    assert data["dietaryCategories"] == []
+    assert data["extractedIngredients"] == ["cheddar", "shrimp", "eggs"]
+
+    pending = client.get(f"/ai/parse-ingredients/{data['refinementId']}", headers=user_auth_header)
+    assert pending.status_code == 202
+    assert pending.headers["Retry-After"] == "1"
+
+    refined = client.get(
+        f"/ai/parse-ingredients/{data['refinementId']}?wait=5", headers=user_auth_header
+    )
+    assert refined.status_code == 200
+    assert refined.json()["provisional"] is False
+    assert sorted(refined.json()["allergens"]) == ["eggs", "shellfish"]
+
+
+def test_refinement_is_private_to_its_user(client: TestClient, user_auth_header, admin_auth_header, slow_stub):
+    refinement_id = _parse(client, user_auth_header, "shrimp").json()["refinementId"]
+
+    assert client.get(f"/ai/parse-ingredients/{refinement_id}", headers=admin_auth_header).status_code == 404
+    assert client.get("/ai/parse-ingredients/unknown", headers=user_auth_header).status_code == 404
+    assert client.get(f"/ai/parse-ingredients/{refinement_id}?wait=5", headers=user_auth_header).status_code == 200
+
+
+def test_failed_refinement_reports_the_ai_error(client: TestClient, user_auth_header, slow_stub):
+    slow_stub.error_rate = 1
+
+    r = _parse(client, user_auth_header, "shrimp")
+    assert r.status_code == 200
+    assert r.json()["allergens"] == ["shellfish"]
+
+    refined = client.get(
+        f"/ai/parse-ingredients/{r.json()['refinementId']}?wait=5", headers=user_auth_header
+    )
+    assert refined.status_code >= 500
+    assert "manually" in refined.json()["detail"].lower()
+
+
+def test_full_refinement_queue_answers_synchronously(
+    client: TestClient, user_auth_header, slow_stub, monkeypatch
+):
+    monkeypatch.setenv("AI_REFINEMENT_MAX_PENDING_PER_USER", "1")
+    first = _parse(client, user_auth_header, "shrimp").json()
+    assert first["provisional"] is True
+
+    second = _parse(client, user_auth_header, "shrimp, eggs")
+    assert second.status_code == 200
+    assert "refinementId" not in second.json()
+    assert sorted(second.json()["allergens"]) == ["eggs", "shellfish"]
+
+    client.get(f"/ai/parse-ingredients/{first['refinementId']}?wait=5", headers=user_auth_header)
+
+
+def test_pending_refinement_holds_an_admission_slot():
+    controller = ai_admission.AdmissionController()
+    store = ai_refinement.RefinementStore(workers=1, admission=controller)
+    gate = threading.Event()
+
+    refinement_id = store.start("u1", lambda: gate.wait(5) and {"allergens": []})
+    assert refinement_id is not None
+    assert controller.metrics()["in_flight"] == 1
+
+    gate.set()
+    store.get(refinement_id, "u1").result(timeout=5)
+    time.sleep(0.05)  # the done callback runs on the worker thread
+    assert controller.metrics()["in_flight"] == 0
+    assert store.metrics()["pending"] == 0
+
+
+def test_pruned_refinements_that_never_started_are_cancelled(monkeypatch):
+    monkeypatch.setenv("AI_REFINEMENT_MAX_ENTRIES", "1")
+    controller = ai_admission.AdmissionController()
+    store = ai_refinement.RefinementStore(workers=1, admission=controller)
+    gate = threading.Event()
+    ran = []
+
+    running = store.start("u1", lambda: gate.wait(5))
+    queued = store.start("u2", lambda: ran.append("queued"))
+    store.start("u3", lambda: ran.append("last"))  # evicts both earlier entries
+
+    assert store.get(running, "u1") is None and store.get(queued, "u2") is None
+    gate.set()
+    store._executor.shutdown(wait=True)
+    assert ran == ["last"]
+    assert store.metrics()["cancelled"] == 1
+    assert controller.metrics()["in_flight"] == 0
@@ -0,0 +1,65 @@
+"""AI provider selection and the offline stub provider."""
+import pytest
+from fastapi.testclient import TestClient
+
+import ai_providers
+
+
+@pytest.fixture
+def stub_provider(monkeypatch):
+    monkeypatch.setenv("AI_PROVIDER", "stub")
+    provider = ai_providers.configure_stub(seed=1, items_per_page=3)
+    yield provider
+    ai_providers._shared_stub = None
+
+
+def test_parse_ingredients_with_stub_provider(client: TestClient, user_auth_header, stub_provider):
+    resp = client.post(
+        "/ai/parse-ingredients",
+        headers=user_auth_header,
+        json={"ingredients": "cream, sugar, almond flour"},
+    )
+    assert resp.status_code == 200
+    data = resp.json()
+    assert data["allergens"] == ["milk", "tree_nuts", "wheat"]
+    assert data["dietaryCategories"] == ["vegetarian"]
+    assert data["extractedIngredients"] == ["cream", "sugar", "almond flour"]
+
+
+def test_ingest_with_stub_provider_is_deterministic(
+    client: TestClient, user_auth_header, stub_provider, storage_objects
+):
+    files = {"file": ("menu.png", b"menu-photo", "image/png")}
+    first = client.post("/ai/ingest-menu?refresh=true", headers=user_auth_header, files=files)
+    second = client.post("/ai/ingest-menu?refresh=true", headers=user_auth_header, files=files)
+    assert first.status_code == 200
+    assert len(first.json()["items"]) == 3
+    assert first.json() == second.json()
+
+
+def test_stub_quota_injection_degrades_to_manual(client: TestClient, user_auth_header, stub_provider):
+    ai_providers.configure_stub(quota=0)
+    resp = client.post(
+        "/ai/parse-ingredients",
+        headers=user_auth_header,
+        json={"ingredients": "cream"},
+    )
+    assert resp.status_code == 503
+    assert "manually" in resp.json()["detail"].lower()
+
+
+def test_stub_latency_beyond_timeout_raises_timeout():
+    provider = ai_providers.StubProvider(latency_ms=50)
+    with pytest.raises(TimeoutError):
+        provider.classify("prompt", "cream", timeout=0.01)
+
+
+def test_unknown_provider_is_a_configuration_error(client: TestClient, user_auth_header, monkeypatch):
+    monkeypatch.setenv("AI_PROVIDER", "carrier-pigeon")
+    resp = client.post(
+        "/ai/parse-ingredients",
+        headers=user_auth_header,
+        json={"ingredients": "cream"},
+    )
+    assert resp.status_code == 500
+    assert "AI_PROVIDER" in resp.json()["detail"]
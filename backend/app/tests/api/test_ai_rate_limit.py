@@ -0,0 +1,105 @@
+"""Shared token-bucket limiter in front of every AI call."""
+import pytest
+from fastapi.testclient import TestClient
+
+import ai_breaker
+import ai_providers
+import ai_rate_limit
+import routes as app_routes
+
+
+class FakeTime:
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def clock(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+
+
+def _bucket(tmp_path, fake, **options):
+    options.setdefault("rpm", 60)
+    options.setdefault("burst", 2)
+    options.setdefault("max_wait", 10)
+    return ai_rate_limit.TokenBucket(
+        state_path=str(tmp_path / "bucket.json"), clock=fake.clock, sleep=fake.sleep, **options
+    )
+
+
+def test_bursts_are_queued_and_spread_out(tmp_path):
+    fake = FakeTime()
+    bucket = _bucket(tmp_path, fake)
+    waits = [bucket.acquire() for _ in range(4)]
+    assert waits == [0, 0, pytest.approx(1), pytest.approx(2)]
+    assert bucket.metrics()["queue_depth"] == 2
+    assert bucket.stats["queued"] == 2
+
+    fake.now += 2
+    assert bucket.metrics()["queue_depth"] == 0
+
+
+def test_wait_beyond_deadline_is_rejected_without_a_token(tmp_path):
+    fake = FakeTime()
+    bucket = _bucket(tmp_path, fake, burst=1)
+    bucket.acquire()
+    with pytest.raises(ai_rate_limit.RateLimitTimeout) as excinfo:
+        bucket.acquire(deadline=0.5)
+    assert excinfo.value.retry_after == pytest.approx(1)
+    assert bucket.acquire(deadline=1) == pytest.approx(1)  # the rejected call reserved nothing
+    assert bucket.stats["rejected"] == 1
+
+
+def test_bucket_is_shared_through_its_state_file(tmp_path):
+    fake = FakeTime()
+    worker_a = _bucket(tmp_path, fake)
+    worker_b = _bucket(tmp_path, fake)
+    worker_a.acquire()
+    worker_a.acquire()
+    assert worker_b.acquire() == pytest.approx(1)
+
+
+def test_zero_rpm_disables_limiting(tmp_path):
+    fake = FakeTime()
+    bucket = _bucket(tmp_path, fake, rpm=0)
+    assert [bucket.acquire() for _ in range(10)] == [0.0] * 10
+
+
+@pytest.fixture
+def limited_stub(monkeypatch, tmp_path):
+    monkeypatch.setenv("AI_PROVIDER", "stub")
+    monkeypatch.setenv("AI_RATE_LIMIT_RPM", "1")
+    monkeypatch.setenv("AI_RATE_LIMIT_BURST", "1")
+    monkeypatch.setenv("AI_RATE_LIMIT_MAX_WAIT_SECONDS", "0")
+    monkeypatch.setenv("AI_RATE_LIMIT_STATE_FILE", str(tmp_path / "bucket.json"))
+    provider = ai_providers.configure_stub(seed=1)
+    app_routes.ai_rate_limiter.reset_metrics()
+    yield provider
+    ai_providers._shared_stub = None
+
+
+def test_parse_over_the_limit_gets_busy_503(client: TestClient, user_auth_header, limited_stub):
+    body = {"ingredients": "cream"}
+    assert client.post("/ai/parse-ingredients", headers=user_auth_header, json=body).status_code == 200
+
+    resp = client.post("/ai/parse-ingredients", headers=user_auth_header, json=body)
+    assert resp.status_code == 503
+    assert "manually" in resp.json()["detail"].lower()
+    assert int(resp.headers["Retry-After"]) >= 1
+    assert limited_stub.calls == 1
+    assert app_routes.ai_circuit.state == ai_breaker.CLOSED  # local throttling is not an outage
+
+
+def test_metrics_endpoint_is_admin_only(client: TestClient, user_auth_header, admin_auth_header, limited_stub):
+    client.post("/ai/parse-ingredients", headers=user_auth_header, json={"ingredients": "cream"})
+
+    assert client.get("/ai/metrics", headers=user_auth_header).status_code == 403
+    resp = client.get("/ai/metrics", headers=admin_auth_header)
+    assert resp.status_code == 200
+    data = resp.json()
+    assert data["rate_limit"]["acquired"] == 1
+    assert data["rate_limit"]["queue_depth"] == 0
+    assert data["circuit"]["state"] == "closed"
+    assert "hedged" in data["classify_hedging"]
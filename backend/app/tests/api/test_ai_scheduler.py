@@ -0,0 +1,106 @@
+"""Priority classes and per-restaurant fair share for AI calls."""
+import threading
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+import ai_breaker
+import ai_providers
+import ai_scheduler
+import routes as app_routes
+
+
+def _queue(scheduler, order, priority, tenant, label):
+    queued_before = scheduler.stats["queued"]
+
+    def run():
+        scheduler.acquire(priority, tenant)
+        order.append(label)
+        scheduler.release()
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    # Wait until the call is queued so arrival order is deterministic.
+    deadline = time.time() + 2
+    while scheduler.stats["queued"] == queued_before and time.time() < deadline:
+        time.sleep(0.001)
+    return thread
+
+
+@pytest.fixture
+def busy_scheduler():
+    scheduler = ai_scheduler.AIScheduler(max_concurrent=1, max_wait=5)
+    scheduler.acquire(ai_scheduler.BULK, "holder")  # occupy the only slot
+    return scheduler
+
+
+def test_interactive_calls_jump_ahead_of_bulk(busy_scheduler):
+    order = []
+    threads = [
+        _queue(busy_scheduler, order, ai_scheduler.BACKGROUND, "r1", "refine"),
+        _queue(busy_scheduler, order, ai_scheduler.BULK, "r1", "bulk-1"),
+        _queue(busy_scheduler, order, ai_scheduler.BULK, "r1", "bulk-2"),
+        _queue(busy_scheduler, order, ai_scheduler.INTERACTIVE, "r2", "parse"),
+    ]
+    busy_scheduler.release()
+    for thread in threads:
+        thread.join(timeout=5)
+    assert order == ["parse", "bulk-1", "bulk-2", "refine"]
+
+
+def test_restaurants_share_bulk_capacity_round_robin(busy_scheduler):
+    order = []
+    threads = [_queue(busy_scheduler, order, ai_scheduler.BULK, "big", f"big-{i}") for i in range(3)]
+    threads += [_queue(busy_scheduler, order, ai_scheduler.BULK, "small", f"small-{i}") for i in range(2)]
+    busy_scheduler.release()
+    for thread in threads:
+        thread.join(timeout=5)
+    assert order == ["big-0", "small-0", "big-1", "small-1", "big-2"]
+
+
+def test_waiting_past_deadline_is_busy_error():
+    scheduler = ai_scheduler.AIScheduler(max_concurrent=1, max_wait=5)
+    scheduler.acquire(ai_scheduler.BULK, "holder")
+    with pytest.raises(ai_scheduler.SchedulerBusy) as excinfo:
+        scheduler.acquire(ai_scheduler.INTERACTIVE, "r1", deadline=0.05)
+    assert scheduler.metrics()["queue_depth"]["interactive"] == 0
+
+    status_code, detail = app_routes._classify_genai_error(excinfo.value, context="text")
+    assert status_code == 503
+    assert "manually" in detail.lower()
+    assert app_routes._breaker_failure_kind(excinfo.value) == ai_breaker.NOT_SENT
+
+
+def test_zero_slots_means_unlimited():
+    scheduler = ai_scheduler.AIScheduler(max_concurrent=0)
+    for _ in range(50):
+        assert scheduler.acquire(ai_scheduler.BULK, "r1") == 0.0
+
+
+def test_fair_share_key_is_only_a_restaurant_the_caller_edits(
+    client: TestClient, fake_db, user_auth_header, monkeypatch
+):
+    monkeypatch.setenv("AI_PROVIDER", "stub")
+    ai_providers.configure_stub(seed=1)
+    fake_db.reference("restaurants/mine").set({"owner_uid": "user1"})
+    fake_db.reference("restaurants/theirs").set({"owner_uid": "admin1"})
+    tenants = []
+    get_provider = app_routes._get_ai_provider
+
+    def recording(priority, tenant="", cancel=None):
+        tenants.append(tenant)
+        return get_provider(priority, tenant, cancel)
+
+    monkeypatch.setattr(app_routes, "_get_ai_provider", recording)
+    try:
+        for restaurant_id in ("mine", "theirs", None):
+            resp = client.post(
+                "/ai/parse-ingredients",
+                headers=user_auth_header,
+                json={"ingredients": "cream", "restaurant_id": restaurant_id},
+            )
+            assert resp.status_code == 200
+    finally:
+        ai_providers._shared_stub = None
+    assert tenants == ["mine", "user1", "user1"]
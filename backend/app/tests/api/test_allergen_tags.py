@@ -0,0 +1,82 @@
+"""Bitmask encoding of allergen and dietary tags."""
+import pytest
+from fastapi.testclient import TestClient
+
+import routes as app_routes
+from allergen_tags import ALLERGENS, DIETARY_CATEGORIES, VALID_ALLERGEN_MASK, TagCodec
+from ingredient_parser import parse_ingredient_tags, parse_ingredients
+
+
+def test_round_trip_is_sorted():
+    mask = ALLERGENS.encode(["wheat", "milk", "eggs", "milk"])
+    assert ALLERGENS.decode(mask) == ["eggs", "milk", "wheat"]
+    assert ALLERGENS.decode(0) == []
+    assert ALLERGENS.decode(VALID_ALLERGEN_MASK) == sorted(app_routes.VALID_ALLERGENS)
+
+
+def test_unknown_names_are_rejected_or_split_off():
+    with pytest.raises(KeyError):
+        ALLERGENS.encode(["mustard"])
+    assert ALLERGENS.split(["milk", "mustard"]) == (ALLERGENS.bit("milk"), ["mustard"])
+
+
+def test_registered_names_keep_existing_bits_and_sorted_decoding():
+    codec = TagCodec(["milk", "wheat"])
+    milk = codec.bit("milk")
+    codec.register(["celery", "milk"])
+    assert codec.bit("milk") == milk
+    assert codec.decode(codec.encode(["wheat", "celery", "milk"])) == ["celery", "milk", "wheat"]
+
+
+def test_bulk_merge_keeps_names_the_codec_cannot_encode():
+    merged = app_routes._merge_tag_updates(["milk", "legacy_tag", "eggs"], ["fish"], ["milk"])
+    assert merged == ["legacy_tag", "eggs", "fish"]
+
+
+def test_parser_masks_agree_with_its_lists():
+    text = "Bread (Flour, Butter), Shrimp. Contains: Soy. May contain peanuts and milk."
+    allergens, dietary, cross_contact = parse_ingredient_tags(text)
+    parsed = parse_ingredients(text)
+    assert ALLERGENS.decode(allergens) == parsed["allergens"] == ["milk", "shellfish", "soybeans", "wheat"]
+    assert DIETARY_CATEGORIES.decode(dietary) == parsed["dietaryCategories"]
+    assert ALLERGENS.decode(cross_contact) == parsed["cross_contact"] == ["peanuts"]
+
+
+@pytest.mark.parametrize(
+    "stored, excluded, expected",
+    [
+        (["milk", "eggs"], ["eggs"], True),
+        (["milk"], ["fish", "wheat"], False),
+        ([], ["milk"], False),
+        (["legacy_tag"], ["legacy_tag"], True),
+        (None, ["milk"], False),
+    ],
+)
+def test_allergen_free_filter(stored, excluded, expected):
+    mask, unknown = ALLERGENS.split(excluded)
+    assert app_routes._has_any_allergen(stored, mask, unknown) is expected
+
+
+def test_menu_item_merges_manual_and_parsed_tags(client: TestClient, user_auth_header, fake_db):
+    fake_db.reference("restaurants").set({})
+    restaurant_id = client.post(
+        "/restaurants/",
+        headers=user_auth_header,
+        json={"name": "Tags", "phone": "1", "address": "A", "cuisine_type": "American"},
+    ).json()["id"]
+
+    r = client.post(
+        f"/restaurants/{restaurant_id}/menu",
+        headers=user_auth_header,
+        json={
+            "name": "Shrimp toast",
+            "description": "",
+            "price": 9,
+            "ingredients": "Shrimp, Bread (Wheat Flour), Sesame Seeds",
+            "allergens": ["sesame", "eggs"],
+            "dietaryCategories": [],
+        },
+    )
+    assert r.status_code == 200
+    assert r.json()["allergens"] == ["eggs", "sesame", "shellfish", "wheat"]
+    assert r.json()["dietaryCategories"] == ["not vegan", "not vegetarian"]
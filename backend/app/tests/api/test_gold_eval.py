@@ -0,0 +1,67 @@
+"""The gold dataset evaluation harness (benchmarks/gold_eval.py)."""
+from benchmarks import gold_eval
+from benchmarks.gold_eval import Case, Prediction
+
+
+# Floors for the local parser on the gold set. The set is held fixed so a
+# rule change is measured against it rather than fitted to it: add cases
+# in their own change, not alongside the rules they would exercise.
+MIN_PRECISION = 0.95
+MIN_RECALL = 0.95
+
+
+def test_local_parser_meets_gold_precision_and_recall():
+    cases = gold_eval.gold_cases()
+    report = gold_eval.evaluate(gold_eval.local_parser, cases)
+    assert report["items"] == len(cases)
+    assert report["micro"]["precision"] >= MIN_PRECISION
+    assert report["micro"]["recall"] >= MIN_RECALL
+    assert report["cross_contact"]["recall"] >= MIN_RECALL
+    assert report["items_per_sec"] > 0
+    assert report["p50_ms"] <= report["p99_ms"]
+
+
+def test_synthetic_cases_keep_their_labels():
+    gold = gold_eval.gold_cases()
+    cases = gold_eval.synthetic_cases(gold, 500)
+    assert len(cases) == 500
+    assert cases == gold_eval.synthetic_cases(gold, 500)
+    parse = gold_eval.local_parser()
+    for case in cases:
+        got = parse(case.text)
+        assert (got.allergens, got.cross_contact) == (case.allergens, case.cross_contact), case.text
+
+
+def test_scores_per_allergen_and_failed_calls():
+    cases = [
+        Case("a", frozenset({"milk"}), frozenset()),
+        Case("b", frozenset({"milk", "eggs"}), frozenset()),
+        Case("c", frozenset(), frozenset()),
+    ]
+    predictions = [Prediction(frozenset({"milk", "wheat"}), None), None, Prediction(frozenset(), None)]
+    scores = gold_eval.score(cases, predictions)
+    assert scores["exact"] == 1
+    assert scores["micro"] == {"precision": 0.5, "recall": 0.3333, "support": 3}
+    assert scores["per_allergen"]["milk"] == {"precision": 1.0, "recall": 0.5, "support": 2}
+    assert scores["per_allergen"]["wheat"] == {"precision": 0.0, "recall": None, "support": 0}
+    assert scores["cross_contact"] is None
+
+
+def test_ai_path_is_scored_through_the_stub(monkeypatch):
+    monkeypatch.setenv("AI_PROVIDER", "stub")
+    cases = gold_eval.gold_cases()[:10]
+    report = gold_eval.evaluate(lambda: gold_eval.ai_parser(latency_ms=0), cases)
+    assert report["items"] == 10 and report["errors"] == 0
+    assert report["micro"]["recall"] > 0
+    assert report["cross_contact"] is None
+
+
+def test_failed_calls_are_counted():
+    def failing():
+        def parse(text):
+            raise RuntimeError("quota")
+
+        return parse
+
+    report = gold_eval.evaluate(failing, gold_eval.gold_cases()[:5])
+    assert report["errors"] == 5
@@ -0,0 +1,77 @@
+"""Image preprocessing before /ai/ingest-menu extraction and archival."""
+import io
+import json
+import os
+import types
+
+import pytest
+from fastapi.testclient import TestClient
+
+import image_preprocess
+import routes as app_routes
+
+Image = pytest.importorskip("PIL.Image")
+
+
+def _photo(width=2400, height=1600, exif_orientation=None) -> bytes:
+    image = Image.frombytes("RGB", (width, height), os.urandom(width * height * 3))
+    buffer = io.BytesIO()
+    kwargs = {}
+    if exif_orientation:
+        exif = Image.Exif()
+        exif[0x0112] = exif_orientation
+        kwargs["exif"] = exif
+    image.save(buffer, "JPEG", quality=95, **kwargs)
+    return buffer.getvalue()
+
+
+def test_preprocess_shrinks_rotates_and_grayscales():
+    original = _photo(exif_orientation=6)  # rotated 90 degrees
+    processed = image_preprocess.preprocess_image(original, byte_budget=400_000, long_side=1200)
+
+    assert processed is not None
+    assert len(processed) < len(original)
+    with Image.open(io.BytesIO(processed)) as result:
+        assert result.mode == "L"
+        assert result.format == "JPEG"
+        width, height = result.size
+        assert height > width
+        assert max(result.size) <= 1200
+
+
+def test_preprocess_keeps_small_uploads():
+    assert image_preprocess.preprocess_image(b"tiny", byte_budget=1000, long_side=1200) is None
+
+
+def test_ingest_sends_preprocessed_image(client: TestClient, user_auth_header, monkeypatch, storage_objects):
+    monkeypatch.setenv("INGEST_PREPROCESS_WORKERS", "0")
+    monkeypatch.setenv("INGEST_IMAGE_MAX_BYTES", "400000")
+    monkeypatch.setenv("INGEST_IMAGE_MAX_SIDE", "1200")
+    sent = []
+
+    class FakeModel:
+        def __init__(self, *args, **kwargs):
+            pass
+
+        def generate_content(self, content, **kwargs):
+            if isinstance(content, list):
+                sent.append(content[1])
+            return types.SimpleNamespace(text=json.dumps({"items": []}))
+
+    monkeypatch.setattr(
+        app_routes, "genai", types.SimpleNamespace(GenerativeModel=FakeModel, list_models=lambda: [])
+    )
+    monkeypatch.setattr(app_routes, "_ensure_genai_configured", lambda: None)
+    monkeypatch.setattr(app_routes, "_select_model_name", lambda *a, **k: "dummy")
+
+    original = _photo()
+    files = {"file": ("photo.jpeg", original, "image/jpeg")}
+    resp = client.post("/ai/ingest-menu", headers=user_auth_header, files=files)
+    assert resp.status_code == 200
+
+    assert sent[0]["mime_type"] == "image/jpeg"
+    assert len(sent[0]["data"]) < len(original)
+    app_routes.menu_archiver.join(timeout=5)
+    (archived_path, archived), = storage_objects.items()
+    assert archived_path.endswith(".jpg")
+    assert archived["data"] == sent[0]["data"]
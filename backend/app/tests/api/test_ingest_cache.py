@@ -0,0 +1,120 @@
+"""Content-hash deduplication of /ai/ingest-menu uploads."""
+import hashlib
+import json
+import types
+
+from fastapi.testclient import TestClient
+
+import ingest_cache
+import routes as app_routes
+
+
+EXTRACTION_TEXT = json.dumps(
+    {"items": [{"name": "Latte", "description": "", "price": 4.5, "ingredients": ["espresso", "milk"]}]}
+)
+
+
+def _install_model(monkeypatch, calls, classify_text='{"allergens":["milk"]}'):
+    class FakeResponse:
+        def __init__(self, text):
+            self.text = text
+
+    class FakeModel:
+        def __init__(self, *args, **kwargs):
+            pass
+
+        def generate_content(self, content, **kwargs):
+            calls.append(content)
+            if isinstance(content, list):
+                return FakeResponse(EXTRACTION_TEXT)
+            if isinstance(classify_text, Exception):
+                raise classify_text
+            return FakeResponse(classify_text)
+
+    stub = types.SimpleNamespace(GenerativeModel=FakeModel, list_models=lambda: [])
+    monkeypatch.setattr(app_routes, "genai", stub)
+    monkeypatch.setattr(app_routes, "_ensure_genai_configured", lambda: None)
+    monkeypatch.setattr(app_routes, "_select_model_name", lambda *a, **k: "dummy")
+
+
+def _upload(client, headers, data=b"same-bytes", query=""):
+    files = {"file": ("menu.pdf", data, "application/pdf")}
+    return client.post(f"/ai/ingest-menu{query}", headers=headers, files=files)
+
+
+def test_reupload_is_served_from_cache(client: TestClient, user_auth_header, monkeypatch, storage_objects):
+    calls = []
+    _install_model(monkeypatch, calls)
+
+    first = _upload(client, user_auth_header)
+    assert first.status_code == 200
+    assert first.headers["X-Ingest-Cache"] == "miss"
+    assert len(calls) == 2
+
+    second = _upload(client, user_auth_header)
+    assert second.status_code == 200
+    assert second.headers["X-Ingest-Cache"] == "hit"
+    assert second.json() == first.json()
+    assert len(calls) == 2  # no further model calls
+
+    app_routes.menu_archiver.join(timeout=5)
+    digest = hashlib.sha256(b"same-bytes").hexdigest()
+    assert list(storage_objects) == [f"menu_files/user1/{digest}.pdf"]
+
+
+def test_refresh_bypasses_cache(client: TestClient, user_auth_header, monkeypatch, storage_objects):
+    calls = []
+    _install_model(monkeypatch, calls)
+
+    _upload(client, user_auth_header)
+    resp = _upload(client, user_auth_header, query="?refresh=true")
+    assert resp.headers["X-Ingest-Cache"] == "miss"
+    assert len(calls) == 4
+
+
+def test_image_settings_change_misses_cache(client: TestClient, user_auth_header, monkeypatch, storage_objects):
+    calls = []
+    _install_model(monkeypatch, calls)
+
+    _upload(client, user_auth_header)
+    monkeypatch.setenv("INGEST_IMAGE_MAX_SIDE", "1600")
+    resp = _upload(client, user_auth_header)
+    assert resp.headers["X-Ingest-Cache"] == "miss"
+    assert len(calls) == 4
+
+
+def test_cache_hit_streams_cached_events(client: TestClient, user_auth_header, monkeypatch, storage_objects):
+    calls = []
+    _install_model(monkeypatch, calls)
+
+    _upload(client, user_auth_header, query="?stream=ndjson")
+    resp = _upload(client, user_auth_header, query="?stream=ndjson")
+    events = [json.loads(line) for line in resp.text.splitlines() if line.strip()]
+    assert resp.headers["X-Ingest-Cache"] == "hit"
+    assert [e["event"] for e in events] == ["started", "items", "item", "done"]
+    assert events[2]["item"]["allergens"] == ["milk"]
+    assert len(calls) == 2
+
+
+def test_degraded_result_is_not_cached(client: TestClient, user_auth_header, monkeypatch, storage_objects):
+    calls = []
+    _install_model(monkeypatch, calls, classify_text=Exception("429 quota"))
+
+    _upload(client, user_auth_header)
+    app_routes.ai_circuit.reset()  # the 429 opened the breaker; let the retry reach the model
+    resp = _upload(client, user_auth_header)
+    assert resp.headers["X-Ingest-Cache"] == "miss"
+
+
+def test_eviction_drops_expired_and_least_recently_used(fake_db, monkeypatch):
+    monkeypatch.setenv("INGEST_CACHE_MAX_ENTRIES", "2")
+    monkeypatch.setenv("INGEST_CACHE_TTL_SECONDS", "100")
+
+    ingest_cache.store_items(fake_db, "a-v", "a", [], now=1000)
+    ingest_cache.store_items(fake_db, "b-v", "b", [], now=1010)
+    ingest_cache.get_cached_items(fake_db, "a-v", now=1020)  # a is now most recent
+    ingest_cache.store_items(fake_db, "c-v", "c", [], now=1030)
+
+    assert ingest_cache.get_cached_items(fake_db, "b-v", now=1031) is None
+    assert ingest_cache.get_cached_items(fake_db, "a-v", now=1031) == []
+    assert ingest_cache.get_cached_items(fake_db, "c-v", now=1500) is None
@@ -0,0 +1,178 @@
+"""Client disconnects cancel the remaining AI and archive work of an ingest."""
+import asyncio
+import json
+import threading
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+import ai_breaker
+import ai_cancel
+import ai_providers
+import routes as app_routes
+from menu_archive import MenuArchiver
+
+
+class CountingProvider(ai_providers.StubProvider):
+    """Stub whose extraction calls run ``on_extract`` first."""
+
+    def __init__(self, on_extract=None, **kwargs):
+        super().__init__(**kwargs)
+        self.on_extract = on_extract
+        self.extract_calls = 0
+
+    def extract_menu(self, prompt, file_bytes, mime_type, timeout=None):
+        self.extract_calls += 1
+        if self.on_extract is not None:
+            self.on_extract()
+        return super().extract_menu(prompt, file_bytes, mime_type, timeout)
+
+
+def _parts(count):
+    return [
+        {"label": f"page {i + 1}", "data": f"page-{i}".encode(), "mime_type": "image/png"}
+        for i in range(count)
+    ]
+
+
+def test_queued_parts_are_skipped_once_cancelled(monkeypatch):
+    monkeypatch.setenv("INGEST_MAX_CONCURRENCY", "1")
+    cancel = threading.Event()
+    provider = CountingProvider(on_extract=cancel.set, items_per_page=2)
+    before = ai_cancel.snapshot()
+
+    items, failures = asyncio.run(app_routes._extract_parts(provider, _parts(4), cancel))
+
+    assert provider.extract_calls == 1
+    assert len(items) == 2
+    assert [type(error) for _, error in failures] == [ai_cancel.RequestCancelled] * 3
+    assert ai_cancel.snapshot()["parts_skipped"] - before["parts_skipped"] == 3
+
+
+def test_cancellable_provider_refuses_new_calls():
+    cancel = threading.Event()
+    provider = ai_cancel.CancellableProvider(ai_providers.StubProvider(), cancel)
+    assert json.loads(provider.classify("prompt", "milk"))["allergens"] == ["milk"]
+
+    cancel.set()
+    before = ai_cancel.snapshot()
+    with pytest.raises(ai_cancel.RequestCancelled):
+        provider.classify("prompt", "milk")
+    assert ai_cancel.snapshot()["ai_calls_skipped"] - before["ai_calls_skipped"] == 1
+    # Skipped calls never reached the backend, so they must not trip the breaker.
+    assert app_routes._breaker_failure_kind(ai_cancel.RequestCancelled()) == ai_breaker.NOT_SENT
+
+
+def test_archiver_skips_jobs_of_cancelled_requests():
+    archiver = MenuArchiver(workers=1, backoff_seconds=0)
+    cancel = threading.Event()
+    cancel.set()
+    uploaded = []
+    done = []
+
+    archiver.submit("menu.png", lambda: uploaded.append(1), on_done=done.append, cancel=cancel)
+    assert archiver.join(timeout=5)
+
+    assert uploaded == []
+    assert done == [False]
+    assert archiver.stats["cancelled"] == 1
+
+
+def _disconnecting_call(app, headers, files, url, hang_up):
+    """Send one request through the ASGI app; the client hangs up once ``hang_up`` is set."""
+    request = httpx.Request("POST", "http://testserver" + url, headers=headers, files=files)
+    body = request.read()
+    messages = [{"type": "http.request", "body": body, "more_body": False}]
+    sent = []
+
+    async def receive():
+        if messages:
+            return messages.pop(0)
+        while not hang_up.is_set():
+            await asyncio.sleep(0.005)
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        sent.append(message)
+        if b'"event": "items"' in message.get("body", b""):
+            hang_up.set()
+
+    path, _, query = url.partition("?")
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "POST",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": query.encode(),
+        "root_path": "",
+        "headers": [(k.lower().encode(), v.encode()) for k, v in request.headers.items()],
+        "client": ("testclient", 50000),
+        "server": ("testserver", 80),
+    }
+    asyncio.run(app(scope, receive, send))
+    return sent
+
+
+@pytest.fixture
+def hang_up(monkeypatch):
+    """Slow stub provider; the returned event is set when extraction starts."""
+    started = threading.Event()
+    monkeypatch.setenv("INGEST_DISCONNECT_POLL_SECONDS", "0.01")
+    monkeypatch.setattr(
+        app_routes.ai_providers,
+        "create_provider",
+        lambda **kwargs: CountingProvider(latency_ms=100, items_per_page=6),
+    )
+    return started
+
+
+def test_disconnect_during_json_ingest_stops_tagging(
+    client: TestClient, user_auth_header, storage_objects, monkeypatch, hang_up
+):
+    monkeypatch.setattr(
+        app_routes.ai_providers,
+        "create_provider",
+        lambda **kwargs: CountingProvider(on_extract=hang_up.set, latency_ms=100, items_per_page=6),
+    )
+    before = ai_cancel.snapshot()
+    files = {"file": ("menu.png", b"cancel-json", "image/png")}
+
+    sent = _disconnecting_call(client.app, user_auth_header, files, "/ai/ingest-menu", hang_up)
+
+    assert sent[0]["status"] == 499
+    after = ai_cancel.snapshot()
+    assert after["requests_cancelled"] - before["requests_cancelled"] == 1
+    assert after["items_untagged"] - before["items_untagged"] == 6
+    # The extraction call was already running; its result was thrown away.
+    assert after["ai_calls_abandoned"] - before["ai_calls_abandoned"] == 1
+
+    # Nothing partial was cached: the next upload of the same file is a miss.
+    resp = client.post("/ai/ingest-menu", headers=user_auth_header, files=files)
+    assert resp.status_code == 200
+    assert resp.headers["X-Ingest-Cache"] == "miss"
+
+
+def test_disconnect_during_stream_stops_tagging(
+    client: TestClient, user_auth_header, storage_objects, hang_up
+):
+    before = ai_cancel.snapshot()
+    files = {"file": ("menu.png", b"cancel-stream", "image/png")}
+
+    sent = _disconnecting_call(client.app, user_auth_header, files, "/ai/ingest-menu?stream=ndjson", hang_up)
+
+    events = [
+        json.loads(line)
+        for message in sent
+        if message["type"] == "http.response.body"
+        for line in message.get("body", b"").decode().splitlines()
+        if line.strip()
+    ]
+    assert [e["event"] for e in events][:2] == ["started", "items"]
+    assert "done" not in [e["event"] for e in events]
+    after = ai_cancel.snapshot()
+    assert after["requests_cancelled"] - before["requests_cancelled"] == 1
+    assert after["items_untagged"] - before["items_untagged"] > 0
@@ -0,0 +1,157 @@
+"""Multi-file and multi-page fan-out for /ai/ingest-menu."""
+import io
+import json
+import types
+
+import pytest
+from fastapi.testclient import TestClient
+
+import routes as app_routes
+
+pypdf = pytest.importorskip("pypdf")
+
+
+def _make_pdf(page_count: int) -> bytes:
+    # Page i is (100 + i) points wide so the stub model can tell pages apart.
+    writer = pypdf.PdfWriter()
+    for index in range(page_count):
+        writer.add_blank_page(width=100 + index, height=200)
+    buffer = io.BytesIO()
+    writer.write(buffer)
+    return buffer.getvalue()
+
+
+def _install_model(monkeypatch, extract):
+    class FakeResponse:
+        def __init__(self, text):
+            self.text = text
+
+    class FakeModel:
+        def __init__(self, *args, **kwargs):
+            pass
+
+        def generate_content(self, content, **kwargs):
+            if isinstance(content, list):
+                return FakeResponse(json.dumps({"items": extract(content[1])}))
+            return FakeResponse('{"allergens":[]}')
+
+    stub = types.SimpleNamespace(GenerativeModel=FakeModel, list_models=lambda: [])
+    monkeypatch.setattr(app_routes, "genai", stub)
+    monkeypatch.setattr(app_routes, "_ensure_genai_configured", lambda: None)
+    monkeypatch.setattr(app_routes, "_select_model_name", lambda *a, **k: "dummy")
+
+
+def _pages(part) -> list:
+    reader = pypdf.PdfReader(io.BytesIO(part["data"]))
+    return [int(page.mediabox.width) - 100 for page in reader.pages]
+
+
+def test_pdf_pages_are_split_and_merged_in_order(
+    client: TestClient, user_auth_header, monkeypatch, storage_objects
+):
+    monkeypatch.setenv("INGEST_PDF_PAGES_PER_PART", "1")
+
+    def extract(part):
+        page = _pages(part)[0]
+        # Every page repeats the "Soup of the day" heading item.
+        return [
+            {"name": f"Dish {page}", "price": 10 + page, "ingredients": []},
+            {"name": "Soup of the Day", "price": 5, "ingredients": []},
+        ]
+
+    _install_model(monkeypatch, extract)
+    files = {"file": ("menu.pdf", _make_pdf(4), "application/pdf")}
+    resp = client.post("/ai/ingest-menu", headers=user_auth_header, files=files)
+    assert resp.status_code == 200
+    names = [item["name"] for item in resp.json()["items"]]
+    assert names == ["Dish 0", "Soup of the Day", "Dish 1", "Dish 2", "Dish 3"]
+    assert "failed_parts" not in resp.json()
+
+
+def test_only_repeats_of_the_previous_page_are_dropped(
+    client: TestClient, user_auth_header, monkeypatch, storage_objects
+):
+    monkeypatch.setenv("INGEST_PDF_PAGES_PER_PART", "1")
+
+    def extract(part):
+        page = _pages(part)[0]
+        if page == 1:
+            return [{"name": "Dish 1", "price": 4, "ingredients": []}]
+        # Pages 0 and 2 list lemonade twice (drinks and kids' menu).
+        return [
+            {"name": f"Dish {page}", "price": 4, "ingredients": []},
+            {"name": "Lemonade", "price": 3, "ingredients": []},
+            {"name": "Lemonade", "price": 3, "ingredients": []},
+        ]
+
+    _install_model(monkeypatch, extract)
+    files = {"file": ("menu.pdf", _make_pdf(3), "application/pdf")}
+    resp = client.post("/ai/ingest-menu", headers=user_auth_header, files=files)
+    assert resp.status_code == 200
+    names = [item["name"] for item in resp.json()["items"]]
+    assert names == ["Dish 0", "Lemonade", "Lemonade", "Dish 1", "Dish 2", "Lemonade", "Lemonade"]
+
+
+def test_failed_page_degrades_result(client: TestClient, user_auth_header, monkeypatch, storage_objects):
+    monkeypatch.setenv("INGEST_PDF_PAGES_PER_PART", "2")
+
+    def extract(part):
+        pages = _pages(part)
+        if 2 in pages:
+            raise TimeoutError("deadline exceeded")
+        return [{"name": f"Dish {page}", "price": 1, "ingredients": []} for page in pages]
+
+    _install_model(monkeypatch, extract)
+    files = {"file": ("menu.pdf", _make_pdf(4), "application/pdf")}
+    resp = client.post("/ai/ingest-menu", headers=user_auth_header, files=files)
+    assert resp.status_code == 200
+    body = resp.json()
+    assert [item["name"] for item in body["items"]] == ["Dish 0", "Dish 1"]
+    assert body["failed_parts"] == [
+        {"part": "menu.pdf pages 3-4", "status": 504, "detail": body["failed_parts"][0]["detail"]}
+    ]
+    assert "manually" in body["failed_parts"][0]["detail"].lower()
+
+    # Degraded results are not cached.
+    again = client.post("/ai/ingest-menu", headers=user_auth_header, files=files)
+    assert again.headers["X-Ingest-Cache"] == "miss"
+
+
+def test_every_page_failing_keeps_error_status(client: TestClient, user_auth_header, monkeypatch, storage_objects):
+    monkeypatch.setenv("INGEST_PDF_PAGES_PER_PART", "1")
+
+    def extract(part):
+        raise Exception("429 quota exhausted")
+
+    _install_model(monkeypatch, extract)
+    files = {"file": ("menu.pdf", _make_pdf(3), "application/pdf")}
+    resp = client.post("/ai/ingest-menu", headers=user_auth_header, files=files)
+    assert resp.status_code == 503
+    assert "manually" in resp.json()["detail"].lower()
+
+
+def test_multiple_files_are_merged_in_upload_order(
+    client: TestClient, user_auth_header, monkeypatch, storage_objects
+):
+    _install_model(
+        monkeypatch,
+        lambda part: [{"name": part["data"].decode(), "price": 1, "ingredients": []}],
+    )
+    files = [
+        ("file", ("front.png", b"front", "image/png")),
+        ("file", ("back.jpg", b"back", "image/jpeg")),
+    ]
+    resp = client.post("/ai/ingest-menu", headers=user_auth_header, files=files)
+    assert resp.status_code == 200
+    assert [item["name"] for item in resp.json()["items"]] == ["front", "back"]
+    app_routes.menu_archiver.join(timeout=5)
+    assert len(storage_objects) == 2
+
+
+def test_unsupported_file_among_many_is_rejected(client: TestClient, user_auth_header):
+    files = [
+        ("file", ("front.png", b"front", "image/png")),
+        ("file", ("notes.txt", b"text", "text/plain")),
+    ]
+    resp = client.post("/ai/ingest-menu", headers=user_auth_header, files=files)
+    assert resp.status_code == 400
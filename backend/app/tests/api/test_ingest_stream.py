@@ -0,0 +1,121 @@
+"""Streaming (NDJSON/SSE) mode of /ai/ingest-menu with stubbed Gemini."""
+import json
+import types
+
+from fastapi.testclient import TestClient
+
+import routes as app_routes
+
+
+EXTRACTION_TEXT = json.dumps(
+    {
+        "items": [
+            {"name": "Latte", "description": "", "price": "$4.50", "ingredients": ["espresso", "milk"]},
+            {"name": "Toast", "description": "", "price": 6, "ingredients": ["bread"]},
+        ]
+    }
+)
+
+
+def _install_model(monkeypatch, classify):
+    class FakeResponse:
+        def __init__(self, text):
+            self.text = text
+
+    class FakeModel:
+        def __init__(self, *args, **kwargs):
+            pass
+
+        def generate_content(self, content, **kwargs):
+            # Extraction sends [prompt, file_part]; classification sends a str.
+            if isinstance(content, list):
+                return FakeResponse(EXTRACTION_TEXT)
+            return FakeResponse(classify(content))
+
+    stub = types.SimpleNamespace(GenerativeModel=FakeModel, list_models=lambda: [])
+    monkeypatch.setattr(app_routes, "genai", stub)
+    monkeypatch.setattr(app_routes, "_ensure_genai_configured", lambda: None)
+    monkeypatch.setattr(app_routes, "_select_model_name", lambda *a, **k: "dummy")
+
+
+def _ndjson_events(resp):
+    return [json.loads(line) for line in resp.text.splitlines() if line.strip()]
+
+
+def test_ingest_stream_ndjson_emits_items_then_each_result(
+    client: TestClient, user_auth_header, monkeypatch, storage_objects
+):
+    _install_model(monkeypatch, lambda prompt: '{"allergens":["milk"],"dietaryCategories":["vegetarian"]}')
+
+    files = {"file": ("menu.png", b"123", "image/png")}
+    resp = client.post("/ai/ingest-menu?stream=ndjson", headers=user_auth_header, files=files)
+    assert resp.status_code == 200
+    assert resp.headers["content-type"].startswith("application/x-ndjson")
+
+    events = _ndjson_events(resp)
+    assert [e["event"] for e in events] == ["started", "items", "item", "item", "done"]
+    assert [i["name"] for i in events[1]["items"]] == ["Latte", "Toast"]
+    assert events[1]["items"][0]["price"] == 4.5
+    assert events[2]["index"] == 0
+    assert events[2]["item"]["allergens"] == ["milk"]
+    assert events[4]["count"] == 2
+
+
+def test_ingest_stream_sse_format(client: TestClient, user_auth_header, monkeypatch, storage_objects):
+    _install_model(monkeypatch, lambda prompt: "{}")
+
+    files = {"file": ("menu.png", b"123", "image/png")}
+    resp = client.post("/ai/ingest-menu?stream=sse", headers=user_auth_header, files=files)
+    assert resp.status_code == 200
+    assert resp.headers["content-type"].startswith("text/event-stream")
+    assert resp.text.startswith("event: started\ndata: ")
+    assert "event: done\n" in resp.text
+
+
+def test_ingest_stream_extraction_failure_is_fatal_error_event(
+    client: TestClient, user_auth_header, monkeypatch, storage_objects
+):
+    _install_model(monkeypatch, lambda prompt: "{}")
+
+    class QuotaModel:
+        def __init__(self, *args, **kwargs):
+            pass
+
+        def generate_content(self, *args, **kwargs):
+            raise Exception("429 quota exhausted")
+
+    monkeypatch.setattr(
+        app_routes, "genai", types.SimpleNamespace(GenerativeModel=QuotaModel, list_models=lambda: [])
+    )
+
+    files = {"file": ("menu.png", b"123", "image/png")}
+    resp = client.post("/ai/ingest-menu?stream=ndjson", headers=user_auth_header, files=files)
+    assert resp.status_code == 200
+    events = _ndjson_events(resp)
+    assert [e["event"] for e in events] == ["started", "error"]
+    assert events[1]["fatal"] is True
+    assert events[1]["status"] == 503
+    assert "manually" in events[1]["detail"].lower()
+
+
+def test_ingest_stream_per_item_failure_degrades(
+    client: TestClient, user_auth_header, monkeypatch, storage_objects
+):
+    def classify(prompt):
+        raise TimeoutError("deadline exceeded")
+
+    _install_model(monkeypatch, classify)
+
+    files = {"file": ("menu.png", b"123", "image/png")}
+    resp = client.post("/ai/ingest-menu?stream=ndjson", headers=user_auth_header, files=files)
+    events = _ndjson_events(resp)
+    assert [e["event"] for e in events] == ["started", "items", "error", "item", "item", "done"]
+    assert events[2]["fatal"] is False
+    assert events[2]["status"] == 504
+    assert all(e["item"]["allergens"] == [] for e in events if e["event"] == "item")
+
+
+def test_ingest_stream_rejects_unknown_format(client: TestClient, user_auth_header):
+    files = {"file": ("menu.png", b"123", "image/png")}
+    resp = client.post("/ai/ingest-menu?stream=xml", headers=user_auth_header, files=files)
+    assert resp.status_code == 400
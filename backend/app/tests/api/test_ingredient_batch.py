@@ -0,0 +1,69 @@
+"""Batch ingredient parsing across a whole menu."""
+import json
+import os
+
+import pytest
+from fastapi.testclient import TestClient
+
+import ingredient_parser
+from ingredient_parser import parse_ingredients, parse_ingredients_batch
+
+GOLD_DATASET = os.path.join(os.path.dirname(__file__), "..", "..", "..", "tests", "testdata", "gold_dataset.json")
+
+
+def test_batch_matches_the_per_item_parser():
+    with open(GOLD_DATASET, encoding="utf-8") as f:
+        inputs = [case["input"] for case in json.load(f)]
+    batch = parse_ingredients_batch(inputs)
+    assert len(batch["items"]) == len(inputs)
+    for text, result in zip(inputs, batch["items"]):
+        single = parse_ingredients(text)
+        assert result["allergens"] == single["allergens"]
+        assert result["dietaryCategories"] == single["dietaryCategories"]
+        assert result["cross_contact"] == single["cross_contact"]
+        assert result["ingredients"] == [p["original_ingredient"] for p in single["parsed_ingredients"]]
+
+
+def test_shared_ingredients_are_classified_once(monkeypatch):
+    calls = []
+    rules = ingredient_parser.active_rules()
+    analysis = rules.analysis
+    monkeypatch.setattr(rules, "analysis", lambda key: calls.append(key) or analysis(key))
+
+    batch = parse_ingredients_batch(
+        ["Butter, Flour, Eggs", "butter, sugar", "Bread (Flour, Water), EGGS", "Butter, Flour, Eggs"]
+    )
+
+    assert sorted(calls) == ["bread", "butter", "egg", "flour", "sugar", "water"]
+    assert batch["distinct_ingredients"] == 6
+    assert batch["total_ingredients"] == 12
+    assert batch["items"][1] == {
+        "allergens": ["milk"],
+        "dietaryCategories": ["not vegan"],
+        "cross_contact": [],
+        "ingredients": ["butter", "sugar"],
+    }
+    assert batch["items"][0] == batch["items"][3]
+
+
+def test_batch_endpoint(client: TestClient, user_auth_header):
+    r = client.post(
+        "/ingredients/parse-batch",
+        headers=user_auth_header,
+        json={"items": ["shrimp, rice", "Contains: milk. May contain peanuts."]},
+    )
+    assert r.status_code == 200
+    items = r.json()["items"]
+    assert items[0]["allergens"] == ["shellfish"]
+    assert items[1]["allergens"] == ["milk"]
+    assert items[1]["cross_contact"] == ["peanuts"]
+
+
+@pytest.mark.parametrize("count, expected", [(2000, 200), (2001, 400)])
+def test_batch_endpoint_caps_the_batch_size(client: TestClient, user_auth_header, count, expected):
+    r = client.post("/ingredients/parse-batch", headers=user_auth_header, json={"items": ["water"] * count})
+    assert r.status_code == expected
+
+
+def test_batch_endpoint_requires_auth(client: TestClient):
+    assert client.post("/ingredients/parse-batch", json={"items": []}).status_code in (401, 403)
@@ -0,0 +1,99 @@
+"""Typo-tolerant ingredient normalization."""
+import pytest
+
+import ingredient_kb
+import ingredient_parser
+from ingredient_fuzzy import SymSpellIndex, osa_distance, single_edits
+from ingredient_parser import RuleSet, normalize_ingredient, parse_ingredient, parse_ingredients
+
+
+def test_osa_distance_counts_a_swap_as_one_edit():
+    assert osa_distance("shirmp", "shrimp", 2) == 1
+    assert osa_distance("sesme", "sesame", 2) == 1
+    assert osa_distance("parmesean", "parmesan", 2) == 1
+    assert osa_distance("butter", "vinegar", 2) == 3
+
+
+def test_lookup_returns_closest_candidates_first():
+    index = SymSpellIndex(["butter", "batter", "better", "bitter", "sesame"])
+    assert index.lookup("buttr") == [("butter", 1), ("batter", 2), ("better", 2), ("bitter", 2)]
+    assert index.lookup("buttr", max_distance=1) == [("butter", 1)]
+
+
+def test_ambiguous_and_short_words_are_not_corrected():
+    index = SymSpellIndex(["butter", "batter", "milk"])
+    assert index.correct("bxtter") is None
+    assert index.correct("mlk") is None
+    assert index.correct("butter") is None
+    assert index.correct("buttr") == ("butter", 1, 0.8)
+
+
+def test_single_edits_cover_every_kind_of_edit():
+    edits = single_edits("crab")
+    assert {"crab", "rab", "rcab", "grab", "crabs"} <= edits
+    assert all(osa_distance("crab", e, 1) <= 1 for e in edits)
+
+
+def test_plural_does_not_make_a_correction_ambiguous():
+    index = SymSpellIndex(["peanut", "peanuts"])
+    assert index.correct("peanutt")[0] == "peanut"
+
+
+@pytest.mark.parametrize(
+    "text, allergens",
+    [
+        ("parmesean cheese", ["milk"]),
+        ("shirmp", ["shellfish"]),
+        ("sesme seeds", ["sesame"]),
+        ("soy lecithn", ["soybeans"]),
+        ("peanutt butter", ["peanuts"]),
+        ("batter", []),
+    ],
+)
+def test_misspelled_ingredients_are_tagged(text, allergens):
+    assert parse_ingredient(text)["allergens"] == allergens
+
+
+def test_corrections_are_reported_with_confidence():
+    assert normalize_ingredient("Shirmp") == "shrimp"
+    (correction,) = parse_ingredient("shirmp")["corrections"]
+    assert correction == {"from": "shirmp", "to": "shrimp", "distance": 1, "confidence": 0.833}
+    parsed = parse_ingredients("Pesto (Basil, Parmesean)")["parsed_ingredients"][0]
+    assert [c["to"] for c in parsed["corrections"]] == ["parmesan"]
+
+
+def test_correction_can_be_disabled():
+    previous = ingredient_parser.active_rules()
+    ingredient_parser.install_rules(
+        ingredient_parser.RuleSet(
+            previous.rules,
+            previous.variants,
+            matcher=previous.matcher,
+            fuzzy=SymSpellIndex(ingredient_parser._vocabulary(), max_distance=0),
+        )
+    )
+    try:
+        assert parse_ingredient("shirmp")["allergens"] == []
+    finally:
+        ingredient_parser.install_rules(previous)
+
+
+def test_corrections_never_drop_an_allergen(tmp_path):
+    # Built-in rules: scallops are shellfish, not a typo of "shallots".
+    assert parse_ingredient("scallops")["corrections"] == []
+    assert parse_ingredient("scallops")["allergens"] == ["shellfish"]
+
+    # A knowledge base's own words are not in the typo index, which would
+    # then turn "scallops" into the one word it knows.
+    path = str(tmp_path / "kb.sekb")
+    shellfish = {"allergens": ["shellfish"], "dietaryCategories": []}
+    ingredient_kb.build({"scallop": shellfish, "shrimp": shellfish}, {}, path)
+    kb = ingredient_kb.KnowledgeBase(path)
+    try:
+        fuzzy = SymSpellIndex(["shallots", "shrimp"])
+        rule_set = RuleSet({}, {}, matcher=kb, fuzzy=fuzzy, morphology=False)
+        assert fuzzy.correct("scallops")[0] == "shallots"
+        assert rule_set.compute("scallops")["corrections"] == []
+        assert rule_set.compute("shirmp")["allergens"] == ["shellfish"]
+    finally:
+        kb.close()
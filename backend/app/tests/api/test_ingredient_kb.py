@@ -0,0 +1,85 @@
+"""Compiled, memory-mapped ingredient knowledge base."""
+import json
+import os
+
+import pytest
+
+import ingredient_kb
+import ingredient_parser
+from allergen_tags import ALLERGENS, DIETARY_CATEGORIES
+
+GOLD_DATASET = os.path.join(os.path.dirname(__file__), "..", "..", "..", "tests", "testdata", "gold_dataset.json")
+
+
+@pytest.fixture
+def csv_kb(tmp_path):
+    source = tmp_path / "kb.csv"
+    source.write_text(
+        "term,canonical,allergens,dietaryCategories\n"
+        "butter,,milk,not vegan\n"
+        "Cocoa  Butter,,,\n"
+        "ghee,butter,,\n"
+        "prawn,,shellfish,not vegan;not vegetarian\n",
+        encoding="utf-8",
+    )
+    out = str(tmp_path / "kb.sekb")
+    rules, variants = ingredient_kb.load_source(str(source))
+    assert ingredient_kb.build(rules, variants, out) == 4
+    kb = ingredient_kb.KnowledgeBase(out)
+    yield kb
+    kb.close()
+
+
+def test_lookup_resolves_synonyms_to_their_canonical_tags(csv_kb):
+    butter = ("butter", ALLERGENS.encode(["milk"]), DIETARY_CATEGORIES.encode(["not vegan"]))
+    assert csv_kb.lookup("butter") == butter
+    assert csv_kb.lookup("ghee") == butter
+    assert DIETARY_CATEGORIES.decode(csv_kb.lookup("prawn")[2]) == ["not vegan", "not vegetarian"]
+    assert csv_kb.lookup("margarine") is None
+
+
+def test_find_matches_like_the_automaton(csv_kb):
+    assert [m[2][0] for m in csv_kb.find("cocoa butter, ghee (clarified butter)")] == [
+        "cocoa butter",
+        "butter",
+        "butter",
+    ]
+    assert csv_kb.find("butternut") == []
+
+
+def test_entries_are_sorted_terms(csv_kb):
+    assert [term for term, _ in csv_kb.entries()] == ["butter", "cocoa butter", "ghee", "prawn"]
+
+
+def test_rejects_files_that_are_not_knowledge_bases(tmp_path):
+    bad = tmp_path / "bad.sekb"
+    bad.write_bytes(b"NOPE" + b"\0" * 32)
+    with pytest.raises(ingredient_kb.KnowledgeBaseError):
+        ingredient_kb.KnowledgeBase(str(bad))
+    (tmp_path / "empty.sekb").write_bytes(b"")
+    with pytest.raises(ingredient_kb.KnowledgeBaseError):
+        ingredient_kb.KnowledgeBase(str(tmp_path / "empty.sekb"))
+
+
+def test_exported_builtin_tables_tag_the_gold_dataset_the_same(tmp_path):
+    source = str(tmp_path / "builtin.json")
+    out = str(tmp_path / "builtin.sekb")
+    ingredient_kb.main(["export", source])
+    ingredient_kb.main(["build", source, out])
+    with open(GOLD_DATASET, encoding="utf-8") as f:
+        gold = json.load(f)
+    expected = [ingredient_parser.parse_ingredients(case["input"])["allergens"] for case in gold]
+
+    kb = ingredient_kb.open_kb(out)
+    previous = ingredient_parser.active_rules()
+    ingredient_parser.install_rules(ingredient_parser.RuleSet(previous.rules, previous.variants, matcher=kb))
+    try:
+        assert [ingredient_parser.parse_ingredients(case["input"])["allergens"] for case in gold] == expected
+    finally:
+        ingredient_parser.install_rules(previous)
+        kb.close()
+
+
+def test_open_kb_is_off_by_default(monkeypatch):
+    monkeypatch.delenv("INGREDIENT_KB_PATH", raising=False)
+    assert ingredient_kb.open_kb() is None
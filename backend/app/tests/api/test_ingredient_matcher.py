@@ -0,0 +1,75 @@
+"""Aho–Corasick rule matching in ingredient_parser."""
+import json
+import os
+
+import pytest
+
+from ingredient_matcher import compile_terms
+from ingredient_parser import parse_ingredient, parse_ingredients
+
+GOLD_DATASET = os.path.join(os.path.dirname(__file__), "..", "..", "..", "tests", "testdata", "gold_dataset.json")
+
+
+def test_matches_respect_word_boundaries():
+    matcher = compile_terms([("butter", "butter"), ("nut", "nut")])
+    assert [m[2] for m in matcher.find("butternut squash, butter (salted)")] == ["butter"]
+    assert matcher.find("peanut") == []
+
+
+def test_longest_overlapping_match_wins():
+    matcher = compile_terms([("butter", "butter"), ("cocoa butter", "cocoa butter"), ("cocoa", "cocoa")])
+    assert [m[2] for m in matcher.find("cocoa butter, butter")] == ["cocoa butter", "butter"]
+
+
+def test_suffix_patterns_are_found_through_failure_links():
+    matcher = compile_terms([("soy lecithin", "soy lecithin"), ("lecithin", "lecithin"), ("in", "in")])
+    assert [m[2] for m in matcher.find_all("sunflower lecithin")] == ["lecithin"]
+
+
+@pytest.mark.parametrize(
+    "ingredient, allergens",
+    [
+        ("Enriched Flour (Wheat Flour)", ["wheat"]),
+        ("Chocolate (Sugar, Cocoa Butter, Soy Lecithin, Vanilla)", ["soybeans"]),
+        ("Peanut Butter (Peanuts, Salt)", ["peanuts"]),
+        ("Whey Protein Isolate", ["milk"]),
+        ("rice flour", []),
+        ("Parmigiano Reggiano", ["milk"]),
+    ],
+)
+def test_parse_ingredient_finds_terms_inside_declarations(ingredient, allergens):
+    assert parse_ingredient(ingredient)["allergens"] == allergens
+
+
+def test_variants_resolve_to_their_canonical_term():
+    result = parse_ingredient("shredded mozzarella")
+    assert result["matched_terms"] == ["cheese"]
+    assert result["allergens"] == ["milk"]
+    assert result["dietaryCategories"] == ["not vegan"]
+
+
+def test_gold_dataset_recall():
+    with open(GOLD_DATASET, encoding="utf-8") as f:
+        gold = json.load(f)
+    missed = [
+        case["name"]
+        for case in gold
+        if not set(case["expected"]["allergens"]) <= set(parse_ingredients(case["input"])["allergens"])
+    ]
+    assert missed == []
+
+
+@pytest.mark.parametrize(
+    "text, allergens",
+    [
+        ("coconut cream", []),
+        ("cashew milk", ["tree_nuts"]),
+        ("crab apples", []),
+        ("bread and butter pickles", []),
+        ("ground nuts", ["peanuts"]),
+        ("crab", ["shellfish"]),
+        ("bread, butter", ["milk", "wheat"]),
+    ],
+)
+def test_longer_terms_shadow_false_positives(text, allergens):
+    assert parse_ingredients(text)["allergens"] == allergens
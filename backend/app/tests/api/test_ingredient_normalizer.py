@@ -0,0 +1,75 @@
+"""Morphological normalization of ingredient names before analysis."""
+import pytest
+
+import ingredient_kb
+import ingredient_parser
+from ingredient_parser import RuleSet, normalize_ingredient, parse_ingredient
+
+_WHEAT = {"allergens": ["wheat"], "dietaryCategories": []}
+
+
+@pytest.mark.parametrize(
+    "spellings, key",
+    [
+        (["egg", "Eggs", "EGGS.", "fresh eggs", "egg*"], "egg"),
+        (["shrimp", "Shrimps", "cooked shrimp"], "shrimp"),
+        (["anchovy", "Anchovies"], "anchovy"),
+        (["Toasted Sesame Seeds", "sesame seeds", "sesame-seeds"], "sesame seeds"),
+        (["breadcrumbs", "Breadcrumb"], "breadcrumbs"),
+    ],
+)
+def test_spellings_share_one_canonical_key(spellings, key):
+    rules = ingredient_parser.active_rules()
+    assert {rules.canonical(s) for s in spellings} == {key}
+    assert len({tuple(parse_ingredient(s)["allergens"]) for s in spellings}) == 1
+
+
+def test_unknown_words_and_lone_modifiers_are_kept():
+    rules = ingredient_parser.active_rules()
+    assert rules.canonical("St. John's Wort") == "st johns wort"
+    assert rules.canonical("Fresh") == "fresh"
+    assert normalize_ingredient("Shirmp") == "shrimp"
+
+
+def test_modifiers_inside_rule_terms_are_not_dropped():
+    rules = RuleSet({"whole wheat": _WHEAT, "wheat": _WHEAT}, {}, morphology=True)
+    assert "whole" not in rules.modifiers
+    assert rules.canonical("Whole Wheat Flour") == "whole wheat flour"
+    assert rules.canonical("toasted wheat") == "wheat"
+
+
+def test_morphology_can_be_turned_off(monkeypatch):
+    monkeypatch.setenv("INGREDIENT_MORPHOLOGY", "0")
+    rules = RuleSet(ingredient_parser.ALLERGEN_RULES, ingredient_parser.INGREDIENT_VARIANTS)
+    assert rules.canonical("Toasted  Sesame Seeds.") == "toasted sesame seeds."
+    assert rules.version != ingredient_parser.RULES_VERSION
+
+
+def test_spellings_share_one_analysis():
+    ingredient_parser.clear_caches()
+    ingredient_parser.PARSE_CACHE.reset_metrics()
+    for spelling in ("Cashews", "cashew", "roasted cashews", "CASHEW."):
+        assert parse_ingredient(spelling)["allergens"] == ["tree_nuts"]
+    metrics = ingredient_parser.cache_metrics()
+    assert metrics["misses"] == 4
+    assert (metrics["analysis_misses"], metrics["analysis_hits"]) == (1, 3)
+
+
+def test_knowledge_base_carries_its_normalizer_tables(tmp_path):
+    rules = {
+        "green beans": {"allergens": [], "dietaryCategories": []},
+        "shrimp": {"allergens": ["shellfish"], "dietaryCategories": []},
+        "whole wheat": {"allergens": ["wheat"], "dietaryCategories": []},
+    }
+    path = str(tmp_path / "kb.sekb")
+    ingredient_kb.build(rules, {}, path)
+    kb = ingredient_kb.KnowledgeBase(path)
+    try:
+        rule_set = RuleSet({}, {}, matcher=kb, morphology=True)
+        assert rule_set.forms is kb.forms and kb.forms["shrimps"] == "shrimp"
+        # The artifact's own words are never rewritten or dropped.
+        assert rule_set.canonical("Green Beans, toasted") == "green beans"
+        assert rule_set.canonical("Whole Wheat") == "whole wheat"
+        assert rule_set.compute("Shrimps")["allergens"] == ["shellfish"]
+    finally:
+        kb.close()
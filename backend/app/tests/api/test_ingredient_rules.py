@@ -0,0 +1,165 @@
+"""Hot-reloadable ingredient rule tables."""
+import json
+import os
+import threading
+
+import pytest
+from fastapi.testclient import TestClient
+
+import ingredient_parser
+import ingredient_rules
+import menu_retag
+from ingredient_rules import RulesReloader
+
+PANEER = {"allergens": ["milk"], "dietaryCategories": ["not vegan"]}
+
+
+@pytest.fixture(autouse=True)
+def restore_rules():
+    previous = ingredient_parser.active_rules()
+    yield
+    ingredient_parser.install_rules(previous, warm=0)
+
+
+@pytest.fixture
+def db_reloader(monkeypatch, fake_db):
+    # Wired like main.py's start_rules_reloader.
+    reloader = RulesReloader(
+        source="db", poll_seconds=0, on_change=lambda report: menu_retag.retagger.start(fake_db)
+    )
+    monkeypatch.setattr(ingredient_rules, "reloader", reloader)
+    return reloader
+
+
+def _tables(**extra):
+    rules = dict(ingredient_parser.ALLERGEN_RULES, **extra)
+    return {"rules": rules, "variants": dict(ingredient_parser.INGREDIENT_VARIANTS)}
+
+
+def _write(path, data, mtime):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    os.utime(path, (mtime, mtime))
+
+
+def test_install_swaps_rules_and_carries_hot_entries_over():
+    before = ingredient_parser.parse_ingredient("Paneer")
+    assert before["allergens"] == []
+    old_cache = ingredient_parser.PARSE_CACHE
+    old_version = ingredient_parser.RULES_VERSION
+
+    tables = _tables(paneer=PANEER)
+    swap = ingredient_parser.install_rules(ingredient_parser.RuleSet(tables["rules"], tables["variants"]))
+
+    assert ingredient_parser.RULES_VERSION != old_version
+    assert ingredient_parser.PARSE_CACHE is not old_cache
+    assert ingredient_parser.PARSE_CACHE.version == ingredient_parser.RULES_VERSION
+    assert swap["warmed"] >= 1
+    assert ingredient_parser.PARSE_CACHE.metrics()["entries"] >= 1
+    assert ingredient_parser.parse_ingredient("Paneer")["allergens"] == ["milk"]
+    # Results already handed out belong to the old rules and stay as they were.
+    assert before["allergens"] == []
+
+
+def test_file_source_is_reloaded_only_when_it_changes(tmp_path):
+    path = str(tmp_path / "rules.json")
+    _write(path, _tables(paneer=PANEER), 1_000_000)
+    reloader = RulesReloader(source=path, poll_seconds=0)
+
+    report = reloader.reload(None)
+    assert report["changed"] and report["version"] == ingredient_parser.RULES_VERSION
+    assert report["terms"] == len(ingredient_parser.ALLERGEN_RULES) + 1 + len(ingredient_parser.INGREDIENT_VARIANTS)
+    for phase in ("load_ms", "compile_ms", "fuzzy_index_ms", "warm_ms", "total_ms"):
+        assert report[phase] >= 0
+    assert ingredient_parser.parse_ingredient("paneer")["allergens"] == ["milk"]
+    assert reloader.reload(None) is None
+
+    _write(path, _tables(paneer=PANEER, halloumi=PANEER), 1_000_100)
+    assert reloader.reload(None)["previousVersion"] == report["version"]
+    assert ingredient_parser.parse_ingredients("Halloumi, Mint")["allergens"] == ["milk"]
+
+
+def test_a_bad_source_keeps_the_current_rules(tmp_path):
+    path = str(tmp_path / "rules.json")
+    _write(path, _tables(paneer={"allergens": ["dairy"]}), 1_000_000)
+    version = ingredient_parser.RULES_VERSION
+    reloader = RulesReloader(source=path, poll_seconds=0)
+
+    assert reloader.check(None) is None
+    assert "Unknown allergens for 'paneer': dairy" in reloader.last_error
+    assert ingredient_parser.RULES_VERSION == version
+    assert RulesReloader(source=str(tmp_path / "missing.json"), poll_seconds=0).check(None) is None
+
+
+def test_a_change_noticed_during_a_reload_is_loaded_after_it(tmp_path, monkeypatch):
+    path = str(tmp_path / "rules.json")
+    _write(path, _tables(paneer=PANEER), 1_000_000)
+    changes = []
+    reloader = RulesReloader(source=path, poll_seconds=0, on_change=changes.append)
+    compiling, release = threading.Event(), threading.Event()
+    load = reloader._load
+
+    def slow_load(db):
+        compiling.set()
+        release.wait(5)
+        return load(db)
+
+    monkeypatch.setattr(reloader, "_load", slow_load)
+    poll = threading.Thread(target=reloader.check, args=(None,))
+    poll.start()
+    assert compiling.wait(5)
+
+    # Neither waits for the compile running on the poll thread.
+    _write(path, _tables(paneer=PANEER, halloumi=PANEER), 1_000_100)
+    assert reloader.reload(None) is None
+    assert reloader.status()["reloading"]
+    release.set()
+    poll.join(5)
+
+    assert reloader.reloads == 2
+    assert changes and changes[-1]["version"] == ingredient_parser.RULES_VERSION
+    assert ingredient_parser.parse_ingredient("halloumi")["allergens"] == ["milk"]
+    assert reloader.reload(None) is None
+
+
+def test_put_rules_publishes_reloads_and_retags(
+    client: TestClient, fake_db, admin_auth_header, db_reloader, monkeypatch
+):
+    started = []
+    monkeypatch.setattr(menu_retag.retagger, "start", lambda db, full=None: started.append(full) or True)
+
+    resp = client.put("/ingredients/rules", headers=admin_auth_header, json=_tables(**{"Paneer ": PANEER}))
+    assert resp.status_code == 200, resp.text
+    db_reloader.join()
+
+    meta = fake_db.reference(ingredient_rules.META_PATH).get()
+    assert resp.json()["published"]["version"] == meta["version"]
+    assert fake_db.reference(f"{ingredient_rules.RULES_PATH}/rules/paneer").get() == PANEER
+    assert db_reloader.last_report["changed"]
+    assert ingredient_parser.parse_ingredient("paneer")["allergens"] == ["milk"]
+    assert started == [None]
+
+    # Another worker sees the new meta version on its next poll.
+    other = RulesReloader(source="db", poll_seconds=0)
+    assert other.check(fake_db)["version"] == ingredient_parser.RULES_VERSION
+    assert other.check(fake_db) is None
+
+    status = client.get("/ingredients/rules", headers=admin_auth_header).json()
+    assert status["source"] == "db" and status["active"]["version"] == ingredient_parser.RULES_VERSION
+
+
+def test_put_rules_rejects_bad_tables_and_other_sources(
+    client: TestClient, fake_db, admin_auth_header, user_auth_header, db_reloader, monkeypatch
+):
+    bad_key = client.put("/ingredients/rules", headers=admin_auth_header, json=_tables(**{"st. john's wort": {}}))
+    assert bad_key.status_code == 400
+    bad_variant = client.put(
+        "/ingredients/rules", headers=admin_auth_header, json={"rules": {"milk": PANEER}, "variants": {"lait": "mlk"}}
+    )
+    assert bad_variant.status_code == 400 and "mlk" in bad_variant.json()["detail"]
+    assert fake_db.reference(ingredient_rules.META_PATH).get() is None
+    assert client.put("/ingredients/rules", headers=user_auth_header, json=_tables()).status_code == 403
+
+    monkeypatch.setattr(ingredient_rules, "reloader", RulesReloader(source="", poll_seconds=0))
+    assert client.put("/ingredients/rules", headers=admin_auth_header, json=_tables()).status_code == 409
+    assert client.post("/ingredients/rules/reload", headers=admin_auth_header).status_code == 409
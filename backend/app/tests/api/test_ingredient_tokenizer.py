@@ -0,0 +1,90 @@
+"""Parenthesis-aware ingredient tokenizer and allergen statements."""
+import json
+import os
+import types
+
+from ingredient_parser import iter_ingredients, parse_ingredients, split_ingredients
+
+GOLD_DATASET = os.path.join(os.path.dirname(__file__), "..", "..", "..", "tests", "testdata", "gold_dataset.json")
+
+
+def _tree(item):
+    if not item["children"]:
+        return item["name"]
+    return {item["name"]: [_tree(child) for child in item["children"]]}
+
+
+def test_nested_declarations_keep_their_sub_ingredients():
+    items = list(iter_ingredients("Bread (Enriched Flour [Wheat Flour, Niacin], Water), Butter (Cream, Salt)."))
+    assert [_tree(item) for item in items] == [
+        {"Bread": [{"Enriched Flour": ["Wheat Flour", "Niacin"]}, "Water"]},
+        {"Butter": ["Cream", "Salt"]},
+    ]
+    assert [item["text"] for item in items] == [
+        "Bread (Enriched Flour [Wheat Flour, Niacin], Water)",
+        "Butter (Cream, Salt)",
+    ]
+
+
+def test_unnamed_parentheticals_are_flattened_into_their_parent():
+    (item,) = iter_ingredients("Seasoning (Salt, (Garlic Powder), Onion Powder)")
+    assert _tree(item) == {"Seasoning": ["Salt", "Garlic Powder", "Onion Powder"]}
+
+
+def test_statements_switch_section_until_the_sentence_ends():
+    items = list(
+        iter_ingredients("Ingredients: Water, *Soybeans*. Contains Wheat, Soy, and Peanuts. May contain traces of milk.")
+    )
+    assert [(item["section"], item["name"]) for item in items] == [
+        ("ingredients", "Water"),
+        ("ingredients", "Soybeans"),
+        ("contains", "Wheat"),
+        ("contains", "Soy"),
+        ("contains", "Peanuts"),
+        ("may_contain", "milk"),
+    ]
+
+
+def test_items_around_brackets_split_like_the_rest():
+    items = list(iter_ingredients("Salt, Milk 2.5%(Skim): Whole. Rice () Flour\nOats (Oat.) [x"))
+    assert [(item["name"], item["text"]) for item in items] == [
+        ("Salt", "Salt"),
+        ("Milk 2.5% : Whole", "Milk 2.5%(Skim): Whole"),
+        ("Rice () Flour", "Rice () Flour"),
+        ("Oats", "Oats (Oat.) [x"),
+    ]
+    assert _tree(items[1]) == {"Milk 2.5% : Whole": ["Skim"]}
+    assert _tree(items[3]) == {"Oats": ["Oat.", "x"]}
+
+
+def test_tokenizer_is_lazy():
+    items = iter_ingredients("Water, Sugar")
+    assert isinstance(items, types.GeneratorType)
+    assert next(items)["name"] == "Water"
+
+
+def test_split_ingredients_keeps_parentheticals_whole():
+    assert split_ingredients("Butter (Cream, Salt), Sugar; Price 2.50 each") == [
+        "Butter (Cream, Salt)",
+        "Sugar",
+        "Price 2.50 each",
+    ]
+
+
+def test_cross_contact_is_not_an_allergen():
+    result = parse_ingredients("Contains: Wheat, Milk. May contain eggs and milk.")
+    assert result["allergens"] == ["milk", "wheat"]
+    assert result["cross_contact"] == ["eggs"]
+    assert result["parsed_ingredients"] == []
+
+
+def test_gold_dataset_allergens_and_cross_contact_notes():
+    with open(GOLD_DATASET, encoding="utf-8") as f:
+        gold = json.load(f)
+    wrong = []
+    for case in gold:
+        result = parse_ingredients(case["input"])
+        notes = sorted(f"possible cross-contact: {a}" for a in result["cross_contact"])
+        if set(result["allergens"]) != set(case["expected"]["allergens"]) or notes != sorted(case["expected"]["notes"]):
+            wrong.append(case["name"])
+    assert wrong == []
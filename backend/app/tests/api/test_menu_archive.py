@@ -0,0 +1,119 @@
+"""Background archival of /ai/ingest-menu uploads."""
+import json
+import threading
+import types
+
+from fastapi.testclient import TestClient
+
+import routes as app_routes
+from menu_archive import MenuArchiver
+
+
+def _install_model(monkeypatch):
+    class FakeModel:
+        def __init__(self, *args, **kwargs):
+            pass
+
+        def generate_content(self, content, **kwargs):
+            return types.SimpleNamespace(text=json.dumps({"items": []}))
+
+    monkeypatch.setattr(
+        app_routes, "genai", types.SimpleNamespace(GenerativeModel=FakeModel, list_models=lambda: [])
+    )
+    monkeypatch.setattr(app_routes, "_ensure_genai_configured", lambda: None)
+    monkeypatch.setattr(app_routes, "_select_model_name", lambda *a, **k: "dummy")
+
+
+def test_ingest_does_not_wait_for_archival(client: TestClient, user_auth_header, monkeypatch, storage_objects):
+    _install_model(monkeypatch)
+    release = threading.Event()
+    uploaded = []
+
+    class SlowBlob:
+        def __init__(self, path):
+            self.path = path
+
+        def upload_from_string(self, data, content_type=None):
+            release.wait(timeout=5)
+            uploaded.append(self.path)
+
+    monkeypatch.setattr(
+        app_routes, "storage", types.SimpleNamespace(bucket=lambda *a, **k: types.SimpleNamespace(blob=SlowBlob))
+    )
+
+    files = {"file": ("menu.png", b"123", "image/png")}
+    resp = client.post("/ai/ingest-menu", headers=user_auth_header, files=files)
+    assert resp.status_code == 200
+    assert uploaded == []  # response went out while the upload was still blocked
+    assert "extract;dur=" in resp.headers["Server-Timing"]
+
+    release.set()
+    assert app_routes.menu_archiver.join(timeout=5)
+    assert len(uploaded) == 1
+
+
+def test_archival_failure_never_fails_ingest(client: TestClient, user_auth_header, monkeypatch, storage_objects):
+    _install_model(monkeypatch)
+
+    def broken_bucket(*args, **kwargs):
+        raise RuntimeError("storage unavailable")
+
+    monkeypatch.setattr(app_routes, "storage", types.SimpleNamespace(bucket=broken_bucket))
+    monkeypatch.setattr(app_routes.menu_archiver, "backoff_seconds", 0)
+
+    files = {"file": ("menu.png", b"123", "image/png")}
+    resp = client.post("/ai/ingest-menu", headers=user_auth_header, files=files)
+    assert resp.status_code == 200
+
+
+def test_archiver_retries_then_succeeds():
+    archiver = MenuArchiver(max_attempts=3, backoff_seconds=0, workers=1)
+    attempts = []
+    results = []
+
+    def flaky_upload():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise RuntimeError("transient")
+
+    archiver.submit("menu_files/u/x.png", flaky_upload, results.append)
+    assert archiver.join(timeout=5)
+    assert len(attempts) == 3
+    assert results == [True]
+    assert archiver.stats["retried"] == 2
+    assert archiver.stats["uploaded"] == 1
+
+
+def test_archiver_drops_when_queue_is_full():
+    archiver = MenuArchiver(queue_size=1, workers=1)
+    release = threading.Event()
+    started = threading.Event()
+
+    def blocked_upload():
+        started.set()
+        release.wait(timeout=5)
+
+    assert archiver.submit("a", blocked_upload)
+    started.wait(timeout=5)  # the worker holds job "a"; the queue is empty
+    assert archiver.submit("b", lambda: None)
+    assert not archiver.submit("c", lambda: None)
+    assert archiver.stats["dropped"] == 1
+
+    release.set()
+    assert archiver.join(timeout=5)
+
+
+def test_archiver_counts_every_job_across_workers():
+    archiver = MenuArchiver(queue_size=400, workers=4)
+    submitters = [
+        threading.Thread(target=lambda: [archiver.submit("x", lambda: None) for _ in range(100)])
+        for _ in range(4)
+    ]
+    for thread in submitters:
+        thread.start()
+    for thread in submitters:
+        thread.join()
+    assert archiver.join(timeout=5)
+    metrics = archiver.metrics()
+    assert metrics["queued"] == 400
+    assert metrics["uploaded"] == 400
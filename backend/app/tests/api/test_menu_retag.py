@@ -0,0 +1,244 @@
+"""Incremental re-tagging of stored menu items after a rules change."""
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+import ingredient_parser
+import menu_retag
+
+
+@pytest.fixture
+def restaurant_id(client: TestClient, user_auth_header, fake_db):
+    fake_db.reference("restaurants").set({})
+    resp = client.post("/restaurants/", headers=user_auth_header, json={
+        "name": "Grain Bowl",
+        "phone": "+1 123-456-7890",
+        "address": "1 Main St",
+        "cuisine_type": "Healthy",
+    })
+    assert resp.status_code == 200
+    return resp.json()["id"]
+
+
+@pytest.fixture
+def change_rules():
+    """Install a changed rule table as a rules reload would."""
+    previous = ingredient_parser.active_rules()
+
+    def change(**changes):
+        rules = dict(ingredient_parser.active_rules().rules)
+        for term, body in changes.items():
+            if body is None:
+                del rules[term]
+            else:
+                rules[term] = body
+        ingredient_parser.install_rules(ingredient_parser.RuleSet(rules, previous.variants))
+
+    yield change
+    ingredient_parser.install_rules(previous)
+
+
+def _add(client, restaurant_id, headers, name, ingredients, allergens=()):
+    resp = client.post(f"/restaurants/{restaurant_id}/menu", headers=headers, json={
+        "name": name,
+        "description": "",
+        "price": 9.5,
+        "ingredients": ingredients,
+        "allergens": list(allergens),
+        "dietaryCategories": [],
+    })
+    assert resp.status_code == 200
+    return resp.json()
+
+
+def _index_items(fake_db, name):
+    entry = fake_db.reference(f"{menu_retag.INDEX_PATH}/{menu_retag.entry_id(name)}").get() or {}
+    return set(entry.get("items") or {})
+
+
+def test_saving_records_inferred_tags_and_indexes_ingredients(client, restaurant_id, user_auth_header, fake_db):
+    item = _add(client, restaurant_id, user_auth_header, "Toast", "Bread (Wheat Flour), Butter", ["sesame"])
+    assert item["allergens"] == ["milk", "sesame", "wheat"]
+    assert item["inferredAllergens"] == ["milk", "wheat"]
+    assert item["rulesVersion"] == ingredient_parser.RULES_VERSION
+    assert _index_items(fake_db, "butter") == {item["id"]}
+    assert _index_items(fake_db, "wheat flour") == {item["id"]}
+
+    client.delete(f"/restaurants/{restaurant_id}/menu/{item['id']}", headers=user_auth_header)
+    assert _index_items(fake_db, "butter") == set()
+
+
+def test_only_items_with_changed_ingredients_are_retagged(
+    client, restaurant_id, user_auth_header, fake_db, change_rules
+):
+    bowl = _add(client, restaurant_id, user_auth_header, "Bowl", "Quinoa, Salt", ["eggs"])
+    salad = _add(client, restaurant_id, user_auth_header, "Salad", "Lettuce, Quinoa (Organic)")
+    bread = _add(client, restaurant_id, user_auth_header, "Bread", "Flour, Water")
+    retagger = menu_retag.MenuRetagger(batch_size=1, batch_pause=0)
+    retagger.run(fake_db)  # first run records the state
+
+    change_rules(quinoa={"allergens": ["sesame"], "dietaryCategories": []})
+    report = retagger.run(fake_db)
+
+    assert report["mode"] == "incremental"
+    assert report["ingredients_changed"] == 1
+    assert report["items_indexed"] == 3
+    assert report["items_touched"] == report["items_updated"] == 2
+    assert report["batches"] == 2
+    stored = fake_db.reference("menu_items").get()
+    assert stored[bowl["id"]]["allergens"] == ["eggs", "sesame"]
+    assert stored[bowl["id"]]["inferredAllergens"] == ["sesame"]
+    assert stored[salad["id"]]["allergens"] == ["sesame"]
+    assert stored[bowl["id"]]["rulesVersion"] == ingredient_parser.RULES_VERSION
+    assert stored[bread["id"]] == bread
+
+    again = retagger.run(fake_db)
+    assert again["items_touched"] == 0
+
+
+def test_removed_rules_drop_inferred_tags_but_keep_hand_set_ones(
+    client, restaurant_id, user_auth_header, fake_db, change_rules
+):
+    inferred = _add(client, restaurant_id, user_auth_header, "Toast", "Toast, Butter")
+    by_hand = _add(client, restaurant_id, user_auth_header, "Roll", "Roll, Butter", ["milk"])
+    retagger = menu_retag.MenuRetagger(batch_pause=0)
+    retagger.run(fake_db)
+
+    change_rules(butter=None)
+    report = retagger.run(fake_db)
+
+    assert report["items_touched"] == 2
+    stored = fake_db.reference("menu_items").get()
+    assert stored[inferred["id"]].get("allergens") in (None, [])
+    assert stored[by_hand["id"]]["allergens"] == ["milk"]
+
+
+def test_manual_edits_stick_through_a_retag(client, restaurant_id, user_auth_header, fake_db, change_rules):
+    item = _add(client, restaurant_id, user_auth_header, "Pesto Pasta", "Pasta, Butter, Pesto")
+    assert item["inferredAllergens"] == ["milk", "tree_nuts"]
+
+    # The user confirms milk by hand; the bulk editor removes tree nuts.
+    resp = client.post(f"/restaurants/{restaurant_id}/menu/bulk-update", headers=user_auth_header, json={
+        "item_ids": [item["id"]],
+        "add_allergens": ["milk"],
+        "remove_allergens": ["tree_nuts"],
+    })
+    assert resp.status_code == 200
+    assert resp.json()["items"][0]["inferredAllergens"] == []
+
+    change_rules(butter=None, pesto=None)
+    menu_retag.MenuRetagger(batch_pause=0).run(fake_db, full=False)
+    assert fake_db.reference(f"menu_items/{item['id']}/allergens").get() == ["milk"]
+
+
+def test_editing_ingredients_retags_and_reindexes(client, restaurant_id, user_auth_header, fake_db):
+    item = _add(client, restaurant_id, user_auth_header, "Soup", "Broth, Cream", ["fish"])
+    resp = client.put(f"/restaurants/{restaurant_id}/menu/{item['id']}", headers=user_auth_header, json={
+        "name": "Soup",
+        "description": "",
+        "price": 9.5,
+        "ingredients": "Broth, Shrimp",
+        "allergens": item["allergens"],
+        "dietaryCategories": [],
+    })
+    body = resp.json()
+    assert body["allergens"] == ["fish", "shellfish"]
+    assert body["inferredAllergens"] == ["shellfish"]
+    assert _index_items(fake_db, "cream") == set()
+    assert _index_items(fake_db, "shrimp") == {item["id"]}
+
+
+def test_full_rescan_indexes_items_saved_before_the_index(fake_db):
+    fake_db.reference("menu_items").set({
+        "old1": {"name": "Cake", "ingredients": "Flour, Eggs", "allergens": ["peanuts"]},
+        "old2": {"name": "Tea", "ingredients": "Tea"},
+    })
+    report = menu_retag.MenuRetagger(batch_pause=0).run(fake_db)
+    assert report["mode"] == "full"
+    assert report["items_touched"] == 2 and report["items_updated"] == 1
+    cake = fake_db.reference("menu_items/old1").get()
+    assert cake["allergens"] == ["eggs", "peanuts", "wheat"]
+    assert cake["inferredAllergens"] == ["eggs", "wheat"]
+    assert _index_items(fake_db, "flour") == {"old1"}
+    assert fake_db.reference("retag_state/rulesVersion").get() == ingredient_parser.RULES_VERSION
+
+
+def test_legacy_tags_the_parser_finds_are_seeded_as_inferred(fake_db, change_rules):
+    fake_db.reference("menu_items").set({
+        "old": {"name": "Toast", "ingredients": "Toast, Butter", "allergens": ["milk", "peanuts"]},
+    })
+    retagger = menu_retag.MenuRetagger(batch_pause=0)
+    retagger.run(fake_db)
+    assert fake_db.reference("menu_items/old/inferredAllergens").get() == ["milk"]
+
+    change_rules(butter=None)
+    retagger.run(fake_db)
+    assert fake_db.reference("menu_items/old/allergens").get() == ["peanuts"]
+
+
+def test_a_retag_keeps_edits_made_while_it_runs(client, restaurant_id, user_auth_header, fake_db, change_rules):
+    item = _add(client, restaurant_id, user_auth_header, "Toast", "Toast, Butter")
+    menu_items = fake_db.reference("menu_items").get()  # a full rescan's snapshot
+    fake_db.reference(f"menu_items/{item['id']}").update({"allergens": ["milk", "sesame"]})
+
+    change_rules(butter=None)
+    menu_retag.MenuRetagger(batch_pause=0)._retag(fake_db, menu_items)
+    stored = fake_db.reference(f"menu_items/{item['id']}").get()
+    assert stored["allergens"] == ["sesame"]
+    assert stored["rulesVersion"] == ingredient_parser.RULES_VERSION
+
+
+def test_items_deleted_while_it_runs_are_not_recreated(fake_db):
+    fake_db.reference("menu_items").set({
+        "kept": {"name": "Tea", "ingredients": "Tea"},
+        "gone": {"name": "Cake", "ingredients": "Flour"},
+    })
+    menu_items = fake_db.reference("menu_items").get()
+    fake_db.reference("menu_items/gone").delete()
+
+    updated, batches, missing = menu_retag.MenuRetagger(batch_pause=0)._retag(fake_db, menu_items)
+    assert (updated, batches, missing) == (0, 1, ["gone"])
+    assert set(fake_db.reference("menu_items").get()) == {"kept"}
+    assert fake_db.reference("menu_items/kept/rulesVersion").get() == ingredient_parser.RULES_VERSION
+
+
+def test_automatic_jobs_leave_the_first_full_rescan_to_an_admin(fake_db, monkeypatch):
+    fake_db.reference("menu_items").set({"old": {"name": "Cake", "ingredients": "Flour"}})
+    retagger = menu_retag.MenuRetagger(batch_pause=0)
+    assert retagger.run(fake_db, stale_only=True) is None
+    assert "rulesVersion" not in fake_db.reference("menu_items/old").get()
+
+    monkeypatch.setenv("MENU_RETAG_AUTO_FULL", "1")
+    assert retagger.run(fake_db, stale_only=True)["mode"] == "full"
+
+
+def test_only_one_worker_runs_a_job(fake_db):
+    fake_db.reference("menu_items").set({"old": {"name": "Cake", "ingredients": "Flour"}})
+    fake_db.reference("retag_state/lease").set({"owner": "other-worker", "expires": time.time() + 60})
+    retagger = menu_retag.MenuRetagger(batch_pause=0)
+    assert retagger.run(fake_db) is None
+    assert "rulesVersion" not in fake_db.reference("menu_items/old").get()
+
+    # The lease expired (its worker died): the job is taken over.
+    fake_db.reference("retag_state/lease/expires").set(time.time() - 1)
+    assert retagger.run(fake_db)["mode"] == "full"
+    assert fake_db.reference("retag_state/lease").get() is None
+
+    # Workers starting after it see the version done and drop their jobs.
+    other = menu_retag.MenuRetagger(batch_pause=0)
+    assert other.run(fake_db, stale_only=True) is None
+    assert other.run(fake_db)["mode"] == "incremental"
+
+
+def test_retag_endpoint_runs_in_the_background(client, admin_auth_header, user_auth_header, fake_db, monkeypatch):
+    monkeypatch.setattr(menu_retag, "retagger", menu_retag.MenuRetagger(batch_pause=0))
+    assert client.post("/ingredients/retag", headers=user_auth_header).status_code == 403
+
+    resp = client.post("/ingredients/retag?full=true", headers=admin_auth_header)
+    assert resp.status_code == 200 and resp.json()["started"] is True
+    menu_retag.retagger.join(timeout=5)
+
+    status = client.get("/ingredients/retag", headers=admin_auth_header).json()
+    assert status["running"] is False
+    assert status["last_report"]["mode"] == "full"
@@ -0,0 +1,114 @@
+"""Two-level, read-only parse cache."""
+import copy
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+import ingredient_parser
+import routes as app_routes
+from parse_cache import FrozenDict, FrozenList, ParseCache, freeze
+
+
+def _counting(calls):
+    def compute(key):
+        calls.append(key)
+        return {"key": key, "tags": [key.upper()]}
+
+    return compute
+
+
+def test_frozen_results_behave_like_plain_containers_but_refuse_changes():
+    value = freeze({"allergens": ["milk"], "sub": [{"x": 1}]})
+    assert value == {"allergens": ["milk"], "sub": [{"x": 1}]}
+    assert json.loads(json.dumps(value)) == value
+    with pytest.raises(TypeError):
+        value["allergens"].append("eggs")
+    with pytest.raises(TypeError):
+        value["sub"][0]["x"] = 2
+    with pytest.raises(TypeError):
+        value.update(other=1)
+    copied = copy.deepcopy(value)
+    copied["allergens"].append("eggs")
+    assert type(copied) is dict and type(copied["allergens"]) is list
+    assert value["allergens"] == ["milk"]
+
+
+def test_parse_ingredient_results_are_shared_and_read_only():
+    first = ingredient_parser.parse_ingredient("Whole Milk")
+    assert ingredient_parser.parse_ingredient("Whole Milk") is first
+    assert isinstance(first, FrozenDict) and isinstance(first["allergens"], FrozenList)
+    with pytest.raises(TypeError):
+        first["allergens"].append("eggs")
+
+
+def test_hits_misses_and_memory_bound_evictions():
+    calls = []
+    cache = ParseCache(_counting(calls), "v1", max_bytes=2000, shared_path="")
+    cache.get("a")
+    cache.get("a")
+    for key in "bcdefghijklmnop":
+        cache.get(key)
+    metrics = cache.metrics()
+    assert metrics["hits"] == 1
+    assert metrics["misses"] == 16
+    assert metrics["evictions"] > 0
+    assert 0 < metrics["bytes"] <= 2000
+    cache.get("a")
+    assert calls.count("a") == 2
+
+
+def test_zero_budget_disables_caching():
+    calls = []
+    cache = ParseCache(_counting(calls), "v1", max_bytes=0, shared_path="")
+    assert cache.get("a") == cache.get("a")
+    assert calls == ["a", "a"]
+
+
+def test_shared_tier_serves_other_workers_and_respects_the_version(tmp_path):
+    path = str(tmp_path / "parse-cache.sqlite")
+    first_calls, second_calls, third_calls = [], [], []
+    ParseCache(_counting(first_calls), "v1", shared_path=path).get("milk")
+
+    second = ParseCache(_counting(second_calls), "v1", shared_path=path)
+    assert second.get("milk") == {"key": "milk", "tags": ["MILK"]}
+    assert isinstance(second.get("milk"), FrozenDict)
+    assert second_calls == []
+    assert second.metrics()["shared_hits"] == 1
+
+    ParseCache(_counting(third_calls), "v2", shared_path=path).get("milk")
+    assert third_calls == ["milk"]
+
+
+def test_shared_tier_results_keep_their_bitmasks(tmp_path, monkeypatch):
+    path = str(tmp_path / "parse-cache.sqlite")
+    writer = ParseCache(ingredient_parser._compute_ingredient, "v", shared_path=path)
+    expected = writer.get("Shrimp")
+    reader = ParseCache(ingredient_parser._compute_ingredient, "v", shared_path=path, load=ingredient_parser._load_ingredient)
+    monkeypatch.setattr(reader, "compute", None)
+    loaded = reader.get("Shrimp")
+    assert loaded == expected
+    assert (loaded.allergen_mask, loaded.dietary_mask) == (expected.allergen_mask, expected.dietary_mask)
+
+
+def test_warm_up_parses_the_most_common_ingredients(monkeypatch):
+    cache = ParseCache(ingredient_parser._compute_ingredient, "v", shared_path="")
+    monkeypatch.setattr(ingredient_parser, "PARSE_CACHE", cache)
+    menus = ["Flour, Butter (Cream, Salt), Eggs", "Flour, Sugar, Eggs", "flour, Water", None, "Flour"]
+    assert ingredient_parser.warm_up(menus, top=2) == 2
+    assert cache.metrics()["entries"] == 2
+    ingredient_parser.parse_ingredient("Flour")
+    assert cache.metrics()["hits"] == 1
+
+
+def test_startup_warm_up_reads_stored_menus(client: TestClient, fake_db, admin_auth_header, monkeypatch):
+    cache = ParseCache(ingredient_parser._compute_ingredient, "v", shared_path="")
+    monkeypatch.setattr(ingredient_parser, "PARSE_CACHE", cache)
+    fake_db.reference("menu_items").set(
+        {"a": {"ingredients": "Shrimp, Rice"}, "b": {"ingredients": "Shrimp, Butter"}, "c": {"name": "No text"}}
+    )
+    app_routes.warm_parse_cache()
+    assert cache.stats["warmed"] == 3
+
+    metrics = client.get("/ai/metrics", headers=admin_auth_header).json()["parse_cache"]
+    assert metrics["warmed"] == 3 and metrics["entries"] == 3
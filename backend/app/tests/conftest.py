@@ -131,18 +131,32 @@ class FakeReference:
 
     def update(self, value: Dict[str, Any]) -> None:
         current = self.get()
-        if current is None:
-            self.set(value)
-            return
-        if not isinstance(current, dict):
+        if current is not None and not isinstance(current, dict):
             raise ValueError("Can only update dict nodes")
-        current.update(value)
-        self.set(current)
+        # Like Firebase: keys may be paths below this node (multi-path
+        # update) and a None value deletes the child.
+        for path, child_value in value.items():
+            ref = self
+            for part in [p for p in path.split("/") if p]:
+                ref = ref.child(part)
+            if child_value is None:
+                ref.delete()
+            else:
+                ref.set(child_value)
 
     def delete(self) -> None:
         parent, key = self._get_parent_and_key()
         parent.pop(key, None)
 
+    def transaction(self, transaction_update) -> Any:
+        # Single process: no concurrent writer, so never retried.
+        value = transaction_update(self.get())
+        if value is None:
+            self.delete()
+        else:
+            self.set(value)
+        return copy.deepcopy(value)
+
     # Minimal no-op implementations to satisfy potential calls
     def order_by_child(self, _field: str) -> "FakeReference":
         return self
@@ -165,6 +179,9 @@ def patch_env():
     # Ensure AI endpoints don't fail on missing API key during tests
     old = os.environ.get("GOOGLE_AI_API_KEY")
     os.environ["GOOGLE_AI_API_KEY"] = "test-key"
+    # Tests make AI calls back to back; the shared RPM limiter is tested on its own
+    old_rpm = os.environ.get("AI_RATE_LIMIT_RPM")
+    os.environ["AI_RATE_LIMIT_RPM"] = "0"
     try:
         yield
     finally:
@@ -172,6 +189,10 @@ def patch_env():
             os.environ.pop("GOOGLE_AI_API_KEY", None)
         else:
             os.environ["GOOGLE_AI_API_KEY"] = old
+        if old_rpm is None:
+            os.environ.pop("AI_RATE_LIMIT_RPM", None)
+        else:
+            os.environ["AI_RATE_LIMIT_RPM"] = old_rpm
 
 
 @pytest.fixture
@@ -197,6 +218,10 @@ def client(fake_db):
     # Reset session tokens
     app_auth.SESSION_TOKENS.clear()
 
+    # The AI circuit breaker and latency window are process-wide; start every test fresh
+    app_routes.ai_circuit.reset()
+    app_routes.classify_hedger.reset()
+
     # Seed two users in "users" path for admin checks
     users_ref = fake_db.reference("users")
     users_ref.child("user1").set({"is_admin": False, "email": "u1@example.com"})
@@ -248,6 +273,9 @@ def storage_objects():
     try:
         yield bucket._objects
     finally:
+        # Menu-file archival runs in the background; let it settle so it
+        # cannot write into the next test's bucket.
+        app_routes.menu_archiver.join(timeout=5)
         bucket._objects.clear()
 
 
@@ -8,12 +8,16 @@ export const api = {
       extractedIngredients: ["milk", "eggs", "flour"]
     };
   }),
-  ingestMenuImage: jest.fn(async (file) => ({
-    items: [
+  ingestMenuImageStream: jest.fn(async (file, onEvent) => {
+    const items = [
       { name: "Caprese Salad", description: "Tomato basil mozzarella", price: 1099, allergens: ["milk"], dietaryCategories: ["vegetarian"], ingredients: "tomato, basil, mozzarella" },
       { name: "Pesto Pasta", description: "Pine nuts + parm", price: 1599, allergens: ["milk", "tree_nuts"], dietaryCategories: ["vegetarian"], ingredients: "pasta, pesto" }
-    ]
-  })),
+    ];
+    onEvent({ event: "started", parts: 1 });
+    onEvent({ event: "items", items });
+    items.forEach((item, index) => onEvent({ event: "item", index, item }));
+    onEvent({ event: "done", count: items.length });
+  }),
   getCurrentUser: jest.fn(async () => ({
     uid: "u1",
     is_admin: false,
@@ -2,7 +2,7 @@
  * @jest-environment jsdom
  */
 import React from "react";
-import { render, screen, fireEvent, waitFor, within } from "@testing-library/react";
+import { render, screen, fireEvent, waitFor, within, act } from "@testing-library/react";
 import { api } from "../services/api.js";
 import ManageMenuItems from "../components/Menu/ManageMenuItems.jsx";
 
@@ -51,7 +51,7 @@ beforeEach(() => {
 
   api.getRestaurants.mockResolvedValue([{ id: "abc", name: "Adrian's Cafe" }]);
   api.getMenuItems.mockResolvedValue([]);
-  api.ingestMenuImage.mockResolvedValue({ items: [] });
+  api.ingestMenuImageStream.mockResolvedValue(undefined);
   api.addMenuItem.mockImplementation(async (rid, data) => ({ id: "m1", ...data }));
 
   mockUseParams.mockReturnValue({ restaurantId: "abc" });
@@ -119,26 +119,29 @@ describe("ManageMenuItems", () => {
     });
   });
 
-  test("ingest seeds multiple forms from /ai/ingest-menu result", async () => {
-    api.ingestMenuImage.mockResolvedValueOnce({
-      items: [
-        {
-          name: "Salad",
-          description: "Green",
-          price: 899,
-          allergens: [],
-          dietaryCategories: [],
-          ingredients: "lettuce",
-        },
-        {
-          name: "Soup",
-          description: "Tomato",
-          price: 499,
-          allergens: ["milk"],
-          dietaryCategories: [],
-          ingredients: "tomato",
-        },
-      ],
+  test("ingest seeds forms from the streamed item list and fills in tags as they arrive", async () => {
+    let tagSecondItem;
+    api.ingestMenuImageStream.mockImplementationOnce(async (file, onEvent) => {
+      onEvent({ event: "started", parts: 1 });
+      onEvent({
+        event: "items",
+        items: [
+          { name: "Salad", description: "Green", price: 899, ingredients: "lettuce" },
+          { name: "Soup", description: "Tomato", price: 499, ingredients: "tomato, cream" },
+        ],
+      });
+      onEvent({
+        event: "item",
+        index: 0,
+        item: { name: "Salad", allergens: [], dietaryCategories: ["vegan"] },
+      });
+      await new Promise((resolve) => {
+        tagSecondItem = () => {
+          onEvent({ event: "item", index: 1, item: { name: "Soup", allergens: ["milk"], dietaryCategories: [] } });
+          onEvent({ event: "done", count: 2 });
+          resolve();
+        };
+      });
     });
 
     renderComponent();
@@ -149,9 +152,31 @@ describe("ManageMenuItems", () => {
     const file = new File(["fake"], "menu.png", { type: "image/png" });
     fireEvent.change(fileInput, { target: { files: [file] } });
 
+    // Both rows are editable before the second one is tagged.
     await screen.findByText(/Imported 2 items/i);
     expect(screen.getByText(/Menu Item #2/)).toBeInTheDocument();
     expect(screen.getByText(/Menu Item #3/)).toBeInTheDocument();
+    // Milk checkboxes of forms #1 (blank), #2 (Salad) and #3 (Soup).
+    const soupMilk = () => screen.getAllByLabelText(/Milk/)[2];
+    expect(soupMilk()).not.toBeChecked();
+
+    await act(async () => tagSecondItem());
+    expect(soupMilk()).toBeChecked();
+  });
+
+  test("a fatal ingest error event is shown", async () => {
+    api.ingestMenuImageStream.mockImplementationOnce(async (file, onEvent) => {
+      onEvent({ event: "started", parts: 1 });
+      onEvent({ event: "error", status: 503, detail: "AI quota exhausted; add items manually.", fatal: true });
+    });
+
+    renderComponent();
+    await screen.findByText(/Add Menu Items/i);
+    const fileInput = document.getElementById("file-upload");
+    fireEvent.change(fileInput, { target: { files: [new File(["fake"], "menu.png", { type: "image/png" })] } });
+
+    await screen.findByText(/AI quota exhausted/i);
+    expect(screen.queryByText(/Imported/i)).not.toBeInTheDocument();
   });
 
   test("Add All Items filters invalid rows, posts in parallel, sets localStorage and navigates back", async () => {
@@ -3,7 +3,7 @@
  * @jest-environment jsdom
  */
 import React from "react";
-import { render, screen, fireEvent, waitFor } from "@testing-library/react";
+import { render, screen, fireEvent, waitFor, act } from "@testing-library/react";
 import MenuItemForm from "../components/Menu/MenuItemForm.jsx";
 
 import { api } from "../services/api.js";
@@ -50,7 +50,30 @@ describe("MenuItemForm", () => {
       expect(screen.getByText(/Milk/)).toBeInTheDocument();
       expect(screen.getByText(/Wheat/)).toBeInTheDocument();
     });
-    expect(api.parseIngredientsWithAI).toHaveBeenCalledWith("milk, wheat");
+    expect(api.parseIngredientsWithAI).toHaveBeenCalledWith("milk, wheat", expect.any(Function));
+  });
+
+  test("Provisional allergens show first and the refined result replaces them", async () => {
+    let refine;
+    api.parseIngredientsWithAI.mockImplementationOnce((text, onProvisional) => {
+      onProvisional({ allergens: ["milk"], provisional: true, refinementId: "r1" });
+      return new Promise((resolve) => {
+        refine = resolve;
+      });
+    });
+    setup();
+    fireEvent.change(screen.getByLabelText(/ingredients/i), { target: { value: "butter, soy sauce" } });
+    fireEvent.click(screen.getByRole("button", { name: /parse/i }));
+
+    const parsed = () => screen.getByText(/Parsed allergens:/i).parentElement;
+    await waitFor(() => expect(parsed()).toHaveTextContent(/Milk/));
+    expect(parsed()).not.toHaveTextContent(/Soybeans/);
+
+    await act(async () => {
+      refine({ allergens: ["milk", "soybeans", "wheat"], dietaryCategories: [], extractedIngredients: [] });
+    });
+    expect(parsed()).toHaveTextContent(/Soybeans/);
+    expect(parsed()).toHaveTextContent(/Wheat/);
   });
 
   test("Failed parse shows error message", async () => {
@@ -106,4 +129,24 @@ describe("MenuItemForm", () => {
     expect(data.dietaryCategories).toContain("vegan");
     expect(data.allergens).toContain("milk");
   });
+
+  test("Streamed tags fill only the tag fields the user has not edited", () => {
+    const onFormChange = jest.fn();
+    const { rerender } = setup({ onFormChange });
+    fireEvent.click(screen.getByLabelText(/Sesame/));
+
+    rerender(
+      <MenuItemForm
+        formIndex={0}
+        onRemove={jest.fn()}
+        onFormChange={onFormChange}
+        restaurantOptions={[]}
+        tags={{ allergens: ["milk"], dietaryCategories: ["vegetarian"] }}
+      />
+    );
+
+    const data = onFormChange.mock.calls.pop()[0];
+    expect(data.allergens).toEqual(["sesame"]);
+    expect(data.dietaryCategories).toEqual(["vegetarian"]);
+  });
 });
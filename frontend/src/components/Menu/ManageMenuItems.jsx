@@ -35,6 +35,7 @@ const ManageMenuItems = () => {
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState('');
   const [ingestedItems, setIngestedItems] = useState([]);
+  const [ingestedTags, setIngestedTags] = useState({}); // form index -> tags streamed in after seeding
   const [isIngesting, setIsIngesting] = useState(false);
   const [showConfirmDialog, setShowConfirmDialog] = useState(false);
   const [itemToDelete, setItemToDelete] = useState(null);
@@ -296,30 +297,51 @@ const ManageMenuItems = () => {
     if (!file) return;
     setError('');
     setIsIngesting(true);
+    // Forms are added as soon as the extracted list arrives; each item's
+    // allergens and dietary categories fill in as the backend tags it.
+    let baseIndex = null;
     try {
-      const result = await api.ingestMenuImage(file);
-      const items = (result && result.items) || [];
-      setIngestedItems(items);
-      // Insert rows into forms for quick editing
-      const baseIndex = menuForms.length > 0 ? Math.max(...menuForms) + 1 : 0;
-      const newIndices = items.map((_, i) => baseIndex + i);
-      setMenuForms(prev => [...prev, ...newIndices]);
-      // Seed form data
-      setMenuItemsData(prev => {
-        const next = { ...prev };
-        newIndices.forEach((idx, i) => {
-          const it = items[i] || {};
-          next[idx] = {
-            name: it.name || '',
-            description: it.description || '',
-            price: it.price || 0,
-            priceNumeric: typeof it.price === 'number' ? it.price : 0,
-            allergens: it.allergens || [],
-            dietaryCategories: it.dietaryCategories || [],
-            ingredients: it.ingredients || ''
-          };
-        });
-        return next;
+      await api.ingestMenuImageStream(file, (event) => {
+        if (event.event === 'items') {
+          const items = event.items || [];
+          setIngestedItems(items);
+          // Insert rows into forms for quick editing
+          baseIndex = menuForms.length > 0 ? Math.max(...menuForms) + 1 : 0;
+          const newIndices = items.map((_, i) => baseIndex + i);
+          setMenuForms(prev => [...prev, ...newIndices]);
+          // Seed form data
+          setMenuItemsData(prev => {
+            const next = { ...prev };
+            newIndices.forEach((idx, i) => {
+              const it = items[i] || {};
+              next[idx] = {
+                name: it.name || '',
+                description: it.description || '',
+                price: it.price || 0,
+                priceNumeric: typeof it.price === 'number' ? it.price : 0,
+                allergens: it.allergens || [],
+                dietaryCategories: it.dietaryCategories || [],
+                ingredients: it.ingredients || ''
+              };
+            });
+            return next;
+          });
+        } else if (event.event === 'item' && baseIndex !== null) {
+          const it = event.item || {};
+          setIngestedTags(prev => ({
+            ...prev,
+            [baseIndex + event.index]: {
+              allergens: it.allergens || [],
+              dietaryCategories: it.dietaryCategories || []
+            }
+          }));
+        } else if (event.event === 'error') {
+          if (event.fatal) {
+            throw new Error(event.detail || 'Failed to ingest image');
+          }
+          // The import goes on with fewer items or manual tagging.
+          setError(event.part ? `${event.part}: ${event.detail}` : event.detail);
+        }
       });
     } catch (e) {
       setError(e?.message || 'Failed to ingest image');
@@ -355,6 +377,11 @@ const ManageMenuItems = () => {
         delete newData[itemToDelete];
         return newData;
       });
+      setIngestedTags(prevTags => {
+        const newTags = { ...prevTags };
+        delete newTags[itemToDelete];
+        return newTags;
+      });
 
       // Close the dialog and reset the item to delete
       setShowConfirmDialog(false);
@@ -657,6 +684,7 @@ const ManageMenuItems = () => {
                 onRemove={() => confirmRemoveMenuItem(formIndex)}
                 onFormChange={(data) => handleFormChange(formIndex, data)}
                 initialData={menuItemsData[formIndex] || {}}
+                tags={ingestedTags[formIndex]}
               />
             </div>
           ))}
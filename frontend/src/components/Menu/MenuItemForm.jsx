@@ -25,6 +25,7 @@ const MenuItemForm = ({
   onRemove,
   onFormChange,
   initialData = {},
+  tags,
   restaurantOptions,
   onImageChange,
   onImageError,
@@ -54,6 +55,9 @@ const MenuItemForm = ({
   const [parsedAllergens, setParsedAllergens] = useState([]);
   const [parseError, setParseError] = useState('');
 
+  // Tag fields the user has set (checkboxes or "Parse"); streamed tags leave them alone.
+  const touchedTagsRef = useRef({ allergens: false, dietaryCategories: false });
+
   // Effect to handle initialData updates from parent
   useEffect(() => {
     if (!isEqual(initialData, prevFormDataRef.current)) {
@@ -91,6 +95,18 @@ const MenuItemForm = ({
     }
   }, [initialData]);
 
+  // Tags that arrive after the form was seeded (a streamed menu import).
+  // They only fill fields the user has not edited in the meantime.
+  useEffect(() => {
+    if (!tags) return;
+    const touched = touchedTagsRef.current;
+    setFormData(prev => ({
+      ...prev,
+      allergens: touched.allergens ? prev.allergens : tags.allergens || [],
+      dietaryCategories: touched.dietaryCategories ? prev.dietaryCategories : tags.dietaryCategories || []
+    }));
+  }, [tags]);
+
   // Notify parent component when form data changes, but only after initial render
   // and only when data actually changes
   useEffect(() => {
@@ -170,6 +186,7 @@ const MenuItemForm = ({
   };
 
   const handleCheckboxChange = (key, id) => {
+    touchedTagsRef.current[key] = true;
     setFormData((prev) => ({
       ...prev,
       [key]: prev[key].includes(id)
@@ -181,9 +198,14 @@ const MenuItemForm = ({
   const parseIngredients = async () => {
     if (!formData.ingredients.trim()) return;
 
+    touchedTagsRef.current = { allergens: true, dietaryCategories: true };
     try {
       setParseError('');
-      const result = await api.parseIngredientsWithAI(formData.ingredients);
+      // Show the instant rule-based allergens while the AI result is on its way.
+      const result = await api.parseIngredientsWithAI(formData.ingredients, (provisional) => {
+        setParsedAllergens(provisional.allergens || []);
+        setFormData((prev) => ({ ...prev, allergens: provisional.allergens || [] }));
+      });
       const { allergens = [], dietaryCategories = [], extractedIngredients = [] } = result || {};
 
       setParsedAllergens(allergens);
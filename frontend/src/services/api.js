@@ -13,6 +13,11 @@ const getBaseUrl = () => {
 
 const BASE_URL = getBaseUrl();
 
+// How long to keep polling for an AI refinement before settling for the
+// provisional tags: the server forgets refinements after this long
+// (AI_REFINEMENT_TTL_SECONDS, default 300).
+const REFINEMENT_MAX_WAIT_MS = 300 * 1000;
+
 console.log('Using API URL:', BASE_URL);
 
 // Helper for getting auth token
@@ -600,8 +605,11 @@ export const api = {
     }
   },
 
-  // AI parsing
-  parseIngredientsWithAI: async (ingredientsText) => {
+  // AI parsing. With onProvisional, the backend answers at once with its
+  // local rule-based tags (passed to onProvisional) and this resolves with
+  // the AI refinement once it is ready, or with the provisional result if
+  // the refinement is not ready within REFINEMENT_MAX_WAIT_MS or expired.
+  parseIngredientsWithAI: async (ingredientsText, onProvisional) => {
     try {
       const response = await httpRequest({
         method: 'POST',
@@ -610,13 +618,36 @@ export const api = {
           'Content-Type': 'application/json',
           'Accept': 'application/json'
         },
-        data: { ingredients: ingredientsText }
+        data: { ingredients: ingredientsText, speculative: Boolean(onProvisional) }
       });
 
       if (response.status !== 200) {
         throw new Error(response.data?.detail || 'Failed to parse ingredients');
       }
 
+      if (!response.data?.provisional) {
+        return response.data;
+      }
+      onProvisional(response.data);
+
+      // Long-poll until the AI result is ready (202 = still running).
+      const deadline = Date.now() + REFINEMENT_MAX_WAIT_MS;
+      while (Date.now() < deadline) {
+        const wait = Math.max(1, Math.min(20, Math.floor((deadline - Date.now()) / 1000)));
+        const refinement = await httpRequest({
+          method: 'GET',
+          url: `${BASE_URL}/ai/parse-ingredients/${response.data.refinementId}?wait=${wait}`,
+          headers: {
+            'Accept': 'application/json'
+          }
+        });
+        if (refinement.status === 202) continue;
+        if (refinement.status === 404) break;
+        if (refinement.status !== 200) {
+          throw new Error(refinement.data?.detail || 'Failed to parse ingredients');
+        }
+        return refinement.data;
+      }
       return response.data;
     } catch (error) {
       console.error('AI parsing error:', error);
@@ -783,8 +814,9 @@ export const api = {
     }
   },
 
-  // Menu image ingestion
-  ingestMenuImage: async (file) => {
+  // Menu image ingestion, streamed: calls onEvent for each NDJSON event
+  // (started, items, item, error, done) as soon as the backend emits it.
+  ingestMenuImageStream: async (file, onEvent) => {
     try {
       const formData = new FormData();
       formData.append('file', file);
@@ -794,7 +826,7 @@ export const api = {
         throw new Error('Authentication required');
       }
 
-      const response = await fetch(`${BASE_URL}/ai/ingest-menu`, {
+      const response = await fetch(`${BASE_URL}/ai/ingest-menu?stream=ndjson`, {
         method: 'POST',
         headers: {
           'Authorization': `Bearer ${token}`
@@ -807,10 +839,30 @@ export const api = {
         throw new Error(errorData?.detail || 'Failed to ingest menu image');
       }
 
-      const data = await response.json();
-      return data;
+      if (!response.body || !response.body.getReader) {
+        // No streaming reads (older WebViews): the same events, all at the end.
+        const text = await response.text();
+        text.split('\n').filter((line) => line.trim()).forEach((line) => onEvent(JSON.parse(line)));
+        return;
+      }
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = '';
+      for (;;) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        let newline = buffer.indexOf('\n');
+        while (newline !== -1) {
+          const line = buffer.slice(0, newline).trim();
+          buffer = buffer.slice(newline + 1);
+          if (line) onEvent(JSON.parse(line));
+          newline = buffer.indexOf('\n');
+        }
+      }
+      if (buffer.trim()) onEvent(JSON.parse(buffer));
     } catch (error) {
-      console.error('Menu ingestion error:', error);
+      console.error('Menu ingestion stream error:', error);
       throw error;
     }
   },